@@ -0,0 +1,84 @@
+#!/usr/bin/env bash
+# 比对 → 排序管道的耗时 / CPU 基准：对比旧版 view -bS 三段管道与当前两段管道
+# Benchmark the align → sort pipe: legacy `bwa mem | samtools view -bS | samtools sort`
+# versus the current `bwa mem | samtools sort`, optionally end to end through bioflow
+# with and without --stream-stats.
+#
+# Usage: ./benchmark_align_sort.sh REF.fa READS.fastq [THREADS] [REPEATS]
+# Output: one TSV row per run on stdout (variant, run, wall_s, cpu_s, max_rss_kb),
+#         then the per-variant median of wall and CPU time. max_rss_kb needs GNU time
+#         (/usr/bin/time or $TIME_BIN); without it bash's time builtin is used and RSS is NA.
+
+set -euo pipefail
+
+if [[ $# -lt 2 ]]; then
+    echo "Usage: $0 REF.fa READS.fastq [THREADS] [REPEATS]" >&2
+    exit 1
+fi
+
+REF="$1"
+READS="$2"
+THREADS="${3:-4}"
+REPEATS="${4:-3}"
+TIME_BIN="${TIME_BIN:-/usr/bin/time}"
+
+for tool in bwa samtools; do
+    if ! command -v "$tool" &>/dev/null; then
+        echo "Error: $tool not found" >&2
+        exit 1
+    fi
+done
+
+WORK_DIR="$(mktemp -d "${TMPDIR:-/tmp}/bioflow-bench.XXXXXX")"
+trap 'rm -rf "$WORK_DIR"' EXIT
+
+if [[ ! -f "$REF.bwt" ]]; then
+    echo "Indexing $REF with bwa index..." >&2
+    bwa index "$REF" >/dev/null 2>&1
+fi
+
+# 固定 sort 内存，两种管道只差中间的 view -bS
+SORT_MEMORY="${SORT_MEMORY:-768M}"
+
+declare -A VARIANTS=(
+    [legacy_view_bS]="bwa mem -t $THREADS '$REF' '$READS' 2>/dev/null | samtools view -bS - 2>/dev/null | samtools sort -@ $THREADS -m $SORT_MEMORY -T '$WORK_DIR/legacy' -o '$WORK_DIR/legacy.bam' - 2>/dev/null"
+    [direct_sort]="bwa mem -t $THREADS '$REF' '$READS' 2>/dev/null | samtools sort -@ $THREADS -m $SORT_MEMORY -T '$WORK_DIR/direct' -o '$WORK_DIR/direct.bam' - 2>/dev/null"
+)
+ORDER=(legacy_view_bS direct_sort)
+
+if command -v bioflow &>/dev/null; then
+    VARIANTS[bioflow]="bioflow --json align --ref '$REF' --input '$READS' --threads $THREADS --sort-memory $SORT_MEMORY --outdir '$WORK_DIR/run-plain' >/dev/null 2>&1"
+    VARIANTS[bioflow_stream_stats]="bioflow --json align --ref '$REF' --input '$READS' --threads $THREADS --sort-memory $SORT_MEMORY --stream-stats --outdir '$WORK_DIR/run-stream' >/dev/null 2>&1"
+    ORDER+=(bioflow bioflow_stream_stats)
+fi
+
+RESULTS="$WORK_DIR/results.tsv"
+printf "variant\trun\twall_s\tcpu_s\tmax_rss_kb\n" | tee "$RESULTS"
+for run in $(seq 1 "$REPEATS"); do
+    # 每轮交替执行各变体，减少页缓存预热带来的偏差
+    for variant in "${ORDER[@]}"; do
+        rm -rf "$WORK_DIR/run-plain" "$WORK_DIR/run-stream"
+        # time 统计的是 bash 及其等待的全部子进程，即整条管道的 CPU
+        if [[ -x "$TIME_BIN" ]]; then
+            "$TIME_BIN" -f "%e %U %S %M" -o "$WORK_DIR/time.txt" bash -c "set -o pipefail; ${VARIANTS[$variant]}"
+        else
+            { TIMEFORMAT="%R %U %S NA"; time bash -c "set -o pipefail; ${VARIANTS[$variant]}"; } 2> "$WORK_DIR/time.txt"
+        fi
+        read -r wall user sys rss < "$WORK_DIR/time.txt"
+        cpu="$(awk -v u="$user" -v s="$sys" 'BEGIN { printf "%.2f", u + s }')"
+        printf "%s\t%s\t%s\t%s\t%s\n" "$variant" "$run" "$wall" "$cpu" "$rss" | tee -a "$RESULTS"
+    done
+done
+
+echo ""
+echo "Median over $REPEATS run(s):"
+for variant in "${ORDER[@]}"; do
+    awk -F'\t' -v v="$variant" '
+        $1 == v { wall[++n] = $3; cpu[n] = $4 }
+        function median(a, n,    i, j, t) {
+            for (i = 1; i <= n; i++) for (j = i + 1; j <= n; j++) if (a[j] < a[i]) { t = a[i]; a[i] = a[j]; a[j] = t }
+            return n % 2 ? a[(n + 1) / 2] : (a[n / 2] + a[n / 2 + 1]) / 2
+        }
+        END { if (n) printf "  %-22s wall %8.2fs  cpu %8.2fs\n", v, median(wall, n), median(cpu, n) }
+    ' "$RESULTS"
+done
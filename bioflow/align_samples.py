@@ -0,0 +1,470 @@
+"""BioFlow-CLI 多样本比对调度模块 — 多个样本共享同一参考索引并发比对。"""
+
+from __future__ import annotations
+
+import csv
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from rich.console import Console
+from rich.table import Table
+
+import bioflow.alignment as alignment
+from bioflow.aligners import DEFAULT_ALIGNER, AlignerBackend, ReadGroup, get_aligner
+from bioflow.i18n import t
+from bioflow.index_cache import resolve_index_cache
+from bioflow.preflight import preflight_check
+from bioflow.run_layout import (
+    STEP_FAILED,
+    STEP_RUNNING,
+    STEP_SKIPPED,
+    STEP_SUCCESS,
+    RunLayout,
+    build_failure_summary,
+    collect_input_details,
+    collect_tool_versions,
+    create_run_layout,
+    init_steps,
+    read_metadata,
+    set_step_state,
+    step_resume_ready,
+    utc_now_iso,
+    write_metadata,
+)
+
+console = Console()
+
+SAMPLES_DIR_NAME = "samples"
+FLAGSTAT_SUMMARY_NAME = "flagstat_summary.tsv"
+FLAGSTAT_SUMMARY_FIELDS = (
+    "sample",
+    "status",
+    "total",
+    "mapped",
+    "mapping_rate",
+    "paired",
+    "properly_paired",
+    "duplicates",
+    "run_dir",
+    "error",
+)
+SAMPLE_STEP_PREFIX = "sample:"
+
+
+@dataclass
+class AlignSample:
+    """样本表中的一个样本。"""
+
+    name: str
+    reads: Path
+    reads2: Path | None = None
+    rg_id: str | None = None
+    platform: str | None = None
+
+    def read_group(self, default_platform: str | None = None) -> ReadGroup:
+        """返回样本的 @RG 读组：SM 为样本名，ID 缺省时同样本名。"""
+        return ReadGroup(self.rg_id or self.name, self.name, self.platform or default_platform)
+
+
+def read_samplesheet(path: Path) -> list[AlignSample]:
+    """读取制表符分隔的样本表。
+
+    表头需包含 ``sample`` 与 ``input`` 列，可选 ``input2`` 列用于双端 R2，
+    可选 ``rg_id`` / ``platform`` 列用于比对时写入的 @RG 读组；
+    相对路径相对于样本表所在目录解析，``#`` 开头的行与空行会被忽略。
+
+    Raises:
+        ValueError: 缺少必需列、样本名重复或非法、reads 文件不存在、读组字段非法。
+    """
+    lines = [
+        line
+        for line in path.read_text(encoding="utf-8").splitlines()
+        if line.strip() and not line.lstrip().startswith("#")
+    ]
+    reader = csv.DictReader(lines, delimiter="\t")
+    fields = set(reader.fieldnames or [])
+    missing = {"sample", "input"} - fields
+    if missing:
+        raise ValueError(f"samplesheet {path} is missing column(s): {', '.join(sorted(missing))}")
+
+    samples: list[AlignSample] = []
+    seen: set[str] = set()
+    for line_no, row in enumerate(reader, start=2):
+        name = (row.get("sample") or "").strip()
+        reads_value = (row.get("input") or "").strip()
+        reads2_value = (row.get("input2") or "").strip()
+        if not name or not reads_value:
+            raise ValueError(f"samplesheet {path} line {line_no}: sample and input are required")
+        if name in seen:
+            raise ValueError(f"samplesheet {path} line {line_no}: duplicate sample '{name}'")
+        if "/" in name or "\\" in name or name in {".", ".."}:
+            raise ValueError(f"samplesheet {path} line {line_no}: invalid sample name '{name}'")
+        seen.add(name)
+        reads = _resolve_sheet_path(path, reads_value)
+        reads2 = _resolve_sheet_path(path, reads2_value) if reads2_value else None
+        for reads_path in (reads, reads2):
+            if reads_path is not None and not reads_path.is_file():
+                raise ValueError(f"samplesheet {path} line {line_no}: file not found: {reads_path}")
+        sample = AlignSample(
+            name,
+            reads,
+            reads2,
+            rg_id=(row.get("rg_id") or "").strip() or None,
+            platform=(row.get("platform") or "").strip() or None,
+        )
+        try:
+            sample.read_group()
+        except ValueError as exc:
+            raise ValueError(f"samplesheet {path} line {line_no}: {exc}") from exc
+        samples.append(sample)
+    if not samples:
+        raise ValueError(f"samplesheet {path} contains no samples")
+    return samples
+
+
+def _resolve_sheet_path(samplesheet: Path, value: str) -> Path:
+    """将样本表中的路径解析为相对于样本表目录的路径。"""
+    path = Path(value).expanduser()
+    return path if path.is_absolute() else samplesheet.parent / path
+
+
+def _prepare_shared_index(
+    ref: Path,
+    layout: RunLayout,
+    *,
+    aligner: AlignerBackend,
+    ref_digest: str,
+    index_cache: str | Path | None,
+    index_cache_max_size: str | int | None,
+) -> tuple[Path, dict[str, object]] | None:
+    """为所有样本准备一份比对器索引，返回 (索引前缀, 步骤输出)，构建失败时返回 None。"""
+    if all(path.exists() for path in aligner.index_files(ref)):
+        return ref, {"index_files": [str(f) for f in aligner.index_files(ref)]}
+
+    index_prefix = layout.root / "index" / ref.name
+    try:
+        cache = resolve_index_cache(index_cache, index_cache_max_size)
+    except ValueError as exc:
+        console.print(t("align_index_cache_invalid", err=str(exc)), style="yellow")
+        cache = None
+    outputs: dict[str, object] = {"index_files": [str(f) for f in aligner.index_files(index_prefix)]}
+
+    def build(prefix: Path) -> bool:
+        prefix.parent.mkdir(parents=True, exist_ok=True)
+        return alignment.run_aligner_index(
+            ref,
+            aligner=aligner,
+            prefix=prefix,
+            stdout_log=layout.stdout_log,
+            stderr_log=layout.stderr_log,
+        )
+
+    if cache is not None and ref_digest:
+        cached = cache.fetch_or_build(
+            aligner.cache_key,
+            ref_digest,
+            aligner.index_suffixes,
+            build,
+            source=ref,
+            link_prefix=index_prefix,
+        )
+        if cached is None:
+            return None
+        if cached.hit:
+            console.print(t("align_index_cache_hit", aligner=aligner.label, path=str(cached.entry_dir)), style="cyan")
+        outputs.update({"cache_entry": str(cached.entry_dir), "cache_hit": cached.hit, "link_mode": cached.link_mode})
+        return index_prefix, outputs
+    if not build(index_prefix):
+        return None
+    return index_prefix, outputs
+
+
+def _sample_row(sample: AlignSample, run_dir: Path, stats: dict[str, int | float] | None) -> dict[str, Any]:
+    """生成汇总表中单个样本的一行。"""
+    row: dict[str, Any] = {"sample": sample.name, "run_dir": str(run_dir), "error": ""}
+    if stats is None:
+        metadata = read_metadata(create_run_layout("align", sample.reads, outdir=run_dir))
+        row.update({key: "" for key in FLAGSTAT_SUMMARY_FIELDS if key not in row})
+        row["status"] = STEP_FAILED
+        row["error"] = str(metadata.get("failure_summary", "")).splitlines()[0] if metadata.get("failure_summary") else ""
+        return row
+    row.update({
+        "status": STEP_SUCCESS,
+        "total": int(stats.get("total", 0)),
+        "mapped": int(stats.get("mapped", 0)),
+        "mapping_rate": round(float(stats.get("mapping_rate", 0.0)), 6),
+        "paired": int(stats.get("paired", 0)),
+        "properly_paired": int(stats.get("properly_paired", 0)),
+        "duplicates": int(stats.get("duplicates", 0)),
+    })
+    return row
+
+
+def write_flagstat_summary(path: Path, rows: list[dict[str, Any]]) -> Path:
+    """将各样本比对统计写为 TSV 汇总表。"""
+    with path.open("w", encoding="utf-8", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=FLAGSTAT_SUMMARY_FIELDS, delimiter="\t", lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def run_alignment_samples(
+    ref: Path,
+    samples: list[AlignSample],
+    *,
+    outdir: Path,
+    threads: int = 1,
+    jobs: int = 1,
+    resume: bool = False,
+    cli_mode: bool = False,
+    skip_preflight: bool = False,
+    index_cache: str | Path | None = None,
+    index_cache_max_size: str | int | None = None,
+    samplesheet: Path | None = None,
+    platform: str | None = None,
+    index_prefix: Path | None = None,
+    ref_details: dict[str, Any] | None = None,
+    **pipeline_options: Any,
+) -> dict[str, Any] | None:
+    """在同一参考索引上调度多个样本的比对流程。
+
+    预检、工具版本采集、参考序列哈希与索引构建只在父运行目录中进行一次；
+    每个样本在 ``<outdir>/samples/<sample>/`` 下拥有独立的运行目录，
+    至多 ``jobs`` 条流程并发，全局线程预算在其间平分。
+    每个样本都会在比对时写入 @RG 读组（SM 为样本名）。
+
+    Args:
+        ref: 参考基因组文件路径。
+        samples: 待比对样本列表。
+        outdir: 父运行目录。
+        threads: 全局线程预算。
+        jobs: 同时运行的样本流程数。
+        resume: 是否从各样本的检查点恢复。
+        samplesheet: 样本表路径，仅记录到 metadata。
+        platform: 样本表未指定 ``platform`` 列时使用的读组 PL。
+        index_prefix: 已构建好的索引前缀（如参考序列包中的索引），指定时跳过索引准备。
+        ref_details: 预先计算的参考序列描述（含 sha256），指定时不再重复哈希参考序列。
+        pipeline_options: 透传给 ``run_alignment_pipeline`` 的其他参数（如 ``markdup``）。
+
+    Returns:
+        包含每个样本结果行与汇总表路径的字典，索引准备失败时返回 None。
+
+    Raises:
+        ValueError: 比对器或预设不受支持。
+    """
+    aligner = get_aligner(
+        pipeline_options.get("aligner") or DEFAULT_ALIGNER,
+        pipeline_options.get("aligner_preset"),
+    )
+    required_tools = alignment.align_required_tools(aligner)
+    if not skip_preflight:
+        if not preflight_check(required_tools, cli_mode=cli_mode):
+            return None
+
+    layout = create_run_layout("align", ref, outdir=outdir)
+    started_at = utc_now_iso()
+    jobs = max(1, min(jobs, len(samples)))
+    sample_threads = max(1, threads // jobs)
+    # 按全局线程预算估算排序内存，避免每个样本各自占用一半可用内存
+    if not pipeline_options.get("sort_memory"):
+        pipeline_options["sort_memory"] = alignment.auto_sort_memory(threads)
+    tool_versions = collect_tool_versions(required_tools)
+    if ref_details is None:
+        ref_details = collect_input_details({"ref": str(ref)})["ref"]
+    existing_metadata = read_metadata(layout)
+    summary_path = layout.results_dir / FLAGSTAT_SUMMARY_NAME
+    step_names = [alignment.ALIGN_STEP_INDEX, *[f"{SAMPLE_STEP_PREFIX}{sample.name}" for sample in samples]]
+    steps = init_steps(step_names, existing_metadata.get("steps"))
+    lock = threading.Lock()
+    failure_summary = ""
+
+    def persist(status: str, *, completed_at: str | None = None) -> None:
+        with lock:
+            write_metadata(
+                layout,
+                status=status,
+                command="align",
+                parameters={
+                    "threads": threads,
+                    "jobs": jobs,
+                    "sample_threads": sample_threads,
+                    "resume": resume,
+                    "samplesheet": str(samplesheet) if samplesheet is not None else None,
+                    "read_groups": {sample.name: sample.read_group(platform).to_dict() for sample in samples},
+                    **{key: str(value) if isinstance(value, Path) else value for key, value in pipeline_options.items()},
+                },
+                inputs={"ref": str(ref), "samples": {sample.name: str(sample.reads) for sample in samples}},
+                outputs={"root": str(layout.root), "flagstat_summary": str(summary_path)},
+                started_at=started_at,
+                completed_at=completed_at,
+                extra={
+                    "steps": steps,
+                    "resume_used": resume,
+                    "input_details": {"ref": ref_details},
+                    "tool_versions": tool_versions,
+                    "failure_summary": failure_summary,
+                },
+            )
+
+    persist("running")
+
+    index_step = alignment.ALIGN_STEP_INDEX
+    previous_index = existing_metadata.get("steps", {}).get(index_step, {}) if isinstance(existing_metadata.get("steps"), dict) else {}
+    previous_outputs = previous_index.get("outputs", {}) if isinstance(previous_index, dict) else {}
+    previous_prefix = previous_outputs.get("index_prefix") if isinstance(previous_outputs, dict) else None
+
+    def previous_index_valid() -> bool:
+        # 比对器或预设变化后旧索引不可用（minimap2 的 k-mer/窗口参数写在 .mmi 中）
+        if previous_outputs.get("aligner") != aligner.label or not previous_prefix:
+            return False
+        expected = aligner.index_files(Path(str(previous_prefix)))
+        return previous_outputs.get("index_files") == [str(f) for f in expected] and all(f.exists() for f in expected)
+
+    if index_prefix is not None:
+        set_step_state(
+            steps,
+            index_step,
+            STEP_SKIPPED,
+            outputs={
+                "index_files": [str(f) for f in aligner.index_files(index_prefix)],
+                "aligner": aligner.label,
+                "index_prefix": str(index_prefix),
+            },
+            note="prebuilt index",
+        )
+    elif resume and previous_prefix and step_resume_ready(
+        existing_metadata,
+        index_step,
+        validator=previous_index_valid,
+        required_outputs=("index_files",),
+    ):
+        index_prefix = Path(str(previous_prefix))
+        set_step_state(steps, index_step, STEP_SKIPPED, outputs=previous_outputs, note="reused existing output")
+    else:
+        set_step_state(steps, index_step, STEP_RUNNING)
+        persist("running")
+        prepared = _prepare_shared_index(
+            ref,
+            layout,
+            aligner=aligner,
+            ref_digest=str(ref_details.get("sha256", "")),
+            index_cache=index_cache,
+            index_cache_max_size=index_cache_max_size,
+        )
+        if prepared is None:
+            failure_summary = build_failure_summary(index_step, stderr_log=layout.stderr_log, fallback=f"{aligner.name} index failed")
+            set_step_state(steps, index_step, STEP_FAILED, error=failure_summary)
+            persist("failed", completed_at=utc_now_iso())
+            return None
+        index_prefix, index_outputs = prepared
+        index_outputs.update({"aligner": aligner.label, "index_prefix": str(index_prefix)})
+        set_step_state(steps, index_step, STEP_SUCCESS, outputs=index_outputs)
+    persist("running")
+
+    console.print(t("align_samples_start", count=len(samples), jobs=jobs, threads=sample_threads), style="bold magenta")
+    samples_root = layout.root / SAMPLES_DIR_NAME
+    rows: dict[str, dict[str, Any]] = {}
+
+    def run_sample(sample: AlignSample) -> dict[str, int | float] | None:
+        return alignment.run_alignment_pipeline(
+            ref,
+            sample.reads,
+            output=Path(f"{sample.name}.sorted.{pipeline_options.get('output_format', 'bam')}"),
+            reads2=sample.reads2,
+            outdir=samples_root / sample.name,
+            threads=sample_threads,
+            resume=resume,
+            cli_mode=cli_mode,
+            skip_preflight=True,
+            index_prefix=index_prefix,
+            tool_versions=tool_versions,
+            ref_details=ref_details,
+            read_group=sample.read_group(platform),
+            **pipeline_options,
+        )
+
+    # 并发运行时各样本的逐步输出会相互穿插，改为只输出调度层的进度
+    quiet_samples = jobs > 1
+    previous_quiet = alignment.console.quiet
+    alignment.console.quiet = previous_quiet or quiet_samples
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            pending: dict[Future[dict[str, int | float] | None], AlignSample] = {}
+            waiting = list(reversed(samples))
+            while waiting or pending:
+                while waiting and len(pending) < jobs:
+                    sample = waiting.pop()
+                    step = f"{SAMPLE_STEP_PREFIX}{sample.name}"
+                    with lock:
+                        set_step_state(steps, step, STEP_RUNNING, outputs={"run_dir": str(samples_root / sample.name)})
+                    persist("running")
+                    pending[executor.submit(run_sample, sample)] = sample
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    sample = pending.pop(future)
+                    step = f"{SAMPLE_STEP_PREFIX}{sample.name}"
+                    try:
+                        stats = future.result()
+                    except Exception as exc:  # 单个样本异常不应中断其他样本
+                        stats = None
+                        error = str(exc)
+                    else:
+                        error = ""
+                    row = _sample_row(sample, samples_root / sample.name, stats)
+                    if error:
+                        row["error"] = error
+                    rows[sample.name] = row
+                    with lock:
+                        set_step_state(
+                            steps,
+                            step,
+                            STEP_SUCCESS if stats is not None else STEP_FAILED,
+                            outputs={"run_dir": row["run_dir"]},
+                            error=row["error"] or None,
+                        )
+                    persist("running")
+                    if quiet_samples:
+                        style = "green" if stats is not None else "bold red"
+                        key = "align_samples_done" if stats is not None else "align_samples_failed"
+                        console.print(t(key, sample=sample.name, done=len(rows), total=len(samples)), style=style)
+    finally:
+        alignment.console.quiet = previous_quiet
+
+    ordered_rows = [rows[sample.name] for sample in samples]
+    write_flagstat_summary(summary_path, ordered_rows)
+    failed = [row for row in ordered_rows if row["status"] != STEP_SUCCESS]
+    failure_summary = "; ".join(f"{row['sample']}: {row['error'] or 'failed'}" for row in failed)
+    persist("failed" if failed else "success", completed_at=utc_now_iso())
+    display_sample_summary(ordered_rows)
+    console.print(t("align_samples_summary", path=str(summary_path)), style="bold green" if not failed else "yellow")
+    return {
+        "samples": ordered_rows,
+        "succeeded": len(ordered_rows) - len(failed),
+        "failed": len(failed),
+        "flagstat_summary": str(summary_path),
+        "outdir": str(layout.root),
+    }
+
+
+def display_sample_summary(rows: list[dict[str, Any]]) -> None:
+    """使用 rich 渲染多样本比对汇总表。"""
+    table = Table(title=t("align_samples_title"), show_header=True, header_style="bold cyan")
+    table.add_column(t("align_samples_col_sample"), style="bold")
+    table.add_column(t("align_samples_col_status"))
+    table.add_column(t("align_stats_total"), justify="right", style="magenta")
+    table.add_column(t("align_stats_rate"), justify="right", style="magenta")
+    table.add_column(t("align_stats_duplicates"), justify="right", style="magenta")
+    for row in rows:
+        ok = row["status"] == STEP_SUCCESS
+        table.add_row(
+            row["sample"],
+            "[green]✓[/green]" if ok else f"[red]✗[/red] {row['error']}",
+            f"{row['total']:,}" if ok else "-",
+            f"{row['mapping_rate']:.2%}" if ok else "-",
+            f"{row['duplicates']:,}" if ok else "-",
+        )
+    console.print(table)
@@ -0,0 +1,202 @@
+"""BioFlow-CLI 比对器后端模块 — 统一 bwa / bwa-mem2 / minimap2 的索引与比对命令。"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+BWA_INDEX_SUFFIXES = (".amb", ".ann", ".bwt", ".pac", ".sa")
+BWA_MEM2_INDEX_SUFFIXES = (".0123", ".amb", ".ann", ".bwt.2bit.64", ".pac")
+MINIMAP2_INDEX_SUFFIXES = (".mmi",)
+# minimap2 的索引参数（k-mer / minimizer 窗口）随预设变化，需按预设区分缓存
+MINIMAP2_PRESETS = (
+    "map-ont",
+    "map-pb",
+    "map-hifi",
+    "lr:hq",
+    "sr",
+    "splice",
+    "splice:hq",
+    "asm5",
+    "asm10",
+    "asm20",
+)
+DEFAULT_ALIGNER = "bwa"
+# 读组字段中不允许出现的字符：制表符、换行会破坏 SAM 头，反斜杠会被比对器当作转义
+_READ_GROUP_FORBIDDEN = ("\t", "\n", "\r", "\\")
+
+
+@dataclass(frozen=True)
+class ReadGroup:
+    """比对时写入 SAM 头并标记到每条记录的 @RG 读组。"""
+
+    id: str
+    sample: str
+    platform: str | None = None
+
+    def __post_init__(self) -> None:
+        for tag, value in (("ID", self.id), ("SM", self.sample), ("PL", self.platform)):
+            if value is None:
+                continue
+            if not value or any(char in value for char in _READ_GROUP_FORBIDDEN):
+                raise ValueError(f"invalid read group {tag}: {value!r}")
+
+    def to_dict(self) -> dict[str, str]:
+        """返回以 SAM 标签为键的读组字段。"""
+        fields = {"ID": self.id, "SM": self.sample}
+        if self.platform:
+            fields["PL"] = self.platform
+        return fields
+
+    def header_line(self) -> str:
+        """返回比对器 ``-R`` 参数所需的 @RG 行（制表符以 ``\\t`` 转义）。"""
+        return "\\t".join(["@RG", *(f"{tag}:{value}" for tag, value in self.to_dict().items())])
+
+
+def resolve_read_group(
+    rg_id: str | None = None,
+    sample: str | None = None,
+    platform: str | None = None,
+    *,
+    default_id: str,
+) -> ReadGroup | None:
+    """根据命令行读组参数构造 ReadGroup，均未指定时返回 None。
+
+    ID 缺省时取样本名，再缺省时取 ``default_id``；SM 缺省时与 ID 相同。
+
+    Raises:
+        ValueError: 字段为空或包含制表符、换行、反斜杠。
+    """
+    if rg_id is None and sample is None and platform is None:
+        return None
+    group_id = rg_id or sample or default_id
+    return ReadGroup(group_id, sample or group_id, platform)
+
+
+@dataclass(frozen=True)
+class AlignerBackend:
+    """比对器后端：索引命令、索引文件集合、比对命令与线程参数。"""
+
+    name: str
+    executable: str
+    index_suffixes: tuple[str, ...]
+    index_subcommand: tuple[str, ...]
+    map_subcommand: tuple[str, ...]
+    progress_pattern: bytes
+    threads_flag: str = "-t"
+    # 单文件索引（如 minimap2 的 .mmi）以 ``-d <文件>`` 输出，多文件索引以 ``-p <前缀>`` 输出
+    single_file_index: bool = False
+    presets: tuple[str, ...] = ()
+    preset: str | None = None
+
+    @property
+    def label(self) -> str:
+        """带预设的后端名称，用于 metadata 与索引缓存分区。"""
+        return f"{self.name}:{self.preset}" if self.preset else self.name
+
+    @property
+    def cache_key(self) -> str:
+        """索引缓存中的后端目录名。"""
+        return self.label.replace(":", "-")
+
+    def _preset_args(self) -> list[str]:
+        return ["-x", self.preset] if self.preset else []
+
+    def index_files(self, prefix: Path) -> list[Path]:
+        """返回以 ``prefix`` 为前缀的索引文件路径列表。"""
+        return [Path(f"{prefix}{suffix}") for suffix in self.index_suffixes]
+
+    def map_target(self, prefix: Path) -> Path:
+        """返回比对命令中引用索引的路径。"""
+        return self.index_files(prefix)[0] if self.single_file_index else prefix
+
+    def index_command(self, ref: Path, prefix: Path | None = None) -> list[str]:
+        """构建索引命令，未指定 ``prefix`` 时索引写在参考序列旁。"""
+        prefix = prefix if prefix is not None else ref
+        cmd = [self.executable, *self.index_subcommand, *self._preset_args()]
+        if self.single_file_index:
+            cmd.extend(["-d", str(self.map_target(prefix))])
+        else:
+            cmd.extend(["-p", str(prefix)])
+        return [*cmd, str(ref)]
+
+    def map_command(
+        self,
+        prefix: Path,
+        reads: Path,
+        reads2: Path | None = None,
+        *,
+        threads: int = 1,
+        read_group: ReadGroup | None = None,
+    ) -> list[str]:
+        """构建输出 SAM 到标准输出的比对命令，提供 ``reads2`` 时按双端比对。
+
+        提供 ``read_group`` 时以 ``-R`` 传入，由比对器直接写入 @RG 头与每条记录的 RG 标签。
+        """
+        cmd = [
+            self.executable,
+            *self.map_subcommand,
+            *self._preset_args(),
+            self.threads_flag,
+            str(threads),
+        ]
+        if read_group is not None:
+            cmd.extend(["-R", read_group.header_line()])
+        cmd.extend([str(self.map_target(prefix)), str(reads)])
+        if reads2 is not None:
+            cmd.append(str(reads2))
+        return cmd
+
+    def parse_progress(self, line: bytes) -> int:
+        """从 stderr 行解析本批次处理的 reads 数，无进度信息时返回 0。"""
+        match = re.search(self.progress_pattern, line)
+        return int(match.group(1)) if match is not None else 0
+
+
+ALIGNERS: dict[str, AlignerBackend] = {
+    "bwa": AlignerBackend(
+        name="bwa",
+        executable="bwa",
+        index_suffixes=BWA_INDEX_SUFFIXES,
+        index_subcommand=("index",),
+        map_subcommand=("mem",),
+        progress_pattern=rb"Processed (\d+) reads",
+    ),
+    "bwa-mem2": AlignerBackend(
+        name="bwa-mem2",
+        executable="bwa-mem2",
+        index_suffixes=BWA_MEM2_INDEX_SUFFIXES,
+        index_subcommand=("index",),
+        map_subcommand=("mem",),
+        progress_pattern=rb"Processed (\d+) reads",
+    ),
+    "minimap2": AlignerBackend(
+        name="minimap2",
+        executable="minimap2",
+        index_suffixes=MINIMAP2_INDEX_SUFFIXES,
+        index_subcommand=(),
+        map_subcommand=("-a",),
+        progress_pattern=rb"mapped (\d+) sequences",
+        single_file_index=True,
+        presets=MINIMAP2_PRESETS,
+        preset="map-ont",
+    ),
+}
+
+
+def get_aligner(name: str = DEFAULT_ALIGNER, preset: str | None = None) -> AlignerBackend:
+    """按名称获取比对器后端，可覆盖预设。
+
+    Raises:
+        ValueError: 未知后端，或预设不被该后端支持。
+    """
+    backend = ALIGNERS.get(name)
+    if backend is None:
+        raise ValueError(f"unknown aligner: {name} (choose from {', '.join(ALIGNERS)})")
+    if preset is None:
+        return backend
+    if preset not in backend.presets:
+        supported = ", ".join(backend.presets) if backend.presets else "none"
+        raise ValueError(f"{name} does not support preset {preset} (supported: {supported})")
+    return replace(backend, preset=preset)
@@ -1,25 +1,44 @@
-"""BioFlow-CLI 序列比对模块 — BWA + SAMtools 完整比对流程。"""
+"""BioFlow-CLI 序列比对模块 — 比对器（bwa / bwa-mem2 / minimap2）+ SAMtools 完整比对流程。"""
 
 from __future__ import annotations
 
+import gzip
+import json
+import os
 import platform
+import queue
 import re
+import shutil
 import subprocess
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import IO, Any, TextIO
 
 import questionary
 from rich.console import Console
 from rich.panel import Panel
-from rich.progress import BarColumn, Progress, TextColumn
+from rich.progress import BarColumn, Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
 from rich.table import Table
 
+from bioflow.aligners import BWA_INDEX_SUFFIXES, DEFAULT_ALIGNER, AlignerBackend, ReadGroup, get_aligner
+from bioflow.coverage import depth_engine, run_depth_stats
 from bioflow.i18n import t
+from bioflow.index_cache import resolve_index_cache
 from bioflow.preflight import preflight_check
+from bioflow.regions import run_region_stats
+from bioflow.resources import available_memory_bytes, parse_bytes, read_process_usage
+from bioflow.sam_stats import SamStreamStats
 from bioflow.run_layout import (
     STEP_FAILED,
+    STEP_PENDING,
     STEP_RUNNING,
     STEP_SKIPPED,
     STEP_SUCCESS,
+    RunLayout,
     append_log,
     build_failure_summary,
     collect_input_details,
@@ -33,15 +52,44 @@ from bioflow.run_layout import (
     utc_now_iso,
     write_metadata,
 )
+from bioflow.unmapped import UnmappedFastqWriter, concat_fastq_gz, fastq_gz_ready, unmapped_fastq_paths
 
 console = Console()
 
-# 比对流程依赖的工具
+# 默认（bwa）比对流程依赖的工具；其他后端见 align_required_tools
 ALIGN_REQUIRED_TOOLS = ("bwa", "samtools")
 ALIGN_STEP_INDEX = "bwa_index"
 ALIGN_STEP_MAP = "map_sort"
 ALIGN_STEP_BAM_INDEX = "bam_index"
 ALIGN_STEP_FLAGSTAT = "flagstat"
+ALIGN_STEP_SPLIT = "split_reads"
+ALIGN_STEP_MARKDUP = "markdup"
+ALIGN_STEP_DEPTH = "depth"
+ALIGN_STEP_REGIONS = "region_stats"
+# 支持的比对输出格式及 samtools index 生成的对应索引后缀
+OUTPUT_FORMATS = ("bam", "cram")
+_ALIGNMENT_INDEX_SUFFIXES = {"bam": ".bai", "cram": ".crai"}
+_CRAM_MAGIC = b"CRAM"
+# BAM 文件末尾固定的空 BGZF 块；缺失说明写入被中断
+_BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+# 分片 BAM 完成标记的后缀，记录写完时的文件大小与记录数
+_DONE_SUFFIX = ".done"
+# samtools sort 自动每线程内存：取可用内存的一半平分给各排序线程，并限制在合理区间
+_SORT_MEMORY_FRACTION = 0.5
+_SORT_MEMORY_MIN = 256 * 1024 * 1024
+_SORT_MEMORY_MAX = 4 * 1024 * 1024 * 1024
+# SAM 流 tee 的转发块大小与解析队列深度（最多缓冲约 64 MiB）
+_TEE_CHUNK_BYTES = 1024 * 1024
+_TEE_QUEUE_CHUNKS = 64
+# 分片时每次轮询写入的记录数；块越大写入越连续，块越小各分片越均衡
+_SHARD_BLOCK_RECORDS = 4096
+# 失败时用于错误摘要的 stderr 末尾行数；完整内容已实时写入日志
+_STDERR_TAIL_LINES = 200
+# /proc 资源采样与进度刷新间隔（秒）
+_MONITOR_INTERVAL = 1.0
+# 分片失败时其余管道检查停止信号的间隔（秒）
+_STOP_POLL_SECONDS = 0.5
+_LOG_LOCK = threading.Lock()
 
 
 def _print_alignment_failure(description: str, err: str) -> bool:
@@ -86,106 +134,911 @@ def _run_cmd(
         return None
 
 
-def _run_bwa_index(ref: Path, *, stdout_log: Path | None = None, stderr_log: Path | None = None) -> bool:
-    """构建 BWA 索引。"""
+def align_required_tools(aligner: AlignerBackend) -> tuple[str, ...]:
+    """返回使用指定比对器时需要预检的工具。"""
+    return (aligner.executable, "samtools")
+
+
+def run_aligner_index(
+    ref: Path,
+    *,
+    aligner: AlignerBackend | None = None,
+    prefix: Path | None = None,
+    quiet: bool = False,
+    stdout_log: Path | None = None,
+    stderr_log: Path | None = None,
+) -> bool:
+    """构建比对器索引，指定 ``prefix`` 时索引写入该前缀而非参考序列旁。
+
+    ``quiet`` 时不打印进度，工具输出只写入日志。
+    """
+    aligner = aligner or get_aligner()
     result = _run_cmd(
-        ["bwa", "index", str(ref)],
-        description=t("align_indexing", file=ref.name),
+        aligner.index_command(ref, prefix),
+        description="" if quiet else t("align_indexing", aligner=aligner.label, file=ref.name),
+        capture=quiet,
         stdout_log=stdout_log,
         stderr_log=stderr_log,
     )
     return result is not None
 
 
-def _run_bwa_mem_pipe_sort(
+class _PipelineMonitor:
+    """跟踪比对管道的实时进度与各阶段进程的 CPU / RSS 占用。
+
+    reads 数来自比对器 stderr 中的进度行（如 bwa 的 ``Processed N reads``）；资源占用由后台
+    线程定期读取 ``/proc/<pid>/stat`` 采样，记录每个阶段的累计 CPU 时间
+    与单进程峰值 RSS。分片比对时多个管道共用同一个监视器。
+    """
+
+    def __init__(
+        self,
+        *,
+        interval: float = _MONITOR_INTERVAL,
+        show_progress: bool = True,
+        aligner: AlignerBackend | None = None,
+    ) -> None:
+        self.reads = 0
+        self._aligner = aligner or get_aligner()
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._procs: list[tuple[str, subprocess.Popen[bytes]]] = []
+        self._cpu: dict[int, tuple[str, float]] = {}
+        self._peak_rss: dict[str, int] = {}
+        self._started = time.monotonic()
+        self._elapsed = 0.0
+        self._sampler: threading.Thread | None = None
+        self._progress = Progress(
+            SpinnerColumn(),
+            TextColumn("[bold blue]{task.description}"),
+            TextColumn("{task.completed:,} reads"),
+            TextColumn("[magenta]{task.fields[rate]} reads/s"),
+            TimeElapsedColumn(),
+            console=console,
+            transient=True,
+            disable=not show_progress or console.quiet or not console.is_terminal,
+        )
+        self._task = self._progress.add_task(t("align_progress"), total=None, rate="-")
+
+    def __enter__(self) -> _PipelineMonitor:
+        self._started = time.monotonic()
+        self._progress.start()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self._sample()
+        self._elapsed = time.monotonic() - self._started
+        self._progress.stop()
+
+    def watch(self, stage: str, proc: subprocess.Popen[bytes]) -> None:
+        """登记需要采样的阶段进程。"""
+        with self._lock:
+            self._procs.append((stage, proc))
+
+    def on_aligner_line(self, line: bytes) -> None:
+        """解析比对器 stderr 行并累加已处理 reads 数。"""
+        processed = self._aligner.parse_progress(line)
+        if not processed:
+            return
+        with self._lock:
+            self.reads += processed
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        with self._lock:
+            procs = [(stage, proc) for stage, proc in self._procs if proc.poll() is None]
+            reads = self.reads
+        for stage, proc in procs:
+            usage = read_process_usage(proc.pid)
+            if usage is None:
+                continue
+            with self._lock:
+                self._cpu[proc.pid] = (stage, usage.cpu_seconds)
+                self._peak_rss[stage] = max(self._peak_rss.get(stage, 0), usage.rss_bytes)
+        elapsed = time.monotonic() - self._started
+        rate = f"{reads / elapsed:,.0f}" if elapsed > 0 and reads else "-"
+        self._progress.update(self._task, completed=reads, rate=rate)
+
+    def summary(self) -> dict[str, Any]:
+        """返回写入 metadata 的吞吐与资源摘要。"""
+        elapsed = self._elapsed or time.monotonic() - self._started
+        stages: dict[str, dict[str, float | int]] = {}
+        with self._lock:
+            for stage, cpu_seconds in self._cpu.values():
+                entry = stages.setdefault(stage, {"cpu_seconds": 0.0, "peak_rss_bytes": 0})
+                entry["cpu_seconds"] = round(float(entry["cpu_seconds"]) + cpu_seconds, 2)
+            for stage, peak in self._peak_rss.items():
+                stages.setdefault(stage, {"cpu_seconds": 0.0, "peak_rss_bytes": 0})["peak_rss_bytes"] = peak
+            reads = self.reads
+        return {
+            "reads": reads,
+            "elapsed_seconds": round(elapsed, 2),
+            "reads_per_second": round(reads / elapsed, 1) if elapsed > 0 else 0.0,
+            "stages": stages,
+        }
+
+
+def _drain_stream(
+    stream: IO[bytes] | None,
+    tail: deque[str],
+    *,
+    log_path: Path | None = None,
+    on_line: Callable[[bytes], None] | None = None,
+) -> threading.Thread:
+    """在后台线程中逐行读空子进程 stderr。
+
+    既避免 stderr 写满管道缓冲区导致阻塞，又将每行实时追加到 ``log_path``；
+    内存中只保留末尾若干行供失败摘要使用，``on_line`` 可用于解析进度。
+    """
+
+    def reader() -> None:
+        if stream is None:
+            return
+        handle = None
+        try:
+            if log_path is not None:
+                log_path.parent.mkdir(parents=True, exist_ok=True)
+                handle = log_path.open("a", encoding="utf-8")
+            for line in iter(stream.readline, b""):
+                text = line.decode("utf-8", errors="replace")
+                tail.append(text.rstrip("\n"))
+                if handle is not None:
+                    with _LOG_LOCK:
+                        handle.write(text if text.endswith("\n") else text + "\n")
+                        handle.flush()
+                if on_line is not None:
+                    on_line(line)
+        finally:
+            if handle is not None:
+                handle.close()
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    return thread
+
+
+def _tee_sam_stream(
+    source: IO[bytes],
+    sink: IO[bytes],
+    *consumers: SamStreamStats | UnmappedFastqWriter,
+    errors: list[str] | None = None,
+) -> threading.Thread:
+    """将比对器的 SAM 输出转发给 sort，同时交给独立解析线程处理。
+
+    转发线程只做块拷贝；每个消费者（流式统计、未比对 reads 导出）各有一个
+    解析线程，与转发线程之间用有界队列缓冲，解析暂时落后时不会阻塞数据
+    流向 sort，除非队列已满。
+    消费者抛出异常时记录到 ``errors`` 并继续取空队列，转发不会因此阻塞；
+    出错的消费者不再调用 ``finish()``。
+    """
+    queues: list[queue.Queue[bytes | None]] = [queue.Queue(maxsize=_TEE_QUEUE_CHUNKS) for _ in consumers]
+    failed: set[int] = set()
+
+    def parse(index: int, consumer: SamStreamStats | UnmappedFastqWriter, chunks: queue.Queue[bytes | None]) -> None:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            if index in failed:
+                continue
+            try:
+                consumer.feed(chunk)
+            except Exception as exc:  # noqa: BLE001 - 解析线程内的任何异常都不能卡住转发
+                failed.add(index)
+                if errors is not None:
+                    errors.append(f"{type(consumer).__name__}: {exc}")
+
+    def forward() -> None:
+        parsers = [
+            threading.Thread(target=parse, args=(index, consumer, chunks), daemon=True)
+            for index, (consumer, chunks) in enumerate(zip(consumers, queues))
+        ]
+        for parser in parsers:
+            parser.start()
+        broken = False
+        try:
+            for chunk in iter(lambda: source.read(_TEE_CHUNK_BYTES), b""):
+                try:
+                    sink.write(chunk)
+                except BrokenPipeError:
+                    broken = True
+                    break
+                for chunks in queues:
+                    chunks.put(chunk)
+        finally:
+            for chunks in queues:
+                chunks.put(None)
+            try:
+                sink.close()
+            except BrokenPipeError:
+                broken = True
+            source.close()
+            for parser in parsers:
+                parser.join()
+            if not broken:
+                for index, consumer in enumerate(consumers):
+                    if index not in failed:
+                        consumer.finish()
+
+    thread = threading.Thread(target=forward, daemon=True)
+    thread.start()
+    return thread
+
+
+def _run_map_pipe_sort(
     ref: Path,
     reads: Path,
     output_bam: Path,
     *,
+    reads2: Path | None = None,
+    aligner: AlignerBackend | None = None,
+    read_group: ReadGroup | None = None,
     threads: int = 1,
+    sort_memory: str | None = None,
+    tmp_prefix: Path | None = None,
+    stream_stats: SamStreamStats | None = None,
+    unmapped_writer: UnmappedFastqWriter | None = None,
+    reference: Path | None = None,
+    monitor: _PipelineMonitor | None = None,
     stdout_log: Path | None = None,
     stderr_log: Path | None = None,
+    stop: threading.Event | None = None,
 ) -> bool:
-    """BWA mem → SAMtools view → SAMtools sort 管道。"""
+    """比对器 → SAMtools sort 管道，提供 ``reads2`` 时按双端比对。
+
+    ``ref`` 为索引前缀，``aligner`` 决定比对命令（默认 bwa mem）。
+    提供 ``read_group`` 时由比对器在同一管道内写入 @RG，无需事后重写 BAM 头。
+
+    sort 先写入同目录下的临时文件，成功后再原子重命名为 ``output_bam``，
+    中断时不会留下看似完整的半成品。
+    sort 直接读取 SAM 文本，省去中间 ``samtools view -bS`` 的 BAM 压缩与解压；
+    ``sort_memory`` 对应 ``-m``（每线程内存），``tmp_prefix`` 对应 ``-T``。
+    提供 ``stream_stats`` 时在比对器与 sort 之间插入 tee，边传输边统计；
+    提供 ``unmapped_writer`` 时同一 tee 把未比对 reads 导出为压缩 FASTQ，管道失败时丢弃其临时文件。
+    提供 ``reference`` 时 sort 直接输出以该参考序列压缩的 CRAM。
+    两个进程的 stderr 由读线程并发读取并实时写入 ``stderr_log``，
+    ``monitor`` 据比对器的进度行与 /proc 采样汇报吞吐和资源占用。
+    ``stop`` 置位时终止两个进程并丢弃临时输出，不再打印失败详情。
+    """
     description = t("align_mapping")
     console.print(f"  → {description}", style="cyan")
 
-    bwa_cmd = ["bwa", "mem", "-t", str(threads), str(ref), str(reads)]
-    view_cmd = ["samtools", "view", "-bS", "-@", str(threads), "-"]
-    sort_cmd = ["samtools", "sort", "-@", str(threads), "-o", str(output_bam), "-"]
-
-    bwa_proc: subprocess.Popen[str] | None = None
-    view_proc: subprocess.Popen[bytes] | None = None
+    aligner = aligner or get_aligner()
+    map_cmd = aligner.map_command(ref, reads, reads2, threads=threads, read_group=read_group)
+    sort_cmd = ["samtools", "sort", "-@", str(threads)]
+    if sort_memory:
+        sort_cmd.extend(["-m", sort_memory])
+    if tmp_prefix is not None:
+        tmp_prefix.parent.mkdir(parents=True, exist_ok=True)
+        sort_cmd.extend(["-T", str(tmp_prefix)])
+    sort_cmd.extend(_cram_output_args(reference))
+    partial = _partial_path(output_bam)
+    sort_cmd.extend(["-o", str(partial), "-"])
+
+    map_proc: subprocess.Popen[bytes] | None = None
     sort_proc: subprocess.Popen[bytes] | None = None
+    map_tail: deque[str] = deque(maxlen=_STDERR_TAIL_LINES)
+    sort_tail: deque[str] = deque(maxlen=_STDERR_TAIL_LINES)
+    consumers = [consumer for consumer in (stream_stats, unmapped_writer) if consumer is not None]
+    tee_errors: list[str] = []
+    succeeded = False
     try:
-        bwa_proc = subprocess.Popen(
-            bwa_cmd,
+        map_proc = subprocess.Popen(
+            map_cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True,
         )
-        view_proc = subprocess.Popen(
-            view_cmd,
-            stdin=bwa_proc.stdout,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        if bwa_proc.stdout is not None:
-            bwa_proc.stdout.close()
-
         sort_proc = subprocess.Popen(
             sort_cmd,
-            stdin=view_proc.stdout,
-            stdout=subprocess.PIPE,
+            stdin=subprocess.PIPE if consumers else map_proc.stdout,
+            stdout=subprocess.DEVNULL,
             stderr=subprocess.PIPE,
         )
-        if view_proc.stdout is not None:
-            view_proc.stdout.close()
-
-        _sort_stdout, sort_stderr = sort_proc.communicate()
-        bwa_stderr = ""
-        view_stderr = ""
-        if bwa_proc.stderr is not None:
-            bwa_stderr = bwa_proc.stderr.read()
-        if view_proc.stderr is not None:
-            view_stderr = view_proc.stderr.read()
-
-        bwa_code = bwa_proc.wait()
-        view_code = view_proc.wait()
-        sort_code = sort_proc.returncode
-
-        if bwa_code == 0 and view_code == 0 and sort_code == 0:
-            append_log(stderr_log, bwa_stderr)
-            append_log(stderr_log, view_stderr)
-            append_log(stderr_log, sort_stderr.decode("utf-8", errors="replace"))
+        if monitor is not None:
+            monitor.watch(aligner.name, map_proc)
+            monitor.watch("samtools sort", sort_proc)
+        readers = [
+            _drain_stream(
+                map_proc.stderr,
+                map_tail,
+                log_path=stderr_log,
+                on_line=monitor.on_aligner_line if monitor is not None else None,
+            ),
+            _drain_stream(sort_proc.stderr, sort_tail, log_path=stderr_log),
+        ]
+        if consumers and map_proc.stdout is not None and sort_proc.stdin is not None:
+            readers.append(_tee_sam_stream(map_proc.stdout, sort_proc.stdin, *consumers, errors=tee_errors))
+        elif map_proc.stdout is not None:
+            map_proc.stdout.close()
+
+        while True:
+            try:
+                sort_code = sort_proc.wait(timeout=_STOP_POLL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                # 其他分片失败时终止整条管道，而不是等待比对跑完
+                if stop is not None and stop.is_set():
+                    map_proc.kill()
+                    sort_proc.kill()
+        map_code = map_proc.wait()
+        for reader in readers:
+            reader.join()
+
+        if map_code == 0 and sort_code == 0 and not tee_errors:
+            partial.replace(output_bam)
+            succeeded = True
             return True
+        if stop is not None and stop.is_set():
+            return False
+        if tee_errors:
+            # 统计或未比对导出不完整时不能当作成功，临时 BAM 一并丢弃
+            message = "SAM stream consumer failed: " + "; ".join(tee_errors)
+            append_log(stderr_log, message)
+            return _print_alignment_failure(description, message)
 
         errors = "\n".join(
-            part.strip()
-            for part in (bwa_stderr, view_stderr, sort_stderr.decode("utf-8", errors="replace"))
-            if part and part.strip()
+            "\n".join(tail).strip()
+            for tail in (map_tail, sort_tail)
+            if "".join(tail).strip()
         ) or "pipeline execution failed"
-        append_log(stderr_log, errors)
         return _print_alignment_failure(description, errors)
     except FileNotFoundError as exc:
         append_log(stderr_log, str(exc))
         return _print_alignment_failure(description, str(exc))
     finally:
-        for proc in (bwa_proc, view_proc, sort_proc):
+        for proc in (map_proc, sort_proc):
             if proc is not None and proc.poll() is None:
                 proc.kill()
+        if not succeeded:
+            partial.unlink(missing_ok=True)
+            if unmapped_writer is not None:
+                unmapped_writer.discard()
 
     return False
 
 
-def _bwa_index_files(ref: Path) -> list[Path]:
-    """返回 BWA 索引文件路径列表。"""
-    return [ref.with_suffix(ref.suffix + ext) for ext in (".amb", ".ann", ".bwt", ".pac", ".sa")]
+def _cram_output_args(reference: Path | None) -> list[str]:
+    """返回写 CRAM 所需的 samtools 参数，未提供参考序列时输出 BAM。"""
+    if reference is None:
+        return []
+    return ["-O", "cram", "--reference", str(reference)]
+
+
+def _run_pipe_chain(
+    commands: list[list[str]],
+    *,
+    description: str,
+    stderr_log: Path | None = None,
+) -> bool:
+    """将多条命令按 stdout → stdin 串成管道运行，所有阶段成功时返回 True。"""
+    console.print(f"  → {description}", style="cyan")
+    procs: list[subprocess.Popen[bytes]] = []
+    stderr_tails: list[deque[str]] = []
+    readers: list[threading.Thread] = []
+    try:
+        upstream: IO[bytes] | None = None
+        for index, cmd in enumerate(commands):
+            last = index == len(commands) - 1
+            proc = subprocess.Popen(
+                cmd,
+                stdin=upstream,
+                stdout=subprocess.DEVNULL if last else subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            # 父进程不再持有上游管道，下游退出时上游能收到 SIGPIPE
+            if upstream is not None:
+                upstream.close()
+            upstream = proc.stdout
+            procs.append(proc)
+            tail: deque[str] = deque(maxlen=_STDERR_TAIL_LINES)
+            stderr_tails.append(tail)
+            readers.append(_drain_stream(proc.stderr, tail, log_path=stderr_log))
+
+        codes = [proc.wait() for proc in reversed(procs)][::-1]
+        for reader in readers:
+            reader.join()
+        if all(code == 0 for code in codes):
+            return True
+
+        stderr_texts = ["\n".join(tail).strip() for tail in stderr_tails]
+        errors = "\n".join(text for text in stderr_texts if text) or "pipeline execution failed"
+        return _print_alignment_failure(description, errors)
+    except FileNotFoundError as exc:
+        append_log(stderr_log, str(exc))
+        return _print_alignment_failure(description, str(exc))
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+
 
+def _run_markdup_pipe(
+    input_bam: Path,
+    output_bam: Path,
+    *,
+    threads: int = 1,
+    sort_memory: str | None = None,
+    tmp_prefix: Path,
+    stats_path: Path,
+    reference: Path | None = None,
+    stderr_log: Path | None = None,
+) -> bool:
+    """collate → fixmate → sort → markdup 全程管道，中间结果不落盘。
+
+    前三个阶段之间传递未压缩 BAM（``-u``），线程预算在负责排序的
+    ``sort`` 与负责压缩输出的 ``markdup`` 之间平分；collate / fixmate
+    只做轻量的记录改写，各用单线程。提供 ``reference`` 时读写 CRAM。
+    """
+    tmp_prefix.parent.mkdir(parents=True, exist_ok=True)
+    sort_threads = max(1, threads // 2)
+    markdup_threads = max(1, threads - sort_threads)
+    sort_cmd = ["samtools", "sort", "-u", "-@", str(sort_threads)]
+    if sort_memory:
+        sort_cmd.extend(["-m", sort_memory])
+    sort_cmd.extend(["-T", f"{tmp_prefix}.sort", "-"])
+    collate_cmd = ["samtools", "collate", "-O", "-u"]
+    if reference is not None:
+        collate_cmd.extend(["--reference", str(reference)])
+    commands = [
+        [*collate_cmd, str(input_bam), f"{tmp_prefix}.collate"],
+        ["samtools", "fixmate", "-m", "-u", "-", "-"],
+        sort_cmd,
+        [
+            "samtools", "markdup", "-@", str(markdup_threads),
+            "-T", f"{tmp_prefix}.markdup", "-s", "-f", str(stats_path),
+            *_cram_output_args(reference),
+            "-", str(output_bam),
+        ],
+    ]
+    return _run_pipe_chain(commands, description=t("align_markdup"), stderr_log=stderr_log)
+
+
+def parse_markdup_stats(text: str) -> dict[str, int]:
+    """解析 ``samtools markdup -s`` 统计输出中的重复计数。"""
+    values: dict[str, int] = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition(":")
+        if not sep:
+            continue
+        try:
+            values[key.strip().upper()] = int(value.strip())
+        except ValueError:
+            continue
+    primary = values.get(
+        "DUPLICATE PRIMARY TOTAL",
+        values.get("DUPLICATE PAIR", 0) + values.get("DUPLICATE SINGLE", 0),
+    )
+    return {
+        "duplicates": values.get("DUPLICATE TOTAL", primary),
+        "primary_duplicates": primary,
+        "optical_duplicates": values.get("DUPLICATE PAIR OPTICAL", 0) + values.get("DUPLICATE SINGLE OPTICAL", 0),
+    }
+
+
+def _run_samtools_merge(
+    output_bam: Path,
+    inputs: list[Path],
+    *,
+    threads: int = 1,
+    reference: Path | None = None,
+    stdout_log: Path | None = None,
+    stderr_log: Path | None = None,
+) -> bool:
+    """合并多个已按坐标排序的分片 BAM，提供 ``reference`` 时输出 CRAM。
+
+    各分片的 @RG / @PG 头相同，``-c``/``-p`` 让 merge 合并同 ID 的头行而不是改名。
+    合并结果先写临时文件，成功后再重命名为 ``output_bam``。
+    """
+    partial = _partial_path(output_bam)
+    result = _run_cmd(
+        [
+            "samtools", "merge", "-f", "-c", "-p", "-@", str(threads),
+            *_cram_output_args(reference),
+            str(partial), *[str(path) for path in inputs],
+        ],
+        description=t("align_merging", count=len(inputs)),
+        stdout_log=stdout_log,
+        stderr_log=stderr_log,
+    )
+    if result is None:
+        partial.unlink(missing_ok=True)
+        return False
+    partial.replace(output_bam)
+    return True
+
+
+def _open_reads(path: Path) -> TextIO:
+    """以文本方式打开 reads 文件，支持 .gz 压缩。"""
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return path.open("r", encoding="utf-8")
+
+
+def _iter_read_records(handle: TextIO) -> Iterator[str]:
+    """逐条产出原始 reads 记录文本（FASTQ 按 4 行，FASTA 按标题行分隔）。"""
+    line = handle.readline()
+    while line and not line.strip():
+        line = handle.readline()
+    if not line:
+        return
+
+    if line.startswith(">"):
+        record = [line]
+        for line in handle:
+            if line.startswith(">"):
+                yield "".join(record)
+                record = [line]
+            elif line.strip():
+                record.append(line)
+        yield "".join(record)
+        return
+
+    while line:
+        if not line.startswith("@"):
+            raise ValueError("parse_error")
+        rest = [handle.readline() for _ in range(3)]
+        if not rest[2]:
+            raise ValueError("parse_error")
+        yield line + "".join(rest)
+        line = handle.readline()
+        while line and not line.strip():
+            line = handle.readline()
+
+
+def _split_reads_round_robin(
+    reads: Path,
+    shard_paths: list[Path],
+    *,
+    block_records: int = _SHARD_BLOCK_RECORDS,
+) -> list[int]:
+    """按记录块轮询写入各分片，返回每个分片的记录数。
+
+    分片只依赖记录序号，块大小相同时双端测序的 R1/R2 会被切到相同分片。
+    """
+    counts = [0] * len(shard_paths)
+    for path in shard_paths:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    handles = [path.open("w", encoding="utf-8") for path in shard_paths]
+    try:
+        with _open_reads(reads) as src:
+            for position, record in enumerate(_iter_read_records(src)):
+                shard = (position // block_records) % len(shard_paths)
+                handles[shard].write(record)
+                counts[shard] += 1
+    finally:
+        for handle in handles:
+            handle.close()
+    return counts
+
+
+def _split_reads_chunks(
+    reads: Path,
+    chunk_path: Callable[[int], Path],
+    *,
+    chunk_records: int,
+) -> list[int]:
+    """按输入顺序每 ``chunk_records`` 条记录切出一个分块，返回每块的记录数。
+
+    分块边界只依赖记录序号，双端测序的 R1/R2 会被切成一一对应的分块；
+    输入为空时仍写出一个空分块。
+    """
+    counts: list[int] = []
+    handle: TextIO | None = None
+    try:
+        with _open_reads(reads) as src:
+            for position, record in enumerate(_iter_read_records(src)):
+                if position % chunk_records == 0:
+                    if handle is not None:
+                        handle.close()
+                    path = chunk_path(len(counts))
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    handle = path.open("w", encoding="utf-8")
+                    counts.append(0)
+                handle.write(record)
+                counts[-1] += 1
+    finally:
+        if handle is not None:
+            handle.close()
+    if not counts:
+        path = chunk_path(0)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("", encoding="utf-8")
+        counts.append(0)
+    return counts
+
+
+def _shard_step_name(shard: int) -> str:
+    """返回分片比对步骤名（如 ``map_sort:shard000``）。"""
+    return f"{ALIGN_STEP_MAP}:shard{shard:03d}"
+
+
+def _insert_shard_steps(steps: dict[str, Any], shards: int, existing_steps: dict[str, Any]) -> None:
+    """按拆分得到的分块数，将分片步骤插入到 ``split_reads`` 之后（原地重排）。"""
+    shard_steps = init_steps([_shard_step_name(shard) for shard in range(shards)], existing_steps)
+    ordered: dict[str, Any] = {}
+    for name, step in steps.items():
+        if name.startswith(f"{ALIGN_STEP_MAP}:shard"):
+            continue
+        ordered[name] = step
+        if name == ALIGN_STEP_SPLIT:
+            ordered.update(shard_steps)
+    steps.clear()
+    steps.update(ordered)
 
-def _default_output_bam(reads: Path) -> Path:
-    """返回默认输出 BAM 路径。"""
-    return reads.parent / f"{reads.stem}.sorted.bam"
+
+def _format_sort_memory(size_bytes: int) -> str:
+    """格式化为 samtools sort ``-m`` 接受的 MiB 整数形式。"""
+    return f"{max(1, size_bytes // (1024 * 1024))}M"
+
+
+def auto_sort_memory(threads: int) -> str | None:
+    """按当前可用内存为 samtools sort 估算每线程内存，无法探测时返回 None（使用默认值）。"""
+    available = available_memory_bytes()
+    if available is None:
+        return None
+    per_thread = int(available * _SORT_MEMORY_FRACTION) // max(1, threads)
+    return _format_sort_memory(min(max(per_thread, _SORT_MEMORY_MIN), _SORT_MEMORY_MAX))
+
+
+def _run_sharded_map(
+    index_prefix: Path,
+    reads: Path,
+    output: Path,
+    *,
+    reads2: Path | None = None,
+    aligner: AlignerBackend | None = None,
+    read_group: ReadGroup | None = None,
+    layout: RunLayout,
+    steps: dict[str, Any],
+    existing_metadata: dict[str, Any],
+    resume: bool,
+    threads: int,
+    shards: int,
+    shard_jobs: int,
+    persist: Callable[[], None],
+    chunk_records: int | None = None,
+    sort_memory: str | None = None,
+    sort_tmp_dir: Path | None = None,
+    stream_stats: SamStreamStats | None = None,
+    unmapped_paths: dict[str, Path] | None = None,
+    unmapped_counts: dict[str, int] | None = None,
+    reference: Path | None = None,
+    monitor: _PipelineMonitor | None = None,
+    announce: Callable[[str], None] | None = None,
+) -> bool:
+    """拆分 reads 并发运行多条比对/sort 管道，最后用 samtools merge 合并。
+
+    默认按记录块轮询切成 ``shards`` 份；提供 ``chunk_records`` 时改为按输入顺序切成
+    每块固定记录数的检查点分块，块数由输入决定。每个分片排序后的 BAM 写完即附带
+    ``.done`` 完成标记（记录文件大小与 reads 数），状态也以独立步骤写入 metadata，
+    resume 时仅重跑缺少有效标记的分片，被中断的长任务只损失正在运行的分块。
+    提供 ``stream_stats`` 且所有分片均在本次运行中完成时，合并各分片的流式统计。
+    提供 ``unmapped_paths`` 时每个分片各自导出未比对 FASTQ（作为分片步骤的输出参与 resume 校验），
+    合并 BAM 后按分片顺序拼接为最终文件，各文件的 reads 数累加到 ``unmapped_counts``。
+    双端输入的 R1/R2 以相同记录块切分，保证同一分片内 mate 一一对应。
+    分片中间结果始终为 BAM，提供 ``reference`` 时仅最终合并输出 CRAM。
+    拆分、分片比对与合并开始前分别以对应的本地化键调用 ``announce`` 输出步骤标签。
+    """
+    shard_dir = layout.tmp_dir / "shards"
+    announce = announce or (lambda _key: None)
+    lock = threading.Lock()
+
+    def shard_path(shard: int, suffix: str) -> Path:
+        return shard_dir / f"shard{shard:03d}.{suffix}"
+
+    def update(step_name: str, status: str, **kwargs: Any) -> None:
+        with lock:
+            set_step_state(steps, step_name, status, **kwargs)
+            persist()
+
+    previous_steps = existing_metadata.get("steps") if isinstance(existing_metadata.get("steps"), dict) else {}
+    previous_split = previous_steps.get(ALIGN_STEP_SPLIT, {}).get("outputs") or {}
+    counts = list(previous_split.get("records") or [])
+    if chunk_records is not None:
+        # 定长分块的块数由输入决定，resume 时沿用上次拆分的块数；块大小变化则重新拆分
+        shards = len(counts) if previous_split.get("chunk_records") == chunk_records else 0
+    announce("align_step_split")
+    split_reused = resume and shards > 0 and len(counts) == shards and step_resume_ready(
+        existing_metadata,
+        ALIGN_STEP_SPLIT,
+        validator=lambda: all(
+            shard_path(shard, suffix).is_file()
+            for shard in range(shards)
+            for suffix in (("reads", "reads2") if reads2 is not None else ("reads",))
+        ),
+        required_outputs=("shards",),
+    )
+    if not split_reused:
+        update(ALIGN_STEP_SPLIT, STEP_RUNNING)
+        try:
+            if chunk_records is not None:
+                counts = _split_reads_chunks(reads, lambda shard: shard_path(shard, "reads"), chunk_records=chunk_records)
+                shards = len(counts)
+            else:
+                counts = _split_reads_round_robin(
+                    reads, [shard_path(shard, "reads") for shard in range(shards)], block_records=_SHARD_BLOCK_RECORDS,
+                )
+            if reads2 is not None:
+                if chunk_records is not None:
+                    counts2 = _split_reads_chunks(reads2, lambda shard: shard_path(shard, "reads2"), chunk_records=chunk_records)
+                else:
+                    counts2 = _split_reads_round_robin(
+                        reads2, [shard_path(shard, "reads2") for shard in range(shards)], block_records=_SHARD_BLOCK_RECORDS,
+                    )
+                if counts2 != counts:
+                    raise ValueError(f"paired read counts differ: {sum(counts)} vs {sum(counts2)}")
+        except (OSError, UnicodeDecodeError, ValueError) as exc:
+            append_log(layout.stderr_log, f"split reads failed: {exc}")
+            update(ALIGN_STEP_SPLIT, STEP_FAILED, error=str(exc))
+            return False
+
+    shard_reads = [shard_path(shard, "reads") for shard in range(shards)]
+    shard_reads2 = [shard_path(shard, "reads2") for shard in range(shards)] if reads2 is not None else []
+    shard_bams = [shard_path(shard, "bam") for shard in range(shards)]
+    shard_unmapped = [
+        unmapped_fastq_paths(shard_dir, f"shard{shard:03d}", paired=reads2 is not None) if unmapped_paths else {}
+        for shard in range(shards)
+    ]
+    split_outputs: dict[str, Any] = {"shards": [str(path) for path in [*shard_reads, *shard_reads2]], "records": counts}
+    if chunk_records is not None:
+        split_outputs["chunk_records"] = chunk_records
+        with lock:
+            _insert_shard_steps(steps, shards, previous_steps)
+    if split_reused:
+        update(ALIGN_STEP_SPLIT, STEP_SKIPPED, outputs=split_outputs, note="reused existing output")
+    else:
+        update(ALIGN_STEP_SPLIT, STEP_SUCCESS, outputs=split_outputs)
+
+    def shard_outputs(shard: int, records: dict[str, int] | None = None) -> dict[str, Any]:
+        outputs: dict[str, Any] = {"bam": str(shard_bams[shard]), "marker": str(_done_marker(shard_bams[shard]))}
+        outputs.update({key: str(path) for key, path in shard_unmapped[shard].items()})
+        if records is not None:
+            outputs["unmapped_records"] = records
+        return outputs
+
+    # 重新拆分后旧的分片 BAM 不再对应新输入，全部重跑；复用的分片须有与 BAM 相符的完成标记
+    pending = [
+        shard
+        for shard in range(shards)
+        if not (
+            split_reused
+            and step_resume_ready(
+                existing_metadata,
+                _shard_step_name(shard),
+                validator=lambda shard=shard: _chunk_done(shard_bams[shard])
+                and all(fastq_gz_ready(path) for path in shard_unmapped[shard].values()),
+                required_outputs=("bam", *shard_unmapped[shard]),
+            )
+        )
+    ]
+    shard_records: dict[int, dict[str, int]] = {}
+    for shard in range(shards):
+        if shard not in pending:
+            previous = previous_steps[_shard_step_name(shard)].get("outputs", {})
+            shard_records[shard] = dict(previous.get("unmapped_records") or {})
+            update(
+                _shard_step_name(shard),
+                STEP_SKIPPED,
+                outputs=shard_outputs(shard, shard_records[shard] if unmapped_paths else None),
+                note="reused existing output",
+            )
+    if split_reused and len(pending) < shards:
+        console.print(t("align_chunks_resumed", done=shards - len(pending), total=shards), style="cyan")
+
+    announce("align_step_map_sort")
+    shard_threads = max(1, threads // shard_jobs)
+    finished = shards - len(pending)
+    shard_stats = {shard: SamStreamStats() for shard in pending} if stream_stats is not None else {}
+
+    stop = threading.Event()
+
+    def run_shard(shard: int) -> bool:
+        step_name = _shard_step_name(shard)
+        if stop.is_set():
+            update(step_name, STEP_PENDING, outputs=shard_outputs(shard), note="not started: another shard failed")
+            return False
+        update(step_name, STEP_RUNNING)
+        _done_marker(shard_bams[shard]).unlink(missing_ok=True)
+        writer = UnmappedFastqWriter(shard_unmapped[shard]) if unmapped_paths else None
+        ok = _run_map_pipe_sort(
+            index_prefix,
+            shard_reads[shard],
+            shard_bams[shard],
+            reads2=shard_reads2[shard] if shard_reads2 else None,
+            aligner=aligner,
+            read_group=read_group,
+            threads=shard_threads,
+            sort_memory=sort_memory,
+            tmp_prefix=(sort_tmp_dir or shard_dir) / f"{output.stem}.shard{shard:03d}.sort",
+            stream_stats=shard_stats.get(shard),
+            unmapped_writer=writer,
+            monitor=monitor,
+            stdout_log=layout.stdout_log,
+            stderr_log=layout.stderr_log,
+            stop=stop,
+        )
+        if writer is not None:
+            shard_records[shard] = dict(writer.counts)
+        if ok:
+            _write_done_marker(shard_bams[shard], counts[shard])
+            error = None
+        elif stop.is_set():
+            error = f"{step_name} stopped: another shard failed"
+        else:
+            error = f"{step_name} failed"
+        update(
+            step_name,
+            STEP_SUCCESS if ok else STEP_FAILED,
+            outputs=shard_outputs(shard, shard_records.get(shard)),
+            error=error,
+        )
+        return ok
+
+    with ThreadPoolExecutor(max_workers=shard_jobs) as executor:
+        futures = {executor.submit(run_shard, shard): shard for shard in pending}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.pop(future)
+                if not future.result():
+                    # 终止正在运行的分片；退出 with 时只需等待管道收到信号后退出
+                    stop.set()
+                    for other, shard in futures.items():
+                        if other.cancel():
+                            update(
+                                _shard_step_name(shard),
+                                STEP_PENDING,
+                                outputs=shard_outputs(shard),
+                                note="not started: another shard failed",
+                            )
+                    return False
+                finished += 1
+                console.print(t("align_shard_done", done=finished, total=shards), style="cyan")
+
+    announce("align_step_merge")
+    if not _run_samtools_merge(
+        output,
+        shard_bams,
+        threads=threads,
+        reference=reference,
+        stdout_log=layout.stdout_log,
+        stderr_log=layout.stderr_log,
+    ):
+        return False
+    if unmapped_paths:
+        try:
+            for key, target in unmapped_paths.items():
+                concat_fastq_gz([shard_unmapped[shard][key] for shard in range(shards)], target)
+        except OSError as exc:
+            append_log(layout.stderr_log, f"merge unmapped reads failed: {exc}")
+            return False
+        if unmapped_counts is not None:
+            for records in shard_records.values():
+                for key, count in records.items():
+                    unmapped_counts[key] = unmapped_counts.get(key, 0) + int(count)
+    if stream_stats is not None and len(shard_stats) == shards and all(part.complete for part in shard_stats.values()):
+        for shard in range(shards):
+            stream_stats.merge(shard_stats[shard])
+        stream_stats.finish()
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    return True
+
+
+def _default_output_bam(reads: Path, reads2: Path | None = None, output_format: str = "bam") -> Path:
+    """返回默认输出 BAM/CRAM 路径，双端输入时去掉 R1 文件名中的 mate 标记。"""
+    stem = reads.stem
+    if reads2 is not None:
+        stem = re.sub(r"[._-]R?1$", "", stem, flags=re.IGNORECASE) or stem
+    return reads.parent / f"{stem}.sorted.{output_format}"
 
 
 def _is_nonempty_file(path: Path) -> bool:
@@ -193,6 +1046,67 @@ def _is_nonempty_file(path: Path) -> bool:
     return path.is_file() and path.stat().st_size > 0
 
 
+def _partial_path(path: Path) -> Path:
+    """返回写入中的临时路径，保留扩展名以便 samtools 识别输出格式。"""
+    return path.with_name(f".{path.stem}.partial{path.suffix}")
+
+
+def _alignment_output_ready(path: Path, output_format: str) -> bool:
+    """比对输出存在且完整：BAM 需以 BGZF EOF 块结尾，CRAM 需以 ``CRAM`` 文件头开头。"""
+    if not _is_nonempty_file(path):
+        return False
+    try:
+        with path.open("rb") as handle:
+            if output_format == "cram":
+                return handle.read(len(_CRAM_MAGIC)) == _CRAM_MAGIC
+            if path.stat().st_size < len(_BGZF_EOF):
+                return False
+            handle.seek(-len(_BGZF_EOF), os.SEEK_END)
+            return handle.read() == _BGZF_EOF
+    except OSError:
+        return False
+
+
+def _done_marker(bam: Path) -> Path:
+    """返回分片 BAM 的完成标记路径。"""
+    return bam.with_name(bam.name + _DONE_SUFFIX)
+
+
+def _write_done_marker(bam: Path, records: int) -> None:
+    """分片 BAM 写完后记录其大小与 reads 数，作为 resume 时的完成凭据。"""
+    marker = {"bam": bam.name, "size": bam.stat().st_size, "records": records, "completed_at": utc_now_iso()}
+    _done_marker(bam).write_text(json.dumps(marker), encoding="utf-8")
+
+
+def _chunk_done(bam: Path) -> bool:
+    """分片 BAM 有完成标记、大小与标记一致且以 BGZF EOF 块结尾。"""
+    try:
+        marker = json.loads(_done_marker(bam).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    if not isinstance(marker, dict) or not _alignment_output_ready(bam, "bam"):
+        return False
+    return marker.get("size") == bam.stat().st_size
+
+
+def _ensure_fasta_index(
+    ref: Path,
+    *,
+    stdout_log: Path | None = None,
+    stderr_log: Path | None = None,
+) -> bool:
+    """CRAM 读写依赖参考序列的 ``.fai``，缺失时用 samtools faidx 生成。"""
+    if _is_nonempty_file(ref.with_suffix(ref.suffix + ".fai")):
+        return True
+    result = _run_cmd(
+        ["samtools", "faidx", str(ref)],
+        description=t("align_faidx", file=ref.name),
+        stdout_log=stdout_log,
+        stderr_log=stderr_log,
+    )
+    return result is not None
+
+
 def _flagstat_ready(path: Path) -> bool:
     """flagstat 输出存在且可解析。"""
     if not _is_nonempty_file(path):
@@ -204,6 +1118,16 @@ def _flagstat_ready(path: Path) -> bool:
     return True
 
 
+def _json_file_ready(path: Path) -> bool:
+    """JSON 文件存在且可解析为对象。"""
+    if not _is_nonempty_file(path):
+        return False
+    try:
+        return isinstance(json.loads(path.read_text(encoding="utf-8")), dict)
+    except (OSError, ValueError):
+        return False
+
+
 def _parse_threads(value: str | None) -> int:
     """解析线程数输入，非法值回退到 1。"""
     if value is None:
@@ -225,7 +1149,7 @@ def _run_samtools_index(
     stdout_log: Path | None = None,
     stderr_log: Path | None = None,
 ) -> bool:
-    """为 BAM 文件创建索引 (.bai)。"""
+    """为 BAM/CRAM 文件创建索引（.bai / .crai）。"""
     result = _run_cmd(
         ["samtools", "index", str(bam)],
         description=t("align_sorting"),
@@ -238,15 +1162,19 @@ def _run_samtools_index(
 def _run_samtools_flagstat(
     bam: Path,
     *,
+    reference: Path | None = None,
     stdout_log: Path | None = None,
     stderr_log: Path | None = None,
 ) -> str | None:
-    """运行 samtools flagstat 并返回原始输出文本。"""
+    """运行 samtools flagstat 并返回原始输出文本，CRAM 输入需提供 ``reference``。"""
     description = t("align_flagstat")
     console.print(f"  → {description}", style="cyan")
+    cmd = ["samtools", "flagstat"]
+    if reference is not None:
+        cmd.extend(["--reference", str(reference)])
     try:
         result = subprocess.run(
-            ["samtools", "flagstat", str(bam)],
+            [*cmd, str(bam)],
             check=True, capture_output=True, text=True,
         )
         append_log(stdout_log, result.stdout)
@@ -295,6 +1223,10 @@ def parse_flagstat(text: str) -> dict[str, int | float]:
 
         if "in total" in rest:
             stats["total"] = count
+        elif rest.startswith("primary"):
+            # 新版 samtools 额外输出 primary / primary mapped / primary duplicates，
+            # 不能覆盖总体计数
+            continue
         elif "secondary" in rest:
             stats["secondary"] = count
         elif "supplementary" in rest:
@@ -348,6 +1280,30 @@ def display_alignment_stats(stats: dict[str, int | float]) -> None:
         table.add_row(t("align_stats_supplementary"), f"{stats['supplementary']:,}")
     if stats.get("duplicates", 0) > 0:
         table.add_row(t("align_stats_duplicates"), f"{stats['duplicates']:,}")
+    paired = stats.get("paired", 0)
+    if paired > 0:
+        properly_paired = stats.get("properly_paired", 0)
+        table.add_row(t("align_stats_paired"), f"{paired:,}")
+        table.add_row(t("align_stats_properly_paired"), f"{properly_paired:,} ({properly_paired / paired:.2%})")
+    if "mapq_mean" in stats:
+        table.add_row(t("align_stats_mapq"), f"{stats['mapq_mean']:.1f} ({stats['mapq30_ratio']:.2%} ≥ 30)")
+    if "mean_depth" in stats:
+        table.add_row(
+            t("align_stats_coverage"),
+            f"{stats['mean_depth']:.2f}x ({stats['coverage_breadth']:.2%})",
+        )
+    if "breadth_10x" in stats:
+        table.add_row(
+            t("align_stats_depth_breadth"),
+            f"{stats['breadth_10x']:.2%} / {stats['breadth_30x']:.2%}",
+        )
+    if "unmapped_fastq_reads" in stats:
+        table.add_row(t("align_stats_unmapped_fastq"), f"{stats['unmapped_fastq_reads']:,}")
+    if stats.get("insert_size_median", 0) > 0:
+        table.add_row(
+            t("align_stats_insert_size"),
+            f"{stats['insert_size_median']:.0f} / {stats['insert_size_mean']:.1f}",
+        )
 
     console.print(table)
 
@@ -368,30 +1324,81 @@ def run_alignment_pipeline(
     reads: Path,
     output: Path | None = None,
     *,
+    reads2: Path | None = None,
     outdir: Path | None = None,
     threads: int = 1,
     resume: bool = False,
     cli_mode: bool = False,
     skip_preflight: bool = False,
+    index_cache: str | Path | None = None,
+    index_cache_max_size: str | int | None = None,
+    shards: int = 1,
+    shard_jobs: int | None = None,
+    chunk_reads: int | None = None,
+    sort_memory: str | int | None = None,
+    sort_tmp: Path | None = None,
+    markdup: bool = False,
+    index_prefix: Path | None = None,
+    tool_versions: dict[str, str] | None = None,
+    ref_details: dict[str, Any] | None = None,
+    output_format: str = "bam",
+    aligner: str = DEFAULT_ALIGNER,
+    aligner_preset: str | None = None,
+    read_group: ReadGroup | None = None,
+    depth_stats: bool = False,
+    stream_stats: bool = False,
+    unmapped_fastq: bool = False,
+    region_stats: bool = False,
+    region_jobs: int | None = None,
+    region_commands: tuple[str, ...] = (),
 ) -> dict[str, int | float] | None:
     """执行完整的比对流程。
 
-    BWA index → BWA mem + SAMtools view/sort → SAMtools index → flagstat
+    index → 比对器 + SAMtools sort → [markdup] → SAMtools index → flagstat → [depth] → [region stats]
 
     Args:
         ref: 参考基因组文件路径。
-        reads: 输入 reads 文件路径。
+        reads: 输入 reads 文件路径（双端测序时为 R1）。
         output: 输出 BAM 文件路径（默认：reads.sorted.bam）。
+        reads2: 双端测序 R2 文件路径，与 R1 作为同一次运行比对。
         threads: 线程数。
+        shards: 拆分 reads 的分片数，大于 1 时并发比对各分片后合并。
+        shard_jobs: 同时运行的分片管道数（默认 min(shards, threads)；定长分块时默认 1），线程数在其间平分。
+        chunk_reads: 按输入顺序每 N 条 reads 切成一个检查点分块，各块排序后带完成标记，resume 时只重跑缺失的分块；与 ``shards`` 互斥。
+        sort_memory: samtools sort 每线程内存（如 ``1G``），默认按可用内存自动估算。
+        sort_tmp: samtools sort 临时文件目录，默认使用运行目录下的 ``tmp/``。
+        markdup: 是否在排序后以 collate/fixmate/sort/markdup 管道标记重复。
+        output_format: 输出格式 ``bam`` 或 ``cram``；CRAM 以 ``ref`` 做参考压缩，缺少 ``.fai`` 时自动生成。
+        aligner: 比对器后端 ``bwa``、``bwa-mem2`` 或 ``minimap2``。
+        aligner_preset: 比对器预设（仅 minimap2，如 ``sr``、``map-hifi``），默认 ``map-ont``。
+        read_group: 比对时经 ``-R`` 写入的 @RG 读组，值记录在 metadata 参数中。
+        depth_stats: 是否流式读取排序后的比对结果，以差分数组计算平均深度与 1x/10x/30x 覆盖广度。
+        stream_stats: 是否在比对器与 sort 之间插入 tee，在 SAM 流上计算 flagstat、MAPQ 与插入片段分布；默认关闭，由 ``samtools flagstat`` 读取排序结果，比对吞吐不受 Python 解析速度限制。
+        unmapped_fastq: 是否在比对管道内把未比对 reads（flag 4）导出为 gzip FASTQ，作为比对步骤的输出参与 resume 校验。
+        region_stats: 是否在建索引后按染色体并行统计 idxstats 与覆盖度。
+        region_jobs: 区域统计的并发进程数（默认等于 threads）。
+        region_commands: 对每条染色体运行的自定义命令模板（支持 ``{region}`` 等占位符），指定时隐含 ``region_stats``。
+        index_prefix: 已用同一比对器构建好的共享索引前缀（多样本调度时使用），指定时跳过索引构建与缓存查询。
+        tool_versions: 预先采集的工具版本，指定时不再逐次探测。
+        ref_details: 预先计算的参考序列描述（含 sha256），指定时不再重复哈希参考序列。
+        index_cache: 共享索引缓存目录（默认读取 BIOFLOW_INDEX_CACHE，未设置则不启用）。
+        index_cache_max_size: 索引缓存磁盘预算（如 ``200G``），超出时按 LRU 淘汰。
         cli_mode: 是否为 CLI 模式。
         skip_preflight: 是否跳过预检。
 
     Returns:
         比对统计字典，失败时返回 None。
+
+    Raises:
+        ValueError: 输出格式、比对器或预设不受支持，或同时指定了 ``shards`` 与 ``chunk_reads``。
     """
+    backend = get_aligner(aligner, aligner_preset)
+    if chunk_reads is not None and (chunk_reads <= 0 or shards > 1):
+        raise ValueError("chunk_reads must be positive and cannot be combined with shards")
+    required_tools = align_required_tools(backend)
     # 1. Preflight 检查
     if not skip_preflight:
-        if not preflight_check(ALIGN_REQUIRED_TOOLS, cli_mode=cli_mode):
+        if not preflight_check(required_tools, cli_mode=cli_mode):
             return None
 
     # Windows 平台提示
@@ -400,17 +1407,89 @@ def run_alignment_pipeline(
 
     layout = create_run_layout("align", reads, outdir=outdir)
     started_at = utc_now_iso()
-    output = resolve_result_path(layout, output, _default_output_bam(reads).name)
-    bai_path = output.with_suffix(output.suffix + ".bai")
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"unsupported output format: {output_format}")
+    output = resolve_result_path(layout, output, _default_output_bam(reads, reads2, output_format).name)
+    # CRAM 依赖参考序列解码，因此各阶段都需显式传入 --reference
+    cram_reference = ref if output_format == "cram" else None
+    output_key = output_format
+    index_key = _ALIGNMENT_INDEX_SUFFIXES[output_format].lstrip(".")
+    bai_path = output.with_suffix(output.suffix + _ALIGNMENT_INDEX_SUFFIXES[output_format])
     flagstat_path = layout.results_dir / f"{output.stem}.flagstat.txt"
+    stream_stats_path = layout.results_dir / f"{output.stem}.alignstats.json"
+    sam_stats = SamStreamStats() if stream_stats else None
+    markdup_stats_path = layout.results_dir / f"{output.stem}.markdup.txt"
+    depth_table_path = layout.results_dir / f"{output.stem}.depth.tsv"
+    depth_summary_path = layout.results_dir / f"{output.stem}.depth.json"
+    unmapped_paths = unmapped_fastq_paths(layout.results_dir, output.stem, paired=reads2 is not None) if unmapped_fastq else {}
+    unmapped_outputs = {key: str(path) for key, path in unmapped_paths.items()}
+    unmapped_counts: dict[str, int] = {}
+    region_stats = region_stats or bool(region_commands)
+    region_jobs = max(1, region_jobs or threads)
+    region_table_path = layout.results_dir / f"{output.stem}.coverage.tsv"
+    region_summary_path = layout.results_dir / f"{output.stem}.regions.json"
     existing_metadata = read_metadata(layout)
-    tool_versions = collect_tool_versions(ALIGN_REQUIRED_TOOLS)
-    input_details = collect_input_details({"ref": ref, "reads": reads})
+    if tool_versions is None:
+        tool_versions = collect_tool_versions(required_tools)
+    run_inputs = {"ref": str(ref), "reads": str(reads)}
+    if reads2 is not None:
+        run_inputs["reads2"] = str(reads2)
+    if ref_details is not None:
+        input_details = {"ref": ref_details, **collect_input_details({k: v for k, v in run_inputs.items() if k != "ref"})}
+    else:
+        input_details = collect_input_details(dict(run_inputs))
     failure_summary = str(existing_metadata.get("failure_summary", ""))
-    steps = init_steps(
-        [ALIGN_STEP_INDEX, ALIGN_STEP_MAP, ALIGN_STEP_BAM_INDEX, ALIGN_STEP_FLAGSTAT],
-        existing_metadata.get("steps"),
-    )
+    previous_inputs = existing_metadata.get("inputs")
+    if resume and isinstance(previous_inputs, dict) and previous_inputs != run_inputs:
+        # 输入（含 R1/R2 组合）变化时，仅索引步骤仍可复用
+        console.print(t("align_resume_inputs_changed"), style="yellow")
+        previous_steps = existing_metadata.get("steps")
+        kept = {ALIGN_STEP_INDEX: previous_steps[ALIGN_STEP_INDEX]} if isinstance(previous_steps, dict) and ALIGN_STEP_INDEX in previous_steps else {}
+        existing_metadata = {**existing_metadata, "steps": kept}
+    previous_parameters = existing_metadata.get("parameters")
+    previous_aligner = previous_parameters.get("aligner") if isinstance(previous_parameters, dict) else None
+    if resume and previous_aligner not in (None, backend.label):
+        # 换用其他比对器后，旧索引与比对结果都不能复用
+        console.print(t("align_resume_aligner_changed", previous=previous_aligner, aligner=backend.label), style="yellow")
+        existing_metadata = {**existing_metadata, "steps": {}}
+    read_group_fields = read_group.to_dict() if read_group is not None else None
+    if resume and isinstance(previous_parameters, dict) and previous_parameters.get("read_group") != read_group_fields:
+        # 读组写在每条比对记录中，变化后只有索引可以复用
+        console.print(t("align_resume_read_group_changed"), style="yellow")
+        previous_steps = existing_metadata.get("steps")
+        kept = {ALIGN_STEP_INDEX: previous_steps[ALIGN_STEP_INDEX]} if isinstance(previous_steps, dict) and ALIGN_STEP_INDEX in previous_steps else {}
+        existing_metadata = {**existing_metadata, "steps": kept}
+    try:
+        cache = resolve_index_cache(index_cache, index_cache_max_size) if index_prefix is None else None
+    except ValueError as exc:
+        console.print(t("align_index_cache_invalid", err=str(exc)), style="yellow")
+        cache = None
+    ref_digest = str(input_details["ref"].get("sha256", ""))
+    # 参考序列旁已有索引时直接使用；否则经缓存链接到运行目录内
+    use_cache = False
+    if index_prefix is None:
+        index_prefix = ref
+        use_cache = cache is not None and bool(ref_digest) and not all(f.exists() for f in backend.index_files(ref))
+        if use_cache:
+            index_prefix = layout.root / "index" / ref.name
+    sort_memory_value = _format_sort_memory(parse_bytes(sort_memory)) if sort_memory else auto_sort_memory(threads)
+    sort_tmp_dir = sort_tmp if sort_tmp is not None else layout.tmp_dir
+    shards = max(1, shards)
+    # 定长分块默认逐块运行、独占全部线程，检查点粒度由块大小决定
+    shard_jobs = max(1, shard_jobs or 1) if chunk_reads else max(1, min(shards, shard_jobs or threads))
+    step_names = [ALIGN_STEP_INDEX, ALIGN_STEP_MAP, ALIGN_STEP_BAM_INDEX, ALIGN_STEP_FLAGSTAT]
+    if markdup:
+        step_names.insert(2, ALIGN_STEP_MARKDUP)
+    if depth_stats:
+        step_names.append(ALIGN_STEP_DEPTH)
+    if region_stats:
+        step_names.append(ALIGN_STEP_REGIONS)
+    if shards > 1:
+        step_names[2:2] = [ALIGN_STEP_SPLIT, *[_shard_step_name(shard) for shard in range(shards)]]
+    elif chunk_reads:
+        # 分块数在拆分后才确定，分块步骤由 _run_sharded_map 插入
+        step_names.insert(2, ALIGN_STEP_SPLIT)
+    steps = init_steps(step_names, existing_metadata.get("steps"))
 
     def persist(status: str, *, completed_at: str | None = None, stats: dict[str, int | float] | None = None) -> None:
         extra: dict[str, object] = {
@@ -426,95 +1505,281 @@ def run_alignment_pipeline(
             layout,
             status=status,
             command="align",
-            parameters={"threads": threads, "resume": resume},
-            inputs={"ref": str(ref), "reads": str(reads)},
-            outputs={"root": str(layout.root), "bam": str(output), "flagstat": str(flagstat_path)},
+            parameters={
+                "threads": threads,
+                "resume": resume,
+                "index_cache": str(cache.root) if cache is not None else None,
+                "shards": shards,
+                "shard_jobs": shard_jobs if shards > 1 or chunk_reads else 1,
+                "chunk_reads": chunk_reads,
+                "sort_memory": sort_memory_value,
+                "sort_tmp": str(sort_tmp_dir),
+                "markdup": markdup,
+                "output_format": output_format,
+                "aligner": backend.label,
+                "read_group": read_group_fields,
+                "depth_stats": depth_stats,
+                "stream_stats": stream_stats,
+                "unmapped_fastq": unmapped_fastq,
+                "region_stats": region_stats,
+                "region_jobs": region_jobs if region_stats else None,
+                "region_commands": list(region_commands),
+            },
+            inputs=run_inputs,
+            outputs={"root": str(layout.root), output_key: str(output), "flagstat": str(flagstat_path), **unmapped_outputs},
             started_at=started_at,
             completed_at=completed_at,
             extra=extra,
         )
 
     persist("running")
+    # 控制台步骤编号在分片决策之后确定：分片/分块模式下拆分、分片比对与合并各占一步
+    sharded = shards > 1 or bool(chunk_reads)
+    label_keys = [
+        "align_step_index",
+        *(("align_step_split", "align_step_map_sort", "align_step_merge") if sharded else ("align_step_map_sort",)),
+        *(("align_step_markdup",) if markdup else ()),
+        "align_step_bam_index",
+        "align_step_flagstat",
+        *(("align_step_depth",) if depth_stats else ()),
+        *(("align_step_regions",) if region_stats else ()),
+    ]
+
+    def announce(key: str, name_key: str | None = None) -> None:
+        step = f"{label_keys.index(key) + 1}/{len(label_keys)}"
+        console.print(_format_step_label(step, name_key or key), style="bold blue")
+    # BAM 在本次运行中被重写时，下游步骤不能复用旧的索引与统计
+    bam_rewritten = False
 
     console.print(
         Panel(t("align_pipeline_start", file=str(reads)), style="bold magenta")
     )
 
-    bwa_index_files = _bwa_index_files(ref)
+    index_files = backend.index_files(index_prefix)
+    index_outputs: dict[str, object] = {"index_files": [str(f) for f in index_files]}
     if resume and step_resume_ready(
         existing_metadata,
         ALIGN_STEP_INDEX,
-        validator=lambda: all(f.exists() for f in bwa_index_files),
+        validator=lambda: all(f.exists() for f in index_files),
         required_outputs=("index_files",),
     ):
-        set_step_state(steps, ALIGN_STEP_INDEX, STEP_SKIPPED, outputs={"index_files": [str(f) for f in bwa_index_files]}, note="reused existing output")
+        set_step_state(steps, ALIGN_STEP_INDEX, STEP_SKIPPED, outputs=index_outputs, note="reused existing output")
         persist("running")
-        console.print(_format_step_label("1/4", "align_step_index_cached"), style="bold blue")
-    elif all(f.exists() for f in bwa_index_files):
-        set_step_state(steps, ALIGN_STEP_INDEX, STEP_SUCCESS, outputs={"index_files": [str(f) for f in bwa_index_files]})
+        announce("align_step_index", "align_step_index_cached")
+    elif not use_cache and all(f.exists() for f in index_files):
+        set_step_state(steps, ALIGN_STEP_INDEX, STEP_SUCCESS, outputs=index_outputs)
+        persist("running")
+        announce("align_step_index", "align_step_index_cached")
+    elif use_cache and cache is not None:
+        announce("align_step_index")
+        set_step_state(steps, ALIGN_STEP_INDEX, STEP_RUNNING)
+        persist("running")
+        cached = cache.fetch_or_build(
+            backend.cache_key,
+            ref_digest,
+            backend.index_suffixes,
+            lambda prefix: run_aligner_index(
+                ref,
+                aligner=backend,
+                prefix=prefix,
+                stdout_log=layout.stdout_log,
+                stderr_log=layout.stderr_log,
+            ),
+            source=ref,
+            link_prefix=index_prefix,
+        )
+        if cached is None:
+            failure_summary = build_failure_summary(ALIGN_STEP_INDEX, stderr_log=layout.stderr_log, fallback=f"{backend.name} index failed")
+            set_step_state(steps, ALIGN_STEP_INDEX, STEP_FAILED, outputs=index_outputs, error=failure_summary)
+            persist("failed", completed_at=utc_now_iso())
+            return None
+        if cached.hit:
+            console.print(t("align_index_cache_hit", aligner=backend.label, path=str(cached.entry_dir)), style="cyan")
+        index_outputs.update({
+            "cache_entry": str(cached.entry_dir),
+            "cache_hit": cached.hit,
+            "link_mode": cached.link_mode,
+        })
+        set_step_state(steps, ALIGN_STEP_INDEX, STEP_SUCCESS, outputs=index_outputs)
         persist("running")
-        console.print(_format_step_label("1/4", "align_step_index_cached"), style="bold blue")
     else:
-        console.print(_format_step_label("1/4", "align_step_index"), style="bold blue")
+        announce("align_step_index")
         set_step_state(steps, ALIGN_STEP_INDEX, STEP_RUNNING)
         persist("running")
-        if not _run_bwa_index(ref, stdout_log=layout.stdout_log, stderr_log=layout.stderr_log):
-            failure_summary = build_failure_summary(ALIGN_STEP_INDEX, stderr_log=layout.stderr_log, fallback="BWA index failed")
-            set_step_state(steps, ALIGN_STEP_INDEX, STEP_FAILED, outputs={"index_files": [str(f) for f in bwa_index_files]}, error=failure_summary)
+        if not run_aligner_index(ref, aligner=backend, stdout_log=layout.stdout_log, stderr_log=layout.stderr_log):
+            failure_summary = build_failure_summary(ALIGN_STEP_INDEX, stderr_log=layout.stderr_log, fallback=f"{backend.name} index failed")
+            set_step_state(steps, ALIGN_STEP_INDEX, STEP_FAILED, outputs=index_outputs, error=failure_summary)
             persist("failed", completed_at=utc_now_iso())
             return None
-        set_step_state(steps, ALIGN_STEP_INDEX, STEP_SUCCESS, outputs={"index_files": [str(f) for f in bwa_index_files]})
+        set_step_state(steps, ALIGN_STEP_INDEX, STEP_SUCCESS, outputs=index_outputs)
         persist("running")
 
-    console.print(_format_step_label("2/4", "align_step_map_sort"), style="bold blue")
     if resume and step_resume_ready(
         existing_metadata,
         ALIGN_STEP_MAP,
-        validator=lambda: _is_nonempty_file(output),
-        required_outputs=("bam",),
+        validator=lambda: _alignment_output_ready(output, output_format)
+        and all(fastq_gz_ready(path) for path in unmapped_paths.values()),
+        required_outputs=(output_key, *unmapped_paths),
     ):
-        set_step_state(steps, ALIGN_STEP_MAP, STEP_SKIPPED, outputs={"bam": str(output)}, note="reused existing output")
+        announce("align_step_map_sort")
+        skipped_outputs: dict[str, object] = {output_key: str(output), **unmapped_outputs}
+        if unmapped_paths:
+            previous = existing_metadata["steps"][ALIGN_STEP_MAP].get("outputs", {})
+            unmapped_counts = dict(previous.get("unmapped_records") or {})
+            skipped_outputs["unmapped_records"] = unmapped_counts
+        set_step_state(steps, ALIGN_STEP_MAP, STEP_SKIPPED, outputs=skipped_outputs, note="reused existing output")
         persist("running")
     else:
+        if not sharded:
+            announce("align_step_map_sort")
         set_step_state(steps, ALIGN_STEP_MAP, STEP_RUNNING)
         persist("running")
-        if not _run_bwa_mem_pipe_sort(
-            ref,
-            reads,
-            output,
-            threads=threads,
-            stdout_log=layout.stdout_log,
-            stderr_log=layout.stderr_log,
-        ):
+        with _PipelineMonitor(aligner=backend) as monitor:
+            if cram_reference is not None and not _ensure_fasta_index(
+                cram_reference,
+                stdout_log=layout.stdout_log,
+                stderr_log=layout.stderr_log,
+            ):
+                mapped = False
+            elif sharded:
+                mapped = _run_sharded_map(
+                    index_prefix,
+                    reads,
+                    output,
+                    reads2=reads2,
+                    aligner=backend,
+                    read_group=read_group,
+                    layout=layout,
+                    steps=steps,
+                    existing_metadata=existing_metadata,
+                    resume=resume,
+                    threads=threads,
+                    shards=shards,
+                    shard_jobs=shard_jobs,
+                    persist=lambda: persist("running"),
+                    chunk_records=chunk_reads,
+                    sort_memory=sort_memory_value,
+                    sort_tmp_dir=sort_tmp,
+                    stream_stats=sam_stats,
+                    unmapped_paths=unmapped_paths,
+                    unmapped_counts=unmapped_counts,
+                    reference=cram_reference,
+                    monitor=monitor,
+                    announce=announce,
+                )
+            else:
+                unmapped_writer = UnmappedFastqWriter(unmapped_paths) if unmapped_paths else None
+                mapped = _run_map_pipe_sort(
+                    index_prefix,
+                    reads,
+                    output,
+                    reads2=reads2,
+                    aligner=backend,
+                    read_group=read_group,
+                    threads=threads,
+                    sort_memory=sort_memory_value,
+                    tmp_prefix=sort_tmp_dir / f"{output.stem}.sort",
+                    stream_stats=sam_stats,
+                    unmapped_writer=unmapped_writer,
+                    reference=cram_reference,
+                    monitor=monitor,
+                    stdout_log=layout.stdout_log,
+                    stderr_log=layout.stderr_log,
+                )
+                if mapped and unmapped_writer is not None:
+                    unmapped_counts = dict(unmapped_writer.counts)
+        map_outputs: dict[str, object] = {output_key: str(output), **unmapped_outputs, "throughput": monitor.summary()}
+        if unmapped_paths:
+            map_outputs["unmapped_records"] = unmapped_counts
+        if not mapped:
             failure_summary = build_failure_summary(ALIGN_STEP_MAP, stderr_log=layout.stderr_log, fallback="Alignment failed")
-            set_step_state(steps, ALIGN_STEP_MAP, STEP_FAILED, outputs={"bam": str(output)}, error=failure_summary)
+            set_step_state(steps, ALIGN_STEP_MAP, STEP_FAILED, outputs=map_outputs, error=failure_summary)
             persist("failed", completed_at=utc_now_iso())
             return None
-        set_step_state(steps, ALIGN_STEP_MAP, STEP_SUCCESS, outputs={"bam": str(output)})
+        set_step_state(steps, ALIGN_STEP_MAP, STEP_SUCCESS, outputs=map_outputs)
         persist("running")
+        bam_rewritten = True
+        if unmapped_paths:
+            console.print(
+                t("align_unmapped_written", count=sum(unmapped_counts.values()), path=str(layout.results_dir)),
+                style="cyan",
+            )
 
-    console.print(_format_step_label("3/4", "align_step_bam_index"), style="bold blue")
-    if resume and step_resume_ready(
+    if markdup:
+        announce("align_step_markdup")
+        markdup_outputs = {output_key: str(output), "markdup_stats": str(markdup_stats_path)}
+        if resume and not bam_rewritten and step_resume_ready(
+            existing_metadata,
+            ALIGN_STEP_MARKDUP,
+            validator=lambda: _alignment_output_ready(output, output_format) and _is_nonempty_file(markdup_stats_path),
+            required_outputs=(output_key, "markdup_stats"),
+        ):
+            set_step_state(steps, ALIGN_STEP_MARKDUP, STEP_SKIPPED, outputs=markdup_outputs, note="reused existing output")
+            persist("running")
+        else:
+            set_step_state(steps, ALIGN_STEP_MARKDUP, STEP_RUNNING)
+            persist("running")
+            markdup_bam = layout.tmp_dir / f"{output.stem}.markdup.{output_format}"
+            if not _run_markdup_pipe(
+                output,
+                markdup_bam,
+                threads=threads,
+                sort_memory=sort_memory_value,
+                tmp_prefix=sort_tmp_dir / output.stem,
+                stats_path=markdup_stats_path,
+                reference=cram_reference,
+                stderr_log=layout.stderr_log,
+            ):
+                markdup_bam.unlink(missing_ok=True)
+                failure_summary = build_failure_summary(ALIGN_STEP_MARKDUP, stderr_log=layout.stderr_log, fallback="Duplicate marking failed")
+                set_step_state(steps, ALIGN_STEP_MARKDUP, STEP_FAILED, outputs=markdup_outputs, error=failure_summary)
+                persist("failed", completed_at=utc_now_iso())
+                return None
+            # 仅在整条管道成功后替换排序 BAM，失败时 resume 仍可从排序结果重试
+            shutil.move(str(markdup_bam), str(output))
+            if sam_stats is not None and sam_stats.complete:
+                duplicates = parse_markdup_stats(markdup_stats_path.read_text(encoding="utf-8"))
+                sam_stats.passed["duplicates"] = duplicates["duplicates"]
+                sam_stats.passed["primary_duplicates"] = duplicates["primary_duplicates"]
+            set_step_state(steps, ALIGN_STEP_MARKDUP, STEP_SUCCESS, outputs=markdup_outputs)
+            persist("running")
+            bam_rewritten = True
+
+    announce("align_step_bam_index")
+    if resume and not bam_rewritten and step_resume_ready(
         existing_metadata,
         ALIGN_STEP_BAM_INDEX,
         validator=lambda: _is_nonempty_file(bai_path),
-        required_outputs=("bai",),
+        required_outputs=(index_key,),
     ):
-        set_step_state(steps, ALIGN_STEP_BAM_INDEX, STEP_SKIPPED, outputs={"bai": str(bai_path)}, note="reused existing output")
+        set_step_state(steps, ALIGN_STEP_BAM_INDEX, STEP_SKIPPED, outputs={index_key: str(bai_path)}, note="reused existing output")
         persist("running")
     else:
         set_step_state(steps, ALIGN_STEP_BAM_INDEX, STEP_RUNNING)
         persist("running")
         if not _run_samtools_index(output, stdout_log=layout.stdout_log, stderr_log=layout.stderr_log):
             failure_summary = build_failure_summary(ALIGN_STEP_BAM_INDEX, stderr_log=layout.stderr_log, fallback="BAM indexing failed")
-            set_step_state(steps, ALIGN_STEP_BAM_INDEX, STEP_FAILED, outputs={"bai": str(bai_path)}, error=failure_summary)
+            set_step_state(steps, ALIGN_STEP_BAM_INDEX, STEP_FAILED, outputs={index_key: str(bai_path)}, error=failure_summary)
             persist("failed", completed_at=utc_now_iso())
             return None
-        set_step_state(steps, ALIGN_STEP_BAM_INDEX, STEP_SUCCESS, outputs={"bai": str(bai_path)})
+        set_step_state(steps, ALIGN_STEP_BAM_INDEX, STEP_SUCCESS, outputs={index_key: str(bai_path)})
         persist("running")
 
-    console.print(_format_step_label("4/4", "align_step_flagstat"), style="bold blue")
-    if resume and step_resume_ready(
+    announce("align_step_flagstat")
+    if sam_stats is not None and sam_stats.complete:
+        # 比对时已在 SAM 流上完成统计，无需再次读取排序后的 BAM
+        flagstat_text = sam_stats.flagstat_text()
+        flagstat_path.write_text(flagstat_text, encoding="utf-8")
+        sam_stats.write_json(stream_stats_path)
+        set_step_state(
+            steps,
+            ALIGN_STEP_FLAGSTAT,
+            STEP_SUCCESS,
+            outputs={"flagstat": str(flagstat_path), "stream_stats": str(stream_stats_path)},
+            note="computed from SAM stream",
+        )
+        persist("running")
+    elif resume and not bam_rewritten and step_resume_ready(
         existing_metadata,
         ALIGN_STEP_FLAGSTAT,
         validator=lambda: _flagstat_ready(flagstat_path),
@@ -526,7 +1791,12 @@ def run_alignment_pipeline(
     else:
         set_step_state(steps, ALIGN_STEP_FLAGSTAT, STEP_RUNNING)
         persist("running")
-        flagstat_text = _run_samtools_flagstat(output, stdout_log=layout.stdout_log, stderr_log=layout.stderr_log)
+        flagstat_text = _run_samtools_flagstat(
+            output,
+            reference=cram_reference,
+            stdout_log=layout.stdout_log,
+            stderr_log=layout.stderr_log,
+        )
         if flagstat_text is None:
             failure_summary = build_failure_summary(ALIGN_STEP_FLAGSTAT, stderr_log=layout.stderr_log, fallback="flagstat failed")
             set_step_state(steps, ALIGN_STEP_FLAGSTAT, STEP_FAILED, outputs={"flagstat": str(flagstat_path)}, error=failure_summary)
@@ -537,6 +1807,127 @@ def run_alignment_pipeline(
         persist("running")
 
     stats = parse_flagstat(flagstat_text)
+    if sam_stats is not None and sam_stats.complete:
+        mapq = sam_stats.mapq_summary()
+        insert_size = sam_stats.insert_size_summary()
+        stats.update({
+            "mapq_mean": round(mapq["mean"], 2),
+            "mapq30_ratio": round(mapq["q30_ratio"], 6),
+            "insert_size_median": insert_size["median"],
+            "insert_size_mean": round(insert_size["mean"], 2),
+        })
+    if unmapped_paths:
+        stats["unmapped_fastq_reads"] = sum(int(count) for count in unmapped_counts.values())
+
+    if depth_stats:
+        announce("align_step_depth")
+        depth_outputs = {"depth": str(depth_table_path), "depth_summary": str(depth_summary_path)}
+        if resume and not bam_rewritten and step_resume_ready(
+            existing_metadata,
+            ALIGN_STEP_DEPTH,
+            validator=lambda: _is_nonempty_file(depth_table_path) and _json_file_ready(depth_summary_path),
+            required_outputs=("depth", "depth_summary"),
+        ):
+            depth_summary = json.loads(depth_summary_path.read_text(encoding="utf-8"))
+            set_step_state(steps, ALIGN_STEP_DEPTH, STEP_SKIPPED, outputs=depth_outputs, note="reused existing output")
+            persist("running")
+        else:
+            set_step_state(steps, ALIGN_STEP_DEPTH, STEP_RUNNING)
+            persist("running")
+            console.print(f"  → {t('align_depth_stats', engine=depth_engine())}", style="cyan")
+            try:
+                depth_summary = run_depth_stats(
+                    output,
+                    table_path=depth_table_path,
+                    summary_path=depth_summary_path,
+                    reference=cram_reference,
+                    stderr_log=layout.stderr_log,
+                )
+            except (subprocess.CalledProcessError, FileNotFoundError, ValueError) as exc:
+                append_log(layout.stderr_log, str(exc))
+                failure_summary = build_failure_summary(ALIGN_STEP_DEPTH, stderr_log=layout.stderr_log, fallback="depth stats failed")
+                set_step_state(steps, ALIGN_STEP_DEPTH, STEP_FAILED, outputs=depth_outputs, error=failure_summary)
+                persist("failed", completed_at=utc_now_iso())
+                _print_alignment_failure(t("align_step_depth"), failure_summary)
+                return None
+            set_step_state(
+                steps,
+                ALIGN_STEP_DEPTH,
+                STEP_SUCCESS,
+                outputs=depth_outputs,
+                note=f"{depth_summary.get('engine', 'python')} engine",
+            )
+            persist("running")
+        stats.update({
+            "covered_bases": int(depth_summary.get("covered_1x", 0)),
+            "coverage_breadth": float(depth_summary.get("breadth_1x", 0.0)),
+            "mean_depth": float(depth_summary.get("mean_depth", 0.0)),
+            "breadth_10x": float(depth_summary.get("breadth_10x", 0.0)),
+            "breadth_30x": float(depth_summary.get("breadth_30x", 0.0)),
+        })
+
+    if region_stats:
+        announce("align_step_regions")
+        region_outputs = {"coverage": str(region_table_path), "region_summary": str(region_summary_path)}
+        if resume and not bam_rewritten and step_resume_ready(
+            existing_metadata,
+            ALIGN_STEP_REGIONS,
+            validator=lambda: _is_nonempty_file(region_table_path) and _json_file_ready(region_summary_path),
+            required_outputs=("coverage", "region_summary"),
+        ):
+            region_summary = json.loads(region_summary_path.read_text(encoding="utf-8"))
+            set_step_state(steps, ALIGN_STEP_REGIONS, STEP_SKIPPED, outputs=region_outputs, note="reused existing output")
+            persist("running")
+        else:
+            set_step_state(steps, ALIGN_STEP_REGIONS, STEP_RUNNING)
+            persist("running")
+            console.print(f"  → {t('align_region_stats', jobs=region_jobs)}", style="cyan")
+            try:
+                region_summary = run_region_stats(
+                    output,
+                    table_path=region_table_path,
+                    summary_path=region_summary_path,
+                    jobs=region_jobs,
+                    reference=cram_reference,
+                    commands=region_commands,
+                    command_dir=layout.results_dir / "regions",
+                )
+            except (subprocess.CalledProcessError, FileNotFoundError) as exc:
+                append_log(layout.stderr_log, getattr(exc, "stderr", "") or str(exc))
+                failure_summary = build_failure_summary(ALIGN_STEP_REGIONS, stderr_log=layout.stderr_log, fallback="region stats failed")
+                set_step_state(steps, ALIGN_STEP_REGIONS, STEP_FAILED, outputs=region_outputs, error=failure_summary)
+                persist("failed", completed_at=utc_now_iso())
+                _print_alignment_failure(t("align_step_regions"), failure_summary)
+                return None
+            failed_contigs = list(region_summary.get("failed_contigs", []))
+            if failed_contigs:
+                # 缺少部分染色体的汇总不能作为成功结果被 resume 复用
+                for contig, error in (region_summary.get("contig_errors") or {}).items():
+                    append_log(layout.stderr_log, f"samtools coverage {contig}: {error}")
+                failure_summary = f"samtools coverage failed for {len(failed_contigs)} contig(s): {', '.join(failed_contigs[:5])}"
+                set_step_state(
+                    steps,
+                    ALIGN_STEP_REGIONS,
+                    STEP_FAILED,
+                    outputs={**region_outputs, "failed_contigs": failed_contigs},
+                    error=failure_summary,
+                )
+                persist("failed", completed_at=utc_now_iso())
+                _print_alignment_failure(t("align_step_regions"), failure_summary)
+                return None
+            set_step_state(steps, ALIGN_STEP_REGIONS, STEP_SUCCESS, outputs=region_outputs)
+            persist("running")
+        region_values = {
+            "covered_bases": int(region_summary.get("covered_bases", 0)),
+            "coverage_breadth": float(region_summary.get("breadth", 0.0)),
+            "mean_depth": float(region_summary.get("mean_depth", 0.0)),
+        }
+        stats.update({f"region_{key}": value for key, value in region_values.items()})
+        stats["contigs_with_reads"] = int(region_summary.get("contigs_with_reads", 0))
+        # samtools coverage 与深度引擎的 MAPQ/flag 过滤不同，深度引擎运行时不覆盖其结果
+        if not depth_stats:
+            stats.update(region_values)
+
     display_alignment_stats(stats)
     failure_summary = ""
     persist("success", completed_at=utc_now_iso(), stats=stats)
@@ -584,8 +1975,19 @@ def align_menu() -> None:
         input(t("press_enter"))
         return
 
+    # 双端测序 R2（可留空）
+    try:
+        reads2_path = questionary.path(t("align_input2_prompt"), default="").ask()
+    except KeyboardInterrupt:
+        return
+    reads2 = Path(reads2_path) if reads2_path else None
+    if reads2 is not None and not reads2.exists():
+        console.print(t("seq_file_not_found", path=str(reads2)), style="bold red")
+        input(t("press_enter"))
+        return
+
     # 输出 BAM 路径
-    default_output = _default_output_bam(reads)
+    default_output = _default_output_bam(reads, reads2)
     try:
         output_path = questionary.path(
             t("align_output_prompt"), default=str(default_output)
@@ -619,6 +2021,7 @@ def align_menu() -> None:
         ref,
         reads,
         output=Path(output_path),
+        reads2=reads2,
         outdir=run_root,
         threads=threads,
         resume=resume,
@@ -2,15 +2,22 @@
 
 from __future__ import annotations
 
+import csv
+import hashlib
+import heapq
+import json
+import logging
 import os
 import re
+import shutil
 import tempfile
 import time
-from collections.abc import Iterator
+from collections.abc import Callable, Iterator
 from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from contextlib import nullcontext
+from dataclasses import dataclass
 from pathlib import Path
-from typing import TextIO
+from typing import Any, BinaryIO, TextIO
 
 import questionary
 from rich.console import Console
@@ -19,11 +26,34 @@ from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn, TimeEl
 from rich.table import Table
 
 from bioflow.i18n import t
+from bioflow.resources import available_memory_bytes, cpu_budget, format_bytes
 
 console = Console()
+logger = logging.getLogger("bioflow")
 
 SUPPORTED_FORMATS = ("fasta", "fastq")
 
+WORKERS_AUTO = "auto"
+# 单个工作进程的基础内存开销（解释器 + 模块导入）
+_WORKER_BASE_MEMORY = 64 * 1024 * 1024
+# FASTA 最坏情况下整条记录驻留内存：行列表 + 拼接串 + 大写副本 + 换行输出
+_FASTA_MEMORY_FACTOR = 4
+# FASTQ 按记录流式处理，仅需为超长读段预留少量缓冲
+_FASTQ_RECORD_MEMORY = 8 * 1024 * 1024
+# 自动模式仅使用可用内存的该比例，为主进程与系统预留余量
+_AUTO_MEMORY_FRACTION = 0.8
+# 大文件按记录边界切分的最小分片字节数
+_SHARD_MIN_BYTES = 64 * 1024 * 1024
+_FORMAT_SUFFIXES = {
+    ".fa": "fasta",
+    ".fasta": "fasta",
+    ".fna": "fasta",
+    ".ffn": "fasta",
+    ".faa": "fasta",
+    ".fq": "fastq",
+    ".fastq": "fastq",
+}
+
 
 def _parse_fasta(text: str) -> list[tuple[str, str]]:
     """解析 FASTA 文本，返回 (header, sequence) 列表。"""
@@ -251,6 +281,12 @@ def _update_fastq_stats(stats: dict[str, float], qual: str) -> None:
             stats["q30_bases"] += 1
 
 
+def _merge_fastq_stats(target: dict[str, float], source: dict[str, float]) -> None:
+    """将一份原始质量计数合并到目标容器。"""
+    for key, value in source.items():
+        target[key] += value
+
+
 def _finalize_fastq_stats(stats: dict[str, float]) -> dict[str, float]:
     """将流式质量统计转换为对外结构。"""
     total_bases = stats["total_bases"]
@@ -265,18 +301,68 @@ def _finalize_fastq_stats(stats: dict[str, float]) -> dict[str, float]:
     }
 
 
+@dataclass
+class FastaIndexEntry:
+    """规范化 FASTA 中一条序列的 ``.fai`` 字段及序列 MD5（供 ``.dict`` 的 M5 标签使用）。"""
+
+    name: str
+    length: int
+    offset: int
+    line_bases: int
+    line_width: int
+    md5: str
+
+    def fai_line(self) -> str:
+        """返回与 ``samtools faidx`` 一致的制表符分隔行。"""
+        return f"{self.name}\t{self.length}\t{self.offset}\t{self.line_bases}\t{self.line_width}\n"
+
+
+class _DigestWriter:
+    """写入文本的同时以 UTF-8 字节更新哈希，使校验和与输出在同一遍中完成。"""
+
+    def __init__(self, handle: TextIO, digest: Any) -> None:
+        self._handle = handle
+        self._digest = digest
+
+    def write(self, text: str) -> int:
+        self._digest.update(text.encode("utf-8"))
+        return self._handle.write(text)
+
+
 def _stream_format_fasta(
     src_handle: TextIO,
     dst_handle: TextIO,
     width: int,
+    fasta_index: list[FastaIndexEntry] | None = None,
 ) -> int:
-    """流式格式化 FASTA 并返回记录数。"""
+    """流式格式化 FASTA 并返回记录数。
+
+    传入 ``fasta_index`` 时按写出的字节偏移为每条记录追加 ``FastaIndexEntry``，
+    无需再读取输出文件即可生成 ``.fai``。
+    """
     count = 0
+    position = 0
     for header, seq in _iter_fasta_records(src_handle):
+        seq_upper = seq.upper()
+        block = _wrap_sequence(seq_upper, width) + "\n"
         dst_handle.write(f"{header}\n")
-        dst_handle.write(_wrap_sequence(seq.upper(), width))
-        dst_handle.write("\n")
+        dst_handle.write(block)
         count += 1
+        if fasta_index is None:
+            continue
+        header_bytes = len(header.encode("utf-8")) + 1
+        line_bases = min(len(seq_upper), width)
+        fasta_index.append(
+            FastaIndexEntry(
+                name=header[1:].split(maxsplit=1)[0] if header[1:].strip() else "",
+                length=len(seq_upper),
+                offset=position + header_bytes,
+                line_bases=line_bases,
+                line_width=line_bases + 1,
+                md5=hashlib.md5(seq_upper.encode("utf-8")).hexdigest(),
+            )
+        )
+        position += header_bytes + (len(block) if block.isascii() else len(block.encode("utf-8")))
     return count
 
 
@@ -284,10 +370,15 @@ def _stream_format_fastq(
     src_handle: TextIO,
     dst_handle: TextIO,
     width: int,
+    stats: dict[str, float] | None = None,
 ) -> tuple[int, dict[str, float]]:
-    """流式格式化 FASTQ 并返回记录数与质量统计。"""
+    """流式格式化 FASTQ 并返回记录数与质量统计。
+
+    传入 ``stats`` 时在其上原地累加原始计数，便于跨分片合并。
+    """
     count = 0
-    stats = _create_fastq_stats()
+    if stats is None:
+        stats = _create_fastq_stats()
     for header, seq, plus, qual in _iter_fastq_records(src_handle):
         seq_upper = seq.upper()
         dst_handle.write(f"{header}\n")
@@ -304,8 +395,18 @@ def format_sequence_file(
     input_path: Path,
     output_path: Path,
     width: int = 80,
+    *,
+    raw_stats: dict[str, float] | None = None,
+    fasta_index: list[FastaIndexEntry] | None = None,
+    digest: Any = None,
 ) -> tuple[str, int, dict[str, float] | None]:
-    """流式格式化单个序列文件并写入目标路径。"""
+    """流式格式化单个序列文件并写入目标路径。
+
+    传入 ``raw_stats`` 时 FASTQ 原始质量计数会原地累加到该容器中，
+    供批处理跨文件、跨进程合并而无需再次读取数据。
+    传入 ``fasta_index`` 时收集输出的 ``.fai`` 条目（仅接受 FASTA 输入），
+    传入 ``digest``（如 ``hashlib.sha256()``）时在写出的同时计算输出校验和。
+    """
     output_path.parent.mkdir(parents=True, exist_ok=True)
     temp_path: Path | None = None
 
@@ -313,6 +414,8 @@ def format_sequence_file(
         seq_format = _detect_sequence_format_in_handle(src_handle)
         if seq_format not in SUPPORTED_FORMATS:
             raise ValueError("invalid_format")
+        if fasta_index is not None and seq_format != "fasta":
+            raise ValueError("invalid_format")
 
         with tempfile.NamedTemporaryFile(
             "w",
@@ -323,12 +426,13 @@ def format_sequence_file(
             delete=False,
         ) as tmp_handle:
             temp_path = Path(tmp_handle.name)
+            writer: Any = tmp_handle if digest is None else _DigestWriter(tmp_handle, digest)
             try:
                 if seq_format == "fasta":
-                    count = _stream_format_fasta(src_handle, tmp_handle, width)
+                    count = _stream_format_fasta(src_handle, writer, width, fasta_index)
                     stats = None
                 else:
-                    count, stats = _stream_format_fastq(src_handle, tmp_handle, width)
+                    count, stats = _stream_format_fastq(src_handle, writer, width, raw_stats)
             except Exception:
                 tmp_handle.close()
                 temp_path.unlink(missing_ok=True)
@@ -400,50 +504,96 @@ def seq_menu() -> None:
     input(t("press_enter"))
 
 
-def _make_unique_output_path(
-    file_path: Path,
-    input_dir: Path,
-    output_dir: Path,
-    recursive: bool,
-    seen: set[str],
-) -> Path:
-    """生成唯一的输出文件路径，递归模式下加入相对路径前缀避免冲突。"""
-    if recursive:
+BATCH_PATH_MAP_NAME = "batch_path_map.tsv"
+
+
+def _base_output_name(file_path: Path, input_dir: Path, recursive: bool) -> str:
+    """生成基础输出文件名，递归模式下加入相对路径前缀便于溯源。"""
+    name = f"{file_path.stem}.formatted{file_path.suffix}"
+    if not recursive:
+        return name
+    try:
+        rel = file_path.relative_to(input_dir)
+    except ValueError:
+        return name
+    if rel.parent == Path("."):
+        return name
+    prefix = str(rel.parent).replace("/", "__").replace("\\", "__")
+    return f"{prefix}__{name}"
+
+
+class OutputPathMapper:
+    """批处理输出路径映射。
+
+    每个基础名维护一个序号计数器，冲突时直接从计数器取下一个候选名，
+    避免在已用名集合中从 ``_1`` 起逐个重试带来的 O(k²) 次查询；输入文件按排序顺序映射，因此
+    同一输入目录多次运行得到相同的输出名，可通过映射文件对比与增量重跑。
+    """
+
+    def __init__(self, input_dir: Path, output_dir: Path, recursive: bool) -> None:
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.recursive = recursive
+        self._counters: dict[str, int] = {}
+        self._used: set[str] = set()
+        self.entries: list[tuple[str, str]] = []
+
+    def map(self, file_path: Path) -> Path:
+        """为输入文件分配唯一输出路径并登记映射。"""
+        base_name = _base_output_name(file_path, self.input_dir, self.recursive)
+        name = base_name
+        if name in self._used:
+            stem, dot, suffix = base_name.rpartition(".")
+            if not dot:
+                stem, suffix = base_name, ""
+            start = self._counters.get(base_name, 1)
+            # 候选名互不相同，至多 len(_used) + 1 个候选中必有一个未被占用；
+            # 仅当其他输入恰好占用了 ``<stem>_<n>`` 这类名称时才会多试几次
+            for counter in range(start, start + len(self._used) + 1):
+                name = f"{stem}_{counter}.{suffix}" if suffix else f"{stem}_{counter}"
+                if name not in self._used:
+                    break
+            self._counters[base_name] = counter + 1
+        self._used.add(name)
+
         try:
-            rel = file_path.relative_to(input_dir)
-            if rel.parent != Path("."):
-                prefix = str(rel.parent).replace("/", "__").replace("\\", "__")
-                name = f"{prefix}__{file_path.stem}.formatted{file_path.suffix}"
-            else:
-                name = f"{file_path.stem}.formatted{file_path.suffix}"
+            source = file_path.relative_to(self.input_dir).as_posix()
         except ValueError:
-            name = f"{file_path.stem}.formatted{file_path.suffix}"
-    else:
-        name = f"{file_path.stem}.formatted{file_path.suffix}"
-
-    # 冲突检测：追加序号
-    base_name = name
-    counter = 1
-    while name in seen:
-        stem, suffix = base_name.rsplit(".", 1) if "." in base_name else (base_name, "")
-        name = f"{stem}_{counter}.{suffix}" if suffix else f"{stem}_{counter}"
-        counter += 1
-    seen.add(name)
-    return output_dir / name
+            source = str(file_path)
+        self.entries.append((source, name))
+        return self.output_dir / name
+
+    def write(self, path: Path | None = None) -> Path:
+        """原子写出 `source -> output` 映射文件（TSV）。"""
+        target = path or self.output_dir / BATCH_PATH_MAP_NAME
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = target.with_name(f".{target.name}.tmp")
+        with temp_path.open("w", encoding="utf-8", newline="") as handle:
+            handle.write("source\toutput\n")
+            for source, output in self.entries:
+                handle.write(f"{source}\t{output}\n")
+        temp_path.replace(target)
+        return target
 
 
 def _process_single_file(
     file_path: Path,
     output_path: Path,
     width: int,
-) -> tuple[str, int]:
-    """处理单个序列文件，返回 (格式化后的格式类型, 序列数)。
+) -> tuple[str, int, dict[str, float] | None]:
+    """处理单个序列文件，返回 (格式化后的格式类型, 序列数, FASTQ 原始质量计数)。
 
     Raises:
         ValueError: 格式不支持或解析失败。
     """
+    raw_stats = _create_fastq_stats()
     try:
-        seq_format, count, _stats = format_sequence_file(file_path, output_path, width)
+        seq_format, count, _stats = format_sequence_file(
+            file_path,
+            output_path,
+            width,
+            raw_stats=raw_stats,
+        )
     except ValueError as exc:
         if str(exc) == "invalid_format":
             with file_path.open("r", encoding="utf-8") as handle:
@@ -451,7 +601,7 @@ def _process_single_file(
             if detected not in SUPPORTED_FORMATS:
                 raise ValueError("unsupported_format") from exc
         raise ValueError("parse_error") from exc
-    return seq_format, count
+    return seq_format, count, raw_stats if seq_format == "fastq" else None
 
 
 def _run_batch_job(
@@ -466,13 +616,14 @@ def _run_batch_job(
     output_path = Path(output_path_str)
 
     try:
-        _seq_format, count = _process_single_file(file_path, output_path, width)
+        _seq_format, count, raw_stats = _process_single_file(file_path, output_path, width)
         return {
             "index": index,
             "kind": "success",
             "file": file_path.name,
             "sequences": count,
             "output": output_path.name,
+            "stats": raw_stats,
             "time": time.time() - start_time,
         }
     except ValueError as exc:
@@ -502,28 +653,394 @@ def _run_batch_job(
         }
 
 
-def _append_batch_result(results: dict[str, list[dict]], item: dict[str, int | float | str]) -> None:
-    """将单文件结果写入聚合结构。"""
-    kind = item.pop("kind")
-    item.pop("index", None)
-    if kind == "success":
-        results["success"].append(item)
-    elif kind == "skipped":
-        results["skipped"].append(item)
-    else:
-        results["failed"].append(item)
+class _ByteRangeReader:
+    """按字节区间逐行读取文本，供分片任务复用流式解析器。"""
+
+    def __init__(self, handle: BinaryIO, start: int, end: int) -> None:
+        self._handle = handle
+        self._end = end
+        self._pos = start
+        handle.seek(start)
+
+    def readline(self) -> str:
+        if self._pos >= self._end:
+            return ""
+        line = self._handle.readline()
+        self._pos += len(line)
+        return line.decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
 
 
-def _normalize_workers(workers: int | None) -> int:
-    """规范化并发数，非法值回退到 1。"""
+def _find_record_start(handle: BinaryIO, offset: int, seq_format: str) -> int:
+    """返回 offset 处或之后第一条完整记录的起始字节位置，找不到时返回文件末尾。
+
+    FASTQ 质量行也可能以 ``@`` 开头，因此要求候选位置之后依次出现
+    序列行、``+`` 行以及等长的质量行。
+    """
+    if offset <= 0:
+        return 0
+    handle.seek(offset - 1)
+    handle.readline()
+    while True:
+        pos = handle.tell()
+        line = handle.readline()
+        if not line:
+            return pos
+        if seq_format == "fasta":
+            if line.startswith(b">"):
+                return pos
+            continue
+        if not line.startswith(b"@"):
+            continue
+        seq_line = handle.readline().strip()
+        plus_line = handle.readline()
+        qual_line = handle.readline().strip()
+        if plus_line.startswith(b"+") and seq_line and len(seq_line) == len(qual_line):
+            return pos
+        handle.seek(pos)
+        handle.readline()
+
+
+def _plan_shards(file_path: Path, seq_format: str, shard_bytes: int) -> list[tuple[int, int]]:
+    """将文件切分为按记录边界对齐的字节区间列表。"""
+    size = file_path.stat().st_size
+    if shard_bytes <= 0 or size <= shard_bytes:
+        return [(0, size)]
+
+    boundaries = [0]
+    with file_path.open("rb") as handle:
+        for offset in range(shard_bytes, size, shard_bytes):
+            start = _find_record_start(handle, max(offset, boundaries[-1]), seq_format)
+            if start >= size:
+                break
+            if start > boundaries[-1]:
+                boundaries.append(start)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _shard_part_path(output_path: Path, shard: int) -> Path:
+    """返回分片临时输出路径（隐藏文件，位于目标目录中）。"""
+    return output_path.with_name(f".{output_path.name}.part{shard:05d}.tmp")
+
+
+def _run_shard_job(
+    index: int,
+    shard: int,
+    file_path_str: str,
+    part_path_str: str,
+    start: int,
+    end: int,
+    width: int,
+    seq_format: str,
+) -> dict[str, Any]:
+    """格式化单个文件分片，结果写入分片临时文件。"""
+    start_time = time.time()
+    part_path = Path(part_path_str)
+    result: dict[str, Any] = {"index": index, "shard": shard, "kind": "shard"}
+    stats = _create_fastq_stats() if seq_format == "fastq" else None
+    try:
+        with Path(file_path_str).open("rb") as src, part_path.open("w", encoding="utf-8") as dst:
+            reader = _ByteRangeReader(src, start, end)
+            if seq_format == "fasta":
+                count = _stream_format_fasta(reader, dst, width)
+            else:
+                count, _stats = _stream_format_fastq(reader, dst, width, stats)
+        result.update({"sequences": count, "stats": stats})
+    except (ValueError, UnicodeDecodeError):
+        part_path.unlink(missing_ok=True)
+        result["error"] = "parse_error"
+    except Exception as exc:
+        part_path.unlink(missing_ok=True)
+        result["error"] = str(exc)
+    result["time"] = time.time() - start_time
+    return result
+
+
+def _run_batch_unit(unit: dict[str, Any], width: int) -> dict[str, Any]:
+    """统一工作队列的任务分发：整文件任务或记录对齐的分片任务。"""
+    if "shard" in unit:
+        return _run_shard_job(
+            unit["index"],
+            unit["shard"],
+            unit["file_path"],
+            unit["part_path"],
+            unit["start"],
+            unit["end"],
+            width,
+            unit["seq_format"],
+        )
+    return _run_batch_job(unit["index"], unit["file_path"], unit["output_path"], width)
+
+
+@dataclass
+class _ShardGroup:
+    """跟踪一个被切分文件的分片完成情况，全部完成后按序拼接输出。"""
+
+    index: int
+    file_path: Path
+    output_path: Path
+    seq_format: str
+    ranges: list[tuple[int, int]]
+    parts: list[Path]
+    remaining: int
+    sequences: int = 0
+    elapsed: float = 0.0
+    error: str | None = None
+    stats: dict[str, float] | None = None
+    finished: bool = False
+
+    def record(self, result: dict[str, Any]) -> None:
+        """登记一个分片结果。"""
+        self.remaining -= 1
+        self.elapsed += float(result.get("time", 0.0))
+        if "error" in result:
+            if self.error is None:
+                self.error = str(result["error"])
+            return
+        self.sequences += int(result.get("sequences", 0))
+        shard_stats = result.get("stats")
+        if shard_stats:
+            if self.stats is None:
+                self.stats = _create_fastq_stats()
+            _merge_fastq_stats(self.stats, shard_stats)
+
+    def cleanup(self) -> None:
+        """删除残留的分片临时文件。"""
+        for part in self.parts:
+            part.unlink(missing_ok=True)
+
+    def finalize(self) -> dict[str, Any]:
+        """按分片顺序拼接输出并返回单文件结果。"""
+        self.finished = True
+        base = {"index": self.index, "file": self.file_path.name, "time": self.elapsed}
+        if self.error is not None:
+            self.cleanup()
+            return {**base, "kind": "failed", "error": self.error}
+
+        temp_path: Path | None = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                "wb",
+                dir=self.output_path.parent,
+                prefix=f".{self.output_path.name}.",
+                suffix=".tmp",
+                delete=False,
+            ) as tmp_handle:
+                temp_path = Path(tmp_handle.name)
+                for part in self.parts:
+                    with part.open("rb") as part_handle:
+                        shutil.copyfileobj(part_handle, tmp_handle, 1024 * 1024)
+            temp_path.replace(self.output_path)
+        except OSError as exc:
+            if temp_path is not None:
+                temp_path.unlink(missing_ok=True)
+            return {**base, "kind": "failed", "error": str(exc)}
+        finally:
+            self.cleanup()
+        return {
+            **base,
+            "kind": "success",
+            "sequences": self.sequences,
+            "output": self.output_path.name,
+            "stats": self.stats,
+        }
+
+
+BATCH_RESULT_FIELDS = (
+    "index",
+    "status",
+    "file",
+    "sequences",
+    "output",
+    "bases",
+    "avg_q",
+    "q20_ratio",
+    "q30_ratio",
+    "time",
+    "error",
+    "reason",
+)
+BATCH_RESULT_FORMATS = {".jsonl": "jsonl", ".csv": "csv"}
+# 未指定 --results-file 时逐文件结果写入输出目录下的该文件
+BATCH_RESULTS_NAME = "batch_results.jsonl"
+
+
+class BatchResultSink:
+    """批处理结果汇聚器。
+
+    逐文件结果按完成顺序增量写入 JSONL/CSV，内存中只保留计数、
+    Top-N 最慢文件以及前 N 条失败/跳过记录，不保留完整结果列表。
+    """
+
+    def __init__(self, results_path: Path | None = None, *, top_n: int = 10) -> None:
+        self.results_path = results_path
+        self.top_n = max(1, top_n)
+        self.counts = {"success": 0, "failed": 0, "skipped": 0}
+        self.total_sequences = 0
+        self.total_time = 0.0
+        self.fastq_files = 0
+        self.fastq_stats = _create_fastq_stats()
+        self._slowest: list[tuple[float, int, dict[str, int | float | str]]] = []
+        self._failed: list[dict[str, int | float | str]] = []
+        self._skipped: list[dict[str, int | float | str]] = []
+        self._handle: TextIO | None = None
+        self._csv_writer: csv.DictWriter | None = None
+        self._format = ""
+
+        if results_path is not None:
+            self._format = BATCH_RESULT_FORMATS.get(results_path.suffix.lower(), "")
+            if not self._format:
+                raise ValueError("unsupported_results_format")
+            results_path.parent.mkdir(parents=True, exist_ok=True)
+            self._handle = results_path.open("w", encoding="utf-8", newline="")
+            if self._format == "csv":
+                self._csv_writer = csv.DictWriter(
+                    self._handle,
+                    fieldnames=BATCH_RESULT_FIELDS,
+                    extrasaction="ignore",
+                )
+                self._csv_writer.writeheader()
+
+    def __enter__(self) -> BatchResultSink:
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """关闭结果文件。"""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def add(self, item: dict[str, int | float | str]) -> None:
+        """记录一条单文件结果。"""
+        kind = str(item.pop("kind"))
+        index = int(item.pop("index", -1))
+        raw_stats = item.pop("stats", None)
+        if kind == "success" and raw_stats:
+            # 工作进程只回传原始计数，此处合并为全局统计并派生单文件指标
+            _merge_fastq_stats(self.fastq_stats, raw_stats)
+            self.fastq_files += 1
+            item.update(_finalize_fastq_stats(raw_stats))
+        self.counts[kind if kind in self.counts else "failed"] += 1
+        elapsed = float(item.get("time", 0.0))
+        self.total_time += elapsed
+
+        if self._handle is not None:
+            row = {"index": index, "status": kind, **item}
+            if self._csv_writer is not None:
+                self._csv_writer.writerow(row)
+            else:
+                self._handle.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+        if kind == "success":
+            self.total_sequences += int(item.get("sequences", 0))
+        elif kind == "skipped":
+            if len(self._skipped) < self.top_n:
+                self._skipped.append(item)
+        elif len(self._failed) < self.top_n:
+            self._failed.append(item)
+
+        if kind != "skipped":
+            entry = (elapsed, -index, item)
+            if len(self._slowest) < self.top_n:
+                heapq.heappush(self._slowest, entry)
+            elif entry[:2] > self._slowest[0][:2]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def results(self) -> dict[str, Any]:
+        """返回批处理结果；逐文件明细见 ``summary["results_file"]``。"""
+        return {"summary": self.summary()}
+
+    def summary(self) -> dict[str, Any]:
+        """返回聚合计数与 Top-N 明细。"""
+        slowest = [item for _time, _index, item in sorted(self._slowest, key=lambda entry: entry[:2], reverse=True)]
+        return {
+            "total": sum(self.counts.values()),
+            "success_count": self.counts["success"],
+            "failed_count": self.counts["failed"],
+            "skipped_count": self.counts["skipped"],
+            "sequences": self.total_sequences,
+            "time": self.total_time,
+            "fastq_files": self.fastq_files,
+            "fastq_stats": _finalize_fastq_stats(self.fastq_stats) if self.fastq_files else None,
+            "slowest": slowest,
+            "failed": list(self._failed),
+            "skipped": list(self._skipped),
+            "results_file": str(self.results_path) if self.results_path is not None else None,
+        }
+
+
+def _normalize_workers(workers: int | str | None) -> int | str:
+    """规范化并发数，`auto` 原样保留，非法值回退到 1。"""
     if workers is None:
         return 1
+    if isinstance(workers, str) and workers.strip().lower() == WORKERS_AUTO:
+        return WORKERS_AUTO
     try:
         return max(1, int(workers))
     except (TypeError, ValueError):
         return 1
 
 
+def _guess_sequence_format(file_path: Path) -> str | None:
+    """按扩展名推断序列格式，无法判断时读取首个非空行。"""
+    guessed = _FORMAT_SUFFIXES.get(file_path.suffix.lower())
+    if guessed is not None:
+        return guessed
+    try:
+        with file_path.open("r", encoding="utf-8") as handle:
+            return _detect_sequence_format_in_handle(handle)
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _estimate_job_memory(size_bytes: int, seq_format: str | None) -> int:
+    """估算单个批处理任务的峰值内存（字节）。
+
+    FASTA 按最坏情况（整个文件为单条记录）估算，FASTQ 为逐条流式处理。
+    """
+    if seq_format == "fastq":
+        return _WORKER_BASE_MEMORY + _FASTQ_RECORD_MEMORY
+    return _WORKER_BASE_MEMORY + _FASTA_MEMORY_FACTOR * max(0, size_bytes)
+
+
+def _auto_worker_budget(quiet: bool = False) -> tuple[int, int | None]:
+    """返回自动模式下的 (CPU 并发上限, 内存预算字节数)，并记录预算。"""
+    cpu_slots = cpu_budget()
+    available = available_memory_bytes()
+    memory_budget = int(available * _AUTO_MEMORY_FRACTION) if available is not None else None
+    memory_label = format_bytes(memory_budget) if memory_budget is not None else "unknown"
+
+    logger.info("batch auto workers: cpu budget=%d, memory budget=%s", cpu_slots, memory_label)
+    if not quiet:
+        console.print(t("batch_auto_budget", cpu=cpu_slots, memory=memory_label), style="cyan")
+    return cpu_slots, memory_budget
+
+
+def _admit_job(
+    job: dict[str, int | str],
+    pending_count: int,
+    in_flight_memory: int,
+    memory_budget: int | None,
+) -> bool:
+    """判断任务能否在当前内存预算下进入进程池。
+
+    池为空时总是放行，保证超出预算的单个大文件也能独立执行。
+    """
+    if memory_budget is None or pending_count == 0:
+        return True
+    return in_flight_memory + int(job.get("memory", 0)) <= memory_budget
+
+
 def batch_format_sequences(
     input_dir: Path,
     output_dir: Path,
@@ -532,8 +1049,10 @@ def batch_format_sequences(
     width: int = 80,
     continue_on_error: bool = True,
     quiet: bool = False,
-    workers: int = 1,
-) -> dict[str, list[dict]]:
+    workers: int | str = 1,
+    results_path: Path | None = None,
+    top_n: int = 10,
+) -> dict[str, Any]:
     """批量格式化序列文件。
 
     Args:
@@ -544,10 +1063,12 @@ def batch_format_sequences(
         width: 序列换行宽度
         continue_on_error: 遇到错误是否继续处理
         quiet: 静默模式（不显示进度）
-        workers: 并发进程数，1 表示串行处理
+        workers: 并发进程数，1 表示串行处理；`auto` 按 CPU 与可用内存自动调度
+        results_path: 逐文件结果流式写出路径（.jsonl / .csv），默认为输出目录下的 ``batch_results.jsonl``
+        top_n: 摘要中保留的最慢 / 失败 / 跳过文件条数
 
     Returns:
-        包含 success/failed/skipped 列表的字典
+        仅含 ``summary`` 聚合摘要的字典，完整逐文件结果只写入结果文件
     """
     # 收集文件
     if recursive:
@@ -555,21 +1076,23 @@ def batch_format_sequences(
     else:
         files = sorted(input_dir.glob(pattern))
 
-    results: dict[str, list[dict]] = {
-        "success": [],
-        "failed": [],
-        "skipped": [],
-    }
-
+    if results_path is None and files:
+        results_path = output_dir / BATCH_RESULTS_NAME
+    sink = BatchResultSink(results_path, top_n=top_n)
     if not files:
-        return results
+        sink.close()
+        return sink.results()
 
     # 确保输出目录存在
     output_dir.mkdir(parents=True, exist_ok=True)
-    seen_names: set[str] = set()
+    path_mapper = OutputPathMapper(input_dir, output_dir, recursive)
 
     workers = _normalize_workers(workers)
-    jobs: list[dict[str, int | str]] = []
+    memory_budget: int | None = None
+    auto_workers = workers == WORKERS_AUTO
+    if auto_workers:
+        workers, memory_budget = _auto_worker_budget(quiet)
+    jobs: list[dict[str, Any]] = []
     skipped_items: list[dict[str, int | float | str]] = []
     for index, file_path in enumerate(files):
         if not file_path.is_file():
@@ -581,17 +1104,61 @@ def batch_format_sequences(
                 "time": 0.0,
             })
             continue
-        out_path = _make_unique_output_path(
-            file_path, input_dir, output_dir, recursive, seen_names
-        )
+        out_path = path_mapper.map(file_path)
         jobs.append({
             "index": index,
             "file_path": str(file_path),
             "output_path": str(out_path),
+            "size": file_path.stat().st_size,
         })
-
-    completed_items: list[dict[str, int | float | str]] = []
-    completed_items.extend(skipped_items)
+    path_map = path_mapper.write()
+
+    # 多进程时将大文件按记录边界切分，使文件数少于核数时也能占满进程池
+    shard_groups: dict[int, _ShardGroup] = {}
+    if workers > 1 and jobs:
+        total_bytes = sum(int(job["size"]) for job in jobs)
+        shard_bytes = max(_SHARD_MIN_BYTES, total_bytes // workers)
+        units: list[dict[str, Any]] = []
+        for job in jobs:
+            group = _plan_shard_group(job, shard_bytes)
+            if group is None:
+                units.append(job)
+                continue
+            shard_groups[group.index] = group
+            for shard, (start, end) in enumerate(group.ranges):
+                units.append({
+                    "index": group.index,
+                    "shard": shard,
+                    "file_path": str(group.file_path),
+                    "part_path": str(group.parts[shard]),
+                    "start": start,
+                    "end": end,
+                    "size": end - start,
+                    "seq_format": group.seq_format,
+                })
+        jobs = units
+
+    if auto_workers:
+        for job in jobs:
+            seq_format = job.get("seq_format") or _guess_sequence_format(Path(str(job["file_path"])))
+            job["memory"] = _estimate_job_memory(int(job["size"]), seq_format)
+            if memory_budget is not None and int(job["memory"]) > memory_budget:
+                logger.warning(
+                    "%s: estimated memory %s exceeds batch budget %s, it will run alone",
+                    Path(str(job["file_path"])).name,
+                    format_bytes(int(job["memory"])),
+                    format_bytes(memory_budget),
+                )
+
+    def complete(result: dict[str, Any]) -> dict[str, Any] | None:
+        """将任务结果归并为单文件结果，分片文件在全部分片完成后才产出。"""
+        if result.get("kind") != "shard":
+            return result
+        group = shard_groups[int(result["index"])]
+        group.record(result)
+        if group.remaining > 0:
+            return None
+        return group.finalize()
 
     progress_cm: Progress | None = None
     if not quiet:
@@ -604,68 +1171,131 @@ def batch_format_sequences(
             console=console,
         )
 
-    with progress_cm or nullcontext() as progress:
+    try:
+        _drive_batch_units(
+            jobs,
+            width=width,
+            workers=workers,
+            memory_budget=memory_budget,
+            continue_on_error=continue_on_error,
+            total_files=len(files),
+            skipped_items=skipped_items,
+            sink=sink,
+            progress_cm=progress_cm,
+            complete=complete,
+        )
+    finally:
+        for group in shard_groups.values():
+            if not group.finished:
+                group.cleanup()
+
+    results = sink.results()
+    results["summary"]["path_map"] = str(path_map)
+    return results
+
+
+def _plan_shard_group(job: dict[str, Any], shard_bytes: int) -> _ShardGroup | None:
+    """为超过分片阈值的文件规划分片，无需切分或格式不支持时返回 None。"""
+    if int(job["size"]) <= shard_bytes:
+        return None
+    file_path = Path(str(job["file_path"]))
+    try:
+        with file_path.open("r", encoding="utf-8") as handle:
+            seq_format = _detect_sequence_format_in_handle(handle)
+    except (OSError, UnicodeDecodeError):
+        return None
+    if seq_format not in SUPPORTED_FORMATS:
+        return None
+
+    ranges = _plan_shards(file_path, seq_format, shard_bytes)
+    if len(ranges) <= 1:
+        return None
+    output_path = Path(str(job["output_path"]))
+    return _ShardGroup(
+        index=int(job["index"]),
+        file_path=file_path,
+        output_path=output_path,
+        seq_format=seq_format,
+        ranges=ranges,
+        parts=[_shard_part_path(output_path, shard) for shard in range(len(ranges))],
+        remaining=len(ranges),
+    )
+
+
+def _drive_batch_units(
+    jobs: list[dict[str, Any]],
+    *,
+    width: int,
+    workers: int,
+    memory_budget: int | None,
+    continue_on_error: bool,
+    total_files: int,
+    skipped_items: list[dict[str, int | float | str]],
+    sink: BatchResultSink,
+    progress_cm: Progress | None,
+    complete: Callable[[dict[str, Any]], dict[str, Any] | None],
+) -> None:
+    """执行统一工作队列，按文件粒度向结果汇聚器与进度条报告。"""
+    with sink, progress_cm or nullcontext() as progress:
         task_id = None
+        for item in skipped_items:
+            sink.add(item)
         if progress is not None:
-            task_id = progress.add_task(t("batch_processing"), total=len(files))
+            task_id = progress.add_task(t("batch_processing"), total=total_files)
             if skipped_items:
                 progress.advance(task_id, advance=len(skipped_items))
 
         if workers == 1 or len(jobs) <= 1:
             for job in jobs:
-                item = _run_batch_job(job["index"], job["file_path"], job["output_path"], width)
-                completed_items.append(item)
+                item = complete(_run_batch_unit(job, width))
+                if item is None:
+                    continue
+                failed = item["kind"] == "failed"
+                sink.add(item)
                 if progress is not None and task_id is not None:
                     progress.advance(task_id)
-                if item["kind"] == "failed" and not continue_on_error:
+                if failed and not continue_on_error:
                     break
         else:
             max_workers = min(workers, len(jobs), os.cpu_count() or workers)
             executor = ProcessPoolExecutor(max_workers=max_workers)
             try:
                 job_iter = iter(jobs)
+                next_job = next(job_iter, None)
                 pending: dict[Future, dict[str, int | str]] = {}
+                in_flight_memory = 0
 
-                for _ in range(max_workers):
-                    try:
-                        job = next(job_iter)
-                    except StopIteration:
+                stop_early = False
+                while True:
+                    # 在并发上限与内存预算内尽量填满进程池
+                    while (
+                        next_job is not None
+                        and len(pending) < max_workers
+                        and _admit_job(next_job, len(pending), in_flight_memory, memory_budget)
+                    ):
+                        future = executor.submit(_run_batch_unit, next_job, width)
+                        pending[future] = next_job
+                        in_flight_memory += int(next_job.get("memory", 0))
+                        next_job = next(job_iter, None)
+
+                    if not pending:
                         break
-                    future = executor.submit(
-                        _run_batch_job,
-                        job["index"],
-                        job["file_path"],
-                        job["output_path"],
-                        width,
-                    )
-                    pending[future] = job
 
-                stop_early = False
-                while pending:
                     done, _ = wait(pending, return_when=FIRST_COMPLETED)
                     for future in done:
-                        pending.pop(future, None)
-                        item = future.result()
-                        completed_items.append(item)
+                        finished_job = pending.pop(future)
+                        in_flight_memory -= int(finished_job.get("memory", 0))
+                        item = complete(future.result())
+                        if item is None:
+                            continue
+                        failed = item["kind"] == "failed"
+                        sink.add(item)
                         if progress is not None and task_id is not None:
                             progress.advance(task_id)
-                        if item["kind"] == "failed" and not continue_on_error:
+                        if failed and not continue_on_error:
                             stop_early = True
                             break
 
-                        try:
-                            job = next(job_iter)
-                        except StopIteration:
-                            continue
-                        new_future = executor.submit(
-                            _run_batch_job,
-                            job["index"],
-                            job["file_path"],
-                            job["output_path"],
-                            width,
-                        )
-                        pending[new_future] = job
-
                     if stop_early:
                         for future in pending:
                             future.cancel()
@@ -673,46 +1303,42 @@ def batch_format_sequences(
             finally:
                 executor.shutdown(wait=True, cancel_futures=True)
 
-    for item in sorted(completed_items, key=lambda entry: int(entry["index"])):
-        _append_batch_result(results, item)
 
-    return results
-
-
-def display_batch_results(results: dict[str, list[dict]]) -> None:
-    """显示批量处理结果表格。"""
-    total = len(results["success"]) + len(results["failed"]) + len(results["skipped"])
+def display_batch_results(results: dict[str, Any]) -> None:
+    """根据聚合摘要显示批量处理结果：最慢文件、失败与跳过明细及统计。"""
+    summary = results["summary"]
+    total = int(summary["total"])
 
     if total == 0:
         console.print(t("batch_no_files"), style="yellow")
         return
 
-    # 成功表格
-    if results["success"]:
-        table = Table(title=t("batch_success_title"), show_header=True, header_style="bold green")
+    # 最慢文件表格
+    if summary["slowest"]:
+        table = Table(title=t("batch_slowest_title", count=len(summary["slowest"])), show_header=True, header_style="bold green")
         table.add_column(t("batch_col_file"), style="cyan")
         table.add_column(t("batch_col_sequences"), justify="right", style="magenta")
         table.add_column(t("batch_col_output"), style="blue")
         table.add_column(t("batch_col_time"), justify="right", style="yellow")
 
-        for item in results["success"]:
+        for item in summary["slowest"]:
             table.add_row(
                 item["file"],
-                str(item["sequences"]),
-                item["output"],
+                str(item.get("sequences", "-")),
+                item.get("output", item.get("error", "")),
                 f"{item['time']:.2f}s",
             )
 
         console.print(table)
 
     # 失败表格
-    if results["failed"]:
+    if summary["failed"]:
         table = Table(title=t("batch_failed_title"), show_header=True, header_style="bold red")
         table.add_column(t("batch_col_file"), style="cyan")
         table.add_column(t("batch_col_error"), style="red")
         table.add_column(t("batch_col_time"), justify="right", style="yellow")
 
-        for item in results["failed"]:
+        for item in summary["failed"]:
             table.add_row(
                 item["file"],
                 item["error"],
@@ -722,24 +1348,50 @@ def display_batch_results(results: dict[str, list[dict]]) -> None:
         console.print(table)
 
     # 跳过表格
-    if results["skipped"]:
+    if summary["skipped"]:
         table = Table(title=t("batch_skipped_title"), show_header=True, header_style="bold yellow")
         table.add_column(t("batch_col_file"), style="cyan")
         table.add_column(t("batch_col_reason"), style="yellow")
 
-        for item in results["skipped"]:
+        for item in summary["skipped"]:
             table.add_row(item["file"], item["reason"])
 
         console.print(table)
 
+    # FASTQ 质量汇总表格（由各工作进程的原始计数合并而来）
+    fastq_stats = summary.get("fastq_stats")
+    if fastq_stats:
+        table = Table(title=t("batch_qc_title"), show_header=True, header_style="bold green")
+        table.add_column(t("batch_col_fastq_files"), justify="right", style="cyan")
+        table.add_column(t("batch_col_bases"), justify="right", style="magenta")
+        table.add_column(t("batch_col_avg_q"), justify="right", style="yellow")
+        table.add_column(t("batch_col_q20"), justify="right", style="green")
+        table.add_column(t("batch_col_q30"), justify="right", style="green")
+        table.add_row(
+            str(summary["fastq_files"]),
+            str(int(fastq_stats["bases"])),
+            f"{fastq_stats['avg_q']:.2f}",
+            f"{fastq_stats['q20_ratio']:.1%}",
+            f"{fastq_stats['q30_ratio']:.1%}",
+        )
+        console.print(table)
+
     # 统计摘要
     console.print(
         t(
             "batch_summary",
             total=total,
-            success=len(results["success"]),
-            failed=len(results["failed"]),
-            skipped=len(results["skipped"]),
+            success=summary["success_count"],
+            failed=summary["failed_count"],
+            skipped=summary["skipped_count"],
         ),
         style="bold cyan",
     )
+    console.print(
+        t("batch_totals", sequences=summary["sequences"], time=f"{summary['time']:.2f}s"),
+        style="cyan",
+    )
+    if summary["results_file"]:
+        console.print(t("batch_results_file", path=summary["results_file"]), style="cyan")
+    if summary.get("path_map"):
+        console.print(t("batch_path_map", path=summary["path_map"]), style="cyan")
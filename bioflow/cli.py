@@ -15,18 +15,27 @@ from rich.console import Console
 
 from bioflow import __version__
 from bioflow.bio_tasks import (
+    WORKERS_AUTO,
     batch_format_sequences,
     display_batch_results,
     format_sequence_file,
 )
 from bioflow.env_manager import BIO_TOOLS, _check_conda, _check_installed
-from bioflow.alignment import run_alignment_pipeline
+from bioflow.aligners import ALIGNERS, DEFAULT_ALIGNER, get_aligner, resolve_read_group
+from bioflow.align_samples import read_samplesheet, run_alignment_samples
+from bioflow.alignment import OUTPUT_FORMATS, _default_output_bam, run_alignment_pipeline
 from bioflow.config import ConfigError, load_workflow_config
 from bioflow.i18n import init_language, t
 from bioflow.inspect import inspect_run, render_inspection_text
 from bioflow.pipeline import run_qc_pipeline
-from bioflow.preflight import PreflightError
+from bioflow.preflight import PreflightError, preflight_check
+from bioflow.reference import (
+    load_reference_bundle,
+    prepare_reference_bundle,
+    resolve_bundle_root,
+)
 from bioflow.report import generate_report
+from bioflow.resources import parse_bytes
 from bioflow.search import run_blast_search
 
 # 退出码标准
@@ -65,15 +74,34 @@ def _resolve_config_path(config_value: str | None) -> Path | None:
     return Path(config_value)
 
 
+def _parse_workers_arg(value: str) -> int | str:
+    """解析 --workers 参数：正整数或 `auto`。"""
+    if value.strip().lower() == WORKERS_AUTO:
+        return WORKERS_AUTO
+    try:
+        return int(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(
+            f"workers must be an integer or '{WORKERS_AUTO}' (got {value})"
+        ) from exc
+
+
 def _default_workflow_outdir(workflow: str, anchor: Path) -> Path:
     """返回工作流默认运行目录。"""
     return anchor.parent / f"{workflow}_run"
 
 
-def _resolve_align_json_output(input_path: Path, output_path: Path | None, outdir: Path | None) -> Path:
-    """返回 align JSON 模式下展示的主输出 BAM 路径。"""
+def _resolve_align_json_output(
+    input_path: Path,
+    output_path: Path | None,
+    outdir: Path | None,
+    input2_path: Path | None = None,
+    output_format: str = "bam",
+) -> Path:
+    """返回 align JSON 模式下展示的主输出 BAM/CRAM 路径。"""
     if output_path is None:
-        return (outdir or _default_workflow_outdir("align", input_path)) / "results" / f"{input_path.stem}.sorted.bam"
+        default_name = _default_output_bam(input_path, input2_path, output_format).name
+        return (outdir or _default_workflow_outdir("align", input_path)) / "results" / default_name
     if output_path.is_absolute():
         return output_path
     return (outdir or _default_workflow_outdir("align", input_path)) / "results" / output_path.name
@@ -207,6 +235,8 @@ def cmd_batch(args: argparse.Namespace) -> int:
     width = args.width
     workers = args.workers
     continue_on_error = args.continue_on_error
+    results_file = Path(args.results_file) if args.results_file else None
+    top_n = args.top
     quiet = args.quiet or args.json
 
     # 参数校验
@@ -231,13 +261,30 @@ def cmd_batch(args: argparse.Namespace) -> int:
             console_err.print(f"Error: width must be positive (got {width})", style="bold red")
         return EXIT_ARGUMENT_ERROR
 
-    if workers <= 0:
+    if workers != WORKERS_AUTO and workers <= 0:
         if args.json:
             print(json.dumps({"error": "invalid_workers", "workers": workers}, ensure_ascii=False))
         else:
             console_err.print(f"Error: workers must be positive (got {workers})", style="bold red")
         return EXIT_ARGUMENT_ERROR
 
+    if top_n <= 0:
+        if args.json:
+            print(json.dumps({"error": "invalid_top", "top": top_n}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: top must be positive (got {top_n})", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+
+    if results_file is not None and results_file.suffix.lower() not in (".jsonl", ".csv"):
+        if args.json:
+            print(json.dumps({"error": "invalid_results_file", "path": str(results_file)}, ensure_ascii=False))
+        else:
+            console_err.print(
+                f"Error: results file must end with .jsonl or .csv (got {results_file})",
+                style="bold red",
+            )
+        return EXIT_ARGUMENT_ERROR
+
     try:
         # 执行批量处理
         results = batch_format_sequences(
@@ -249,7 +296,10 @@ def cmd_batch(args: argparse.Namespace) -> int:
             continue_on_error=continue_on_error,
             quiet=quiet,
             workers=workers,
+            results_path=results_file,
+            top_n=top_n,
         )
+        summary = results["summary"]
 
         # 输出结果
         if args.json:
@@ -261,17 +311,8 @@ def cmd_batch(args: argparse.Namespace) -> int:
                 "recursive": recursive,
                 "width": width,
                 "workers": workers,
-                "results": {
-                    "success": results["success"],
-                    "failed": results["failed"],
-                    "skipped": results["skipped"],
-                },
-                "summary": {
-                    "total": len(results["success"]) + len(results["failed"]) + len(results["skipped"]),
-                    "success_count": len(results["success"]),
-                    "failed_count": len(results["failed"]),
-                    "skipped_count": len(results["skipped"]),
-                },
+                "results_file": summary["results_file"],
+                "summary": summary,
             }
             print(json.dumps(payload, ensure_ascii=False))
         else:
@@ -279,7 +320,7 @@ def cmd_batch(args: argparse.Namespace) -> int:
                 display_batch_results(results)
 
         # 如果有失败且未设置 continue_on_error，返回错误码
-        if results["failed"] and not continue_on_error:
+        if summary["failed_count"] and not continue_on_error:
             return EXIT_RUNTIME_ERROR
 
         return EXIT_SUCCESS
@@ -464,7 +505,37 @@ def cmd_align(args: argparse.Namespace) -> int:
         params = _merge_workflow_args(
             args,
             "align",
-            {"ref": None, "input": None, "output": None, "outdir": None, "threads": 1, "resume": False},
+            {
+                "ref": None,
+                "input": None,
+                "input2": None,
+                "output": None,
+                "outdir": None,
+                "threads": 1,
+                "resume": False,
+                "index_cache": None,
+                "index_cache_max_size": None,
+                "shards": 1,
+                "shard_jobs": None,
+                "chunk_reads": None,
+                "sort_memory": None,
+                "sort_tmp": None,
+                "markdup": None,
+                "samplesheet": None,
+                "jobs": 1,
+                "output_format": "bam",
+                "aligner": DEFAULT_ALIGNER,
+                "aligner_preset": None,
+                "rg_id": None,
+                "sample": None,
+                "platform": None,
+                "depth_stats": None,
+                "stream_stats": None,
+                "unmapped_fastq": None,
+                "region_stats": None,
+                "region_jobs": None,
+                "region_commands": None,
+            },
         )
     except ConfigError as exc:
         if args.json:
@@ -473,7 +544,7 @@ def cmd_align(args: argparse.Namespace) -> int:
             console_err.print(f"Error: {exc}", style="bold red")
         return EXIT_ARGUMENT_ERROR
 
-    if not params["ref"] or not params["input"]:
+    if not params["ref"] or not (params["input"] or params["samplesheet"]):
         missing = "ref" if not params["ref"] else "input"
         if args.json:
             print(json.dumps({"error": "missing_required", "field": missing}, ensure_ascii=False))
@@ -482,23 +553,33 @@ def cmd_align(args: argparse.Namespace) -> int:
         return EXIT_ARGUMENT_ERROR
 
     ref_path = Path(str(params["ref"]))
-    input_path = Path(str(params["input"]))
+    samplesheet_path = Path(str(params["samplesheet"])) if params["samplesheet"] else None
+    input_path = Path(str(params["input"])) if params["input"] else None
+    input2_path = Path(str(params["input2"])) if params["input2"] else None
     threads = int(params["threads"])
     resume = bool(params["resume"])
 
-    # 参数校验
-    if not ref_path.exists():
+    if samplesheet_path is not None and (input_path is not None or input2_path is not None):
         if args.json:
-            print(json.dumps({"error": "file_not_found", "path": str(ref_path)}, ensure_ascii=False))
+            print(json.dumps({"error": "conflicting_inputs", "fields": ["samplesheet", "input"]}, ensure_ascii=False))
         else:
-            console_err.print(t("seq_file_not_found", path=str(ref_path)), style="bold red")
+            console_err.print("Error: --samplesheet cannot be combined with --input/--input2", style="bold red")
         return EXIT_ARGUMENT_ERROR
 
-    if not input_path.exists():
+    # 参数校验
+    for required_path in (ref_path, samplesheet_path, input_path, input2_path):
+        if required_path is not None and not required_path.exists():
+            if args.json:
+                print(json.dumps({"error": "file_not_found", "path": str(required_path)}, ensure_ascii=False))
+            else:
+                console_err.print(t("seq_file_not_found", path=str(required_path)), style="bold red")
+            return EXIT_ARGUMENT_ERROR
+
+    if input_path is not None and input2_path is not None and input2_path.resolve() == input_path.resolve():
         if args.json:
-            print(json.dumps({"error": "file_not_found", "path": str(input_path)}, ensure_ascii=False))
+            print(json.dumps({"error": "invalid_input2", "path": str(input2_path)}, ensure_ascii=False))
         else:
-            console_err.print(t("seq_file_not_found", path=str(input_path)), style="bold red")
+            console_err.print("Error: input2 must be a different file from input", style="bold red")
         return EXIT_ARGUMENT_ERROR
 
     if threads <= 0:
@@ -508,18 +589,188 @@ def cmd_align(args: argparse.Namespace) -> int:
             console_err.print(f"Error: threads must be positive (got {threads})", style="bold red")
         return EXIT_ARGUMENT_ERROR
 
+    shards = int(params["shards"])
+    shard_jobs = int(params["shard_jobs"]) if params["shard_jobs"] is not None else None
+    if shards <= 0 or (shard_jobs is not None and shard_jobs <= 0):
+        if args.json:
+            print(json.dumps({"error": "invalid_shards", "shards": shards, "shard_jobs": shard_jobs}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: shards and shard jobs must be positive (got {shards}, {shard_jobs})", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+    chunk_reads = int(params["chunk_reads"]) if params["chunk_reads"] is not None else None
+    if chunk_reads is not None and (chunk_reads <= 0 or shards > 1):
+        if args.json:
+            print(json.dumps({"error": "invalid_chunk_reads", "chunk_reads": chunk_reads, "shards": shards}, ensure_ascii=False))
+        else:
+            console_err.print(
+                f"Error: chunk reads must be positive and cannot be combined with --shards (got {chunk_reads}, {shards})",
+                style="bold red",
+            )
+        return EXIT_ARGUMENT_ERROR
+
+    sort_memory = params["sort_memory"]
+    if sort_memory is not None:
+        try:
+            parse_bytes(sort_memory)
+        except ValueError:
+            if args.json:
+                print(json.dumps({"error": "invalid_sort_memory", "value": str(sort_memory)}, ensure_ascii=False))
+            else:
+                console_err.print(f"Error: invalid sort memory: {sort_memory}", style="bold red")
+            return EXIT_ARGUMENT_ERROR
+
+    index_cache_max_size = params["index_cache_max_size"]
+    if index_cache_max_size is not None:
+        try:
+            parse_bytes(index_cache_max_size)
+        except ValueError:
+            if args.json:
+                print(json.dumps({"error": "invalid_index_cache_max_size", "value": str(index_cache_max_size)}, ensure_ascii=False))
+            else:
+                console_err.print(f"Error: invalid index cache size: {index_cache_max_size}", style="bold red")
+            return EXIT_ARGUMENT_ERROR
+
+    output_format = str(params["output_format"]).lower()
+    if output_format not in OUTPUT_FORMATS:
+        if args.json:
+            print(json.dumps({"error": "invalid_output_format", "value": output_format}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: output format must be one of {', '.join(OUTPUT_FORMATS)} (got {output_format})", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+
+    aligner = str(params["aligner"]).lower()
+    aligner_preset = str(params["aligner_preset"]) if params["aligner_preset"] else None
+    try:
+        backend = get_aligner(aligner, aligner_preset)
+    except ValueError as exc:
+        if args.json:
+            print(json.dumps({"error": "invalid_aligner", "aligner": aligner, "preset": aligner_preset}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: {exc}", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+
+    # --ref 指向参考序列包时使用包内规范化序列、预建索引与已记录的 sha256
+    try:
+        ref_bundle = load_reference_bundle(ref_path)
+    except ValueError as exc:
+        if args.json:
+            print(json.dumps({"error": "invalid_reference_bundle", "path": str(ref_path), "message": str(exc)}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: {exc}", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+    bundle_options: dict[str, Any] = {}
+    if ref_bundle is not None:
+        bundle_prefix = ref_bundle.index_prefix(backend.label)
+        if bundle_prefix is None:
+            # 包是内容寻址的只读目录，不能在其中补建未登记的索引
+            hint = f"bioflow ref prepare --input <reference> --aligner {backend.name}"
+            if backend.preset:
+                hint += f" --aligner-preset {backend.preset}"
+            if args.json:
+                print(
+                    json.dumps(
+                        {"error": "reference_bundle_missing_index", "path": str(ref_bundle.root), "aligner": backend.label, "hint": hint},
+                        ensure_ascii=False,
+                    )
+                )
+            else:
+                console_err.print(
+                    f"Error: reference bundle {ref_bundle.root} has no {backend.label} index; run `{hint}` first",
+                    style="bold red",
+                )
+            return EXIT_ARGUMENT_ERROR
+        ref_path = ref_bundle.fasta
+        bundle_options = {"index_prefix": bundle_prefix, "ref_details": ref_bundle.ref_details()}
+        if not quiet:
+            console_err.print(t("ref_bundle_used", path=str(ref_bundle.root)), style="cyan")
+
+    rg_id = str(params["rg_id"]) if params["rg_id"] is not None else None
+    rg_sample = str(params["sample"]) if params["sample"] is not None else None
+    rg_platform = str(params["platform"]) if params["platform"] is not None else None
+    if samplesheet_path is not None and (rg_id is not None or rg_sample is not None):
+        if args.json:
+            print(json.dumps({"error": "conflicting_inputs", "fields": ["samplesheet", "rg_id", "sample"]}, ensure_ascii=False))
+        else:
+            console_err.print("Error: --rg-id/--sample come from the samplesheet when --samplesheet is used", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+    read_group = None
+    if input_path is not None:
+        try:
+            read_group = resolve_read_group(
+                rg_id,
+                rg_sample,
+                rg_platform,
+                default_id=_default_output_bam(input_path, input2_path).name.removesuffix(".sorted.bam"),
+            )
+        except ValueError as exc:
+            if args.json:
+                print(json.dumps({"error": "invalid_read_group", "message": str(exc)}, ensure_ascii=False))
+            else:
+                console_err.print(f"Error: {exc}", style="bold red")
+            return EXIT_ARGUMENT_ERROR
+
+    region_jobs = int(params["region_jobs"]) if params["region_jobs"] is not None else None
+    if region_jobs is not None and region_jobs <= 0:
+        if args.json:
+            print(json.dumps({"error": "invalid_region_jobs", "region_jobs": region_jobs}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: region jobs must be positive (got {region_jobs})", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+    region_commands = params["region_commands"] or []
+    if isinstance(region_commands, str):
+        region_commands = [region_commands]
+
     output_path = Path(str(params["output"])) if params["output"] else None
     outdir = Path(str(params["outdir"])) if params["outdir"] else None
+    pipeline_options = {
+        "shards": shards,
+        "shard_jobs": shard_jobs,
+        "chunk_reads": chunk_reads,
+        "sort_memory": sort_memory,
+        "sort_tmp": Path(str(params["sort_tmp"])) if params["sort_tmp"] else None,
+        "markdup": bool(params["markdup"]),
+        "output_format": output_format,
+        "aligner": aligner,
+        "aligner_preset": aligner_preset,
+        "depth_stats": bool(params["depth_stats"]),
+        "stream_stats": bool(params["stream_stats"]),
+        "unmapped_fastq": bool(params["unmapped_fastq"]),
+        "region_stats": bool(params["region_stats"]),
+        "region_jobs": region_jobs,
+        "region_commands": tuple(str(command) for command in region_commands),
+    }
+
+    if samplesheet_path is not None:
+        return _cmd_align_samples(
+            args,
+            ref_path,
+            samplesheet_path,
+            outdir=outdir,
+            threads=threads,
+            jobs=int(params["jobs"]),
+            resume=resume,
+            index_cache=params["index_cache"],
+            index_cache_max_size=index_cache_max_size,
+            platform=rg_platform,
+            pipeline_options=pipeline_options,
+            bundle_options=bundle_options,
+        )
 
     try:
         stats = run_alignment_pipeline(
             ref_path,
             input_path,
             output=output_path,
+            reads2=input2_path,
             outdir=outdir,
             threads=threads,
             resume=resume,
             cli_mode=True,
+            index_cache=params["index_cache"],
+            index_cache_max_size=index_cache_max_size,
+            read_group=read_group,
+            **bundle_options,
+            **pipeline_options,
         )
         if stats is not None:
             if args.json:
@@ -527,7 +778,8 @@ def cmd_align(args: argparse.Namespace) -> int:
                     "status": "success",
                     "ref": str(ref_path),
                     "input": str(input_path),
-                    "output": str(_resolve_align_json_output(input_path, output_path, outdir)),
+                    "input2": str(input2_path) if input2_path is not None else None,
+                    "output": str(_resolve_align_json_output(input_path, output_path, outdir, input2_path, output_format)),
                     "outdir": str(outdir or _default_workflow_outdir("align", input_path)),
                     "metadata": str((outdir or _default_workflow_outdir("align", input_path)) / "metadata.json"),
                     "resume_used": resume,
@@ -536,6 +788,13 @@ def cmd_align(args: argparse.Namespace) -> int:
                         "mapped": stats["mapped"],
                         "unmapped": stats["unmapped"],
                         "mapping_rate": round(float(stats["mapping_rate"]), 6),
+                        "paired": stats.get("paired", 0),
+                        "properly_paired": stats.get("properly_paired", 0),
+                        "duplicates": stats.get("duplicates", 0),
+                        "mean_depth": stats.get("mean_depth"),
+                        "coverage_breadth": stats.get("coverage_breadth"),
+                        "breadth_10x": stats.get("breadth_10x"),
+                        "breadth_30x": stats.get("breadth_30x"),
                     },
                 }
                 print(json.dumps(payload, ensure_ascii=False))
@@ -554,6 +813,93 @@ def cmd_align(args: argparse.Namespace) -> int:
         return EXIT_RUNTIME_ERROR
 
 
+def _cmd_align_samples(
+    args: argparse.Namespace,
+    ref_path: Path,
+    samplesheet_path: Path,
+    *,
+    outdir: Path | None,
+    threads: int,
+    jobs: int,
+    resume: bool,
+    index_cache: str | None,
+    index_cache_max_size: str | None,
+    platform: str | None,
+    pipeline_options: dict[str, Any],
+    bundle_options: dict[str, Any] | None = None,
+) -> int:
+    """处理 align --samplesheet：按样本表调度多样本比对。"""
+    if jobs <= 0:
+        if args.json:
+            print(json.dumps({"error": "invalid_jobs", "jobs": jobs}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: jobs must be positive (got {jobs})", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+    try:
+        samples = read_samplesheet(samplesheet_path)
+    except (OSError, ValueError) as exc:
+        if args.json:
+            print(json.dumps({"error": "invalid_samplesheet", "message": str(exc)}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: {exc}", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+    try:
+        for sample in samples:
+            sample.read_group(platform)
+    except ValueError as exc:
+        if args.json:
+            print(json.dumps({"error": "invalid_read_group", "message": str(exc)}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: {exc}", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+
+    run_root = outdir or _default_workflow_outdir("align", samplesheet_path)
+    try:
+        results = run_alignment_samples(
+            ref_path,
+            samples,
+            outdir=run_root,
+            threads=threads,
+            jobs=jobs,
+            resume=resume,
+            cli_mode=True,
+            index_cache=index_cache,
+            index_cache_max_size=index_cache_max_size,
+            samplesheet=samplesheet_path,
+            platform=platform,
+            **(bundle_options or {}),
+            **pipeline_options,
+        )
+    except PreflightError as exc:
+        if args.json:
+            print(json.dumps({"error": "dependency_missing", "tools": exc.missing_tools}, ensure_ascii=False))
+        return EXIT_DEPENDENCY_MISSING
+    except Exception as exc:
+        if args.json:
+            print(json.dumps({"error": "runtime_error", "message": str(exc)}, ensure_ascii=False))
+        else:
+            console_err.print(t("error_unexpected", err=str(exc)), style="bold red")
+        return EXIT_RUNTIME_ERROR
+
+    if results is None:
+        return EXIT_RUNTIME_ERROR
+    if args.json:
+        payload = {
+            "status": "success" if results["failed"] == 0 else "partial_failure",
+            "ref": str(ref_path),
+            "samplesheet": str(samplesheet_path),
+            "outdir": str(run_root),
+            "metadata": str(run_root / "metadata.json"),
+            "flagstat_summary": results["flagstat_summary"],
+            "resume_used": resume,
+            "succeeded": results["succeeded"],
+            "failed": results["failed"],
+            "samples": results["samples"],
+        }
+        print(json.dumps(payload, ensure_ascii=False))
+    return EXIT_SUCCESS if results["failed"] == 0 else EXIT_RUNTIME_ERROR
+
+
 def cmd_report(args: argparse.Namespace) -> int:
     """处理 report 子命令：生成 HTML 运行报告。"""
     input_path = Path(args.input)
@@ -632,6 +978,101 @@ def cmd_inspect(args: argparse.Namespace) -> int:
         return EXIT_RUNTIME_ERROR
 
 
+def cmd_ref_prepare(args: argparse.Namespace) -> int:
+    """处理 ref prepare 子命令：构建参考序列包。"""
+    quiet = args.quiet or args.json
+    input_path = Path(args.input)
+    if not input_path.is_file():
+        if args.json:
+            print(json.dumps({"error": "file_not_found", "path": str(input_path)}, ensure_ascii=False))
+        else:
+            console_err.print(t("seq_file_not_found", path=str(input_path)), style="bold red")
+        return EXIT_ARGUMENT_ERROR
+
+    if args.width <= 0:
+        if args.json:
+            print(json.dumps({"error": "invalid_width", "width": args.width}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: width must be positive (got {args.width})", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+
+    aligner_names = list(dict.fromkeys(args.aligners or [DEFAULT_ALIGNER]))
+    try:
+        backends = tuple(
+            get_aligner(name, args.aligner_preset if ALIGNERS[name].presets else None)
+            for name in aligner_names
+        )
+    except ValueError as exc:
+        if args.json:
+            print(json.dumps({"error": "invalid_aligner", "aligner": aligner_names, "preset": args.aligner_preset}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: {exc}", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+
+    tools = [backend.executable for backend in backends] + (["makeblastdb"] if args.blast else [])
+    try:
+        preflight_check(tools, cli_mode=True)
+        if not quiet:
+            console_err.print(t("ref_preparing", file=str(input_path)), style="cyan")
+        try:
+            prepared = prepare_reference_bundle(
+                input_path,
+                root=resolve_bundle_root(args.bundle_root),
+                aligners=backends,
+                blast=args.blast,
+                width=args.width,
+                quiet=quiet,
+            )
+        except ValueError as exc:
+            if args.json:
+                print(json.dumps({"error": "invalid_format", "path": str(input_path), "message": str(exc)}, ensure_ascii=False))
+            else:
+                console_err.print(t("seq_invalid_format"), style="bold red")
+            return EXIT_RUNTIME_ERROR
+        if prepared is None:
+            if args.json:
+                print(json.dumps({"error": "runtime_error", "message": "reference index build failed"}, ensure_ascii=False))
+            else:
+                console_err.print(t("ref_prepare_failed"), style="bold red")
+            return EXIT_RUNTIME_ERROR
+        bundle, built = prepared
+        if args.json:
+            payload = {
+                "status": "success",
+                "input": str(input_path),
+                "bundle": str(bundle.root),
+                "reference": str(bundle.fasta),
+                "sha256": bundle.sha256,
+                "sequences": bundle.manifest.get("sequences"),
+                "total_length": bundle.manifest.get("total_length"),
+                "indexes": {label: {"built": built[label], **bundle.indexes[label]} for label in built},
+            }
+            print(json.dumps(payload, ensure_ascii=False))
+        else:
+            for label, was_built in built.items():
+                status = t("ref_index_built") if was_built else t("ref_index_reused")
+                console_err.print(f"  {_SYM_OK} {label}: {status}", style="green")
+            console_out.print(
+                t(
+                    "ref_prepare_done",
+                    path=str(bundle.root),
+                    sequences=bundle.manifest.get("sequences"),
+                    length=bundle.manifest.get("total_length"),
+                )
+            )
+        return EXIT_SUCCESS
+    except PreflightError as exc:
+        if args.json:
+            print(json.dumps({"error": "dependency_missing", "tools": exc.missing_tools}, ensure_ascii=False))
+        return EXIT_DEPENDENCY_MISSING
+    except Exception as exc:
+        if args.json:
+            print(json.dumps({"error": "runtime_error", "message": str(exc)}, ensure_ascii=False))
+        else:
+            console_err.print(t("error_unexpected", err=str(exc)), style="bold red")
+        return EXIT_RUNTIME_ERROR
+
+
 def cmd_search(args: argparse.Namespace) -> int:
     """处理 search 子命令：BLAST 检索流程。"""
     try:
@@ -646,7 +1087,12 @@ def cmd_search(args: argparse.Namespace) -> int:
                 "evalue": 10.0,
                 "max_target_seqs": 10,
                 "top": 5,
+                "top_per_query": 0,
+                "threads": 1,
+                "shards": 1,
                 "resume": False,
+                "index_cache": None,
+                "index_cache_max_size": None,
             },
         )
     except ConfigError as exc:
@@ -669,6 +1115,9 @@ def cmd_search(args: argparse.Namespace) -> int:
     evalue = float(params["evalue"])
     max_target_seqs = int(params["max_target_seqs"])
     top_n = int(params["top"])
+    top_per_query = int(params["top_per_query"])
+    threads = int(params["threads"])
+    shards = int(params["shards"])
     resume = bool(params["resume"])
 
     if not db_path.exists():
@@ -678,6 +1127,18 @@ def cmd_search(args: argparse.Namespace) -> int:
             console_err.print(t("seq_file_not_found", path=str(db_path)), style="bold red")
         return EXIT_ARGUMENT_ERROR
 
+    try:
+        ref_bundle = load_reference_bundle(db_path)
+    except ValueError as exc:
+        if args.json:
+            print(json.dumps({"error": "invalid_reference_bundle", "path": str(db_path), "message": str(exc)}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: {exc}", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+    if ref_bundle is not None:
+        # 包内 BLAST 数据库与 reference.fa 同前缀，makeblastdb 步骤会直接复用
+        db_path = ref_bundle.fasta
+
     if not query_path.exists():
         if args.json:
             print(json.dumps({"error": "file_not_found", "path": str(query_path)}, ensure_ascii=False))
@@ -714,6 +1175,38 @@ def cmd_search(args: argparse.Namespace) -> int:
             console_err.print(f"Error: top must be positive (got {top_n})", style="bold red")
         return EXIT_ARGUMENT_ERROR
 
+    if top_per_query < 0:
+        if args.json:
+            print(json.dumps({"error": "invalid_top_per_query", "top_per_query": top_per_query}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: top per query must not be negative (got {top_per_query})", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+
+    if threads <= 0:
+        if args.json:
+            print(json.dumps({"error": "invalid_threads", "threads": threads}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: threads must be positive (got {threads})", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+
+    if shards <= 0:
+        if args.json:
+            print(json.dumps({"error": "invalid_shards", "shards": shards}, ensure_ascii=False))
+        else:
+            console_err.print(f"Error: shards must be positive (got {shards})", style="bold red")
+        return EXIT_ARGUMENT_ERROR
+
+    index_cache_max_size = params["index_cache_max_size"]
+    if index_cache_max_size is not None:
+        try:
+            parse_bytes(index_cache_max_size)
+        except ValueError:
+            if args.json:
+                print(json.dumps({"error": "invalid_index_cache_max_size", "value": str(index_cache_max_size)}, ensure_ascii=False))
+            else:
+                console_err.print(f"Error: invalid index cache size: {index_cache_max_size}", style="bold red")
+            return EXIT_ARGUMENT_ERROR
+
     output_path = Path(str(params["output"])) if params["output"] else None
     outdir = Path(str(params["outdir"])) if params["outdir"] else None
 
@@ -726,8 +1219,13 @@ def cmd_search(args: argparse.Namespace) -> int:
             evalue=evalue,
             max_target_seqs=max_target_seqs,
             top_n=top_n,
+            top_per_query=top_per_query,
+            threads=threads,
+            shards=shards,
             resume=resume,
             cli_mode=True,
+            index_cache=params["index_cache"],
+            index_cache_max_size=index_cache_max_size,
         )
         if result is None:
             return EXIT_RUNTIME_ERROR
@@ -792,23 +1290,172 @@ def main() -> int:
     parser_batch.add_argument("--pattern", "-p", default="*.fasta", help="File pattern to match (default: *.fasta)")
     parser_batch.add_argument("--recursive", "-r", action="store_true", help="Recursively scan subdirectories")
     parser_batch.add_argument("--width", "-w", type=int, default=80, help="Line width (default: 80)")
-    parser_batch.add_argument("--workers", type=int, default=1, help="Number of worker processes (default: 1)")
+    parser_batch.add_argument(
+        "--workers",
+        type=_parse_workers_arg,
+        default=1,
+        help="Number of worker processes, or 'auto' to size by CPU and available memory (default: 1)",
+    )
     parser_batch.add_argument("--continue-on-error", "-c", action="store_true", help="Continue processing on error")
+    parser_batch.add_argument(
+        "--results-file",
+        help="Stream per-file results to a .jsonl or .csv file (default: <output-dir>/batch_results.jsonl)",
+    )
+    parser_batch.add_argument("--top", type=int, default=10, help="Number of slowest/failed files to summarize (default: 10)")
 
     # align 子命令
-    parser_align = subparsers.add_parser("align", help="Run alignment pipeline (BWA + SAMtools)")
+    parser_align = subparsers.add_parser("align", help="Run alignment pipeline (bwa / bwa-mem2 / minimap2 + SAMtools)")
     parser_align.add_argument("--config", help="YAML config file for alignment workflow")
-    parser_align.add_argument("--ref", "-r", help="Reference genome FASTA file")
-    parser_align.add_argument("--input", "-i", help="Input reads file (FASTQ)")
-    parser_align.add_argument("--output", "-o", help="Output BAM file written under results/ unless absolute path is given")
+    parser_align.add_argument("--ref", "-r", help="Reference genome FASTA file or reference bundle directory from `bioflow ref prepare`")
+    parser_align.add_argument("--input", "-i", help="Input reads file (FASTQ); R1 for paired-end data")
+    parser_align.add_argument("--input2", help="Paired-end R2 reads file aligned together with --input")
+    parser_align.add_argument(
+        "--samplesheet",
+        help="TSV with sample/input[/input2] columns; aligns every sample against one shared reference index",
+    )
+    parser_align.add_argument(
+        "--jobs",
+        type=int,
+        help="Number of samples aligned concurrently with --samplesheet; threads are divided between them (default: 1)",
+    )
+    parser_align.add_argument("--output", "-o", help="Output BAM/CRAM file written under results/ unless absolute path is given")
+    parser_align.add_argument(
+        "--aligner",
+        choices=list(ALIGNERS),
+        help="Aligner backend: bwa, bwa-mem2 (faster short reads) or minimap2 (long reads); indexes are cached per backend (default: bwa)",
+    )
+    parser_align.add_argument(
+        "--aligner-preset",
+        help="minimap2 preset passed as -x, e.g. sr, map-ont, map-hifi (default: map-ont)",
+    )
+    parser_align.add_argument(
+        "--rg-id",
+        help="Read group ID written by the aligner via -R (default: --sample, else the input name)",
+    )
+    parser_align.add_argument(
+        "--sample",
+        help="Read group sample (SM) tagged on every alignment record (default: the read group ID)",
+    )
+    parser_align.add_argument(
+        "--platform",
+        help="Read group platform (PL), e.g. ILLUMINA or ONT; with --samplesheet it is the default for rows without a platform column",
+    )
+    parser_align.add_argument(
+        "--output-format",
+        choices=["bam", "cram"],
+        help="Alignment output format; cram uses the reference for compression and builds its .fai if missing (default: bam)",
+    )
     parser_align.add_argument("--outdir", help="Run output root directory (default: input_dir/align_run)")
     parser_align.add_argument("--resume", action="store_true", help="Resume from the latest valid alignment checkpoint")
     parser_align.add_argument("--threads", "-t", type=int, help="Number of threads (default: 1)")
+    parser_align.add_argument(
+        "--sort-memory",
+        help="Per-thread memory for samtools sort (-m), e.g. 2G (default: sized from available RAM)",
+    )
+    parser_align.add_argument(
+        "--sort-tmp",
+        help="Directory for samtools sort temporary files (-T) (default: <outdir>/tmp)",
+    )
+    parser_align.add_argument(
+        "--markdup",
+        action="store_true",
+        default=None,
+        help="Mark duplicates with a streamed samtools collate/fixmate/sort/markdup stage",
+    )
+    parser_align.add_argument(
+        "--depth-stats",
+        action="store_true",
+        default=None,
+        help="Stream the sorted alignment into per-contig depth arrays and report mean depth and 1x/10x/30x breadth",
+    )
+    parser_align.add_argument(
+        "--stream-stats",
+        action="store_true",
+        default=None,
+        help="Compute flagstat, MAPQ and insert-size stats from the SAM stream instead of running samtools flagstat on the BAM (adds a Python parser to the alignment pipe)",
+    )
+    parser_align.add_argument(
+        "--unmapped-fastq",
+        action="store_true",
+        default=None,
+        help="Write unmapped reads (flag 4) to gzipped FASTQ from the alignment stream, e.g. for host depletion",
+    )
+    parser_align.add_argument(
+        "--region-stats",
+        action="store_true",
+        default=None,
+        help="After indexing, compute samtools idxstats and per-contig coverage in parallel across contigs",
+    )
+    parser_align.add_argument(
+        "--region-jobs",
+        type=int,
+        help="Worker processes for region stats (default: --threads)",
+    )
+    parser_align.add_argument(
+        "--region-cmd",
+        dest="region_commands",
+        action="append",
+        help="Command run once per contig in the region pool; supports {region}, {name}, {length}, {bam} placeholders (repeatable)",
+    )
+    parser_align.add_argument(
+        "--shards",
+        type=int,
+        help="Split reads into N record-aligned shards aligned concurrently and merged with samtools merge (default: 1)",
+    )
+    parser_align.add_argument(
+        "--shard-jobs",
+        type=int,
+        help="Number of shard pipelines to run at once; threads are divided between them (default: min(shards, threads))",
+    )
+    parser_align.add_argument(
+        "--chunk-reads",
+        type=int,
+        help="Align in checkpointed chunks of N reads, each sorted with a completion marker; --resume reruns only missing chunks",
+    )
+    parser_align.add_argument(
+        "--index-cache",
+        help="Shared aligner index cache directory keyed by backend and reference sha256 (default: $BIOFLOW_INDEX_CACHE)",
+    )
+    parser_align.add_argument(
+        "--index-cache-max-size",
+        help="Disk budget for the index cache, e.g. 200G; least recently used entries are evicted (default: $BIOFLOW_INDEX_CACHE_MAX_SIZE)",
+    )
+
+    # ref 子命令
+    parser_ref = subparsers.add_parser("ref", help="Prepare versioned, content-addressed reference bundles")
+    ref_subparsers = parser_ref.add_subparsers(dest="ref_command")
+    parser_ref_prepare = ref_subparsers.add_parser(
+        "prepare",
+        help="Normalise a reference once, write .fai/.dict and build aligner and BLAST indexes in parallel",
+    )
+    parser_ref_prepare.add_argument("--input", "-i", required=True, help="Reference FASTA file")
+    parser_ref_prepare.add_argument(
+        "--bundle-root",
+        help="Directory holding reference bundles keyed by sha256 (default: $BIOFLOW_REF_BUNDLES or ~/.bioflow/references)",
+    )
+    parser_ref_prepare.add_argument(
+        "--aligner",
+        dest="aligners",
+        action="append",
+        choices=list(ALIGNERS),
+        help="Aligner index to build into the bundle (repeatable, default: bwa)",
+    )
+    parser_ref_prepare.add_argument(
+        "--aligner-preset",
+        help="minimap2 preset used for its index, e.g. sr or map-hifi (default: map-ont)",
+    )
+    parser_ref_prepare.add_argument(
+        "--blast",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Build a BLAST nucleotide database next to the normalised reference (default: on)",
+    )
+    parser_ref_prepare.add_argument("--width", "-w", type=int, default=80, help="Line width of the normalised FASTA (default: 80)")
 
     # search 子命令
     parser_search = subparsers.add_parser("search", help="Run BLAST nucleotide search")
     parser_search.add_argument("--config", help="YAML config file for search workflow")
-    parser_search.add_argument("--db", help="Reference database FASTA file")
+    parser_search.add_argument("--db", help="Reference database FASTA file or reference bundle directory")
     parser_search.add_argument("--query", "-q", help="Query FASTA file")
     parser_search.add_argument("--output", "-o", help="Output TSV file written under results/ unless absolute path is given")
     parser_search.add_argument("--outdir", help="Run output root directory (default: query_dir/search_run)")
@@ -820,6 +1467,30 @@ def main() -> int:
         help="Maximum target sequences per query (default: 10)",
     )
     parser_search.add_argument("--top", type=int, help="Number of top hits to summarize (default: 5)")
+    parser_search.add_argument(
+        "--top-per-query",
+        type=int,
+        help="Also keep the N best hits of every query in the summary, using bounded per-query heaps (default: 0, off)",
+    )
+    parser_search.add_argument(
+        "--threads",
+        "-t",
+        type=int,
+        help="CPU budget: blastn -num_threads, or divided between concurrent blastn processes with --shards (default: 1)",
+    )
+    parser_search.add_argument(
+        "--shards",
+        type=int,
+        help="Split the query FASTA into N record-balanced shards searched concurrently; each shard resumes on its own (default: 1)",
+    )
+    parser_search.add_argument(
+        "--index-cache",
+        help="Shared cache for BLAST databases keyed by db sha256 and makeblastdb version (default: $BIOFLOW_INDEX_CACHE)",
+    )
+    parser_search.add_argument(
+        "--index-cache-max-size",
+        help="Disk budget for the index cache, e.g. 200G; least recently used entries are evicted (default: $BIOFLOW_INDEX_CACHE_MAX_SIZE)",
+    )
 
     # report 子命令
     parser_report = subparsers.add_parser("report", help="Generate HTML run report")
@@ -853,6 +1524,11 @@ def main() -> int:
         return cmd_qc(args)
     elif args.command == "align":
         return cmd_align(args)
+    elif args.command == "ref":
+        if args.ref_command == "prepare":
+            return cmd_ref_prepare(args)
+        parser_ref.print_help(sys.stderr)
+        return EXIT_ARGUMENT_ERROR
     elif args.command == "search":
         return cmd_search(args)
     elif args.command == "report":
@@ -10,8 +10,52 @@ import yaml
 
 WORKFLOW_ALLOWED_KEYS: dict[str, set[str]] = {
     "qc": {"input", "output", "outdir", "adapter", "minlen", "resume"},
-    "align": {"ref", "input", "output", "outdir", "threads", "resume"},
-    "search": {"db", "query", "output", "outdir", "evalue", "max_target_seqs", "top", "resume"},
+    "align": {
+        "ref",
+        "input",
+        "input2",
+        "samplesheet",
+        "jobs",
+        "output",
+        "output_format",
+        "aligner",
+        "aligner_preset",
+        "rg_id",
+        "sample",
+        "platform",
+        "outdir",
+        "threads",
+        "resume",
+        "shards",
+        "shard_jobs",
+        "chunk_reads",
+        "sort_memory",
+        "sort_tmp",
+        "markdup",
+        "depth_stats",
+        "stream_stats",
+        "unmapped_fastq",
+        "region_stats",
+        "region_jobs",
+        "region_commands",
+        "index_cache",
+        "index_cache_max_size",
+    },
+    "search": {
+        "db",
+        "query",
+        "output",
+        "outdir",
+        "evalue",
+        "max_target_seqs",
+        "top",
+        "top_per_query",
+        "threads",
+        "shards",
+        "resume",
+        "index_cache",
+        "index_cache_max_size",
+    },
 }
 
 
@@ -0,0 +1,352 @@
+"""BioFlow-CLI 覆盖深度模块 — 流式读取排序后的 BAM/CRAM，以差分数组累计每个位点的深度。"""
+
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import re
+import subprocess
+from array import array
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - 未安装 numpy 时退化为纯 Python 实现
+    np = None  # type: ignore[assignment]
+
+logger = logging.getLogger("bioflow")
+
+# 输出覆盖广度的深度阈值
+DEPTH_THRESHOLDS = (1, 10, 30)
+# 与 samtools depth/coverage 默认一致：排除 unmapped、secondary、QC fail 与 duplicate
+DEPTH_EXCLUDE_FLAGS = 0x704
+# numpy 模式下缓冲的区间端点数，满后批量写入差分数组
+_FLUSH_EVENTS = 1 << 20
+_CIGAR_RE = re.compile(r"(\d+)([MIDNSHP=X])")
+# 消耗参考序列且计入深度的 CIGAR 操作；D/N 只推进位置
+_CIGAR_DEPTH_OPS = frozenset("M=X")
+_CIGAR_SKIP_OPS = frozenset("DN")
+
+
+def depth_engine() -> str:
+    """返回当前使用的深度累计实现名称。"""
+    return "numpy" if np is not None else "python"
+
+
+@dataclass
+class ContigDepth:
+    """单条参考序列的深度统计。"""
+
+    contig: str
+    length: int
+    aligned_bases: int = 0
+    covered: dict[int, int] = field(default_factory=dict)
+
+    @property
+    def mean_depth(self) -> float:
+        """平均深度（总比对碱基数 / 序列长度）。"""
+        return self.aligned_bases / self.length if self.length else 0.0
+
+    def to_row(self, thresholds: tuple[int, ...] = DEPTH_THRESHOLDS) -> dict[str, Any]:
+        """返回写入 TSV 的一行。"""
+        row: dict[str, Any] = {
+            "contig": self.contig,
+            "length": self.length,
+            "aligned_bases": self.aligned_bases,
+            "mean_depth": round(self.mean_depth, 4),
+        }
+        for threshold in thresholds:
+            covered = self.covered.get(threshold, 0)
+            row[f"breadth_{threshold}x"] = round(covered / self.length, 6) if self.length else 0.0
+        return row
+
+
+class _DiffArray:
+    """单条参考序列的差分数组，内存只与序列长度相关，与 reads 数无关。"""
+
+    def __init__(self, length: int) -> None:
+        self.length = length
+        if np is not None:
+            self._diff = np.zeros(length + 1, dtype=np.int32)
+            self._starts = array("q")
+            self._ends = array("q")
+        else:
+            self._diff = array("i", bytes(4 * (length + 1)))
+
+    def add(self, start: int, end: int) -> None:
+        """记录覆盖 [start, end) 的一个比对区块（0-based）。"""
+        if np is None:
+            self._diff[start] += 1
+            self._diff[end] -= 1
+            return
+        self._starts.append(start)
+        self._ends.append(end)
+        if len(self._starts) >= _FLUSH_EVENTS:
+            self._flush()
+
+    def _flush(self) -> None:
+        """将缓冲的区间端点批量写入差分数组。"""
+        for events, sign in ((self._starts, 1), (self._ends, -1)):
+            if events:
+                positions, counts = np.unique(np.frombuffer(events, dtype=np.int64), return_counts=True)
+                self._diff[positions] += sign * counts.astype(np.int32)
+        self._starts = array("q")
+        self._ends = array("q")
+
+    def summarize(self, thresholds: tuple[int, ...]) -> tuple[int, dict[int, int]]:
+        """前缀和还原逐位点深度，返回 (总比对碱基数, 各阈值覆盖碱基数)。"""
+        if np is not None:
+            self._flush()
+            depth = self._diff[:-1]
+            np.cumsum(depth, dtype=np.int32, out=depth)
+            total = int(depth.sum(dtype=np.int64))
+            return total, {threshold: int(np.count_nonzero(depth >= threshold)) for threshold in thresholds}
+
+        total = 0
+        running = 0
+        covered = dict.fromkeys(thresholds, 0)
+        for index in range(self.length):
+            running += self._diff[index]
+            if running:
+                total += running
+                for threshold in thresholds:
+                    if running >= threshold:
+                        covered[threshold] += 1
+        return total, covered
+
+
+class DepthAccumulator:
+    """从坐标排序的 SAM 文本流累计每条参考序列的深度。
+
+    同一时刻只为当前参考序列保留一个差分数组，参考序列切换时立即汇总并释放，
+    因此峰值内存由最长的参考序列决定。深度口径与 ``samtools depth`` 默认一致：
+    只计 M/=/X 区块，删除与跳过区域不计入。
+    """
+
+    def __init__(self, thresholds: tuple[int, ...] = DEPTH_THRESHOLDS, *, min_mapq: int = 0) -> None:
+        self.thresholds = tuple(sorted(set(thresholds)))
+        self.min_mapq = min_mapq
+        self.lengths: dict[str, int] = {}
+        self.results: dict[str, ContigDepth] = {}
+        self.malformed = 0
+        self._current: str | None = None
+        self._diff: _DiffArray | None = None
+
+    def add_line(self, line: str) -> None:
+        """统计单行 SAM（头部或比对记录）。"""
+        if not line or line == "\n":
+            return
+        if line.startswith("@"):
+            if line.startswith("@SQ"):
+                self._add_sequence_header(line)
+            return
+        fields = line.split("\t", 6)
+        if len(fields) < 6:
+            self.malformed += 1
+            return
+        contig, cigar = fields[2], fields[5]
+        if contig == "*" or cigar == "*":
+            return
+        try:
+            flag = int(fields[1])
+            position = int(fields[3]) - 1
+            mapq = int(fields[4])
+        except ValueError:
+            self.malformed += 1
+            return
+        if flag & DEPTH_EXCLUDE_FLAGS or mapq < self.min_mapq:
+            return
+        if contig != self._current:
+            self._switch_contig(contig)
+        if self._diff is None:
+            return
+        self._add_cigar(position, cigar)
+
+    def _add_sequence_header(self, line: str) -> None:
+        """从 @SQ 头部记录参考序列名称与长度。"""
+        name = ""
+        length = 0
+        for tag in line.rstrip("\n").split("\t")[1:]:
+            if tag.startswith("SN:"):
+                name = tag[3:]
+            elif tag.startswith("LN:"):
+                try:
+                    length = int(tag[3:])
+                except ValueError:
+                    length = 0
+        if name:
+            self.lengths[name] = length
+
+    def _switch_contig(self, contig: str) -> None:
+        """汇总上一条参考序列并为新的参考序列分配差分数组。
+
+        Raises:
+            ValueError: 输入未按坐标排序（参考序列重复出现）。
+        """
+        self._close_current()
+        if contig in self.results:
+            raise ValueError(f"alignment is not coordinate-sorted: {contig} appears in more than one block")
+        self._current = contig
+        length = self.lengths.get(contig, 0)
+        self._diff = _DiffArray(length) if length > 0 else None
+
+    def _add_cigar(self, position: int, cigar: str) -> None:
+        """按 CIGAR 拆分比对区块，相邻的 M/=/X 合并为一个区块。"""
+        assert self._diff is not None
+        limit = self._diff.length
+        block_start = block_end = position
+        reference_pos = position
+        for size_text, op in _CIGAR_RE.findall(cigar):
+            size = int(size_text)
+            if op in _CIGAR_DEPTH_OPS:
+                if reference_pos != block_end:
+                    self._add_block(block_start, block_end, limit)
+                    block_start = reference_pos
+                reference_pos += size
+                block_end = reference_pos
+            elif op in _CIGAR_SKIP_OPS:
+                reference_pos += size
+        self._add_block(block_start, block_end, limit)
+
+    def _add_block(self, start: int, end: int, limit: int) -> None:
+        """将区块裁剪到序列范围内后写入差分数组。"""
+        start = max(start, 0)
+        end = min(end, limit)
+        if end > start and self._diff is not None:
+            self._diff.add(start, end)
+
+    def _close_current(self) -> None:
+        """汇总当前参考序列并释放其差分数组。"""
+        if self._current is None:
+            return
+        length = self.lengths.get(self._current, 0)
+        result = ContigDepth(self._current, length, covered=dict.fromkeys(self.thresholds, 0))
+        if self._diff is not None:
+            result.aligned_bases, result.covered = self._diff.summarize(self.thresholds)
+        self.results[self._current] = result
+        self._current = None
+        self._diff = None
+
+    def finish(self) -> list[ContigDepth]:
+        """结束统计，按 @SQ 顺序返回全部参考序列（无 reads 的序列深度为 0）。"""
+        self._close_current()
+        ordered = [
+            self.results.get(name) or ContigDepth(name, length, covered=dict.fromkeys(self.thresholds, 0))
+            for name, length in self.lengths.items()
+        ]
+        ordered.extend(result for name, result in self.results.items() if name not in self.lengths)
+        return ordered
+
+
+def compute_depth(
+    lines: Iterable[str],
+    thresholds: tuple[int, ...] = DEPTH_THRESHOLDS,
+    *,
+    min_mapq: int = 0,
+) -> list[ContigDepth]:
+    """从 SAM 文本行计算每条参考序列的深度统计。"""
+    accumulator = DepthAccumulator(thresholds, min_mapq=min_mapq)
+    for line in lines:
+        accumulator.add_line(line)
+    return accumulator.finish()
+
+
+def summarize_depth(results: list[ContigDepth], thresholds: tuple[int, ...] = DEPTH_THRESHOLDS) -> dict[str, Any]:
+    """汇总全基因组平均深度与各阈值下的覆盖广度。"""
+    total_length = sum(item.length for item in results)
+    aligned = sum(item.aligned_bases for item in results)
+    summary: dict[str, Any] = {
+        "engine": depth_engine(),
+        "contigs": len(results),
+        "reference_length": total_length,
+        "aligned_bases": aligned,
+        "mean_depth": round(aligned / total_length, 4) if total_length else 0.0,
+    }
+    for threshold in thresholds:
+        covered = sum(item.covered.get(threshold, 0) for item in results)
+        summary[f"covered_{threshold}x"] = covered
+        summary[f"breadth_{threshold}x"] = round(covered / total_length, 6) if total_length else 0.0
+    return summary
+
+
+def write_depth_table(path: Path, results: list[ContigDepth], thresholds: tuple[int, ...] = DEPTH_THRESHOLDS) -> Path:
+    """将每条参考序列的深度统计写为 TSV。"""
+    fieldnames = ["contig", "length", "aligned_bases", "mean_depth", *(f"breadth_{value}x" for value in thresholds)]
+    with path.open("w", encoding="utf-8", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=fieldnames, delimiter="\t", lineterminator="\n")
+        writer.writeheader()
+        for item in results:
+            writer.writerow(item.to_row(thresholds))
+    return path
+
+
+def run_depth_stats(
+    alignment: Path,
+    *,
+    table_path: Path,
+    summary_path: Path,
+    reference: Path | None = None,
+    thresholds: tuple[int, ...] = DEPTH_THRESHOLDS,
+    min_mapq: int = 0,
+    stderr_log: Path | None = None,
+) -> dict[str, Any]:
+    """流式读取坐标排序的 BAM/CRAM，计算平均深度与各阈值覆盖广度。
+
+    通过 ``samtools view -h`` 解码比对记录（按 samtools depth 默认口径过滤），
+    逐条写入当前参考序列的差分数组；安装 numpy 时批量累加并以前缀和还原深度，
+    否则退化为纯 Python 实现，并记录一条警告（大参考序列上会慢很多）。
+
+    Args:
+        alignment: 坐标排序的 BAM/CRAM。
+        table_path: 每条参考序列统计 TSV 的输出路径。
+        summary_path: 汇总 JSON 的输出路径。
+        reference: CRAM 输入时使用的参考序列。
+        thresholds: 覆盖广度的深度阈值。
+        min_mapq: 计入深度的最低 MAPQ。
+        stderr_log: samtools 标准错误追加写入的日志。
+
+    Returns:
+        全基因组汇总统计。
+
+    Raises:
+        subprocess.CalledProcessError: samtools 执行失败。
+        FileNotFoundError: 未找到 samtools。
+        ValueError: 输入未按坐标排序。
+    """
+    thresholds = tuple(sorted(set(thresholds)))
+    if np is None:
+        logger.warning(
+            "numpy is not installed; depth stats use the pure-Python engine, which is much slower on large "
+            "references (install bioflow-cli[coverage] for numpy>=1.22)"
+        )
+    cmd = ["samtools", "view", "-h", "-F", hex(DEPTH_EXCLUDE_FLAGS)]
+    if reference is not None:
+        cmd.extend(["--reference", str(reference)])
+    cmd.append(str(alignment))
+    stderr_handle = stderr_log.open("a", encoding="utf-8") if stderr_log is not None else subprocess.DEVNULL
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_handle, text=True)
+        assert proc.stdout is not None
+        try:
+            results = compute_depth(proc.stdout, thresholds, min_mapq=min_mapq)
+        except ValueError:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            proc.stdout.close()
+        returncode = proc.wait()
+    finally:
+        if stderr_log is not None:
+            stderr_handle.close()  # type: ignore[union-attr]
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+    write_depth_table(table_path, results, thresholds)
+    summary = summarize_depth(results, thresholds)
+    summary_path.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
+    return summary
@@ -26,6 +26,8 @@ BIO_TOOLS: list[tuple[str, str, list[str]]] = [
     ("FastQC", "fastqc", ["conda", "install", "-y", "-c", "bioconda", "fastqc"]),
     ("SAMtools", "samtools", ["conda", "install", "-y", "-c", "bioconda", "samtools"]),
     ("BWA", "bwa", ["conda", "install", "-y", "-c", "bioconda", "bwa"]),
+    ("BWA-MEM2", "bwa-mem2", ["conda", "install", "-y", "-c", "bioconda", "bwa-mem2"]),
+    ("minimap2", "minimap2", ["conda", "install", "-y", "-c", "bioconda", "minimap2"]),
     ("BLAST+", "blastn", ["conda", "install", "-y", "-c", "bioconda", "blast"]),
     ("Trimmomatic", "trimmomatic", ["conda", "install", "-y", "-c", "bioconda", "trimmomatic"]),
 ]
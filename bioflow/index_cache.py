@@ -0,0 +1,313 @@
+"""BioFlow-CLI 索引缓存模块 — 按参考序列内容寻址、跨运行共享的比对索引。"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TextIO
+
+from bioflow.resources import parse_bytes
+from bioflow.run_layout import utc_now_iso
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows 无 fcntl，退化为无锁模式
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger("bioflow")
+
+INDEX_CACHE_ENV = "BIOFLOW_INDEX_CACHE"
+INDEX_CACHE_MAX_SIZE_ENV = "BIOFLOW_INDEX_CACHE_MAX_SIZE"
+# 缓存条目内索引文件统一使用的前缀名
+CACHE_INDEX_PREFIX = "index"
+CACHE_MANIFEST = "entry.json"
+# 本进程仍依赖其文件的条目的共享锁句柄（使用锁），进程退出时由系统释放
+_LEASES: dict[Path, TextIO] = {}
+_LEASES_LOCK = threading.Lock()
+
+
+@dataclass
+class CachedIndex:
+    """一次缓存查询的结果。"""
+
+    entry_dir: Path
+    prefix: Path
+    hit: bool
+    link_mode: str = ""
+
+
+@contextmanager
+def file_lock(path: Path, *, blocking: bool = True) -> Iterator[bool]:
+    """对锁文件加排他锁，非阻塞模式下获取失败时产出 False。"""
+    if fcntl is None:
+        yield True
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a") as handle:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(handle.fileno(), flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def _acquire_lease(path: Path) -> None:
+    """对条目的使用锁加共享锁并保持到进程结束，淘汰时据此跳过仍在使用的条目。"""
+    if fcntl is None:
+        return
+    with _LEASES_LOCK:
+        if path in _LEASES:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handle = path.open("a")
+        fcntl.flock(handle.fileno(), fcntl.LOCK_SH)
+        _LEASES[path] = handle
+
+
+def _release_leases() -> None:
+    """释放本进程持有的全部使用锁。"""
+    with _LEASES_LOCK:
+        for handle in _LEASES.values():
+            handle.close()
+        _LEASES.clear()
+
+
+def _reclaimable_size(path: Path) -> int:
+    """统计目录内仅由缓存持有（``st_nlink == 1``）的常规文件字节数。
+
+    已硬链接到运行目录的文件在删除条目后仍占用磁盘，不计入可回收空间。
+    """
+    total = 0
+    for child in path.rglob("*"):
+        try:
+            if child.is_symlink() or not child.is_file():
+                continue
+            info = child.stat()
+        except OSError:
+            continue
+        if info.st_nlink == 1:
+            total += info.st_size
+    return total
+
+
+def link_or_copy(source: Path, target: Path) -> str:
+    """优先硬链接，跨文件系统时退化为符号链接，返回所用方式。"""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.is_symlink() or target.exists():
+        target.unlink()
+    try:
+        os.link(source, target)
+        return "hardlink"
+    except OSError:
+        pass
+    try:
+        target.symlink_to(source.resolve())
+        return "symlink"
+    except OSError:
+        shutil.copy2(source, target)
+        return "copy"
+
+
+class IndexCache:
+    """机器级索引缓存。
+
+    目录结构为 ``<root>/<backend>/<sha256>/``，条目内索引文件使用统一前缀
+    ``index``，并附带 ``entry.json`` 记录来源信息；条目的 mtime 作为 LRU
+    时间戳，超出磁盘预算时按最久未使用顺序淘汰。构建在临时目录中完成后
+    原子重命名为正式条目，并以每个条目独立的文件锁保证同一索引只构建一次。
+
+    检出后运行仍依赖条目内文件（未指定链接前缀，或退化为符号链接）时，
+    本进程对条目的使用锁持有共享锁直到退出；淘汰只删除能取得排他使用锁的条目，
+    预算只统计删除后真正能释放的字节。
+    """
+
+    def __init__(self, root: Path, *, max_bytes: int | None = None) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def entry_dir(self, backend: str, digest: str) -> Path:
+        """返回条目目录路径。"""
+        return self.root / backend / digest
+
+    def _lock_path(self, backend: str, digest: str) -> Path:
+        return self.root / backend / f".{digest}.lock"
+
+    def _use_lock_path(self, backend: str, digest: str) -> Path:
+        return self.root / backend / f".{digest}.use"
+
+    @staticmethod
+    def _entry_complete(
+        entry: Path,
+        suffixes: tuple[str, ...],
+        ready: Callable[[Path], bool] | None = None,
+    ) -> bool:
+        prefix = entry / CACHE_INDEX_PREFIX
+        if not (entry / CACHE_MANIFEST).is_file():
+            return False
+        if ready is not None:
+            return ready(prefix)
+        return all(Path(f"{prefix}{suffix}").is_file() for suffix in suffixes)
+
+    def fetch_or_build(
+        self,
+        backend: str,
+        digest: str,
+        suffixes: tuple[str, ...],
+        build: Callable[[Path], bool],
+        *,
+        source: Path | None = None,
+        link_prefix: Path | None = None,
+        ready: Callable[[Path], bool] | None = None,
+    ) -> CachedIndex | None:
+        """查找缓存条目，缺失时在锁保护下构建。
+
+        Args:
+            backend: 索引类型（如 ``bwa``），用于区分不同工具的索引。
+            digest: 参考序列 sha256。
+            suffixes: 条目完整时必须存在的索引文件后缀；为空时链接条目内全部 ``index.*`` 文件。
+            build: 以临时前缀路径为参数构建索引，成功返回 True。
+            source: 参考序列路径，仅写入条目清单。
+            link_prefix: 指定时在持锁期间将索引文件链接到该前缀下，避免链接前被淘汰。
+            ready: 以条目内索引前缀为参数判断条目是否完整，用于文件集合不固定的索引（如多卷数据库）。
+
+        Returns:
+            缓存结果，构建失败时返回 None。
+        """
+        entry = self.entry_dir(backend, digest)
+        with file_lock(self._lock_path(backend, digest)):
+            if self._entry_complete(entry, suffixes, ready):
+                os.utime(entry)
+                cached = self._checkout(entry, suffixes, link_prefix, hit=True)
+                self._lease_if_needed(backend, digest, cached, link_prefix)
+                return cached
+
+            # 不完整的旧条目（例如被手工删改）直接丢弃后重建
+            if entry.exists():
+                shutil.rmtree(entry, ignore_errors=True)
+            staging = entry.with_name(f".tmp-{digest}-{os.getpid()}")
+            shutil.rmtree(staging, ignore_errors=True)
+            staging.mkdir(parents=True)
+            try:
+                if not build(staging / CACHE_INDEX_PREFIX):
+                    return None
+                manifest = {
+                    "backend": backend,
+                    "sha256": digest,
+                    "source": str(source) if source is not None else "",
+                    "created_at": utc_now_iso(),
+                }
+                (staging / CACHE_MANIFEST).write_text(
+                    json.dumps(manifest, indent=2, ensure_ascii=False),
+                    encoding="utf-8",
+                )
+                staging.rename(entry)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            cached = self._checkout(entry, suffixes, link_prefix, hit=False)
+            self._lease_if_needed(backend, digest, cached, link_prefix)
+
+        self.evict(keep=entry)
+        return cached
+
+    def _lease_if_needed(self, backend: str, digest: str, cached: CachedIndex, link_prefix: Path | None) -> None:
+        """硬链接或复制的检出与条目无关，其余情况在持有条目锁时加使用锁。"""
+        if link_prefix is None or "symlink" in cached.link_mode.split(","):
+            _acquire_lease(self._use_lock_path(backend, digest))
+
+    @staticmethod
+    def _checkout(
+        entry: Path,
+        suffixes: tuple[str, ...],
+        link_prefix: Path | None,
+        *,
+        hit: bool,
+    ) -> CachedIndex:
+        """将条目内索引文件链接到目标前缀（若指定）。"""
+        prefix = entry / CACHE_INDEX_PREFIX
+        if link_prefix is None:
+            return CachedIndex(entry, prefix, hit=hit)
+        if not suffixes:
+            suffixes = tuple(
+                sorted(path.name[len(CACHE_INDEX_PREFIX):] for path in entry.glob(f"{CACHE_INDEX_PREFIX}.*"))
+            )
+        modes = {
+            link_or_copy(Path(f"{prefix}{suffix}"), Path(f"{link_prefix}{suffix}"))
+            for suffix in suffixes
+        }
+        return CachedIndex(entry, link_prefix, hit=hit, link_mode=",".join(sorted(modes)))
+
+    def entries(self) -> list[tuple[float, int, Path]]:
+        """返回所有条目的 (最近使用时间, 可回收字节数, 路径)，按最久未使用排序。"""
+        found: list[tuple[float, int, Path]] = []
+        if not self.root.is_dir():
+            return found
+        for backend_dir in self.root.iterdir():
+            if not backend_dir.is_dir():
+                continue
+            for entry in backend_dir.iterdir():
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+                try:
+                    used_at = entry.stat().st_mtime
+                except OSError:
+                    continue
+                found.append((used_at, _reclaimable_size(entry), entry))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def evict(self, *, keep: Path | None = None) -> list[Path]:
+        """按 LRU 淘汰条目直至可回收占用不超过预算。
+
+        正在构建/检出或仍被运行使用的条目，以及删除后不释放空间（文件均已硬链接到运行目录）的条目会跳过。
+        """
+        if self.max_bytes is None:
+            return []
+        entries = self.entries()
+        total = sum(size for _used, size, _path in entries)
+        removed: list[Path] = []
+        for _used, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            if size == 0 or (keep is not None and entry == keep):
+                continue
+            backend, digest = entry.parent.name, entry.name
+            with file_lock(self._lock_path(backend, digest), blocking=False) as acquired:
+                if not acquired:
+                    continue
+                with file_lock(self._use_lock_path(backend, digest), blocking=False) as unused:
+                    if not unused:
+                        continue
+                    shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed.append(entry)
+            logger.info("evicted index cache entry %s (%d bytes)", entry, size)
+        return removed
+
+
+def resolve_index_cache(
+    root: str | Path | None = None,
+    max_size: str | int | None = None,
+) -> IndexCache | None:
+    """根据参数或环境变量构造索引缓存，均未配置时返回 None。
+
+    Raises:
+        ValueError: 磁盘预算格式非法。
+    """
+    root_value = root if root is not None else os.environ.get(INDEX_CACHE_ENV)
+    if not root_value:
+        return None
+    size_value = max_size if max_size is not None else os.environ.get(INDEX_CACHE_MAX_SIZE_ENV)
+    max_bytes = parse_bytes(size_value) if size_value else None
+    return IndexCache(Path(root_value).expanduser(), max_bytes=max_bytes)
@@ -40,6 +40,7 @@ STRINGS = {
     "align_title": "Sequence Alignment",
     "align_ref_prompt": "Enter reference genome path:",
     "align_input_prompt": "Enter reads file path:",
+    "align_input2_prompt": "Enter paired-end R2 file path (leave empty for single-end):",
     "align_output_prompt": "Enter output BAM path:",
     "align_threads_prompt": "Number of threads (default 1):",
     "align_pipeline_start": "Starting alignment: {file}",
@@ -56,16 +57,32 @@ STRINGS = {
     "align_stats_secondary": "Secondary",
     "align_stats_supplementary": "Supplementary",
     "align_stats_duplicates": "Duplicates",
+    "align_stats_paired": "Paired in sequencing",
+    "align_stats_properly_paired": "Properly paired",
+    "align_stats_mapq": "Mean MAPQ",
+    "align_stats_insert_size": "Insert size (median / mean)",
     "align_windows_warn": "Alignment module is recommended for use with WSL on Windows.",
-    "align_indexing": "Building BWA index for {file}...",
+    "align_indexing": "Building {aligner} index for {file}...",
     "align_mapping": "Mapping reads to reference...",
     "align_sorting": "Sorting BAM file...",
     "align_flagstat": "Generating alignment statistics...",
-    "align_step_index": "BWA Index",
-    "align_step_index_cached": "BWA Index (cached)",
-    "align_step_map_sort": "BWA mem + SAMtools sort",
+    "align_step_index": "Reference index",
+    "align_step_index_cached": "Reference index (cached)",
+    "align_step_map_sort": "Align + SAMtools sort",
     "align_step_bam_index": "SAMtools index",
+    "align_step_split": "Split reads into shards",
+    "align_step_merge": "SAMtools merge",
     "align_step_flagstat": "SAMtools flagstat",
+    "align_step_markdup": "SAMtools markdup",
+    "align_step_depth": "Depth and breadth (1x/10x/30x)",
+    "align_depth_stats": "Streaming the sorted alignment into per-contig depth arrays ({engine} engine)...",
+    "align_step_regions": "Region-parallel coverage stats",
+    "align_region_stats": "Computing per-contig idxstats and coverage with {jobs} worker(s)...",
+    "align_stats_coverage": "Mean depth (breadth)",
+    "align_stats_depth_breadth": "Breadth ≥10x / ≥30x",
+    "align_stats_unmapped_fastq": "Unmapped reads exported",
+    "align_unmapped_written": "Exported {count} unmapped reads as gzipped FASTQ to {path}",
+    "align_markdup": "Marking duplicates (collate → fixmate → sort → markdup)...",
 
     # === Search ===
     "search_title": "BLAST Search",
@@ -174,4 +191,43 @@ STRINGS = {
     "batch_col_error": "Error",
     "batch_col_reason": "Reason",
     "batch_summary": "Total: {total} files | Success: {success} | Failed: {failed} | Skipped: {skipped}",
+    "batch_auto_budget": "Auto workers: CPU budget {cpu}, memory budget {memory}",
+    "batch_slowest_title": "Slowest {count} Files",
+    "batch_totals": "Sequences: {sequences} | Processing time: {time}",
+    "batch_results_file": "Per-file results written to: {path}",
+    "batch_path_map": "Source-to-output path map: {path}",
+    "batch_qc_title": "FASTQ Quality Summary (all files)",
+    "batch_col_fastq_files": "FASTQ Files",
+    "batch_col_bases": "Bases",
+    "batch_col_avg_q": "Avg Q",
+    "batch_col_q20": "Q20",
+    "batch_col_q30": "Q30",
+    "align_index_cache_hit": "Reusing cached {aligner} index: {path}",
+    "align_resume_read_group_changed": "Read group changed since the last run; re-running alignment instead of resuming",
+    "align_resume_aligner_changed": "Aligner changed from {previous} to {aligner}; rebuilding index and alignment instead of resuming",
+    "align_index_cache_invalid": "Index cache disabled: {err}",
+    "align_merging": "Merging {count} shard BAM files...",
+    "align_progress": "Aligning",
+    "align_faidx": "Indexing reference {file} for CRAM (samtools faidx)...",
+    "align_samples_start": "Aligning {count} samples, {jobs} at a time with {threads} thread(s) each",
+    "align_samples_done": "[{done}/{total}] {sample} finished",
+    "align_samples_failed": "[{done}/{total}] {sample} failed",
+    "align_samples_summary": "Per-sample flagstat summary: {path}",
+    "align_samples_title": "Sample Alignment Summary",
+    "align_samples_col_sample": "Sample",
+    "align_samples_col_status": "Status",
+    "align_shard_done": "Shard alignment finished: {done}/{total}",
+    "align_chunks_resumed": "Reusing {done}/{total} completed chunk(s) with valid completion markers",
+    "align_resume_inputs_changed": "Inputs differ from the previous run; alignment steps will be recomputed.",
+    "ref_preparing": "Preparing reference bundle for {file}...",
+    "ref_prepare_done": "Reference bundle ready: {path} ({sequences} sequences, {length} bp)",
+    "ref_prepare_failed": "Reference bundle index build failed; see logs/prepare.stderr.log in the bundle.",
+    "ref_index_built": "built",
+    "ref_index_reused": "reused from bundle",
+    "ref_bundle_used": "Using reference bundle {path}",
+    "search_shard_done": "Query shard searched: {done}/{total}",
+    "search_shards_resumed": "Reusing {done}/{total} completed query shard(s)",
+    "search_query_tables_done": "Per-query table: {path} | Queries with hits: {queries}",
+    "search_db_cache_hit": "BLAST database reused from cache: {path}",
+    "search_db_cache_invalid": "BLAST database cache disabled: {err}",
 }
@@ -40,6 +40,7 @@ STRINGS = {
     "align_title": "序列比对",
     "align_ref_prompt": "请输入参考基因组路径：",
     "align_input_prompt": "请输入 reads 文件路径：",
+    "align_input2_prompt": "请输入双端测序 R2 文件路径（单端留空）：",
     "align_output_prompt": "请输入输出 BAM 路径：",
     "align_threads_prompt": "线程数（默认 1）：",
     "align_pipeline_start": "开始比对：{file}",
@@ -56,16 +57,32 @@ STRINGS = {
     "align_stats_secondary": "次级比对",
     "align_stats_supplementary": "补充比对",
     "align_stats_duplicates": "重复",
+    "align_stats_paired": "双端 reads",
+    "align_stats_properly_paired": "正确配对",
+    "align_stats_mapq": "平均 MAPQ",
+    "align_stats_insert_size": "插入片段长度（中位数 / 均值）",
     "align_windows_warn": "比对模块在 Windows 上推荐使用 WSL。",
-    "align_indexing": "正在为 {file} 构建 BWA 索引...",
+    "align_indexing": "正在为 {file} 构建 {aligner} 索引...",
     "align_mapping": "正在将 reads 比对到参考基因组...",
     "align_sorting": "正在排序 BAM 文件...",
     "align_flagstat": "正在生成比对统计...",
-    "align_step_index": "BWA 建索引",
-    "align_step_index_cached": "BWA 建索引（已缓存）",
-    "align_step_map_sort": "BWA mem + SAMtools 排序",
+    "align_step_index": "参考序列建索引",
+    "align_step_index_cached": "参考序列建索引（已缓存）",
+    "align_step_map_sort": "比对 + SAMtools 排序",
     "align_step_bam_index": "SAMtools 建索引",
+    "align_step_split": "拆分 reads",
+    "align_step_merge": "SAMtools 合并",
     "align_step_flagstat": "SAMtools flagstat",
+    "align_step_markdup": "SAMtools markdup",
+    "align_step_depth": "深度与覆盖广度 (1x/10x/30x)",
+    "align_depth_stats": "正在流式读取排序结果并按染色体累计深度（{engine} 实现）...",
+    "align_step_regions": "按区域并行覆盖度统计",
+    "align_region_stats": "正在以 {jobs} 个进程按染色体统计 idxstats 与覆盖度...",
+    "align_stats_coverage": "平均深度（覆盖广度）",
+    "align_stats_depth_breadth": "覆盖广度 ≥10x / ≥30x",
+    "align_stats_unmapped_fastq": "导出的未比对 reads",
+    "align_unmapped_written": "已将 {count} 条未比对 reads 导出为 gzip FASTQ：{path}",
+    "align_markdup": "正在标记重复 (collate → fixmate → sort → markdup)...",
 
     # === BLAST 检索 ===
     "search_title": "BLAST 检索",
@@ -174,4 +191,43 @@ STRINGS = {
     "batch_col_error": "错误信息",
     "batch_col_reason": "原因",
     "batch_summary": "总计：{total} 个文件 | 成功：{success} | 失败：{failed} | 跳过：{skipped}",
+    "batch_auto_budget": "自动并发：CPU 预算 {cpu}，内存预算 {memory}",
+    "batch_slowest_title": "耗时最长的 {count} 个文件",
+    "batch_totals": "序列总数：{sequences} | 处理耗时：{time}",
+    "batch_results_file": "逐文件结果已写入：{path}",
+    "batch_path_map": "源文件与输出路径映射：{path}",
+    "batch_qc_title": "FASTQ 质量汇总（全部文件）",
+    "batch_col_fastq_files": "FASTQ 文件数",
+    "batch_col_bases": "碱基数",
+    "batch_col_avg_q": "平均 Q",
+    "batch_col_q20": "Q20",
+    "batch_col_q30": "Q30",
+    "align_index_cache_hit": "复用缓存的 {aligner} 索引：{path}",
+    "align_resume_read_group_changed": "读组与上次运行不同，将重新比对而不是恢复",
+    "align_resume_aligner_changed": "比对器已由 {previous} 改为 {aligner}，将重新建索引并比对而不是恢复",
+    "align_index_cache_invalid": "索引缓存已禁用：{err}",
+    "align_merging": "正在合并 {count} 个分片 BAM 文件...",
+    "align_progress": "比对中",
+    "align_faidx": "正在为 CRAM 构建参考序列索引 {file} (samtools faidx)...",
+    "align_samples_start": "正在比对 {count} 个样本，同时运行 {jobs} 个，每个 {threads} 线程",
+    "align_samples_done": "[{done}/{total}] {sample} 已完成",
+    "align_samples_failed": "[{done}/{total}] {sample} 失败",
+    "align_samples_summary": "各样本 flagstat 汇总表: {path}",
+    "align_samples_title": "多样本比对汇总",
+    "align_samples_col_sample": "样本",
+    "align_samples_col_status": "状态",
+    "align_shard_done": "分片比对完成：{done}/{total}",
+    "align_chunks_resumed": "复用 {done}/{total} 个带有效完成标记的已完成分块",
+    "align_resume_inputs_changed": "输入与上次运行不同，比对相关步骤将重新计算。",
+    "ref_preparing": "正在为 {file} 准备参考序列包...",
+    "ref_prepare_done": "参考序列包已就绪：{path}（{sequences} 条序列，{length} bp）",
+    "ref_prepare_failed": "参考序列包索引构建失败，详见包内 logs/prepare.stderr.log。",
+    "ref_index_built": "已构建",
+    "ref_index_reused": "复用包内已有索引",
+    "ref_bundle_used": "使用参考序列包 {path}",
+    "search_shard_done": "查询分片检索完成：{done}/{total}",
+    "search_shards_resumed": "复用 {done}/{total} 个已完成的查询分片",
+    "search_query_tables_done": "按 query 汇总表：{path} | 有命中的 query 数：{queries}",
+    "search_db_cache_hit": "从缓存复用 BLAST 数据库：{path}",
+    "search_db_cache_invalid": "BLAST 数据库缓存已禁用：{err}",
 }
@@ -15,6 +15,8 @@ TOOL_REGISTRY: dict[str, tuple[str, str]] = {
     "trimmomatic": ("trimmomatic", "conda install -y -c bioconda trimmomatic"),
     "samtools": ("samtools", "conda install -y -c bioconda samtools"),
     "bwa": ("bwa", "conda install -y -c bioconda bwa"),
+    "bwa-mem2": ("bwa-mem2", "conda install -y -c bioconda bwa-mem2"),
+    "minimap2": ("minimap2", "conda install -y -c bioconda minimap2"),
     "makeblastdb": ("makeblastdb", "conda install -y -c bioconda blast"),
     "blastn": ("blastn", "conda install -y -c bioconda blast"),
 }
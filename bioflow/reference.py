@@ -0,0 +1,323 @@
+"""BioFlow-CLI 参考序列包模块 — 一次读取完成规范化、.fai/.dict 与并行索引构建。"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from bioflow.aligners import AlignerBackend
+from bioflow.alignment import run_aligner_index
+from bioflow.bio_tasks import FastaIndexEntry, format_sequence_file
+from bioflow.index_cache import file_lock
+from bioflow.run_layout import describe_path, detect_tool_version, utc_now_iso
+from bioflow.search import blast_db_index_files, build_blast_db
+
+logger = logging.getLogger("bioflow")
+
+REF_BUNDLE_ENV = "BIOFLOW_REF_BUNDLES"
+# 包格式版本：布局或清单字段不兼容变化时递增，旧版本程序拒绝读取新包
+REF_BUNDLE_VERSION = 1
+BUNDLE_MANIFEST = "bundle.json"
+BUNDLE_FASTA = "reference.fa"
+BUNDLE_DICT = "reference.dict"
+BLAST_INDEX_KEY = "blast"
+
+
+@dataclass
+class ReferenceBundle:
+    """按规范化参考序列 sha256 寻址的参考序列包。
+
+    目录结构为 ``<root>/<sha256>/``：``reference.fa`` 及其 ``.fai``、``.dict``
+    与 BLAST 数据库位于包根目录，比对器索引位于 ``<后端>/reference.fa*``；
+    ``bundle.json`` 记录包版本、来源、序列统计以及各索引的文件与工具版本。
+    """
+
+    root: Path
+    manifest: dict[str, Any]
+
+    @property
+    def fasta(self) -> Path:
+        """规范化后的参考序列路径。"""
+        return self.root / BUNDLE_FASTA
+
+    @property
+    def sha256(self) -> str:
+        """规范化参考序列的 sha256。"""
+        return str(self.manifest.get("sha256", ""))
+
+    @property
+    def indexes(self) -> dict[str, Any]:
+        """已构建完成的索引清单，键为比对器标签或 ``blast``。"""
+        indexes = self.manifest.get("indexes")
+        return indexes if isinstance(indexes, dict) else {}
+
+    def index_prefix(self, label: str) -> Path | None:
+        """返回指定比对器标签的索引前缀，未构建或文件缺失时返回 None。"""
+        entry = self.indexes.get(label)
+        if not isinstance(entry, dict) or not entry.get("prefix"):
+            return None
+        files = [self.root / name for name in entry.get("files", [])]
+        if not files or not all(path.is_file() for path in files):
+            return None
+        return self.root / str(entry["prefix"])
+
+    def ref_details(self) -> dict[str, Any]:
+        """返回参考序列描述，直接使用清单中的 sha256 而不重新哈希。"""
+        return describe_path(self.fasta, sha256=self.sha256 or None)
+
+
+def resolve_bundle_root(root: str | Path | None = None) -> Path:
+    """返回参考序列包根目录：参数 > ``BIOFLOW_REF_BUNDLES`` > 用户目录下的默认位置。"""
+    value = root if root is not None else os.environ.get(REF_BUNDLE_ENV)
+    if value:
+        return Path(value).expanduser()
+    return Path.home() / ".bioflow" / "references"
+
+
+def load_reference_bundle(path: Path) -> ReferenceBundle | None:
+    """将包目录或其 ``bundle.json`` 解析为参考序列包，普通文件返回 None。
+
+    Raises:
+        ValueError: 清单无法解析、包版本过新或缺少参考序列。
+    """
+    manifest_path = path if path.name == BUNDLE_MANIFEST else path / BUNDLE_MANIFEST
+    if not manifest_path.is_file():
+        return None
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as exc:
+        raise ValueError(f"unreadable reference bundle manifest: {manifest_path} ({exc})") from exc
+    if not isinstance(manifest, dict):
+        raise ValueError(f"invalid reference bundle manifest: {manifest_path}")
+    version = manifest.get("bundle_version")
+    if not isinstance(version, int) or version > REF_BUNDLE_VERSION:
+        raise ValueError(f"unsupported reference bundle version {version!r} (supported: <= {REF_BUNDLE_VERSION})")
+    bundle = ReferenceBundle(manifest_path.parent, manifest)
+    if not bundle.fasta.is_file():
+        raise ValueError(f"reference bundle is missing {BUNDLE_FASTA}: {bundle.root}")
+    return bundle
+
+
+def _write_manifest(root: Path, manifest: dict[str, Any]) -> None:
+    """先写临时文件再替换，读取方不会看到写了一半的清单。"""
+    temp_path = root / f".{BUNDLE_MANIFEST}.tmp"
+    temp_path.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+    temp_path.replace(root / BUNDLE_MANIFEST)
+
+
+def _write_fai_and_dict(fasta: Path, entries: list[FastaIndexEntry], *, uri_path: Path) -> None:
+    """由格式化时收集的条目直接写出 ``.fai`` 与 Picard 风格的 ``.dict``，UR 指向 ``uri_path``。
+
+    Raises:
+        ValueError: 序列名为空或重复。
+    """
+    seen: set[str] = set()
+    for entry in entries:
+        if not entry.name or entry.name in seen:
+            raise ValueError(f"reference sequence names must be unique and non-empty (got {entry.name!r})")
+        seen.add(entry.name)
+    fasta.with_name(fasta.name + ".fai").write_text(
+        "".join(entry.fai_line() for entry in entries),
+        encoding="utf-8",
+    )
+    lines = ["@HD\tVN:1.6\n"]
+    lines.extend(
+        f"@SQ\tSN:{entry.name}\tLN:{entry.length}\tM5:{entry.md5}\tUR:file:{uri_path.resolve()}\n"
+        for entry in entries
+    )
+    (fasta.parent / BUNDLE_DICT).write_text("".join(lines), encoding="utf-8")
+
+
+def _aligner_index_entry(backend: AlignerBackend) -> dict[str, Any]:
+    prefix = Path(backend.cache_key) / BUNDLE_FASTA
+    return {
+        "prefix": str(prefix),
+        "files": [str(path) for path in backend.index_files(prefix)],
+    }
+
+
+def _blast_index_entry(root: Path) -> dict[str, Any]:
+    # 多卷数据库的卷数在建库后才知道，文件清单需在构建完成后生成
+    return {
+        "prefix": BUNDLE_FASTA,
+        "files": [str(path.relative_to(root)) for path in blast_db_index_files(root / BUNDLE_FASTA)],
+    }
+
+
+def prepare_reference_bundle(
+    source: Path,
+    *,
+    root: Path,
+    aligners: tuple[AlignerBackend, ...] = (),
+    blast: bool = False,
+    width: int = 80,
+    quiet: bool = False,
+) -> tuple[ReferenceBundle, dict[str, bool]] | None:
+    """流式规范化参考序列并在内容寻址的包中并行构建所需索引。
+
+    参考序列只读取一次：格式化输出的同时计算 sha256、``.fai`` 偏移与每条
+    序列的 MD5。规范化内容相同的参考序列（即使来源换行或大小写不同）落在
+    同一个包中，已构建的索引直接复用，只补建缺失的部分；各索引构建在线程
+    池中并发运行。包级锁只在创建包目录和合并清单时短暂持有，每个索引另有
+    独立的锁，并发的 ``ref prepare`` 只会等待自己也要构建的同一个索引。
+
+    Args:
+        source: 原始参考序列 FASTA。
+        root: 参考序列包根目录。
+        aligners: 需要构建索引的比对器后端。
+        blast: 是否构建 BLAST nucleotide 数据库。
+        width: 规范化 FASTA 的行宽。
+        quiet: 是否隐藏索引构建进度。
+
+    Returns:
+        (参考序列包, 各索引本次是否新建)；任一索引构建失败时返回 None。
+
+    Raises:
+        ValueError: 输入不是 FASTA，或序列名为空、重复。
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    # 同一进程内多个线程可能同时准备同名来源，暂存目录名需唯一
+    staging = root / f".tmp-{os.getpid()}-{uuid.uuid4().hex[:12]}-{source.name}"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir()
+    try:
+        entries: list[FastaIndexEntry] = []
+        digest = hashlib.sha256()
+        _seq_format, count, _stats = format_sequence_file(
+            source,
+            staging / BUNDLE_FASTA,
+            width,
+            fasta_index=entries,
+            digest=digest,
+        )
+        sha256 = digest.hexdigest()
+        bundle_dir = root / sha256
+        _write_fai_and_dict(staging / BUNDLE_FASTA, entries, uri_path=bundle_dir / BUNDLE_FASTA)
+        bundle_lock = root / f".{sha256}.lock"
+        with file_lock(bundle_lock):
+            if not (bundle_dir / BUNDLE_MANIFEST).is_file():
+                # 没有清单的目录是中断的旧构建，直接替换
+                shutil.rmtree(bundle_dir, ignore_errors=True)
+                _write_manifest(
+                    staging,
+                    {
+                        "bundle_version": REF_BUNDLE_VERSION,
+                        "sha256": sha256,
+                        "source": str(source.resolve()),
+                        "created_at": utc_now_iso(),
+                        "width": width,
+                        "sequences": count,
+                        "total_length": sum(entry.length for entry in entries),
+                        "indexes": {},
+                    },
+                )
+                staging.rename(bundle_dir)
+            bundle = load_reference_bundle(bundle_dir)
+        if bundle is None:
+            raise ValueError(f"reference bundle manifest missing: {bundle_dir}")
+        built = _build_missing_indexes(bundle, aligners, blast=blast, quiet=quiet, bundle_lock=bundle_lock)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    if built is None:
+        return None
+    return bundle, built
+
+
+_LOCK_NAME_UNSAFE = re.compile(r"[^\w.-]")
+
+
+def _index_lock_path(bundle: ReferenceBundle, label: str) -> Path:
+    """返回单个索引的构建锁路径，标签中的 ``:`` 等字符替换为 ``_``。"""
+    return bundle.root / f".index-{_LOCK_NAME_UNSAFE.sub('_', label)}.lock"
+
+
+def _record_index(bundle: ReferenceBundle, label: str, entry: dict[str, Any], *, bundle_lock: Path) -> None:
+    """在包级锁内重新读取清单并合并一条索引记录，保留其他进程同时写入的索引。"""
+    with file_lock(bundle_lock):
+        current = load_reference_bundle(bundle.root)
+        manifest = current.manifest if current is not None else bundle.manifest
+        indexes = dict(manifest.get("indexes") or {})
+        indexes[label] = entry
+        bundle.manifest = {**manifest, "indexes": indexes, "updated_at": utc_now_iso()}
+        _write_manifest(bundle.root, bundle.manifest)
+
+
+def _build_missing_indexes(
+    bundle: ReferenceBundle,
+    aligners: tuple[AlignerBackend, ...],
+    *,
+    blast: bool,
+    quiet: bool,
+    bundle_lock: Path,
+) -> dict[str, bool] | None:
+    """并行构建包中缺失的索引，成功的索引即使其他索引失败也会写入清单。
+
+    每个索引在自己的锁内构建：取得锁后重新读取清单，若其他进程已建好则直接复用。
+    """
+    stdout_log = bundle.root / "logs" / "prepare.stdout.log"
+    stderr_log = bundle.root / "logs" / "prepare.stderr.log"
+    tasks: dict[str, tuple[dict[str, Any], Any]] = {}
+    for backend in aligners:
+        if bundle.index_prefix(backend.label) is None:
+            entry = _aligner_index_entry(backend)
+            (bundle.root / backend.cache_key).mkdir(exist_ok=True)
+            tasks[backend.label] = (
+                {**entry, "tool": backend.executable},
+                lambda backend=backend, entry=entry: run_aligner_index(
+                    bundle.fasta,
+                    aligner=backend,
+                    prefix=bundle.root / entry["prefix"],
+                    quiet=quiet,
+                    stdout_log=stdout_log,
+                    stderr_log=stderr_log,
+                ),
+            )
+    if blast and bundle.index_prefix(BLAST_INDEX_KEY) is None:
+        tasks[BLAST_INDEX_KEY] = (
+            {"tool": "makeblastdb"},
+            lambda: build_blast_db(bundle.fasta, quiet=quiet, stdout_log=stdout_log, stderr_log=stderr_log),
+        )
+    built = {backend.label: False for backend in aligners}
+    if blast:
+        built[BLAST_INDEX_KEY] = False
+    if not tasks:
+        return built
+
+    def run(label: str) -> bool | None:
+        """构建单个索引并写入清单；已由其他进程建好时返回 None。"""
+        entry, build = tasks[label]
+        with file_lock(_index_lock_path(bundle, label)):
+            current = load_reference_bundle(bundle.root)
+            if current is not None and current.index_prefix(label) is not None:
+                return None
+            if not build():
+                logger.error("reference bundle index %s failed (see %s)", label, stderr_log)
+                return False
+            tool = entry["tool"]
+            entry = {key: value for key, value in entry.items() if key != "tool"}
+            if label == BLAST_INDEX_KEY:
+                entry = _blast_index_entry(bundle.root)
+            record = {**entry, "tool_version": detect_tool_version(tool), "built_at": utc_now_iso()}
+            _record_index(bundle, label, record, bundle_lock=bundle_lock)
+            return True
+
+    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        futures = {label: executor.submit(run, label) for label in tasks}
+        results = {label: future.result() for label, future in futures.items()}
+
+    # 其他进程可能同时补建了别的索引，以磁盘上的最新清单为准
+    current = load_reference_bundle(bundle.root)
+    if current is not None:
+        bundle.manifest = current.manifest
+    for label, result in results.items():
+        built[label] = result is True
+    return built if all(result is not False for result in results.values()) else None
@@ -0,0 +1,268 @@
+"""BioFlow-CLI 区域并行后处理模块 — 基于 BAM/CRAM 索引按染色体并发统计。"""
+
+from __future__ import annotations
+
+import csv
+import json
+import re
+import shlex
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+REGION_FIELDS = (
+    "contig",
+    "length",
+    "mapped",
+    "unmapped",
+    "covered_bases",
+    "breadth",
+    "mean_depth",
+    "mean_mapq",
+    "commands_failed",
+)
+
+
+@dataclass
+class RegionTask:
+    """单个染色体的后处理任务，需可被 pickle 传给工作进程。"""
+
+    contig: str
+    length: int
+    mapped: int
+    unmapped: int
+    alignment: Path
+    reference: Path | None = None
+    commands: tuple[str, ...] = ()
+    command_dir: Path | None = None
+
+
+@dataclass
+class RegionResult:
+    """单个染色体的统计结果。"""
+
+    contig: str
+    length: int
+    mapped: int
+    unmapped: int
+    covered_bases: int = 0
+    mean_depth: float = 0.0
+    mean_mapq: float = 0.0
+    command_errors: list[str] = field(default_factory=list)
+    error: str = ""
+
+    def to_row(self) -> dict[str, Any]:
+        """返回写入 TSV 的一行。"""
+        return {
+            "contig": self.contig,
+            "length": self.length,
+            "mapped": self.mapped,
+            "unmapped": self.unmapped,
+            "covered_bases": self.covered_bases,
+            "breadth": round(self.covered_bases / self.length, 6) if self.length else 0.0,
+            "mean_depth": round(self.mean_depth, 4),
+            "mean_mapq": round(self.mean_mapq, 2),
+            "commands_failed": len(self.command_errors),
+        }
+
+
+def _reference_args(reference: Path | None) -> list[str]:
+    """CRAM 输入时附加 --reference。"""
+    return ["--reference", str(reference)] if reference is not None else []
+
+
+def parse_idxstats(text: str) -> list[tuple[str, int, int, int]]:
+    """解析 ``samtools idxstats`` 输出为 (contig, 长度, mapped, unmapped) 列表，跳过 ``*`` 行。"""
+    contigs: list[tuple[str, int, int, int]] = []
+    for line in text.splitlines():
+        parts = line.split("\t")
+        if len(parts) < 4 or parts[0] == "*":
+            continue
+        try:
+            contigs.append((parts[0], int(parts[1]), int(parts[2]), int(parts[3])))
+        except ValueError:
+            continue
+    return contigs
+
+
+def run_idxstats(alignment: Path, *, reference: Path | None = None) -> list[tuple[str, int, int, int]]:
+    """运行 samtools idxstats，仅读取索引即可得到每条染色体的 reads 计数。
+
+    Raises:
+        subprocess.CalledProcessError: samtools 执行失败。
+        FileNotFoundError: 未找到 samtools。
+    """
+    result = subprocess.run(
+        ["samtools", "idxstats", *_reference_args(reference), str(alignment)],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return parse_idxstats(result.stdout)
+
+
+def parse_coverage(text: str) -> tuple[int, float, float]:
+    """解析 ``samtools coverage`` 单区域输出，返回 (覆盖碱基数, 平均深度, 平均 MAPQ)。"""
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        parts = line.split("\t")
+        if len(parts) < 9:
+            continue
+        try:
+            return int(parts[4]), float(parts[6]), float(parts[8])
+        except ValueError:
+            continue
+    return 0, 0.0, 0.0
+
+
+def region_spec(contig: str) -> str:
+    """返回整条染色体的 htslib 区域写法，名称加花括号，含 ``:``/``-`` 的 HLA/alt 名不会被解析为坐标范围。"""
+    return f"{{{contig}}}"
+
+
+def _safe_name(contig: str) -> str:
+    """将染色体名转换为可用作文件名的形式。"""
+    return re.sub(r"[^\w.-]", "_", contig) or "contig"
+
+
+def _process_region(task: RegionTask) -> RegionResult:
+    """工作进程入口：统计单条染色体的覆盖度并运行自定义命令。"""
+    result = RegionResult(task.contig, task.length, task.mapped, task.unmapped)
+    # idxstats 显示无 reads 的染色体覆盖度必为 0，无需再启动 samtools
+    if task.mapped > 0:
+        try:
+            completed = subprocess.run(
+                [
+                    "samtools", "coverage", *_reference_args(task.reference),
+                    "-r", region_spec(task.contig), str(task.alignment),
+                ],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            result.covered_bases, result.mean_depth, result.mean_mapq = parse_coverage(completed.stdout)
+        except (subprocess.CalledProcessError, FileNotFoundError) as exc:
+            stderr = getattr(exc, "stderr", "") or ""
+            result.error = (stderr.strip() or str(exc)).splitlines()[-1]
+            return result
+
+    for index, template in enumerate(task.commands):
+        values = {
+            "region": region_spec(task.contig),
+            "contig": task.contig,
+            "length": task.length,
+            "bam": task.alignment,
+            "name": _safe_name(task.contig),
+        }
+        try:
+            cmd = [part.format(**values) for part in shlex.split(template)]
+        except (KeyError, ValueError) as exc:
+            result.command_errors.append(f"{template}: {exc}")
+            continue
+        output_path = None
+        if task.command_dir is not None:
+            output_path = task.command_dir / f"{_safe_name(task.contig)}.cmd{index}.out"
+        try:
+            if output_path is None:
+                completed_cmd = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
+            else:
+                with output_path.open("wb") as handle:
+                    completed_cmd = subprocess.run(cmd, stdout=handle, stderr=subprocess.PIPE, check=False)
+        except OSError as exc:
+            result.command_errors.append(f"{cmd[0] if cmd else template}: {exc}")
+            continue
+        if completed_cmd.returncode != 0:
+            stderr_text = completed_cmd.stderr.decode("utf-8", errors="replace").strip()
+            result.command_errors.append(stderr_text.splitlines()[-1] if stderr_text else f"exit {completed_cmd.returncode}")
+    return result
+
+
+def summarize_regions(results: list[RegionResult]) -> dict[str, Any]:
+    """按染色体长度加权汇总全基因组覆盖度统计。"""
+    total_length = sum(item.length for item in results)
+    covered = sum(item.covered_bases for item in results)
+    depth_sum = sum(item.mean_depth * item.length for item in results)
+    return {
+        "contigs": len(results),
+        "reference_length": total_length,
+        "covered_bases": covered,
+        "breadth": round(covered / total_length, 6) if total_length else 0.0,
+        "mean_depth": round(depth_sum / total_length, 4) if total_length else 0.0,
+        "contigs_with_reads": sum(1 for item in results if item.mapped > 0),
+        "failed_contigs": [item.contig for item in results if item.error],
+        "contig_errors": {item.contig: item.error for item in results if item.error},
+        "command_failures": sum(len(item.command_errors) for item in results),
+    }
+
+
+def write_region_table(path: Path, results: list[RegionResult]) -> Path:
+    """将每条染色体的统计写为 TSV。"""
+    with path.open("w", encoding="utf-8", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=REGION_FIELDS, delimiter="\t", lineterminator="\n")
+        writer.writeheader()
+        for item in results:
+            writer.writerow(item.to_row())
+    return path
+
+
+def run_region_stats(
+    alignment: Path,
+    *,
+    table_path: Path,
+    summary_path: Path,
+    jobs: int = 1,
+    reference: Path | None = None,
+    commands: tuple[str, ...] = (),
+    command_dir: Path | None = None,
+) -> dict[str, Any]:
+    """按染色体并行统计已索引 BAM/CRAM 的覆盖度，并可对每个区域运行自定义命令。
+
+    先用 ``samtools idxstats`` 从索引取得染色体列表与 reads 计数，再在进程池中
+    对每条染色体运行 ``samtools coverage -r``，大染色体优先提交以缩短尾部等待。
+    自定义命令模板支持 ``{region}``（加花括号的 htslib 区域）、``{contig}``（原始名称）、
+    ``{name}``、``{length}``、``{bam}`` 占位符，标准输出写入 ``command_dir/<name>.cmd<N>.out``。
+    单条染色体 coverage 失败时仍写出其余结果，失败的染色体及错误记录在汇总的
+    ``failed_contigs``/``contig_errors`` 中，由调用方决定步骤状态。
+
+    Args:
+        alignment: 已建立索引的 BAM/CRAM。
+        table_path: 每条染色体统计 TSV 的输出路径。
+        summary_path: 汇总 JSON 的输出路径。
+        jobs: 并发工作进程数。
+        reference: CRAM 输入时使用的参考序列。
+        commands: 对每个区域运行的命令模板。
+        command_dir: 自定义命令输出目录。
+
+    Returns:
+        全基因组汇总统计。
+
+    Raises:
+        subprocess.CalledProcessError: idxstats 执行失败。
+        FileNotFoundError: 未找到 samtools。
+    """
+    contigs = run_idxstats(alignment, reference=reference)
+    if command_dir is not None and commands:
+        command_dir.mkdir(parents=True, exist_ok=True)
+    tasks = [
+        RegionTask(name, length, mapped, unmapped, alignment, reference, commands, command_dir)
+        for name, length, mapped, unmapped in contigs
+    ]
+    order = sorted(range(len(tasks)), key=lambda index: tasks[index].length, reverse=True)
+    results: list[RegionResult | None] = [None] * len(tasks)
+    if jobs <= 1 or len(tasks) <= 1:
+        for index in order:
+            results[index] = _process_region(tasks[index])
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+            futures = {index: executor.submit(_process_region, tasks[index]) for index in order}
+            for index, future in futures.items():
+                results[index] = future.result()
+
+    ordered = [item for item in results if item is not None]
+    write_region_table(table_path, ordered)
+    summary = summarize_regions(ordered)
+    summary_path.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
+    return summary
@@ -0,0 +1,176 @@
+"""BioFlow-CLI 资源探测模块 — CPU 与内存预算估算。"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+MEMINFO_PATH = Path("/proc/meminfo")
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+PROC_ROOT = Path("/proc")
+
+# cgroup v1 在无限制时返回接近 2^63 的值，超过该阈值视为不限制
+_CGROUP_UNLIMITED = 1 << 60
+
+
+def _read_text(path: Path) -> str | None:
+    """读取小型系统文件，失败时返回 None。"""
+    try:
+        return path.read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+
+
+def _read_int(path: Path) -> int | None:
+    """读取仅包含整数的系统文件，`max` 或非法内容返回 None。"""
+    text = _read_text(path)
+    if not text or text == "max":
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+def read_meminfo_available(meminfo_path: Path = MEMINFO_PATH) -> int | None:
+    """从 /proc/meminfo 读取 MemAvailable（字节）。"""
+    text = _read_text(meminfo_path)
+    if not text:
+        return None
+    for line in text.splitlines():
+        if line.startswith("MemAvailable:"):
+            parts = line.split()
+            try:
+                return int(parts[1]) * 1024
+            except (IndexError, ValueError):
+                return None
+    return None
+
+
+def read_cgroup_memory_headroom(cgroup_root: Path = CGROUP_ROOT) -> int | None:
+    """返回 cgroup 内存限制减去当前用量（字节），无限制时返回 None。
+
+    同时兼容 cgroup v2（memory.max / memory.current）与
+    cgroup v1（memory/memory.limit_in_bytes / memory.usage_in_bytes）。
+    """
+    candidates = (
+        (cgroup_root / "memory.max", cgroup_root / "memory.current"),
+        (
+            cgroup_root / "memory" / "memory.limit_in_bytes",
+            cgroup_root / "memory" / "memory.usage_in_bytes",
+        ),
+    )
+    for limit_path, usage_path in candidates:
+        limit = _read_int(limit_path)
+        if limit is None or limit >= _CGROUP_UNLIMITED:
+            continue
+        usage = _read_int(usage_path) or 0
+        return max(0, limit - usage)
+    return None
+
+
+def available_memory_bytes() -> int | None:
+    """返回当前进程实际可用的内存（取 MemAvailable 与 cgroup 余量的较小值）。"""
+    values = [
+        value
+        for value in (read_meminfo_available(), read_cgroup_memory_headroom())
+        if value is not None
+    ]
+    if not values:
+        return None
+    return min(values)
+
+
+@dataclass
+class ProcessUsage:
+    """单个进程的累计 CPU 时间与当前常驻内存。"""
+
+    cpu_seconds: float
+    rss_bytes: int
+
+
+def read_process_usage(pid: int, proc_root: Path = PROC_ROOT) -> ProcessUsage | None:
+    """从 /proc/<pid>/stat 读取进程的 CPU 时间（utime + stime）与 RSS。
+
+    进程已退出或平台不提供 /proc 时返回 None。
+    """
+    text = _read_text(proc_root / str(pid) / "stat")
+    if not text or ")" not in text:
+        return None
+    # comm 字段可能包含空格，从最后一个右括号之后按空格切分（首项为第 3 个字段 state）
+    fields = text.rsplit(")", 1)[1].split()
+    try:
+        ticks = os.sysconf("SC_CLK_TCK")
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        cpu_ticks = int(fields[11]) + int(fields[12])
+        rss_pages = int(fields[21])
+    except (AttributeError, IndexError, ValueError, OSError):
+        return None
+    return ProcessUsage(cpu_seconds=cpu_ticks / ticks, rss_bytes=rss_pages * page_size)
+
+
+def read_cgroup_cpu_limit(cgroup_root: Path = CGROUP_ROOT) -> int | None:
+    """返回 cgroup CPU 配额折算的核数，无限制时返回 None。"""
+    text = _read_text(cgroup_root / "cpu.max")
+    if text:
+        parts = text.split()
+        if len(parts) == 2 and parts[0] != "max":
+            try:
+                return max(1, int(int(parts[0]) / int(parts[1])))
+            except (ValueError, ZeroDivisionError):
+                return None
+        return None
+
+    quota = _read_int(cgroup_root / "cpu" / "cpu.cfs_quota_us")
+    period = _read_int(cgroup_root / "cpu" / "cpu.cfs_period_us")
+    if quota is None or period is None or quota <= 0 or period <= 0:
+        return None
+    return max(1, quota // period)
+
+
+def cpu_budget() -> int:
+    """返回当前进程可用的 CPU 核数（考虑亲和性与 cgroup 配额）。"""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        count = os.cpu_count() or 1
+
+    cgroup_limit = read_cgroup_cpu_limit()
+    if cgroup_limit is not None:
+        count = min(count, cgroup_limit)
+    return max(1, count)
+
+
+def format_bytes(value: int | float) -> str:
+    """将字节数格式化为便于阅读的字符串。"""
+    size = float(value)
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_bytes(value: str | int) -> int:
+    """解析 `500M`、`200G`、`1.5T` 形式的容量字符串为字节数。
+
+    Raises:
+        ValueError: 格式非法或数值不为正。
+    """
+    if isinstance(value, int):
+        size = value
+    else:
+        text = value.strip().upper().removesuffix("IB").removesuffix("B")
+        unit = text[-1:] if text[-1:] in _SIZE_UNITS else ""
+        number = text[: len(text) - len(unit)].strip()
+        try:
+            size = int(float(number) * _SIZE_UNITS[unit])
+        except ValueError as exc:
+            raise ValueError(f"invalid size: {value}") from exc
+    if size <= 0:
+        raise ValueError(f"invalid size: {value}")
+    return size
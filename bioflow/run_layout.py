@@ -68,8 +68,8 @@ def sha256_file(path: Path) -> str:
     return digest.hexdigest()
 
 
-def describe_path(path: str | Path) -> dict[str, Any]:
-    """返回文件或目录的基础描述信息。"""
+def describe_path(path: str | Path, *, sha256: str | None = None) -> dict[str, Any]:
+    """返回文件或目录的基础描述信息，已知文件 ``sha256`` 时不再重新哈希。"""
     resolved = Path(path)
     stat_result = _safe_stat(resolved)
     payload: dict[str, Any] = {
@@ -88,7 +88,7 @@ def describe_path(path: str | Path) -> dict[str, Any]:
             tz=timezone.utc,
         ).isoformat()
         try:
-            payload["sha256"] = sha256_file(resolved)
+            payload["sha256"] = sha256 or sha256_file(resolved)
         except OSError:
             payload["sha256"] = ""
     elif resolved.is_dir():
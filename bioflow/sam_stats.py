@@ -0,0 +1,255 @@
+"""BioFlow-CLI SAM 流式统计模块 — 在比对数据流经时计算 flagstat 等统计。"""
+
+from __future__ import annotations
+
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+# SAM FLAG 位
+FLAG_PAIRED = 0x1
+FLAG_PROPER_PAIR = 0x2
+FLAG_UNMAPPED = 0x4
+FLAG_MATE_UNMAPPED = 0x8
+FLAG_READ1 = 0x40
+FLAG_READ2 = 0x80
+FLAG_SECONDARY = 0x100
+FLAG_QCFAIL = 0x200
+FLAG_DUPLICATE = 0x400
+FLAG_SUPPLEMENTARY = 0x800
+
+# 与 samtools flagstat 输出顺序一致的计数项
+FLAGSTAT_FIELDS = (
+    "total",
+    "primary",
+    "secondary",
+    "supplementary",
+    "duplicates",
+    "primary_duplicates",
+    "mapped",
+    "primary_mapped",
+    "paired",
+    "read1",
+    "read2",
+    "properly_paired",
+    "both_mapped",
+    "singletons",
+    "mate_diff_chr",
+    "mate_diff_chr_q5",
+)
+# 插入片段长度超过该值时视为异常配对，不计入分布
+MAX_INSERT_SIZE = 100_000
+
+
+def _percent(part: int, whole: int) -> str:
+    """返回 flagstat 风格的百分比字符串。"""
+    return f"{part / whole * 100:.2f}%" if whole else "N/A"
+
+
+class SamStreamStats:
+    """从 SAM 文本流增量计算比对统计。
+
+    计数口径与 ``samtools flagstat`` 相同（QC 通过 / 未通过分列），
+    另外统计主比对的 MAPQ 直方图、正确配对 R1 的插入片段长度分布
+    以及每条参考序列上的主比对 reads 数。可按块喂入任意切分的字节流。
+    """
+
+    def __init__(self) -> None:
+        self.passed = dict.fromkeys(FLAGSTAT_FIELDS, 0)
+        self.failed = dict.fromkeys(FLAGSTAT_FIELDS, 0)
+        self.mapq = Counter()
+        self.insert_sizes = Counter()
+        self.contig_counts = Counter()
+        self.contig_lengths: dict[str, int] = {}
+        self.malformed = 0
+        self.complete = False
+        self._partial = b""
+
+    def feed(self, chunk: bytes) -> None:
+        """喂入一段 SAM 字节流，跨块的半行会缓存到下一块。"""
+        data = self._partial + chunk
+        lines = data.split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self.add_line(line)
+
+    def finish(self) -> None:
+        """处理流末尾未以换行结束的记录，并标记统计完整。"""
+        if self._partial:
+            self.add_line(self._partial)
+            self._partial = b""
+        self.complete = True
+
+    def add_line(self, line: bytes) -> None:
+        """统计单行 SAM（头部或比对记录）。"""
+        if not line:
+            return
+        if line.startswith(b"@"):
+            if line.startswith(b"@SQ"):
+                self._add_sequence_header(line)
+            return
+
+        fields = line.split(b"\t", 9)
+        if len(fields) < 9:
+            self.malformed += 1
+            return
+        try:
+            flag = int(fields[1])
+            mapq = int(fields[4])
+            tlen = int(fields[8])
+        except ValueError:
+            self.malformed += 1
+            return
+
+        counts = self.failed if flag & FLAG_QCFAIL else self.passed
+        counts["total"] += 1
+        mapped = not flag & FLAG_UNMAPPED
+        if flag & FLAG_SECONDARY:
+            counts["secondary"] += 1
+        elif flag & FLAG_SUPPLEMENTARY:
+            counts["supplementary"] += 1
+        else:
+            counts["primary"] += 1
+            if flag & FLAG_DUPLICATE:
+                counts["primary_duplicates"] += 1
+            if mapped:
+                counts["primary_mapped"] += 1
+                self.mapq[mapq] += 1
+                self.contig_counts[fields[2].decode("utf-8", errors="replace")] += 1
+            if flag & FLAG_PAIRED:
+                self._add_pair_flags(counts, flag, fields, mapq, tlen)
+        if flag & FLAG_DUPLICATE:
+            counts["duplicates"] += 1
+        if mapped:
+            counts["mapped"] += 1
+
+    def _add_pair_flags(
+        self,
+        counts: dict[str, int],
+        flag: int,
+        fields: list[bytes],
+        mapq: int,
+        tlen: int,
+    ) -> None:
+        """统计主比对记录的双端相关计数与插入片段长度。"""
+        counts["paired"] += 1
+        if flag & FLAG_READ1:
+            counts["read1"] += 1
+        if flag & FLAG_READ2:
+            counts["read2"] += 1
+        if flag & FLAG_UNMAPPED:
+            return
+        if flag & FLAG_PROPER_PAIR:
+            counts["properly_paired"] += 1
+            insert = abs(tlen)
+            if flag & FLAG_READ1 and 0 < insert <= MAX_INSERT_SIZE:
+                self.insert_sizes[insert] += 1
+        if flag & FLAG_MATE_UNMAPPED:
+            counts["singletons"] += 1
+            return
+        counts["both_mapped"] += 1
+        if fields[6] != b"=" and fields[6] != fields[2]:
+            counts["mate_diff_chr"] += 1
+            if mapq >= 5:
+                counts["mate_diff_chr_q5"] += 1
+
+    def _add_sequence_header(self, line: bytes) -> None:
+        """从 @SQ 头部记录参考序列名称与长度。"""
+        name = ""
+        length = 0
+        for tag in line.decode("utf-8", errors="replace").split("\t")[1:]:
+            if tag.startswith("SN:"):
+                name = tag[3:]
+            elif tag.startswith("LN:"):
+                try:
+                    length = int(tag[3:])
+                except ValueError:
+                    length = 0
+        if name:
+            self.contig_lengths[name] = length
+
+    def merge(self, other: SamStreamStats) -> None:
+        """合并另一份统计（例如分片比对的结果）。"""
+        for key in FLAGSTAT_FIELDS:
+            self.passed[key] += other.passed[key]
+            self.failed[key] += other.failed[key]
+        self.mapq.update(other.mapq)
+        self.insert_sizes.update(other.insert_sizes)
+        self.contig_counts.update(other.contig_counts)
+        self.contig_lengths.update(other.contig_lengths)
+        self.malformed += other.malformed
+
+    def flagstat_text(self) -> str:
+        """生成与 ``samtools flagstat`` 默认输出兼容的文本。"""
+        p, f = self.passed, self.failed
+
+        def row(key: str, label: str, denominator: str | None = None) -> str:
+            text = f"{p[key]} + {f[key]} {label}"
+            if denominator is not None:
+                text += f" ({_percent(p[key], p[denominator])} : {_percent(f[key], f[denominator])})"
+            return text
+
+        lines = [
+            row("total", "in total (QC-passed reads + QC-failed reads)"),
+            row("primary", "primary"),
+            row("secondary", "secondary"),
+            row("supplementary", "supplementary"),
+            row("duplicates", "duplicates"),
+            row("primary_duplicates", "primary duplicates"),
+            row("mapped", "mapped", "total"),
+            row("primary_mapped", "primary mapped", "primary"),
+            row("paired", "paired in sequencing"),
+            row("read1", "read1"),
+            row("read2", "read2"),
+            row("properly_paired", "properly paired", "paired"),
+            row("both_mapped", "with itself and mate mapped"),
+            row("singletons", "singletons", "paired"),
+            row("mate_diff_chr", "with mate mapped to a different chr"),
+            row("mate_diff_chr_q5", "with mate mapped to a different chr (mapQ>=5)"),
+        ]
+        return "\n".join(lines) + "\n"
+
+    def insert_size_summary(self) -> dict[str, float]:
+        """返回插入片段长度的数量、均值、中位数与标准差。"""
+        count = sum(self.insert_sizes.values())
+        if count == 0:
+            return {"count": 0, "mean": 0.0, "median": 0.0, "sd": 0.0}
+        mean = sum(size * n for size, n in self.insert_sizes.items()) / count
+        variance = sum(n * (size - mean) ** 2 for size, n in self.insert_sizes.items()) / count
+        median = 0.0
+        seen = 0
+        for size in sorted(self.insert_sizes):
+            seen += self.insert_sizes[size]
+            if seen * 2 >= count:
+                median = float(size)
+                break
+        return {"count": count, "mean": mean, "median": median, "sd": variance ** 0.5}
+
+    def mapq_summary(self) -> dict[str, float]:
+        """返回主比对 MAPQ 的均值与 MAPQ≥30 的比例。"""
+        count = sum(self.mapq.values())
+        if count == 0:
+            return {"mean": 0.0, "q30_ratio": 0.0}
+        mean = sum(value * n for value, n in self.mapq.items()) / count
+        high = sum(n for value, n in self.mapq.items() if value >= 30)
+        return {"mean": mean, "q30_ratio": high / count}
+
+    def to_dict(self) -> dict[str, Any]:
+        """返回可写入 JSON 的完整统计。"""
+        return {
+            "flagstat": {"passed": dict(self.passed), "failed": dict(self.failed)},
+            "mapq_histogram": {str(value): self.mapq[value] for value in sorted(self.mapq)},
+            "mapq": self.mapq_summary(),
+            "insert_size": self.insert_size_summary(),
+            "insert_size_histogram": {str(size): self.insert_sizes[size] for size in sorted(self.insert_sizes)},
+            "contigs": [
+                {"name": name, "length": self.contig_lengths.get(name, 0), "mapped": self.contig_counts.get(name, 0)}
+                for name in [*self.contig_lengths, *(n for n in self.contig_counts if n not in self.contig_lengths)]
+            ],
+            "malformed_lines": self.malformed,
+        }
+
+    def write_json(self, path: Path) -> None:
+        """将完整统计写入 JSON 文件。"""
+        path.write_text(json.dumps(self.to_dict(), indent=2, ensure_ascii=False), encoding="utf-8")
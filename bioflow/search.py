@@ -2,10 +2,19 @@
 
 from __future__ import annotations
 
+import shutil
 import subprocess
 import json
+import heapq
+import os
+import re
+import shlex
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import asdict, dataclass
 from pathlib import Path
+from typing import Any
 
 import questionary
 from rich.console import Console
@@ -13,12 +22,15 @@ from rich.panel import Panel
 from rich.table import Table
 
 from bioflow.i18n import t
+from bioflow.index_cache import CACHE_INDEX_PREFIX, file_lock, resolve_index_cache
 from bioflow.preflight import preflight_check
 from bioflow.run_layout import (
     STEP_FAILED,
+    STEP_PENDING,
     STEP_RUNNING,
     STEP_SKIPPED,
     STEP_SUCCESS,
+    RunLayout,
     append_log,
     build_failure_summary,
     collect_input_details,
@@ -33,10 +45,21 @@ from bioflow.run_layout import (
     write_metadata,
 )
 
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - 未安装 numpy 时只导出 TSV 表
+    np = None  # type: ignore[assignment]
+
 console = Console()
 
 SEARCH_REQUIRED_TOOLS = ("makeblastdb", "blastn")
+# 共享索引缓存中 BLAST 数据库的后端名前缀，后接 makeblastdb 版本
+BLAST_DB_CACHE_BACKEND = "blastdb"
+BLAST_DB_VOLUME_SUFFIXES = (".nhr", ".nin", ".nsq")
+# 可终止命令检查终止信号的间隔（秒）
+_STOP_POLL_SECONDS = 0.5
 SEARCH_STEP_DB = "makeblastdb"
+SEARCH_STEP_SPLIT = "split_query"
 SEARCH_STEP_BLASTN = "blastn"
 SEARCH_STEP_SUMMARY = "summary"
 BLAST_OUTFMT6_COLUMNS = (
@@ -53,10 +76,30 @@ BLAST_OUTFMT6_COLUMNS = (
     "evalue",
     "bitscore",
 )
+# 每个 query 的聚合表列，顺序即 TSV 表头与列式文件中的数组顺序
+QUERY_TABLE_COLUMNS = (
+    "query_id",
+    "query_length",
+    "hit_count",
+    "subject_count",
+    "best_subject",
+    "best_identity",
+    "best_alignment_length",
+    "best_evalue",
+    "best_bitscore",
+    "max_identity",
+    "max_bitscore",
+    "covered_bases",
+    "query_coverage",
+)
 
 
 @dataclass
 class BlastHit:
+    """一条 outfmt 6 命中；以 ``__slots__`` 存储，大量命中驻留内存时不再为每个实例分配 ``__dict__``。"""
+
+    __slots__ = BLAST_OUTFMT6_COLUMNS
+
     query_id: str
     subject_id: str
     identity: float
@@ -80,6 +123,25 @@ def _print_search_failure(description: str, err: str) -> bool:
     return False
 
 
+def _run_stoppable(cmd: list[str], stop: threading.Event) -> subprocess.CompletedProcess[str]:
+    """等同 ``subprocess.run(check=True, capture_output=True)``，``stop`` 置位时终止进程。
+
+    Raises:
+        subprocess.CalledProcessError: 命令失败或被终止。
+    """
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as proc:
+        while True:
+            try:
+                stdout, stderr = proc.communicate(timeout=_STOP_POLL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                if stop.is_set() and proc.poll() is None:
+                    proc.terminate()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
 def _run_cmd(
     cmd: list[str],
     *,
@@ -87,12 +149,16 @@ def _run_cmd(
     quiet: bool = False,
     stdout_log: Path | None = None,
     stderr_log: Path | None = None,
+    stop: threading.Event | None = None,
 ) -> bool:
-    """执行外部命令并返回是否成功。"""
+    """执行外部命令并返回是否成功；提供 ``stop`` 时可被其他线程中途终止。"""
     if description and not quiet:
         console.print(f"  → {description}", style="cyan")
     try:
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        if stop is None:
+            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        else:
+            result = _run_stoppable(cmd, stop)
         append_log(stdout_log, result.stdout)
         append_log(stderr_log, result.stderr)
         return True
@@ -100,38 +166,86 @@ def _run_cmd(
         stderr_text = exc.stderr or str(exc)
         append_log(stdout_log, exc.stdout or "")
         append_log(stderr_log, exc.stderr or "")
+        if stop is not None and stop.is_set():
+            # 被主动终止的进程不是失败原因，只记录日志
+            return False
         return _print_search_failure(description, stderr_text.strip())
     except FileNotFoundError as exc:
         append_log(stderr_log, str(exc))
         return _print_search_failure(description, str(exc))
 
 
-def _blast_db_index_files(db_fasta: Path) -> list[Path]:
-    """返回 BLAST nucleotide 数据库索引文件列表。"""
-    return [db_fasta.with_suffix(db_fasta.suffix + ext) for ext in (".nhr", ".nin", ".nsq")]
+def _blast_db_volumes(db_prefix: Path) -> list[Path]:
+    """返回数据库各卷的前缀：多卷库按 ``.nal`` 别名文件的 DBLIST 解析，单卷库即自身。"""
+    alias = Path(f"{db_prefix}.nal")
+    try:
+        lines = alias.read_text(encoding="utf-8", errors="replace").splitlines()
+    except OSError:
+        return [db_prefix]
+    volumes: list[Path] = []
+    for line in lines:
+        if line.startswith("DBLIST"):
+            for name in shlex.split(line[len("DBLIST"):]):
+                volume = Path(name)
+                volumes.append(volume if volume.is_absolute() else alias.parent / volume)
+    return volumes or [db_prefix]
+
+
+def blast_db_index_files(db_prefix: Path) -> list[Path]:
+    """返回 BLAST nucleotide 数据库索引文件列表，多卷库包含别名文件与每一卷的文件。"""
+    alias = Path(f"{db_prefix}.nal")
+    files = [alias] if alias.is_file() else []
+    for volume in _blast_db_volumes(db_prefix):
+        files.extend(Path(f"{volume}{suffix}") for suffix in BLAST_DB_VOLUME_SUFFIXES)
+    return files
+
+
+def _blast_db_ready(db_prefix: Path) -> bool:
+    """判断 BLAST 数据库所有卷的索引文件是否均已存在。"""
+    return all(path.is_file() for path in blast_db_index_files(db_prefix))
+
+
+def _blast_db_stale(db_prefix: Path, source: Path) -> bool:
+    """已有索引文件早于源序列时视为过期（FASTA 在建库后被修改）。"""
+    try:
+        source_mtime = source.stat().st_mtime
+    except OSError:
+        return False
+    for path in blast_db_index_files(db_prefix):
+        try:
+            if path.stat().st_mtime < source_mtime:
+                return True
+        except OSError:
+            continue
+    return False
+
+
+def _blast_db_current(db_fasta: Path) -> bool:
+    """源序列旁的数据库完整且不早于源序列。"""
+    return _blast_db_ready(db_fasta) and not _blast_db_stale(db_fasta, db_fasta)
 
 
-def _blast_db_ready(db_fasta: Path) -> bool:
-    """判断 BLAST 数据库索引是否已存在。"""
-    return all(path.exists() for path in _blast_db_index_files(db_fasta))
+def _blast_db_cache_backend(makeblastdb_version: str) -> str:
+    """返回缓存后端名，不同 makeblastdb 版本构建的数据库互不复用。"""
+    match = re.search(r"\d+(?:\.\d+)+\+?", makeblastdb_version)
+    key = match.group(0) if match else re.sub(r"[^A-Za-z0-9.+-]+", "_", makeblastdb_version).strip("_")
+    return f"{BLAST_DB_CACHE_BACKEND}-{key or 'unknown'}"
 
 
 def _run_makeblastdb(
     db_fasta: Path,
     *,
+    out: Path | None = None,
     quiet: bool = False,
     stdout_log: Path | None = None,
     stderr_log: Path | None = None,
 ) -> bool:
-    """构建 BLAST nucleotide 数据库。"""
+    """构建 BLAST nucleotide 数据库，``out`` 指定时写到该前缀而不是源序列旁。"""
+    cmd = ["makeblastdb", "-in", str(db_fasta), "-dbtype", "nucl"]
+    if out is not None:
+        cmd.extend(["-out", str(out)])
     return _run_cmd(
-        [
-            "makeblastdb",
-            "-in",
-            str(db_fasta),
-            "-dbtype",
-            "nucl",
-        ],
+        cmd,
         description=t("search_building_db", file=db_fasta.name),
         quiet=quiet,
         stdout_log=stdout_log,
@@ -139,6 +253,41 @@ def _run_makeblastdb(
     )
 
 
+def build_blast_db(
+    db_fasta: Path,
+    *,
+    quiet: bool = False,
+    stdout_log: Path | None = None,
+    stderr_log: Path | None = None,
+) -> bool:
+    """在隐藏暂存目录中构建数据库，成功后再逐个重命名到源序列旁。
+
+    调用方需持有该数据库的文件锁。暂存前缀与源序列同名，``.nal`` 中的卷名
+    在重命名后仍然有效；别名与 ``.nin`` 文件最后落位，半途中断不会留下被
+    判定为完整的数据库。
+    """
+    staging = db_fasta.parent / f".tmp-blastdb-{os.getpid()}-{db_fasta.name}"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir()
+    try:
+        if not _run_makeblastdb(
+            db_fasta,
+            out=staging / db_fasta.name,
+            quiet=quiet,
+            stdout_log=stdout_log,
+            stderr_log=stderr_log,
+        ):
+            return False
+        for path in blast_db_index_files(db_fasta):
+            path.unlink(missing_ok=True)
+        built = sorted(staging.iterdir(), key=lambda path: path.suffix in (".nal", ".nin"))
+        for path in built:
+            path.replace(db_fasta.parent / path.name)
+        return True
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
 def _run_blastn(
     db_fasta: Path,
     query_fasta: Path,
@@ -146,9 +295,11 @@ def _run_blastn(
     *,
     evalue: float = 10.0,
     max_target_seqs: int = 10,
+    num_threads: int = 1,
     quiet: bool = False,
     stdout_log: Path | None = None,
     stderr_log: Path | None = None,
+    stop: threading.Event | None = None,
 ) -> bool:
     """执行 blastn 检索。"""
     return _run_cmd(
@@ -166,45 +317,265 @@ def _run_blastn(
             str(evalue),
             "-max_target_seqs",
             str(max_target_seqs),
+            "-num_threads",
+            str(num_threads),
         ],
         description=t("search_running_blastn", file=query_fasta.name),
         quiet=quiet,
         stdout_log=stdout_log,
         stderr_log=stderr_log,
+        stop=stop,
     )
 
 
-def parse_blast_tsv(output_path: Path) -> list[BlastHit]:
-    """解析 BLAST outfmt 6 结果。"""
-    hits: list[BlastHit] = []
-    if not output_path.exists():
-        return hits
+def _shard_step_name(shard: int) -> str:
+    """返回分片检索步骤名（如 ``blastn:shard000``）。"""
+    return f"{SEARCH_STEP_BLASTN}:shard{shard:03d}"
+
+
+def _split_query_fasta(query_fasta: Path, shard_path: Callable[[int], Path], *, shards: int) -> list[int]:
+    """将查询 FASTA 按输入顺序切成记录数均衡的连续分片，返回各分片记录数。
+
+    分片保持原始字节不做规范化；分片数不超过记录数，按分片顺序拼接结果即保持查询顺序。
+    """
+    with query_fasta.open("rb") as handle:
+        total = sum(1 for line in handle if line.startswith(b">"))
+    shards = max(1, min(shards, total))
+    # 前 extra 个分片各多一条记录，分片间记录数至多相差 1，且不会出现空分片
+    base, extra = divmod(total, shards)
+    counts = [base + (1 if shard < extra else 0) for shard in range(shards)]
+    if not total:
+        # 空查询文件也产出一个分片，交给 blastn 报告
+        shard_path(0).write_bytes(b"")
+        return counts
+    shard = -1
+    remaining = 0
+    out = None
+    try:
+        with query_fasta.open("rb") as handle:
+            for line in handle:
+                if line.startswith(b">"):
+                    if remaining == 0:
+                        if out is not None:
+                            out.close()
+                        shard += 1
+                        remaining = counts[shard]
+                        out = shard_path(shard).open("wb")
+                    remaining -= 1
+                if out is not None:
+                    out.write(line)
+    finally:
+        if out is not None:
+            out.close()
+    return counts
+
+
+def _concat_files(parts: list[Path], target: Path) -> None:
+    """按顺序拼接文件，先写临时文件再替换目标。"""
+    temp_path = target.with_name(f".{target.name}.tmp")
+    with temp_path.open("wb") as out:
+        for part in parts:
+            with part.open("rb") as handle:
+                shutil.copyfileobj(handle, out, 1 << 20)
+    temp_path.replace(target)
+
+
+def _run_sharded_blastn(
+    db_fasta: Path,
+    query_fasta: Path,
+    output: Path,
+    *,
+    layout: RunLayout,
+    steps: dict[str, Any],
+    existing_metadata: dict[str, Any],
+    resume: bool,
+    threads: int,
+    shards: int,
+    persist: Callable[[], None],
+    evalue: float,
+    max_target_seqs: int,
+    quiet: bool,
+) -> bool:
+    """拆分查询序列并发运行多个 blastn，按分片顺序拼接 outfmt 6 结果。
+
+    同时运行 ``min(shards, threads)`` 个 blastn 进程，线程预算在其间平分为
+    ``-num_threads``。每个分片的结果先写临时文件、成功后重命名，状态以独立
+    步骤写入 metadata；resume 时复用已完成的分片，只重跑缺失的部分。
+    任一分片失败时终止其余正在运行的 blastn 进程（记为失败），尚未启动的
+    分片保持 pending，不必等待长时间运行的分片结束才报告失败。
+    """
+    shard_dir = layout.tmp_dir / "query_shards"
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    lock = threading.Lock()
+
+    def shard_path(shard: int, suffix: str) -> Path:
+        return shard_dir / f"shard{shard:03d}.{suffix}"
+
+    def update(step_name: str, status: str, **kwargs: Any) -> None:
+        with lock:
+            set_step_state(steps, step_name, status, **kwargs)
+            persist()
+
+    previous_steps = existing_metadata.get("steps") if isinstance(existing_metadata.get("steps"), dict) else {}
+    previous_parameters = existing_metadata.get("parameters") if isinstance(existing_metadata.get("parameters"), dict) else {}
+    counts = list((previous_steps.get(SEARCH_STEP_SPLIT, {}).get("outputs") or {}).get("records") or [])
+    # 分片数变化后旧分片与新的分片边界不对应，需要重新拆分
+    split_reused = resume and previous_parameters.get("shards") == shards and bool(counts) and step_resume_ready(
+        existing_metadata,
+        SEARCH_STEP_SPLIT,
+        validator=lambda: all(shard_path(shard, "fa").is_file() for shard in range(len(counts))),
+        required_outputs=("shards",),
+    )
+    if not split_reused:
+        update(SEARCH_STEP_SPLIT, STEP_RUNNING)
+        try:
+            counts = _split_query_fasta(query_fasta, lambda shard: shard_path(shard, "fa"), shards=shards)
+        except OSError as exc:
+            append_log(layout.stderr_log, f"split query failed: {exc}")
+            update(SEARCH_STEP_SPLIT, STEP_FAILED, error=str(exc))
+            return False
+    # 查询记录少于分片数时只保留实际产生的分片步骤
+    with lock:
+        for shard in range(len(counts), shards):
+            steps.pop(_shard_step_name(shard), None)
+    shards = len(counts)
+    shard_queries = [shard_path(shard, "fa") for shard in range(shards)]
+    shard_tsvs = [shard_path(shard, "tsv") for shard in range(shards)]
+    split_outputs = {"shards": [str(path) for path in shard_queries], "records": counts}
+    if split_reused:
+        update(SEARCH_STEP_SPLIT, STEP_SKIPPED, outputs=split_outputs, note="reused existing output")
+    else:
+        update(SEARCH_STEP_SPLIT, STEP_SUCCESS, outputs=split_outputs)
+
+    def shard_outputs(shard: int) -> dict[str, Any]:
+        return {"query": str(shard_queries[shard]), "tsv": str(shard_tsvs[shard]), "records": counts[shard]}
+
+    # 结果文件仅在 blastn 成功后由临时文件重命名得到，存在即表示完整（无命中时为空文件）
+    pending = [
+        shard
+        for shard in range(shards)
+        if not (
+            split_reused
+            and step_resume_ready(
+                existing_metadata,
+                _shard_step_name(shard),
+                validator=lambda shard=shard: shard_tsvs[shard].is_file(),
+                required_outputs=("tsv",),
+            )
+        )
+    ]
+    for shard in range(shards):
+        if shard not in pending:
+            update(_shard_step_name(shard), STEP_SKIPPED, outputs=shard_outputs(shard), note="reused existing output")
+    if split_reused and len(pending) < shards and not quiet:
+        console.print(t("search_shards_resumed", done=shards - len(pending), total=shards), style="cyan")
+
+    jobs = max(1, min(len(pending), threads))
+    num_threads = max(1, threads // jobs)
+    stop = threading.Event()
+
+    def run_shard(shard: int) -> bool:
+        step_name = _shard_step_name(shard)
+        if stop.is_set():
+            update(step_name, STEP_PENDING, outputs=shard_outputs(shard), note="not started: another shard failed")
+            return False
+        update(step_name, STEP_RUNNING)
+        partial = shard_tsvs[shard].with_name(f".{shard_tsvs[shard].name}.partial")
+        shard_tsvs[shard].unlink(missing_ok=True)
+        ok = _run_blastn(
+            db_fasta,
+            shard_queries[shard],
+            partial,
+            evalue=evalue,
+            max_target_seqs=max_target_seqs,
+            num_threads=num_threads,
+            quiet=quiet,
+            stdout_log=layout.stdout_log,
+            stderr_log=layout.stderr_log,
+            stop=stop,
+        )
+        if ok:
+            # blastn 无命中时可能不创建输出文件
+            partial.touch()
+            partial.replace(shard_tsvs[shard])
+        else:
+            partial.unlink(missing_ok=True)
+        if ok:
+            error = None
+        elif stop.is_set():
+            error = f"{step_name} stopped: another shard failed"
+        else:
+            error = f"{step_name} failed"
+        update(step_name, STEP_SUCCESS if ok else STEP_FAILED, outputs=shard_outputs(shard), error=error)
+        return ok
+
+    finished = shards - len(pending)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(run_shard, shard): shard for shard in pending}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.pop(future)
+                if not future.result():
+                    # 终止正在运行的分片；退出 with 时只需等待进程收到信号后退出
+                    stop.set()
+                    for other, shard in futures.items():
+                        if other.cancel():
+                            update(
+                                _shard_step_name(shard),
+                                STEP_PENDING,
+                                outputs=shard_outputs(shard),
+                                note="not started: another shard failed",
+                            )
+                    return False
+                finished += 1
+                if not quiet:
+                    console.print(t("search_shard_done", done=finished, total=shards), style="cyan")
+
+    try:
+        _concat_files(shard_tsvs, output)
+    except OSError as exc:
+        append_log(layout.stderr_log, f"merge blastn shards failed: {exc}")
+        return False
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    return True
+
+
+def _parse_blast_line(line: str) -> BlastHit:
+    """解析一行 outfmt 6。"""
+    parts = line.split("\t")
+    if len(parts) != len(BLAST_OUTFMT6_COLUMNS):
+        raise ValueError("invalid_blast_output")
+    return BlastHit(
+        query_id=parts[0],
+        subject_id=parts[1],
+        identity=float(parts[2]),
+        alignment_length=int(parts[3]),
+        mismatches=int(parts[4]),
+        gap_opens=int(parts[5]),
+        query_start=int(parts[6]),
+        query_end=int(parts[7]),
+        subject_start=int(parts[8]),
+        subject_end=int(parts[9]),
+        evalue=float(parts[10]),
+        bitscore=float(parts[11]),
+    )
+
 
+def iter_blast_tsv(output_path: Path) -> Iterator[BlastHit]:
+    """逐行流式解析 BLAST outfmt 6 结果，文件不存在时不产出任何命中。"""
+    if not output_path.exists():
+        return
     with output_path.open("r", encoding="utf-8") as handle:
         for raw_line in handle:
             line = raw_line.strip()
-            if not line:
-                continue
-            parts = line.split("\t")
-            if len(parts) != len(BLAST_OUTFMT6_COLUMNS):
-                raise ValueError("invalid_blast_output")
-            hits.append(
-                BlastHit(
-                    query_id=parts[0],
-                    subject_id=parts[1],
-                    identity=float(parts[2]),
-                    alignment_length=int(parts[3]),
-                    mismatches=int(parts[4]),
-                    gap_opens=int(parts[5]),
-                    query_start=int(parts[6]),
-                    query_end=int(parts[7]),
-                    subject_start=int(parts[8]),
-                    subject_end=int(parts[9]),
-                    evalue=float(parts[10]),
-                    bitscore=float(parts[11]),
-                )
-            )
-    return hits
+            if line:
+                yield _parse_blast_line(line)
+
+
+def parse_blast_tsv(output_path: Path) -> list[BlastHit]:
+    """解析 BLAST outfmt 6 结果。"""
+    return list(iter_blast_tsv(output_path))
 
 
 def _is_nonempty_file(path: Path) -> bool:
@@ -212,39 +583,342 @@ def _is_nonempty_file(path: Path) -> bool:
     return path.is_file() and path.stat().st_size > 0
 
 
-def _summary_ready(path: Path) -> bool:
-    """summary JSON 存在且结构基本有效。"""
+def _summary_ready(path: Path, *, per_query: bool = False) -> bool:
+    """summary JSON 存在且结构基本有效；``per_query`` 时还须包含每个 query 的 Top hits。"""
     if not _is_nonempty_file(path):
         return False
     try:
         payload = json.loads(path.read_text(encoding="utf-8"))
     except (OSError, json.JSONDecodeError):
         return False
-    return isinstance(payload, dict) and "hit_count" in payload
+    return isinstance(payload, dict) and "hit_count" in payload and (not per_query or "top_hits_per_query" in payload)
+
+
+def _rank_key(hit: BlastHit) -> tuple[float, float, float]:
+    """排名键：evalue 升序，其次 bitscore、identity 降序。"""
+    return (hit.evalue, -hit.bitscore, -hit.identity)
 
 
 def _rank_hits(hits: list[BlastHit]) -> list[BlastHit]:
     """按 evalue / bitscore / identity 排序。"""
-    return sorted(
-        hits,
-        key=lambda hit: (hit.evalue, -hit.bitscore, -hit.identity),
-    )
+    return sorted(hits, key=_rank_key)
 
 
-def summarize_blast_hits(hits: list[BlastHit], *, top_n: int = 5) -> dict[str, object]:
-    """生成 BLAST 结果摘要。"""
-    ranked_hits = _rank_hits(hits)
-    best_hit = ranked_hits[0] if ranked_hits else None
-    top_hits = ranked_hits[:top_n]
+class _TopHits:
+    """只保留排名最前 ``limit`` 条命中的有界堆，排名相同时先到者优先。"""
+
+    __slots__ = ("limit", "_heap", "_seen")
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        # 堆顶为当前保留集合中排名最差的命中，键取反以复用 heapq 的最小堆
+        self._heap: list[tuple[float, float, float, int, BlastHit]] = []
+        self._seen = 0
+
+    def push(self, hit: BlastHit) -> None:
+        if self.limit <= 0:
+            return
+        self._seen += 1
+        entry = (-hit.evalue, hit.bitscore, hit.identity, -self._seen, hit)
+        if len(self._heap) < self.limit:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def ranked(self) -> list[BlastHit]:
+        """按排名返回保留的命中。"""
+        return [entry[-1] for entry in sorted(self._heap, reverse=True)]
+
+
+class BlastHitSummarizer:
+    """单遍流式汇总 BLAST 命中：有界堆维护全局与每个 query 的 Top-N，并累计 min/max 指标。
+
+    内存只随 ``top_n`` 与 query 数增长，与命中总数无关。
+    """
+
+    def __init__(self, *, top_n: int = 5, per_query_top_n: int = 0) -> None:
+        self.top_n = top_n
+        self.per_query_top_n = per_query_top_n
+        self.hit_count = 0
+        self.min_evalue: float | None = None
+        self.max_evalue: float | None = None
+        self.min_identity: float | None = None
+        self.max_identity: float | None = None
+        self.min_bitscore: float | None = None
+        self.max_bitscore: float | None = None
+        self._queries: set[str] = set()
+        self._top = _TopHits(max(1, top_n))
+        self._per_query: dict[str, _TopHits] = {}
+
+    def add(self, hit: BlastHit) -> None:
+        """累计一条命中。"""
+        if self.hit_count == 0:
+            self.min_evalue = self.max_evalue = hit.evalue
+            self.min_identity = self.max_identity = hit.identity
+            self.min_bitscore = self.max_bitscore = hit.bitscore
+        else:
+            self.min_evalue = min(self.min_evalue, hit.evalue)
+            self.max_evalue = max(self.max_evalue, hit.evalue)
+            self.min_identity = min(self.min_identity, hit.identity)
+            self.max_identity = max(self.max_identity, hit.identity)
+            self.min_bitscore = min(self.min_bitscore, hit.bitscore)
+            self.max_bitscore = max(self.max_bitscore, hit.bitscore)
+        self.hit_count += 1
+        self._queries.add(hit.query_id)
+        self._top.push(hit)
+        if self.per_query_top_n > 0:
+            top = self._per_query.get(hit.query_id)
+            if top is None:
+                top = self._per_query[hit.query_id] = _TopHits(self.per_query_top_n)
+            top.push(hit)
+
+    def update(self, hits: Iterable[BlastHit]) -> None:
+        """累计一批命中。"""
+        for hit in hits:
+            self.add(hit)
+
+    def summary(self) -> dict[str, object]:
+        """返回可写入 JSON 的摘要。"""
+        ranked = self._top.ranked()
+        best_hit = ranked[0] if ranked else None
+        summary: dict[str, object] = {
+            "hit_count": self.hit_count,
+            "query_count": len(self._queries),
+            "best_hit": asdict(best_hit) if best_hit else None,
+            "best_identity": best_hit.identity if best_hit else None,
+            "best_bitscore": best_hit.bitscore if best_hit else None,
+            "min_evalue": self.min_evalue,
+            "max_evalue": self.max_evalue,
+            "min_identity": self.min_identity,
+            "max_identity": self.max_identity,
+            "min_bitscore": self.min_bitscore,
+            "max_bitscore": self.max_bitscore,
+            "top_hits": [asdict(hit) for hit in ranked[: self.top_n]],
+        }
+        if self.per_query_top_n > 0:
+            summary["top_hits_per_query"] = {
+                query_id: [asdict(hit) for hit in top.ranked()] for query_id, top in self._per_query.items()
+            }
+        return summary
 
-    return {
-        "hit_count": len(hits),
-        "best_hit": asdict(best_hit) if best_hit else None,
-        "best_identity": best_hit.identity if best_hit else None,
-        "best_bitscore": best_hit.bitscore if best_hit else None,
-        "min_evalue": best_hit.evalue if best_hit else None,
-        "top_hits": [asdict(hit) for hit in top_hits],
-    }
+
+def summarize_blast_hits(
+    hits: Iterable[BlastHit],
+    *,
+    top_n: int = 5,
+    per_query_top_n: int = 0,
+) -> dict[str, object]:
+    """生成 BLAST 结果摘要，``hits`` 可以是任意可迭代对象（如 ``iter_blast_tsv`` 的流）。"""
+    summarizer = BlastHitSummarizer(top_n=top_n, per_query_top_n=per_query_top_n)
+    summarizer.update(hits)
+    return summarizer.summary()
+
+
+@dataclass
+class QueryHitSummary:
+    """单个 query 的命中聚合：最佳命中、命中数、最大 identity 与 query 覆盖度。"""
+
+    query_id: str
+    query_length: int | None
+    hit_count: int
+    subject_count: int
+    best_subject: str
+    best_identity: float
+    best_alignment_length: int
+    best_evalue: float
+    best_bitscore: float
+    max_identity: float
+    max_bitscore: float
+    covered_bases: int
+    query_coverage: float | None
+
+    def tsv_row(self) -> str:
+        """返回制表符分隔的一行，未知长度与覆盖度留空。"""
+        values = [
+            "" if value is None else (f"{value:.6g}" if isinstance(value, float) else str(value))
+            for value in (getattr(self, column) for column in QUERY_TABLE_COLUMNS)
+        ]
+        return "\t".join(values) + "\n"
+
+
+def read_query_lengths(query_fasta: Path) -> dict[str, int]:
+    """流式读取查询 FASTA，返回 query ID（header 首个字段，与 blastn 的 qseqid 一致）到序列长度的映射。"""
+    lengths: dict[str, int] = {}
+    name: str | None = None
+    with query_fasta.open("rb") as handle:
+        for line in handle:
+            if line.startswith(b">"):
+                fields = line[1:].split(maxsplit=1)
+                name = fields[0].decode("utf-8", "replace") if fields else ""
+                lengths[name] = 0
+            elif name is not None:
+                lengths[name] += len(line.strip().replace(b" ", b""))
+    return lengths
+
+
+def _merge_intervals(intervals: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """合并 query 上重叠或相邻的比对区间（半开区间）。"""
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class _QueryAccumulator:
+    """单个 query 的累计状态；比对区间超过阈值时合并，内存不随命中数线性增长。"""
+
+    __slots__ = ("best", "count", "subjects", "intervals", "merged_size", "max_identity", "max_bitscore")
+
+    def __init__(self, first: BlastHit) -> None:
+        self.best = first
+        self.count = 0
+        self.subjects: set[str] = set()
+        self.intervals: list[tuple[int, int]] = []
+        self.merged_size = 0
+        self.max_identity = 0.0
+        self.max_bitscore = 0.0
+
+    def add(self, hit: BlastHit) -> None:
+        self.count += 1
+        self.subjects.add(hit.subject_id)
+        self.intervals.append((min(hit.query_start, hit.query_end) - 1, max(hit.query_start, hit.query_end)))
+        if len(self.intervals) > 2 * self.merged_size + 64:
+            self.intervals = _merge_intervals(self.intervals)
+            self.merged_size = len(self.intervals)
+        self.max_identity = max(self.max_identity, hit.identity)
+        self.max_bitscore = max(self.max_bitscore, hit.bitscore)
+        if _rank_key(hit) < _rank_key(self.best):
+            self.best = hit
+
+    def summary(self, query_id: str, length: int | None) -> QueryHitSummary:
+        best = self.best
+        covered = sum(end - start for start, end in _merge_intervals(self.intervals))
+        return QueryHitSummary(
+            query_id=query_id,
+            query_length=length,
+            hit_count=self.count,
+            subject_count=len(self.subjects),
+            best_subject=best.subject_id,
+            best_identity=best.identity,
+            best_alignment_length=best.alignment_length,
+            best_evalue=best.evalue,
+            best_bitscore=best.bitscore,
+            max_identity=self.max_identity,
+            max_bitscore=self.max_bitscore,
+            covered_bases=covered,
+            query_coverage=min(1.0, covered / length) if length else None,
+        )
+
+
+def iter_query_summaries(
+    hits: Iterable[BlastHit],
+    query_lengths: dict[str, int] | None = None,
+) -> Iterator[QueryHitSummary]:
+    """单遍按 query 聚合命中，读完全部命中后按 query 首次出现的顺序产出汇总。
+
+    以 query_id 为键累计，不要求同一 query 的命中连续（例如查询 FASTA 中
+    重复出现同一 ID）；内存与 query 数相关，而不随命中数增长。
+    """
+    accumulators: dict[str, _QueryAccumulator] = {}
+    for hit in hits:
+        accumulator = accumulators.get(hit.query_id)
+        if accumulator is None:
+            accumulator = accumulators[hit.query_id] = _QueryAccumulator(hit)
+        accumulator.add(hit)
+    for query_id, accumulator in accumulators.items():
+        length = query_lengths.get(query_id) if query_lengths is not None else None
+        yield accumulator.summary(query_id, length)
+
+
+def query_table_paths(output: Path) -> dict[str, Path]:
+    """返回每个 query 聚合表的输出路径；安装 numpy 时额外输出列式 ``.npz``。"""
+    paths = {"per_query_tsv": output.with_name(f"{output.stem}.per_query.tsv")}
+    if np is not None:
+        paths["per_query_npz"] = output.with_name(f"{output.stem}.per_query.npz")
+    return paths
+
+
+def query_tables_ready(paths: dict[str, Path]) -> bool:
+    """聚合表均已写出（TSV 至少包含表头）。"""
+    return all(_is_nonempty_file(path) for path in paths.values())
+
+
+def write_query_tables(rows: Iterable[QueryHitSummary], paths: dict[str, Path]) -> int:
+    """流式写出每个 query 的聚合表并返回行数。
+
+    TSV 逐行写出；提供 ``per_query_npz`` 时同时按列收集并以 ``numpy.savez_compressed``
+    写出列式文件（未知长度记为 -1、覆盖度记为 NaN），下游可直接 ``numpy.load``
+    按列过滤而无需重新解析原始结果。均先写临时文件，全部成功后再替换。
+    """
+    tsv_path = paths["per_query_tsv"]
+    npz_path = paths.get("per_query_npz")
+    temp_tsv = tsv_path.with_name(f".{tsv_path.name}.tmp")
+    temp_npz = npz_path.with_name(f".{npz_path.stem}.tmp.npz") if npz_path is not None else None
+    columns: dict[str, list[Any]] | None = {name: [] for name in QUERY_TABLE_COLUMNS} if npz_path is not None else None
+    count = 0
+    try:
+        with temp_tsv.open("w", encoding="utf-8") as handle:
+            handle.write("\t".join(QUERY_TABLE_COLUMNS) + "\n")
+            for row in rows:
+                handle.write(row.tsv_row())
+                count += 1
+                if columns is not None:
+                    for name in QUERY_TABLE_COLUMNS:
+                        columns[name].append(getattr(row, name))
+        if npz_path is not None and temp_npz is not None and columns is not None:
+            columns["query_length"] = [-1 if value is None else value for value in columns["query_length"]]
+            columns["query_coverage"] = [float("nan") if value is None else value for value in columns["query_coverage"]]
+            arrays = {
+                name: np.array(values, dtype=str if name in ("query_id", "best_subject") else None)
+                for name, values in columns.items()
+            }
+            with temp_npz.open("wb") as npz_handle:
+                np.savez_compressed(npz_handle, **arrays)
+            temp_npz.replace(npz_path)
+    except BaseException:
+        temp_tsv.unlink(missing_ok=True)
+        if temp_npz is not None:
+            temp_npz.unlink(missing_ok=True)
+        raise
+    temp_tsv.replace(tsv_path)
+    return count
+
+
+def summarize_blast_tsv(
+    output_path: Path,
+    *,
+    top_n: int = 5,
+    per_query_top_n: int = 0,
+    query_tables: dict[str, Path] | None = None,
+    query_lengths: dict[str, int] | None = None,
+) -> dict[str, object]:
+    """单遍流式读取 outfmt 6 文件并生成摘要，不在内存中保留全部命中。
+
+    提供 ``query_tables`` 时在同一遍中按 query 聚合并写出聚合表。
+
+    Raises:
+        ValueError: 结果文件格式非法。
+    """
+    summarizer = BlastHitSummarizer(top_n=top_n, per_query_top_n=per_query_top_n)
+    if query_tables is None:
+        summarizer.update(iter_blast_tsv(output_path))
+        return summarizer.summary()
+
+    def observed() -> Iterator[BlastHit]:
+        for hit in iter_blast_tsv(output_path):
+            summarizer.add(hit)
+            yield hit
+
+    rows = write_query_tables(iter_query_summaries(observed(), query_lengths), query_tables)
+    summary = summarizer.summary()
+    summary["queries_with_hits"] = rows
+    if query_lengths is not None:
+        summary["queries_without_hits"] = max(0, len(query_lengths) - rows)
+    return summary
 
 
 def display_search_summary(summary: dict[str, object]) -> None:
@@ -306,11 +980,24 @@ def run_blast_search(
     evalue: float = 10.0,
     max_target_seqs: int = 10,
     top_n: int = 5,
+    top_per_query: int = 0,
+    threads: int = 1,
+    shards: int = 1,
     resume: bool = False,
     cli_mode: bool = False,
     skip_preflight: bool = False,
+    index_cache: str | Path | None = None,
+    index_cache_max_size: str | int | None = None,
 ) -> dict[str, object] | None:
-    """执行 makeblastdb + blastn 基础检索流程。"""
+    """执行 makeblastdb + blastn 基础检索流程。
+
+    Args:
+        top_per_query: 大于 0 时在摘要中为每个 query 保留前 N 条命中。
+        threads: CPU 预算；单个 blastn 时作为 ``-num_threads``，分片时在并发进程间平分。
+        shards: 将查询序列切成的分片数，大于 1 时并发运行多个 blastn 并按查询顺序合并结果。
+        index_cache: 共享索引缓存目录（默认读取 BIOFLOW_INDEX_CACHE），数据库按 sha256 与 makeblastdb 版本缓存。
+        index_cache_max_size: 索引缓存磁盘预算（如 ``200G``），超出时按 LRU 淘汰。
+    """
     if not skip_preflight:
         if not preflight_check(SEARCH_REQUIRED_TOOLS, cli_mode=cli_mode):
             return None
@@ -319,14 +1006,33 @@ def run_blast_search(
     started_at = utc_now_iso()
     output = resolve_result_path(layout, output, f"{query_fasta.stem}.blast.tsv")
     summary_path = layout.results_dir / "search_summary.json"
+    query_tables = query_table_paths(output)
+    table_outputs = {name: str(path) for name, path in query_tables.items()}
     existing_metadata = read_metadata(layout)
     tool_versions = collect_tool_versions(SEARCH_REQUIRED_TOOLS)
     input_details = collect_input_details({"db": db_fasta, "query": query_fasta})
     failure_summary = str(existing_metadata.get("failure_summary", ""))
-    steps = init_steps(
-        [SEARCH_STEP_DB, SEARCH_STEP_BLASTN, SEARCH_STEP_SUMMARY],
-        existing_metadata.get("steps"),
+    threads = max(1, threads)
+    shards = max(1, shards)
+    step_names = [SEARCH_STEP_DB, SEARCH_STEP_BLASTN, SEARCH_STEP_SUMMARY]
+    if shards > 1:
+        step_names[1:1] = [SEARCH_STEP_SPLIT, *[_shard_step_name(shard) for shard in range(shards)]]
+    steps = init_steps(step_names, existing_metadata.get("steps"))
+    try:
+        cache = resolve_index_cache(index_cache, index_cache_max_size)
+    except ValueError as exc:
+        console.print(t("search_db_cache_invalid", err=str(exc)), style="yellow")
+        cache = None
+    db_digest = str(input_details["db"].get("sha256", ""))
+    # 源序列旁已有最新的数据库时直接使用；否则经内容寻址的共享缓存链接到运行目录内。
+    # 链接前缀必须与缓存条目内同名（index），多卷库 .nal 中记录的卷名才仍然有效
+    use_cache = (
+        cache is not None
+        and bool(db_digest)
+        and not _blast_db_current(db_fasta)
     )
+    db_prefix = layout.root / "index" / BLAST_DB_CACHE_BACKEND / CACHE_INDEX_PREFIX if use_cache else db_fasta
+    db_outputs: dict[str, object] = {"db": str(db_fasta), "db_prefix": str(db_prefix), "sha256": db_digest}
 
     def persist(status: str, *, completed_at: str | None = None, summary: dict[str, object] | None = None) -> None:
         extra: dict[str, object] = {
@@ -342,9 +1048,18 @@ def run_blast_search(
             layout,
             status=status,
             command="search",
-            parameters={"evalue": evalue, "max_target_seqs": max_target_seqs, "top_n": top_n, "resume": resume},
+            parameters={
+                "evalue": evalue,
+                "max_target_seqs": max_target_seqs,
+                "top_n": top_n,
+                "top_per_query": top_per_query,
+                "threads": threads,
+                "shards": shards,
+                "resume": resume,
+                "index_cache": str(cache.root) if cache is not None else None,
+            },
             inputs={"db": str(db_fasta), "query": str(query_fasta)},
-            outputs={"root": str(layout.root), "tsv": str(output), "summary": str(summary_path)},
+            outputs={"root": str(layout.root), "tsv": str(output), "summary": str(summary_path), **table_outputs},
             started_at=started_at,
             completed_at=completed_at,
             extra=extra,
@@ -361,108 +1076,199 @@ def run_blast_search(
             )
         )
 
+    def db_step_done(status: str, outputs: dict[str, object], **kwargs: Any) -> None:
+        set_step_state(steps, SEARCH_STEP_DB, status, outputs=outputs, **kwargs)
+        persist("running")
+        if not quiet:
+            console.print(t("search_db_cached"), style="bold blue")
+
+    def db_step_failed(outputs: dict[str, object]) -> None:
+        nonlocal failure_summary
+        failure_summary = build_failure_summary(SEARCH_STEP_DB, stderr_log=layout.stderr_log, fallback="makeblastdb failed")
+        set_step_state(steps, SEARCH_STEP_DB, STEP_FAILED, outputs=outputs, error=failure_summary)
+        persist("failed", completed_at=utc_now_iso())
+
+    def db_resume_valid() -> bool:
+        if not _blast_db_ready(db_prefix):
+            return False
+        if not use_cache:
+            return not _blast_db_stale(db_prefix, db_fasta)
+        # 运行目录内的链接来自按内容寻址的缓存条目，源序列内容变化后不能复用
+        previous_steps = existing_metadata.get("steps")
+        previous = previous_steps.get(SEARCH_STEP_DB) if isinstance(previous_steps, dict) else None
+        outputs = previous.get("outputs") if isinstance(previous, dict) else None
+        return isinstance(outputs, dict) and outputs.get("sha256") == db_digest
+
     if resume and step_resume_ready(
         existing_metadata,
         SEARCH_STEP_DB,
-        validator=lambda: _blast_db_ready(db_fasta),
+        validator=db_resume_valid,
         required_outputs=("db",),
     ):
-        set_step_state(steps, SEARCH_STEP_DB, STEP_SKIPPED, outputs={"db": str(db_fasta)}, note="reused existing output")
-        persist("running")
-        if not quiet:
-            console.print(t("search_db_cached"), style="bold blue")
-    elif _blast_db_ready(db_fasta):
-        set_step_state(steps, SEARCH_STEP_DB, STEP_SUCCESS, outputs={"db": str(db_fasta)})
-        persist("running")
-        if not quiet:
-            console.print(t("search_db_cached"), style="bold blue")
-    else:
+        db_step_done(STEP_SKIPPED, db_outputs, note="reused existing output")
+    elif not use_cache and _blast_db_current(db_fasta):
+        # 已建好的数据库无需加锁，共享只读目录中的数据库也能直接使用
+        db_step_done(STEP_SUCCESS, db_outputs)
+    elif not use_cache:
+        # 多个检索同时使用同一个新数据库时只有一个进程建库，其余等待后直接复用
+        try:
+            with file_lock(db_fasta.with_name(f".{db_fasta.name}.blastdb.lock")):
+                if _blast_db_current(db_fasta):
+                    db_step_done(STEP_SUCCESS, db_outputs)
+                    built = True
+                else:
+                    if not quiet:
+                        console.print(t("search_step_makeblastdb"), style="bold blue")
+                    set_step_state(steps, SEARCH_STEP_DB, STEP_RUNNING)
+                    persist("running")
+                    built = build_blast_db(
+                        db_fasta,
+                        quiet=quiet,
+                        stdout_log=layout.stdout_log,
+                        stderr_log=layout.stderr_log,
+                    )
+                    if built:
+                        set_step_state(steps, SEARCH_STEP_DB, STEP_SUCCESS, outputs=db_outputs)
+                        persist("running")
+        except OSError as exc:
+            # 例如数据库目录只读、无法创建锁文件或暂存目录
+            append_log(layout.stderr_log, f"makeblastdb: {exc}\n")
+            built = False
+        if not built:
+            db_step_failed(db_outputs)
+            return None
+    elif cache is not None:
         if not quiet:
             console.print(t("search_step_makeblastdb"), style="bold blue")
         set_step_state(steps, SEARCH_STEP_DB, STEP_RUNNING)
         persist("running")
-        if not _run_makeblastdb(
-            db_fasta,
+        cached = cache.fetch_or_build(
+            _blast_db_cache_backend(tool_versions.get("makeblastdb", "")),
+            db_digest,
+            (),
+            lambda prefix: _run_makeblastdb(
+                db_fasta,
+                out=prefix,
+                quiet=quiet,
+                stdout_log=layout.stdout_log,
+                stderr_log=layout.stderr_log,
+            ),
+            source=db_fasta,
+            link_prefix=db_prefix,
+            ready=_blast_db_ready,
+        )
+        if cached is None:
+            db_step_failed(db_outputs)
+            return None
+        if cached.hit and not quiet:
+            console.print(t("search_db_cache_hit", path=str(cached.entry_dir)), style="cyan")
+        db_outputs.update({"cache_entry": str(cached.entry_dir), "cache_hit": cached.hit, "link_mode": cached.link_mode})
+        set_step_state(steps, SEARCH_STEP_DB, STEP_SUCCESS, outputs=db_outputs)
+        persist("running")
+
+    def run_blastn() -> bool:
+        if shards > 1:
+            return _run_sharded_blastn(
+                db_prefix,
+                query_fasta,
+                output,
+                layout=layout,
+                steps=steps,
+                existing_metadata=existing_metadata,
+                resume=resume,
+                threads=threads,
+                shards=shards,
+                persist=lambda: persist("running"),
+                evalue=evalue,
+                max_target_seqs=max_target_seqs,
+                quiet=quiet,
+            )
+        return _run_blastn(
+            db_prefix,
+            query_fasta,
+            output,
+            evalue=evalue,
+            max_target_seqs=max_target_seqs,
+            num_threads=threads,
             quiet=quiet,
             stdout_log=layout.stdout_log,
             stderr_log=layout.stderr_log,
-        ):
-            failure_summary = build_failure_summary(SEARCH_STEP_DB, stderr_log=layout.stderr_log, fallback="makeblastdb failed")
-            set_step_state(steps, SEARCH_STEP_DB, STEP_FAILED, outputs={"db": str(db_fasta)}, error=failure_summary)
-            persist("failed", completed_at=utc_now_iso())
-            return None
-        set_step_state(steps, SEARCH_STEP_DB, STEP_SUCCESS, outputs={"db": str(db_fasta)})
-        persist("running")
+        )
+
+    def summarize() -> dict[str, object]:
+        # 摘要与每个 query 的聚合表在同一遍读取中完成
+        return summarize_blast_tsv(
+            output,
+            top_n=top_n,
+            per_query_top_n=top_per_query,
+            query_tables=query_tables,
+            query_lengths=read_query_lengths(query_fasta),
+        )
 
     if not quiet:
         console.print(t("search_step_blastn"), style="bold blue")
+    streamed_summary: dict[str, object] | None = None
     if resume and step_resume_ready(
         existing_metadata,
         SEARCH_STEP_BLASTN,
         validator=lambda: _is_nonempty_file(output),
         required_outputs=("tsv",),
     ):
+        # 校验旧结果的同一遍流式读取直接产出摘要，summary 步骤不再重复读取
         try:
-            hits = parse_blast_tsv(output)
+            streamed_summary = summarize()
         except ValueError:
-            hits = None
-        if hits is not None:
+            streamed_summary = None
+        if streamed_summary is not None:
             set_step_state(steps, SEARCH_STEP_BLASTN, STEP_SKIPPED, outputs={"tsv": str(output)}, note="reused existing output")
             persist("running")
         else:
             set_step_state(steps, SEARCH_STEP_BLASTN, STEP_RUNNING)
             persist("running")
-            if not _run_blastn(
-                db_fasta,
-                query_fasta,
-                output,
-                evalue=evalue,
-                max_target_seqs=max_target_seqs,
-                quiet=quiet,
-                stdout_log=layout.stdout_log,
-                stderr_log=layout.stderr_log,
-            ):
+            if not run_blastn():
                 failure_summary = build_failure_summary(SEARCH_STEP_BLASTN, stderr_log=layout.stderr_log, fallback="blastn failed")
                 set_step_state(steps, SEARCH_STEP_BLASTN, STEP_FAILED, outputs={"tsv": str(output)}, error=failure_summary)
                 persist("failed", completed_at=utc_now_iso())
                 return None
-            hits = parse_blast_tsv(output)
             set_step_state(steps, SEARCH_STEP_BLASTN, STEP_SUCCESS, outputs={"tsv": str(output)})
             persist("running")
     else:
         set_step_state(steps, SEARCH_STEP_BLASTN, STEP_RUNNING)
         persist("running")
-        if not _run_blastn(
-            db_fasta,
-            query_fasta,
-            output,
-            evalue=evalue,
-            max_target_seqs=max_target_seqs,
-            quiet=quiet,
-            stdout_log=layout.stdout_log,
-            stderr_log=layout.stderr_log,
-        ):
+        if not run_blastn():
             failure_summary = build_failure_summary(SEARCH_STEP_BLASTN, stderr_log=layout.stderr_log, fallback="blastn failed")
             set_step_state(steps, SEARCH_STEP_BLASTN, STEP_FAILED, outputs={"tsv": str(output)}, error=failure_summary)
             persist("failed", completed_at=utc_now_iso())
             return None
-        hits = parse_blast_tsv(output)
         set_step_state(steps, SEARCH_STEP_BLASTN, STEP_SUCCESS, outputs={"tsv": str(output)})
         persist("running")
 
     if resume and step_resume_ready(
         existing_metadata,
         SEARCH_STEP_SUMMARY,
-        validator=lambda: _summary_ready(summary_path),
+        validator=lambda: _summary_ready(summary_path, per_query=top_per_query > 0) and query_tables_ready(query_tables),
         required_outputs=("summary",),
     ):
         summary = json.loads(summary_path.read_text(encoding="utf-8"))
-        set_step_state(steps, SEARCH_STEP_SUMMARY, STEP_SKIPPED, outputs={"summary": str(summary_path)}, note="reused existing output")
+        set_step_state(
+            steps,
+            SEARCH_STEP_SUMMARY,
+            STEP_SKIPPED,
+            outputs={"summary": str(summary_path), **table_outputs},
+            note="reused existing output",
+        )
         persist("running", summary=summary)
     else:
-        summary = summarize_blast_hits(hits, top_n=top_n)
+        try:
+            summary = streamed_summary if streamed_summary is not None else summarize()
+        except ValueError as exc:
+            failure_summary = f"{SEARCH_STEP_SUMMARY}: {exc}"
+            append_log(layout.stderr_log, failure_summary)
+            set_step_state(steps, SEARCH_STEP_SUMMARY, STEP_FAILED, outputs={"summary": str(summary_path)}, error=failure_summary)
+            persist("failed", completed_at=utc_now_iso())
+            return None
         summary_path.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
-        set_step_state(steps, SEARCH_STEP_SUMMARY, STEP_SUCCESS, outputs={"summary": str(summary_path)})
+        set_step_state(steps, SEARCH_STEP_SUMMARY, STEP_SUCCESS, outputs={"summary": str(summary_path), **table_outputs})
         persist("running", summary=summary)
     hit_count = int(summary["hit_count"])
     if not quiet:
@@ -471,6 +1277,14 @@ def run_blast_search(
             style="bold green",
         )
         display_search_summary(summary)
+        console.print(
+            t(
+                "search_query_tables_done",
+                path=str(query_tables["per_query_tsv"]),
+                queries=summary.get("queries_with_hits", 0),
+            ),
+            style="bold cyan",
+        )
 
     failure_summary = ""
     persist("success", completed_at=utc_now_iso(), summary=summary)
@@ -480,10 +1294,13 @@ def run_blast_search(
         "query": str(query_fasta),
         "output": str(output),
         "outdir": str(layout.root),
+        "query_tables": table_outputs,
         "hits": hit_count,
         "evalue": evalue,
         "max_target_seqs": max_target_seqs,
         "top_n": top_n,
+        "threads": threads,
+        "shards": shards,
         "resume_used": resume,
         "summary": summary,
     }
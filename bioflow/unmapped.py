@@ -0,0 +1,167 @@
+"""BioFlow-CLI 未比对 reads 导出模块 — 从 SAM 流中提取 flag 4 记录写为压缩 FASTQ。"""
+
+from __future__ import annotations
+
+import gzip
+from pathlib import Path
+from typing import IO
+
+from bioflow.sam_stats import (
+    FLAG_MATE_UNMAPPED,
+    FLAG_PAIRED,
+    FLAG_READ1,
+    FLAG_READ2,
+    FLAG_SECONDARY,
+    FLAG_SUPPLEMENTARY,
+    FLAG_UNMAPPED,
+)
+
+FLAG_REVERSE = 0x10
+UNMAPPED_SINGLE_KEYS = ("unmapped",)
+UNMAPPED_PAIRED_KEYS = ("unmapped_r1", "unmapped_r2", "unmapped_singletons")
+_GZIP_MAGIC = b"\x1f\x8b"
+# 在解析线程中压缩，使用最快级别以免拖慢流向 sort 的数据
+_COMPRESS_LEVEL = 1
+# SAM 质量为 ``*`` 时的替代质量值，与 samtools fastq 默认的 Q1 一致
+_DEFAULT_QUALITY = b'"'
+_COMPLEMENT = bytes.maketrans(b"ACGTNacgtn", b"TGCANtgcan")
+
+
+def unmapped_fastq_paths(directory: Path, stem: str, *, paired: bool) -> dict[str, Path]:
+    """返回未比对 FASTQ 输出路径；双端时分为 R1、R2 与 mate 已比对的单端 reads。"""
+    if not paired:
+        return {"unmapped": directory / f"{stem}.unmapped.fastq.gz"}
+    return {
+        "unmapped_r1": directory / f"{stem}.unmapped_R1.fastq.gz",
+        "unmapped_r2": directory / f"{stem}.unmapped_R2.fastq.gz",
+        "unmapped_singletons": directory / f"{stem}.unmapped_singletons.fastq.gz",
+    }
+
+
+def fastq_gz_ready(path: Path) -> bool:
+    """压缩 FASTQ 存在且以 gzip 魔数开头。"""
+    try:
+        with path.open("rb") as handle:
+            return handle.read(len(_GZIP_MAGIC)) == _GZIP_MAGIC
+    except OSError:
+        return False
+
+
+def concat_fastq_gz(parts: list[Path], target: Path) -> Path:
+    """按顺序拼接多个 gzip 文件；多成员 gzip 可被标准工具直接解压。"""
+    temp_path = target.with_name(f".{target.name}.tmp")
+    with temp_path.open("wb") as out:
+        for part in parts:
+            with part.open("rb") as handle:
+                while chunk := handle.read(1 << 20):
+                    out.write(chunk)
+    temp_path.replace(target)
+    return target
+
+
+def _fastq_record(fields: list[bytes], flag: int) -> bytes:
+    """将未比对 SAM 记录转换为 FASTQ，反向链记录还原为测序方向。"""
+    name, seq, qual = fields[0], fields[9], fields[10]
+    if qual == b"*":
+        qual = _DEFAULT_QUALITY * len(seq)
+    if flag & FLAG_REVERSE:
+        seq = seq.translate(_COMPLEMENT)[::-1]
+        qual = qual[::-1]
+    if flag & FLAG_PAIRED:
+        if flag & FLAG_READ1:
+            name += b"/1"
+        elif flag & FLAG_READ2:
+            name += b"/2"
+    return b"@" + name + b"\n" + seq + b"\n+\n" + qual + b"\n"
+
+
+class UnmappedFastqWriter:
+    """从 SAM 文本流中挑出未比对的主记录，写入 gzip 压缩 FASTQ。
+
+    接口与 ``SamStreamStats`` 相同，可按任意切分的字节块喂入。
+    单端输入写入 ``unmapped``；双端输入时两条 mate 均未比对的 reads
+    分别写入 ``unmapped_r1`` / ``unmapped_r2``（保持成对顺序），
+    mate 已比对的写入 ``unmapped_singletons``。输出先写临时文件，
+    ``finish`` 时再原子替换，因此最终路径存在即表示内容完整。
+    """
+
+    def __init__(self, paths: dict[str, Path]) -> None:
+        self.paths = dict(paths)
+        self.paired = "unmapped" not in self.paths
+        self.counts = dict.fromkeys(self.paths, 0)
+        self.malformed = 0
+        self.complete = False
+        self._partial = b""
+        self._temp_paths = {key: path.with_name(f".{path.name}.tmp") for key, path in self.paths.items()}
+        self._handles: dict[str, IO[bytes]] = {}
+        for key, temp_path in self._temp_paths.items():
+            temp_path.parent.mkdir(parents=True, exist_ok=True)
+            self._handles[key] = gzip.open(temp_path, "wb", compresslevel=_COMPRESS_LEVEL)
+
+    @property
+    def total(self) -> int:
+        """已写出的未比对 reads 总数。"""
+        return sum(self.counts.values())
+
+    def feed(self, chunk: bytes) -> None:
+        """喂入一段 SAM 字节流，跨块的半行会缓存到下一块。"""
+        data = self._partial + chunk
+        lines = data.split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self.add_line(line)
+
+    def add_line(self, line: bytes) -> None:
+        """处理单行 SAM，仅输出未比对的主记录。"""
+        if not line or line.startswith(b"@"):
+            return
+        fields = line.split(b"\t", 11)
+        if len(fields) < 11:
+            self.malformed += 1
+            return
+        try:
+            flag = int(fields[1])
+        except ValueError:
+            self.malformed += 1
+            return
+        if not flag & FLAG_UNMAPPED or flag & (FLAG_SECONDARY | FLAG_SUPPLEMENTARY):
+            return
+        key = self._route(flag)
+        self._handles[key].write(_fastq_record(fields, flag))
+        self.counts[key] += 1
+
+    def _route(self, flag: int) -> str:
+        """决定记录写入哪个输出。"""
+        if not self.paired:
+            return "unmapped"
+        if flag & FLAG_PAIRED and flag & FLAG_MATE_UNMAPPED:
+            if flag & FLAG_READ1:
+                return "unmapped_r1"
+            if flag & FLAG_READ2:
+                return "unmapped_r2"
+        return "unmapped_singletons"
+
+    def finish(self) -> None:
+        """处理末尾半行，关闭压缩流并将临时文件替换为最终输出。"""
+        if self._partial:
+            self.add_line(self._partial)
+            self._partial = b""
+        self._close()
+        for key, temp_path in self._temp_paths.items():
+            temp_path.replace(self.paths[key])
+        self.complete = True
+
+    def discard(self) -> None:
+        """比对失败时关闭并删除本次写出的文件（含已替换的最终输出）。"""
+        self._close()
+        for temp_path in self._temp_paths.values():
+            temp_path.unlink(missing_ok=True)
+        if self.complete:
+            for path in self.paths.values():
+                path.unlink(missing_ok=True)
+            self.complete = False
+
+    def _close(self) -> None:
+        for handle in self._handles.values():
+            handle.close()
+        self._handles = {}
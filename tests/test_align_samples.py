@@ -0,0 +1,159 @@
+import csv
+import json
+from pathlib import Path
+
+import pytest
+
+import bioflow.align_samples as align_samples
+import bioflow.alignment as alignment
+
+
+def _write_reads(path: Path) -> None:
+    path.write_text("@r1\nACGT\n+\nIIII\n", encoding="utf-8")
+
+
+def test_read_samplesheet_resolves_paths_and_rejects_duplicates(tmp_path: Path) -> None:
+    _write_reads(tmp_path / "a_R1.fq")
+    _write_reads(tmp_path / "a_R2.fq")
+    _write_reads(tmp_path / "b.fq")
+    sheet = tmp_path / "samples.tsv"
+    sheet.write_text("# plate 1\nsample\tinput\tinput2\nA\ta_R1.fq\ta_R2.fq\n\nB\tb.fq\t\n", encoding="utf-8")
+
+    samples = align_samples.read_samplesheet(sheet)
+
+    assert [(s.name, s.reads, s.reads2) for s in samples] == [
+        ("A", tmp_path / "a_R1.fq", tmp_path / "a_R2.fq"),
+        ("B", tmp_path / "b.fq", None),
+    ]
+    assert samples[1].read_group("ILLUMINA").header_line() == "@RG\\tID:B\\tSM:B\\tPL:ILLUMINA"
+    sheet.write_text("sample\tinput\trg_id\tplatform\nA\tb.fq\tA.L001\tONT\n", encoding="utf-8")
+    assert align_samples.read_samplesheet(sheet)[0].read_group("ILLUMINA").to_dict() == {"ID": "A.L001", "SM": "A", "PL": "ONT"}
+    sheet.write_text("sample\tinput\nA\tb.fq\nA\tb.fq\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="duplicate sample"):
+        align_samples.read_samplesheet(sheet)
+
+
+def test_alignment_samples_share_one_index_and_write_summary(tmp_path: Path, monkeypatch) -> None:
+    ref = tmp_path / "ref.fa"
+    ref.write_text(">ref\nACGT\n", encoding="utf-8")
+    samples = []
+    for name in ("s1", "s2", "s3"):
+        _write_reads(tmp_path / f"{name}.fq")
+        samples.append(align_samples.AlignSample(name, tmp_path / f"{name}.fq"))
+    run_root = tmp_path / "plate"
+    index_builds: list[Path] = []
+    version_probes: list[tuple[str, ...]] = []
+
+    def fake_index(_ref: Path, *, prefix: Path | None = None, **_: object) -> bool:
+        index_builds.append(prefix)
+        for suffix in alignment.BWA_INDEX_SUFFIXES:
+            Path(f"{prefix}{suffix}").write_text("idx", encoding="utf-8")
+        return True
+
+    def fake_map(index_prefix: Path, reads: Path, output_bam: Path, *, threads: int, read_group, **_: object) -> bool:
+        assert index_prefix == run_root / "index" / "ref.fa"
+        assert threads == 2
+        assert read_group.to_dict() == {"ID": reads.stem, "SM": reads.stem}
+        if reads.stem == "s2":
+            return False
+        output_bam.write_text("bam", encoding="utf-8")
+        return True
+
+    def fake_bam_index(bam: Path, **_: object) -> bool:
+        bam.with_suffix(bam.suffix + ".bai").write_text("bai", encoding="utf-8")
+        return True
+
+    monkeypatch.setattr(alignment, "run_aligner_index", fake_index)
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", fake_map)
+    monkeypatch.setattr(alignment, "_run_samtools_index", fake_bam_index)
+    monkeypatch.setattr(
+        alignment,
+        "_run_samtools_flagstat",
+        lambda *args, **kwargs: "10 + 0 in total (QC-passed reads + QC-failed reads)\n8 + 0 mapped (80.00% : N/A)\n",
+    )
+    monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
+    monkeypatch.setattr(
+        align_samples,
+        "collect_tool_versions",
+        lambda tools: version_probes.append(tuple(tools)) or {tool: "test" for tool in tools},
+    )
+    monkeypatch.setattr(alignment, "collect_tool_versions", lambda tools: pytest.fail("versions probed per sample"))
+
+    results = align_samples.run_alignment_samples(
+        ref,
+        samples,
+        outdir=run_root,
+        threads=4,
+        jobs=2,
+        skip_preflight=True,
+    )
+
+    assert results is not None
+    assert (results["succeeded"], results["failed"]) == (2, 1)
+    assert index_builds == [run_root / "index" / "ref.fa"]
+    assert len(version_probes) == 1
+    assert (run_root / "samples" / "s1" / "results" / "s1.sorted.bam").exists()
+    with (run_root / "results" / "flagstat_summary.tsv").open(encoding="utf-8") as handle:
+        rows = list(csv.DictReader(handle, delimiter="\t"))
+    assert [(row["sample"], row["status"], row["mapped"]) for row in rows] == [
+        ("s1", "success", "8"),
+        ("s2", "failed", ""),
+        ("s3", "success", "8"),
+    ]
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["status"] == "failed"
+    assert metadata["steps"]["sample:s2"]["status"] == "failed"
+    sample_metadata = json.loads((run_root / "samples" / "s1" / "metadata.json").read_text(encoding="utf-8"))
+    assert sample_metadata["tool_versions"] == {"bwa": "test", "samtools": "test"}
+    assert sample_metadata["steps"]["bwa_index"]["status"] == "success"
+    assert sample_metadata["parameters"]["read_group"] == {"ID": "s1", "SM": "s1"}
+
+
+def test_alignment_samples_resume_rebuilds_index_when_aligner_changes(tmp_path: Path, monkeypatch) -> None:
+    ref = tmp_path / "ref.fa"
+    ref.write_text(">ref\nACGT\n", encoding="utf-8")
+    _write_reads(tmp_path / "s1.fq")
+    samples = [align_samples.AlignSample("s1", tmp_path / "s1.fq")]
+    run_root = tmp_path / "plate"
+    index_builds: list[str] = []
+    mapped: list[str] = []
+
+    def fake_index(_ref: Path, *, aligner, prefix: Path | None = None, **_: object) -> bool:
+        index_builds.append(aligner.label)
+        for path in aligner.index_files(prefix):
+            path.write_text("idx", encoding="utf-8")
+        return True
+
+    def fake_map(index_prefix: Path, _reads: Path, output_bam: Path, *, aligner, **_: object) -> bool:
+        # 比对时必须能找到当前比对器自己的索引文件
+        assert all(path.exists() for path in aligner.index_files(index_prefix))
+        mapped.append(aligner.label)
+        output_bam.write_text("bam", encoding="utf-8")
+        return True
+
+    monkeypatch.setattr(alignment, "run_aligner_index", fake_index)
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", fake_map)
+    monkeypatch.setattr(alignment, "_run_samtools_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(
+        alignment,
+        "_run_samtools_flagstat",
+        lambda *args, **kwargs: "10 + 0 in total (QC-passed reads + QC-failed reads)\n8 + 0 mapped (80.00% : N/A)\n",
+    )
+    monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
+    monkeypatch.setattr(align_samples, "collect_tool_versions", lambda tools: {tool: "test" for tool in tools})
+
+    def run(**options: object) -> None:
+        results = align_samples.run_alignment_samples(
+            ref, samples, outdir=run_root, resume=True, skip_preflight=True, **options,
+        )
+        assert results is not None and results["failed"] == 0
+
+    run(aligner="bwa")
+    run(aligner="minimap2")
+    run(aligner="minimap2")
+    run(aligner="minimap2", aligner_preset="sr")
+
+    assert index_builds == ["bwa", "minimap2:map-ont", "minimap2:sr"]
+    assert (mapped[0], mapped[-1]) == ("bwa", "minimap2:sr")
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["steps"]["bwa_index"]["outputs"]["aligner"] == "minimap2:sr"
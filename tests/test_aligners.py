@@ -0,0 +1,132 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+import bioflow.alignment as alignment
+from bioflow.aligners import ReadGroup, get_aligner, resolve_read_group
+
+
+def test_aligner_backends_build_index_and_map_commands() -> None:
+    ref = Path("ref.fa")
+    mem2 = get_aligner("bwa-mem2")
+    assert mem2.index_command(ref, Path("idx/ref.fa")) == ["bwa-mem2", "index", "-p", "idx/ref.fa", "ref.fa"]
+    assert mem2.map_command(ref, Path("r1.fq"), Path("r2.fq"), threads=8) == [
+        "bwa-mem2", "mem", "-t", "8", "ref.fa", "r1.fq", "r2.fq",
+    ]
+    assert Path("ref.fa.bwt.2bit.64") in mem2.index_files(ref)
+
+    minimap2 = get_aligner("minimap2", "sr")
+    assert minimap2.index_command(ref) == ["minimap2", "-x", "sr", "-d", "ref.fa.mmi", "ref.fa"]
+    assert minimap2.map_command(ref, Path("r1.fq"), threads=4) == ["minimap2", "-a", "-x", "sr", "-t", "4", "ref.fa.mmi", "r1.fq"]
+    assert minimap2.cache_key == "minimap2-sr" and get_aligner("minimap2").label == "minimap2:map-ont"
+    assert minimap2.parse_progress(b"[M::worker_pipeline::1.2*0.98] mapped 2500 sequences") == 2500
+    assert alignment.align_required_tools(minimap2) == ("minimap2", "samtools")
+
+    read_group = resolve_read_group(sample="NA12878", platform="ILLUMINA", default_id="reads")
+    assert read_group == ReadGroup("NA12878", "NA12878", "ILLUMINA")
+    assert get_aligner().map_command(ref, Path("r1.fq"), read_group=read_group)[4:6] == [
+        "-R", "@RG\\tID:NA12878\\tSM:NA12878\\tPL:ILLUMINA",
+    ]
+    assert resolve_read_group(default_id="reads") is None
+    with pytest.raises(ValueError):
+        ReadGroup("lane\t1", "S1")
+
+    with pytest.raises(ValueError):
+        get_aligner("bwa", "sr")
+    with pytest.raises(ValueError):
+        get_aligner("bowtie2")
+
+
+def test_alignment_pipeline_runs_minimap2_with_per_backend_cache(tmp_path: Path, monkeypatch) -> None:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    calls = tmp_path / "calls.log"
+    minimap2 = bin_dir / "minimap2"
+    minimap2.write_text(
+        "#!/bin/sh\n"
+        f'echo "minimap2 $*" >> {calls}\n'
+        'case " $* " in\n'
+        '  *" -d "*) while [ $# -gt 0 ]; do [ "$1" = "-d" ] && echo mmi > "$2"; shift; done ;;\n'
+        '  *) printf "@SQ\\tSN:chr1\\tLN:100\\nr1\\t0\\tchr1\\t1\\t60\\t4M\\t*\\t0\\t0\\tACGT\\tIIII\\n"\n'
+        '     echo "[M::worker_pipeline::0.1*1.00] mapped 1 sequences" >&2 ;;\n'
+        "esac\n",
+        encoding="utf-8",
+    )
+    samtools = bin_dir / "samtools"
+    samtools.write_text(
+        '#!/bin/sh\nout=""\nwhile [ $# -gt 0 ]; do [ "$1" = "-o" ] && out="$2"; shift; done\ncat > "$out"\n',
+        encoding="utf-8",
+    )
+    for tool in (minimap2, samtools):
+        tool.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setattr(alignment, "_run_samtools_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
+    ref = tmp_path / "ref.fa"
+    reads = tmp_path / "reads.fastq"
+    ref.write_text(">chr1\nACGT\n", encoding="utf-8")
+    reads.write_text("@r1\nACGT\n+\nIIII\n", encoding="utf-8")
+    run_root = tmp_path / "run"
+
+    stats = alignment.run_alignment_pipeline(
+        ref,
+        reads,
+        outdir=run_root,
+        threads=2,
+        skip_preflight=True,
+        index_cache=tmp_path / "cache",
+        aligner="minimap2",
+        aligner_preset="sr",
+        stream_stats=True,
+    )
+
+    assert stats is not None and stats["mapped"] == 1
+    logged = [line for line in calls.read_text(encoding="utf-8").splitlines() if "version" not in line]
+    assert logged[0].startswith("minimap2 -x sr -d ") and logged[0].endswith(f"index.mmi {ref}")
+    assert logged[1] == f"minimap2 -a -x sr -t 2 {run_root / 'index' / 'ref.fa.mmi'} {reads}"
+    assert list((tmp_path / "cache" / "minimap2-sr").glob("*/index.mmi"))
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["parameters"]["aligner"] == "minimap2:sr"
+    assert set(metadata["tool_versions"]) == {"minimap2", "samtools"}
+    assert metadata["steps"]["map_sort"]["outputs"]["throughput"]["reads"] == 1
+
+
+def test_read_group_is_recorded_and_invalidates_resumed_alignment(tmp_path: Path, monkeypatch) -> None:
+    ref = tmp_path / "ref.fa"
+    reads = tmp_path / "reads.fastq"
+    ref.write_text(">chr1\nACGT\n", encoding="utf-8")
+    reads.write_text("@r1\nACGT\n+\nIIII\n", encoding="utf-8")
+    run_root = tmp_path / "run"
+    seen: list[ReadGroup | None] = []
+
+    def fake_map(_ref: Path, _reads: Path, output_bam: Path, *, read_group: ReadGroup | None = None, **_: object) -> bool:
+        seen.append(read_group)
+        output_bam.write_bytes(b"bam" + alignment._BGZF_EOF)
+        return True
+
+    def fake_index(bam: Path, **_: object) -> bool:
+        bam.with_suffix(bam.suffix + ".bai").write_text("bai", encoding="utf-8")
+        return True
+
+    monkeypatch.setattr(alignment, "run_aligner_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", fake_map)
+    monkeypatch.setattr(alignment, "_run_samtools_index", fake_index)
+    monkeypatch.setattr(
+        alignment,
+        "_run_samtools_flagstat",
+        lambda *args, **kwargs: "1 + 0 in total (QC-passed reads + QC-failed reads)\n1 + 0 mapped (100.00% : N/A)\n",
+    )
+    monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
+
+    for read_group in (ReadGroup("L1", "S1", "ILLUMINA"), ReadGroup("L1", "S1", "ILLUMINA"), ReadGroup("L2", "S1")):
+        stats = alignment.run_alignment_pipeline(
+            ref, reads, outdir=run_root, skip_preflight=True, resume=True, read_group=read_group,
+        )
+        assert stats is not None
+
+    # 第二次读组未变，复用比对结果；第三次读组变化，重新比对
+    assert [group.id for group in seen if group is not None] == ["L1", "L2"]
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["parameters"]["read_group"] == {"ID": "L2", "SM": "S1"}
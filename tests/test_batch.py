@@ -0,0 +1,195 @@
+import csv
+import json
+from pathlib import Path
+
+import bioflow.bio_tasks as bio_tasks
+from bioflow.resources import read_cgroup_memory_headroom, read_meminfo_available, read_process_usage
+
+
+def _write_fasta(path: Path, name: str, seq: str) -> None:
+    path.write_text(f">{name}\n{seq}\n", encoding="utf-8")
+
+
+def _read_results(results: dict) -> list[dict]:
+    path = Path(results["summary"]["results_file"])
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_memory_probes_read_meminfo_and_cgroup(tmp_path: Path) -> None:
+    meminfo = tmp_path / "meminfo"
+    meminfo.write_text("MemTotal: 2048 kB\nMemAvailable: 1024 kB\n", encoding="utf-8")
+    cgroup_v2 = tmp_path / "v2"
+    cgroup_v2.mkdir()
+    (cgroup_v2 / "memory.max").write_text("4096\n", encoding="utf-8")
+    (cgroup_v2 / "memory.current").write_text("1000\n", encoding="utf-8")
+    cgroup_unlimited = tmp_path / "unlimited"
+    cgroup_unlimited.mkdir()
+    (cgroup_unlimited / "memory.max").write_text("max\n", encoding="utf-8")
+
+    assert read_meminfo_available(meminfo) == 1024 * 1024
+    assert read_cgroup_memory_headroom(cgroup_v2) == 3096
+    assert read_cgroup_memory_headroom(cgroup_unlimited) is None
+
+
+def test_read_process_usage_parses_proc_stat(tmp_path: Path, monkeypatch) -> None:
+    proc_dir = tmp_path / "4242"
+    proc_dir.mkdir()
+    # comm 中含空格与括号，字段 14/15 为 utime/stime，字段 24 为 rss 页数
+    fields = ["S", "1", "1", "1", "0", "-1", "0", "0", "0", "0", "0", "300", "100"] + ["0"] * 8 + ["50"]
+    (proc_dir / "stat").write_text(f"4242 (samtools (sort)) {' '.join(fields)}\n", encoding="utf-8")
+    monkeypatch.setattr("os.sysconf", lambda name: {"SC_CLK_TCK": 100, "SC_PAGE_SIZE": 4096}[name])
+
+    usage = read_process_usage(4242, proc_root=tmp_path)
+
+    assert usage is not None
+    assert usage.cpu_seconds == 4.0
+    assert usage.rss_bytes == 50 * 4096
+    assert read_process_usage(9999, proc_root=tmp_path) is None
+
+
+def test_batch_auto_workers_admits_jobs_within_memory_budget(tmp_path: Path, monkeypatch) -> None:
+    input_dir = tmp_path / "data"
+    input_dir.mkdir()
+    for index in range(4):
+        _write_fasta(input_dir / f"s{index}.fasta", f"s{index}", "acgt" * 10)
+
+    monkeypatch.setattr(bio_tasks, "cpu_budget", lambda: 2)
+    monkeypatch.setattr(bio_tasks, "available_memory_bytes", lambda: 10 * 1024 ** 3)
+
+    results = bio_tasks.batch_format_sequences(
+        input_dir,
+        tmp_path / "out",
+        workers="auto",
+        quiet=True,
+    )
+
+    assert Path(results["summary"]["results_file"]) == tmp_path / "out" / bio_tasks.BATCH_RESULTS_NAME
+    rows = sorted(_read_results(results), key=lambda row: row["index"])
+    assert [row["file"] for row in rows if row["status"] == "success"] == [f"s{index}.fasta" for index in range(4)]
+    assert (tmp_path / "out" / "s0.formatted.fasta").read_text(encoding="utf-8") == ">s0\n" + "ACGT" * 10 + "\n"
+
+    job = {"memory": 600}
+    assert bio_tasks._admit_job(job, 0, 0, 100) is True
+    assert bio_tasks._admit_job(job, 1, 100, 500) is False
+    assert bio_tasks._admit_job(job, 1, 100, None) is True
+
+
+def test_batch_streams_results_and_keeps_only_aggregates(tmp_path: Path) -> None:
+    input_dir = tmp_path / "data"
+    input_dir.mkdir()
+    for index in range(5):
+        _write_fasta(input_dir / f"s{index}.fasta", f"s{index}", "ACGT")
+    (input_dir / "broken.fasta").write_text("@r1\nACGT\n+\n!!\n", encoding="utf-8")
+    results_file = tmp_path / "results.jsonl"
+
+    results = bio_tasks.batch_format_sequences(
+        input_dir,
+        tmp_path / "out",
+        quiet=True,
+        results_path=results_file,
+        top_n=2,
+    )
+
+    assert set(results) == {"summary"}
+    summary = results["summary"]
+    assert summary["total"] == 6
+    assert summary["success_count"] == 5
+    assert summary["failed_count"] == 1
+    assert summary["sequences"] == 5
+    assert len(summary["slowest"]) == 2
+    assert summary["failed"][0]["file"] == "broken.fasta"
+
+    rows = [json.loads(line) for line in results_file.read_text(encoding="utf-8").splitlines()]
+    assert len(rows) == 6
+    assert {row["status"] for row in rows} == {"success", "failed"}
+
+
+def test_batch_splits_large_files_into_record_aligned_shards(tmp_path: Path, monkeypatch) -> None:
+    input_dir = tmp_path / "data"
+    input_dir.mkdir()
+    records = []
+    for index in range(200):
+        # 质量行以 @ 开头，用于验证分片边界不会误判 FASTQ 记录起点
+        records.append(f"@read{index}\nacgtacgtac\n+\n@IIIIIIIII\n")
+    (input_dir / "reads.fastq").write_text("".join(records), encoding="utf-8")
+
+    serial = bio_tasks.batch_format_sequences(input_dir, tmp_path / "serial", pattern="*.fastq", quiet=True)
+    monkeypatch.setattr(bio_tasks, "_SHARD_MIN_BYTES", 512)
+    sharded = bio_tasks.batch_format_sequences(
+        input_dir,
+        tmp_path / "sharded",
+        pattern="*.fastq",
+        quiet=True,
+        workers=4,
+    )
+
+    assert _read_results(sharded)[0]["sequences"] == _read_results(serial)[0]["sequences"] == 200
+    assert sharded["summary"]["fastq_stats"] == serial["summary"]["fastq_stats"]
+    expected = (tmp_path / "serial" / "reads.formatted.fastq").read_text(encoding="utf-8")
+    assert (tmp_path / "sharded" / "reads.formatted.fastq").read_text(encoding="utf-8") == expected
+    assert sorted(path.name for path in (tmp_path / "sharded").iterdir()) == [
+        bio_tasks.BATCH_PATH_MAP_NAME,
+        bio_tasks.BATCH_RESULTS_NAME,
+        "reads.formatted.fastq",
+    ]
+
+    with (input_dir / "reads.fastq").open("rb") as handle:
+        starts = [start for start, _end in bio_tasks._plan_shards(input_dir / "reads.fastq", "fastq", 512)]
+        for start in starts:
+            handle.seek(start)
+            assert handle.readline().startswith(b"@read")
+    assert len(starts) > 1
+
+
+def test_output_path_mapper_counts_collisions_and_writes_map(tmp_path: Path) -> None:
+    input_dir = tmp_path / "data"
+    output_dir = tmp_path / "out"
+    mapper = bio_tasks.OutputPathMapper(input_dir, output_dir, recursive=False)
+
+    names = [mapper.map(input_dir / f"s{index}" / "reads.fastq").name for index in range(4)]
+    assert names == [
+        "reads.formatted.fastq",
+        "reads.formatted_1.fastq",
+        "reads.formatted_2.fastq",
+        "reads.formatted_3.fastq",
+    ]
+    assert mapper.map(input_dir / "reads.formatted_4.fastq").name == "reads.formatted_4.formatted.fastq"
+    # 无扩展名的输入可能恰好占用另一基础名的候选名，此时跳过继续取号
+    assert mapper.map(input_dir / "sample_1").name == "sample_1.formatted"
+    assert [mapper.map(input_dir / f"s{index}" / "sample").name for index in range(2)] == [
+        "sample.formatted",
+        "sample_2.formatted",
+    ]
+
+    map_path = mapper.write()
+    lines = map_path.read_text(encoding="utf-8").splitlines()
+    assert map_path.name == bio_tasks.BATCH_PATH_MAP_NAME
+    assert lines[0] == "source\toutput"
+    assert lines[2] == "s1/reads.fastq\treads.formatted_1.fastq"
+
+
+def test_batch_merges_fastq_quality_stats_across_files(tmp_path: Path) -> None:
+    input_dir = tmp_path / "data"
+    input_dir.mkdir()
+    # Q40 与 Q10 各 4 个碱基
+    (input_dir / "high.fastq").write_text("@r1\nACGT\n+\nIIII\n", encoding="utf-8")
+    (input_dir / "low.fastq").write_text("@r2\nACGT\n+\n++++\n", encoding="utf-8")
+    _write_fasta(input_dir / "ref.fasta", "ref", "ACGT")
+    results_file = tmp_path / "results.csv"
+
+    results = bio_tasks.batch_format_sequences(
+        input_dir,
+        tmp_path / "out",
+        pattern="*.f*",
+        quiet=True,
+        workers=2,
+        results_path=results_file,
+    )
+
+    summary = results["summary"]
+    assert summary["fastq_files"] == 2
+    assert summary["fastq_stats"] == {"avg_q": 25.0, "q20_ratio": 0.5, "q30_ratio": 0.5, "bases": 8.0}
+    rows = {row["file"]: row for row in csv.DictReader(results_file.open(encoding="utf-8"))}
+    assert float(rows["high.fastq"]["avg_q"]) == 40.0
+    assert float(rows["low.fastq"]["q20_ratio"]) == 0.0
+    assert rows["ref.fasta"]["avg_q"] == ""
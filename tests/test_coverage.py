@@ -0,0 +1,107 @@
+import json
+import os
+from pathlib import Path
+
+import bioflow.alignment as alignment
+import bioflow.coverage as coverage
+from bioflow.coverage import compute_depth, summarize_depth
+
+SAM = (
+    "@HD\tVN:1.6\tSO:coordinate\n"
+    "@SQ\tSN:chr1\tLN:20\n"
+    "@SQ\tSN:chr2\tLN:10\n"
+    "@SQ\tSN:chrM\tLN:5\n"
+    "r1\t0\tchr1\t1\t60\t5M\t*\t0\t0\tACGTA\tIIIII\n"
+    "r2\t0\tchr1\t3\t60\t2S3M2D3M\t*\t0\t0\tACGTACGT\tIIIIIIII\n"
+    "r3\t0\tchr1\t18\t60\t5M\t*\t0\t0\tACGTA\tIIIII\n"
+    "r4\t1024\tchr1\t1\t60\t5M\t*\t0\t0\tACGTA\tIIIII\n"
+    "r5\t0\tchr2\t1\t3\t4M\t*\t0\t0\tACGT\tIIII\n"
+)
+
+
+def test_compute_depth_uses_difference_arrays_per_contig(monkeypatch) -> None:
+    for engine in (coverage.np, None):
+        monkeypatch.setattr(coverage, "np", engine)
+        results = compute_depth(SAM.splitlines(keepends=True), (1, 2))
+
+        assert [item.contig for item in results] == ["chr1", "chr2", "chrM"]
+        chr1 = results[0]
+        # r1: 0-4, r2: 2-4 与 7-9（删除不计入），r3 截断到序列末尾 17-19；duplicate 不计
+        assert chr1.aligned_bases == 5 + 6 + 3
+        assert chr1.covered == {1: 11, 2: 3}
+        assert results[1].covered[1] == 4 and results[2].aligned_bases == 0
+
+        summary = summarize_depth(results, (1, 2))
+        assert summary["reference_length"] == 35
+        assert summary["mean_depth"] == round(18 / 35, 4)
+        assert summary["breadth_1x"] == round(15 / 35, 6)
+
+    low_mapq = compute_depth(SAM.splitlines(keepends=True), (1,), min_mapq=10)
+    assert low_mapq[1].aligned_bases == 0
+
+
+def test_alignment_merges_depth_stats_into_metadata(tmp_path: Path, monkeypatch) -> None:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    sam = tmp_path / "stream.sam"
+    sam.write_text(SAM, encoding="utf-8")
+    tool = bin_dir / "samtools"
+    tool.write_text(f'#!/bin/sh\n[ "$1" = view ] && cat {sam}\n', encoding="utf-8")
+    tool.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    ref = tmp_path / "ref.fa"
+    reads = tmp_path / "reads.fastq"
+    ref.write_text(">chr1\nACGT\n", encoding="utf-8")
+    reads.write_text("@r1\nACGT\n+\nIIII\n", encoding="utf-8")
+    run_root = tmp_path / "run"
+
+    def fake_map(_ref: Path, _reads: Path, output_bam: Path, **_: object) -> bool:
+        output_bam.write_text("bam", encoding="utf-8")
+        return True
+
+    def fake_index(bam: Path, **_: object) -> bool:
+        bam.with_suffix(bam.suffix + ".bai").write_text("bai", encoding="utf-8")
+        return True
+
+    monkeypatch.setattr(alignment, "run_aligner_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", fake_map)
+    monkeypatch.setattr(alignment, "_run_samtools_index", fake_index)
+    monkeypatch.setattr(
+        alignment,
+        "_run_samtools_flagstat",
+        lambda *args, **kwargs: "5 + 0 in total (QC-passed reads + QC-failed reads)\n5 + 0 mapped (100.00% : N/A)\n",
+    )
+    monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
+
+    stats = alignment.run_alignment_pipeline(ref, reads, outdir=run_root, skip_preflight=True, depth_stats=True)
+
+    assert stats is not None and stats["covered_bases"] == 15
+    assert stats["breadth_10x"] == 0.0
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["steps"]["depth"]["status"] == "success"
+    assert metadata["stats"]["mean_depth"] == round(18 / 35, 4)
+    rows = (run_root / "results" / "reads.sorted.depth.tsv").read_text(encoding="utf-8").splitlines()
+    assert rows[0].split("\t") == ["contig", "length", "aligned_bases", "mean_depth", "breadth_1x", "breadth_10x", "breadth_30x"]
+    assert rows[1].split("\t")[:3] == ["chr1", "20", "14"]
+
+
+def test_run_depth_stats_warns_on_pure_python_fallback(tmp_path: Path, monkeypatch, caplog) -> None:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    sam = tmp_path / "stream.sam"
+    sam.write_text(SAM, encoding="utf-8")
+    tool = bin_dir / "samtools"
+    tool.write_text(f'#!/bin/sh\n[ "$1" = view ] && cat {sam}\n', encoding="utf-8")
+    tool.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setattr(coverage, "np", None)
+
+    with caplog.at_level("WARNING", logger="bioflow"):
+        summary = coverage.run_depth_stats(
+            tmp_path / "in.bam",
+            table_path=tmp_path / "depth.tsv",
+            summary_path=tmp_path / "depth.json",
+        )
+
+    assert summary["mean_depth"] == round(18 / 35, 4)
+    assert any("pure-Python" in record.getMessage() for record in caplog.records)
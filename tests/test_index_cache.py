@@ -0,0 +1,229 @@
+import json
+import os
+from pathlib import Path
+
+import bioflow.alignment as alignment
+import bioflow.search as search
+from bioflow.index_cache import IndexCache, _release_leases
+
+
+def _fake_build(calls: list[Path]):
+    def build(prefix: Path) -> bool:
+        calls.append(prefix)
+        for suffix in alignment.BWA_INDEX_SUFFIXES:
+            Path(f"{prefix}{suffix}").write_text("x" * 100, encoding="utf-8")
+        return True
+
+    return build
+
+
+def test_index_cache_builds_once_and_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache = IndexCache(tmp_path / "cache", max_bytes=1400)
+    calls: list[Path] = []
+
+    first = cache.fetch_or_build("bwa", "a" * 64, alignment.BWA_INDEX_SUFFIXES, _fake_build(calls))
+    again = cache.fetch_or_build(
+        "bwa",
+        "a" * 64,
+        alignment.BWA_INDEX_SUFFIXES,
+        _fake_build(calls),
+        link_prefix=tmp_path / "run" / "ref.fa",
+    )
+    assert first is not None and not first.hit
+    assert again is not None and again.hit
+    assert len(calls) == 1
+    assert (tmp_path / "run" / "ref.fa.bwt").read_text(encoding="utf-8") == "x" * 100
+
+    # 已硬链接到运行目录的索引文件不计入可回收空间，只剩条目清单
+    manifest_size = (first.entry_dir / "entry.json").stat().st_size
+    assert [size for _used, size, _entry in cache.entries()] == [manifest_size]
+
+    # 未指定链接前缀的检出在本进程内持有使用锁，释放后才可被淘汰
+    _release_leases()
+    os.utime(first.entry_dir, (1, 1))
+    cache.fetch_or_build("bwa", "b" * 64, alignment.BWA_INDEX_SUFFIXES, _fake_build(calls))
+    _release_leases()
+    cache.fetch_or_build("bwa", "c" * 64, alignment.BWA_INDEX_SUFFIXES, _fake_build(calls))
+    _release_leases()
+
+    remaining = sorted(entry.name[0] for _used, _size, entry in cache.entries())
+    assert remaining == ["b", "c"]
+    # 硬链接的运行目录索引不受淘汰影响
+    assert (tmp_path / "run" / "ref.fa.bwt").exists()
+
+
+def test_index_cache_keeps_entries_in_use_through_symlinks(tmp_path: Path, monkeypatch) -> None:
+    cache = IndexCache(tmp_path / "cache", max_bytes=700)
+    calls: list[Path] = []
+
+    def no_hardlink(*_: object) -> None:
+        raise OSError("cross-device link")
+
+    monkeypatch.setattr(os, "link", no_hardlink)
+    linked = cache.fetch_or_build(
+        "bwa", "a" * 64, alignment.BWA_INDEX_SUFFIXES, _fake_build(calls), link_prefix=tmp_path / "run" / "ref.fa",
+    )
+    assert linked is not None and linked.link_mode == "symlink"
+    os.utime(linked.entry_dir, (1, 1))
+    cache.fetch_or_build("bwa", "b" * 64, alignment.BWA_INDEX_SUFFIXES, _fake_build(calls))
+
+    # a 仍被运行目录的符号链接使用，超出预算也不淘汰
+    assert linked.entry_dir.is_dir()
+    assert (tmp_path / "run" / "ref.fa.bwt").read_text(encoding="utf-8") == "x" * 100
+
+    _release_leases()
+    assert cache.evict() == [linked.entry_dir]
+
+
+def test_alignment_pipeline_links_index_from_shared_cache(tmp_path: Path, monkeypatch) -> None:
+    cache_root = tmp_path / "cache"
+    index_calls: list[Path | None] = []
+    mapped_refs: list[Path] = []
+
+    def fake_index(_ref: Path, *, prefix: Path | None = None, **_: object) -> bool:
+        index_calls.append(prefix)
+        for suffix in alignment.BWA_INDEX_SUFFIXES:
+            Path(f"{prefix}{suffix}").write_text("idx", encoding="utf-8")
+        return True
+
+    def fake_map(index_ref: Path, _reads: Path, output_bam: Path, **_: object) -> bool:
+        mapped_refs.append(index_ref)
+        output_bam.write_text("bam", encoding="utf-8")
+        return True
+
+    monkeypatch.setattr(alignment, "run_aligner_index", fake_index)
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", fake_map)
+    monkeypatch.setattr(alignment, "_run_samtools_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(
+        alignment,
+        "_run_samtools_flagstat",
+        lambda *args, **kwargs: "10 + 0 in total (QC-passed reads + QC-failed reads)\n8 + 0 mapped (80.00% : N/A)\n",
+    )
+    monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
+    monkeypatch.setenv("BIOFLOW_INDEX_CACHE", str(cache_root))
+
+    for project in ("project-a", "project-b"):
+        project_dir = tmp_path / project
+        project_dir.mkdir()
+        ref = project_dir / "ref.fa"
+        reads = project_dir / "reads.fastq"
+        ref.write_text(">ref\nACGT\n", encoding="utf-8")
+        reads.write_text("@r1\nACGT\n+\n!!!!\n", encoding="utf-8")
+        stats = alignment.run_alignment_pipeline(ref, reads, outdir=project_dir / "run", skip_preflight=True)
+        assert stats is not None
+
+    assert len(index_calls) == 1
+    assert mapped_refs[1] == tmp_path / "project-b" / "run" / "index" / "ref.fa"
+    assert (mapped_refs[1].parent / "ref.fa.sa").exists()
+    metadata = json.loads((tmp_path / "project-b" / "run" / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["steps"]["bwa_index"]["outputs"]["cache_hit"] is True
+    assert not (tmp_path / "project-b" / "ref.fa.bwt").exists()
+
+
+def test_search_builds_multi_volume_blast_db_once_in_shared_cache(tmp_path: Path, monkeypatch) -> None:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    calls = tmp_path / "calls.log"
+    # 假 makeblastdb 按 -out 写出两卷数据库及 .nal 别名文件
+    (bin_dir / "makeblastdb").write_text(
+        "#!/bin/sh\n"
+        'case "$1" in -version|--version) echo "makeblastdb: 2.14.0+"; exit 0;; esac\n'
+        f'echo "makeblastdb $*" >> {calls}\n'
+        'out=""\nwhile [ $# -gt 0 ]; do [ "$1" = "-out" ] && out="$2"; shift; done\n'
+        '[ -n "$out" ] || exit 1\n'
+        'name=$(basename "$out")\n'
+        'for vol in 00 01; do for ext in nhr nin nsq; do echo db > "$out.$vol.$ext"; done; done\n'
+        'printf "TITLE db\\nDBLIST $name.00 $name.01\\n" > "$out.nal"\n',
+        encoding="utf-8",
+    )
+    (bin_dir / "makeblastdb").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setenv("BIOFLOW_INDEX_CACHE", str(tmp_path / "cache"))
+    searched: list[Path] = []
+
+    def fake_blastn(db_prefix: Path, _query: Path, output_path: Path, **_: object) -> bool:
+        searched.append(db_prefix)
+        output_path.write_text("q1\tref\t99.00\t4\t0\t0\t1\t4\t1\t4\t1e-20\t80\n", encoding="utf-8")
+        return True
+
+    monkeypatch.setattr(search, "_run_blastn", fake_blastn)
+    for project in ("project-a", "project-b"):
+        project_dir = tmp_path / project
+        project_dir.mkdir()
+        (project_dir / "db.fa").write_text(">ref\nACGT\n", encoding="utf-8")
+        (project_dir / "query.fa").write_text(">q1\nACGT\n", encoding="utf-8")
+        result = search.run_blast_search(
+            project_dir / "db.fa", project_dir / "query.fa", outdir=project_dir / "run", skip_preflight=True,
+        )
+        assert result is not None
+
+    assert calls.read_text(encoding="utf-8").count("makeblastdb -in") == 1
+    linked = tmp_path / "project-b" / "run" / "index" / "blastdb" / "index"
+    assert searched[1] == linked
+    assert search._blast_db_ready(linked)
+    assert len(search.blast_db_index_files(linked)) == 7
+    metadata = json.loads((tmp_path / "project-b" / "run" / "metadata.json").read_text(encoding="utf-8"))
+    db_outputs = metadata["steps"]["makeblastdb"]["outputs"]
+    assert db_outputs["cache_hit"] is True
+    assert Path(db_outputs["cache_entry"]).parent.name == "blastdb-2.14.0+"
+    assert not list((tmp_path / "project-b").glob("db.fa.*"))
+
+    # 缺少任一卷的文件即视为不完整
+    Path(f"{linked}.01.nsq").unlink()
+    assert not search._blast_db_ready(linked)
+
+
+def test_search_rebuilds_stale_blast_db_next_to_fasta(tmp_path: Path, monkeypatch) -> None:
+    db = tmp_path / "db.fa"
+    db.write_text(">ref\nACGT\n", encoding="utf-8")
+    builds: list[Path] = []
+
+    def fake_makeblastdb(_db: Path, *, out: Path, **_: object) -> bool:
+        builds.append(out)
+        for suffix in search.BLAST_DB_VOLUME_SUFFIXES:
+            Path(f"{out}{suffix}").write_text("db", encoding="utf-8")
+        return True
+
+    monkeypatch.setattr(search, "_run_makeblastdb", fake_makeblastdb)
+    assert search.build_blast_db(db)
+    assert search._blast_db_ready(db) and not search._blast_db_stale(db, db)
+    assert not list(tmp_path.glob(".tmp-*"))
+
+    # 建库后修改过的 FASTA：索引早于源序列
+    for path in search.blast_db_index_files(db):
+        os.utime(path, (1, 1))
+    assert search._blast_db_stale(db, db)
+    monkeypatch.setattr(search, "_run_blastn", lambda *args, **kwargs: False)
+    search.run_blast_search(db, db, outdir=tmp_path / "run", skip_preflight=True)
+    assert len(builds) == 2
+    assert not search._blast_db_stale(db, db)
+
+
+def test_search_uses_current_blast_db_without_locking_and_fails_cleanly(tmp_path: Path, monkeypatch) -> None:
+    db = tmp_path / "shared" / "db.fa"
+    db.parent.mkdir()
+    db.write_text(">ref\nACGT\n", encoding="utf-8")
+    for suffix in search.BLAST_DB_VOLUME_SUFFIXES:
+        Path(f"{db}{suffix}").write_text("db", encoding="utf-8")
+    query = tmp_path / "query.fa"
+    query.write_text(">q1\nACGT\n", encoding="utf-8")
+
+    def readonly_lock(path: Path, **_: object):
+        raise PermissionError(13, "Permission denied", str(path))
+
+    def fake_blastn(_db: Path, _query: Path, output_path: Path, **_: object) -> bool:
+        output_path.write_text("q1\tref\t99.00\t4\t0\t0\t1\t4\t1\t4\t1e-20\t80\n", encoding="utf-8")
+        return True
+
+    # 模拟只读的共享数据库目录：已建好的数据库不加锁即可使用
+    monkeypatch.setattr(search, "file_lock", readonly_lock)
+    monkeypatch.setattr(search, "_run_blastn", fake_blastn)
+    assert search.run_blast_search(db, query, outdir=tmp_path / "run-a", skip_preflight=True) is not None
+
+    # 需要建库但无法加锁时记录为失败的 makeblastdb 步骤，而不是抛出异常
+    Path(f"{db}.nsq").unlink()
+    assert search.run_blast_search(db, query, outdir=tmp_path / "run-b", skip_preflight=True) is None
+    metadata = json.loads((tmp_path / "run-b" / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["status"] == "failed"
+    assert metadata["steps"]["makeblastdb"]["status"] == "failed"
+    assert "Permission denied" in metadata["failure_summary"]
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import bioflow.cli as cli
+from bioflow.aligners import get_aligner
+from bioflow.reference import load_reference_bundle, prepare_reference_bundle
+
+
+def _install_fake_indexers(bin_dir: Path, calls: Path) -> None:
+    """假 bwa / makeblastdb 只按命令行约定创建索引文件并记录调用。"""
+    bin_dir.mkdir()
+    (bin_dir / "bwa").write_text(
+        "#!/bin/sh\n"
+        f'echo "bwa $*" >> {calls}\n'
+        'prefix=""\nwhile [ $# -gt 0 ]; do [ "$1" = "-p" ] && prefix="$2"; shift; done\n'
+        # 版本探测不带 -p，不能在当前目录留下索引文件
+        '[ -n "$prefix" ] || exit 1\n'
+        'for ext in amb ann bwt pac sa; do echo idx > "$prefix.$ext"; done\n',
+        encoding="utf-8",
+    )
+    (bin_dir / "makeblastdb").write_text(
+        "#!/bin/sh\n"
+        f'echo "makeblastdb $*" >> {calls}\n'
+        'db=""\nout=""\n'
+        'while [ $# -gt 0 ]; do [ "$1" = "-in" ] && db="$2"; [ "$1" = "-out" ] && out="$2"; shift; done\n'
+        '[ -n "$db" ] || exit 1\n'
+        'for ext in nhr nin nsq; do echo db > "${out:-$db}.$ext"; done\n',
+        encoding="utf-8",
+    )
+    for tool in bin_dir.iterdir():
+        tool.chmod(0o755)
+
+
+def test_prepare_reference_bundle_writes_fai_dict_and_reuses_indexes(tmp_path: Path, monkeypatch) -> None:
+    calls = tmp_path / "calls.log"
+    _install_fake_indexers(tmp_path / "bin", calls)
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}:{os.environ['PATH']}")
+    source = tmp_path / "genome.fa"
+    source.write_text(">chr1 first contig\nacgtac\ngtA\n\n>chr2\nNNNN\n>chrM\n", encoding="utf-8")
+    root = tmp_path / "bundles"
+
+    prepared = prepare_reference_bundle(source, root=root, aligners=(get_aligner("bwa"),), blast=True, width=4, quiet=True)
+
+    assert prepared is not None
+    bundle, built = prepared
+    assert built == {"bwa": True, "blast": True}
+    data = bundle.fasta.read_bytes()
+    assert data == b">chr1 first contig\nACGT\nACGT\nA\n>chr2\nNNNN\n>chrM\n\n"
+    assert bundle.root.name == hashlib.sha256(data).hexdigest() == bundle.sha256
+    fai = [line.split("\t") for line in (bundle.root / "reference.fa.fai").read_text(encoding="utf-8").splitlines()]
+    assert [row[0] for row in fai] == ["chr1", "chr2", "chrM"]
+    for name, length, offset, line_bases, line_width in fai:
+        assert int(line_width) == int(line_bases) + 1
+        if int(length):
+            assert data[int(offset):int(offset) + int(line_bases)] in (b"ACGT", b"NNNN")
+    assert fai[0][1:] == ["9", "19", "4", "5"]
+    dict_lines = (bundle.root / "reference.dict").read_text(encoding="utf-8").splitlines()
+    assert dict_lines[1].startswith(f"@SQ\tSN:chr1\tLN:9\tM5:{hashlib.md5(b'ACGTACGTA').hexdigest()}\t")
+    assert bundle.index_prefix("bwa") == bundle.root / "bwa" / "reference.fa"
+    assert (bundle.root / "reference.fa.nsq").is_file()
+    assert not list(root.glob(".tmp-*"))
+
+    # 换行、大小写不同但规范化内容相同的参考序列落在同一个包中，索引直接复用
+    calls.unlink()
+    other = tmp_path / "genome_upper.fa"
+    other.write_text(">chr1 first contig\nACGTACGTA\n>chr2\nNNNN\n>chrM\n", encoding="utf-8")
+    reused = prepare_reference_bundle(other, root=root, aligners=(get_aligner("bwa"),), blast=True, width=4, quiet=True)
+    assert reused is not None and reused[0].root == bundle.root and reused[1] == {"bwa": False, "blast": False}
+    assert not calls.exists()
+
+
+def test_concurrent_prepare_builds_each_index_once(tmp_path: Path, monkeypatch) -> None:
+    calls = tmp_path / "calls.log"
+    _install_fake_indexers(tmp_path / "bin", calls)
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}:{os.environ['PATH']}")
+    root = tmp_path / "bundles"
+    sources = []
+    for index in range(4):
+        source = tmp_path / f"copy{index}" / "genome.fa"
+        source.parent.mkdir()
+        source.write_text(">chr1\nACGTACGT\n", encoding="utf-8")
+        sources.append(source)
+
+    # 同名来源在同一进程的多个线程中并发准备：暂存目录互不冲突，每个索引只构建一次
+    with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+        results = list(executor.map(
+            lambda source: prepare_reference_bundle(source, root=root, aligners=(get_aligner("bwa"),), blast=True, quiet=True),
+            sources,
+        ))
+
+    assert all(result is not None for result in results)
+    assert len({result[0].root for result in results}) == 1
+    assert sum(result[1]["bwa"] for result in results) == 1
+    assert sum(result[1]["blast"] for result in results) == 1
+    lines = calls.read_text(encoding="utf-8").splitlines()
+    assert len([line for line in lines if line.startswith("bwa index")]) == 1
+    assert len([line for line in lines if line.startswith("makeblastdb") and "-in" in line]) == 1
+    bundle = load_reference_bundle(results[0][0].root)
+    assert bundle is not None and set(bundle.indexes) == {"bwa", "blast"}
+    assert not list(root.glob(".tmp-*"))
+
+
+def test_align_and_search_resolve_reference_bundle(tmp_path: Path, monkeypatch, capsys) -> None:
+    calls = tmp_path / "calls.log"
+    _install_fake_indexers(tmp_path / "bin", calls)
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}:{os.environ['PATH']}")
+    source = tmp_path / "genome.fa"
+    source.write_text(">chr1\nACGT\n", encoding="utf-8")
+    reads = tmp_path / "reads.fastq"
+    reads.write_text("@r1\nACGT\n+\nIIII\n", encoding="utf-8")
+
+    monkeypatch.setattr(sys, "argv", ["bioflow", "--json", "ref", "prepare", "-i", str(source), "--bundle-root", str(tmp_path / "bundles")])
+    assert cli.main() == cli.EXIT_SUCCESS
+    payload = json.loads(capsys.readouterr().out)
+    assert payload["indexes"]["bwa"]["built"] and payload["indexes"]["blast"]["built"]
+    bundle = load_reference_bundle(Path(payload["bundle"]))
+    assert bundle is not None
+
+    captured: dict[str, object] = {}
+    monkeypatch.setattr(cli, "run_alignment_pipeline", lambda ref, reads, **kwargs: captured.update(ref=ref, **kwargs))
+    monkeypatch.setattr(cli, "run_blast_search", lambda db, query, **kwargs: captured.update(db=db))
+    monkeypatch.setattr(sys, "argv", ["bioflow", "--json", "align", "--ref", payload["bundle"], "-i", str(reads)])
+    cli.main()
+    assert captured["ref"] == bundle.fasta
+    assert captured["index_prefix"] == bundle.root / "bwa" / "reference.fa"
+    assert captured["ref_details"]["sha256"] == bundle.sha256
+
+    # 多样本调度同样使用包内索引，不重新建索引或哈希参考序列
+    captured.clear()
+    sheet = tmp_path / "samples.tsv"
+    sheet.write_text(f"sample\tinput\nS1\t{reads}\n", encoding="utf-8")
+    monkeypatch.setattr(cli, "run_alignment_samples", lambda ref, samples, **kwargs: captured.update(ref=ref, **kwargs))
+    monkeypatch.setattr(sys, "argv", ["bioflow", "--json", "align", "--ref", payload["bundle"], "--samplesheet", str(sheet)])
+    cli.main()
+    assert captured["ref"] == bundle.fasta
+    assert captured["index_prefix"] == bundle.root / "bwa" / "reference.fa"
+    assert captured["ref_details"]["sha256"] == bundle.sha256
+
+    # 包中没有所选比对器的索引时直接报错，不在包内补建
+    capsys.readouterr()
+    monkeypatch.setattr(sys, "argv", ["bioflow", "--json", "align", "--ref", payload["bundle"], "-i", str(reads), "--aligner", "minimap2"])
+    assert cli.main() == cli.EXIT_ARGUMENT_ERROR
+    error = json.loads(capsys.readouterr().out)
+    assert error["error"] == "reference_bundle_missing_index" and "--aligner minimap2" in error["hint"]
+    assert not list(bundle.root.glob("*.mmi"))
+
+    monkeypatch.setattr(sys, "argv", ["bioflow", "--json", "search", "--db", str(bundle.root / "bundle.json"), "--query", str(source)])
+    cli.main()
+    assert captured["db"] == bundle.fasta
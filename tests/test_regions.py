@@ -0,0 +1,142 @@
+import json
+import os
+from pathlib import Path
+
+import bioflow.alignment as alignment
+from bioflow.regions import parse_idxstats, run_region_stats
+
+
+def _install_fake_samtools(tmp_path: Path) -> Path:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    calls = tmp_path / "calls.log"
+    tool = bin_dir / "samtools"
+    tool.write_text(
+        "#!/bin/sh\n"
+        f'echo "$*" >> {calls}\n'
+        f'if [ "$1" = "coverage" ] && [ "$3" = "{{chr2}}" ] && [ -e {tmp_path / "fail_chr2"} ]; then echo "chr2 broken" >&2; exit 1; fi\n'
+        'case "$1" in\n'
+        '  idxstats) printf "chr1\\t1000\\t40\\t2\\nchr2\\t500\\t10\\t0\\nchrM\\t100\\t0\\t0\\n*\\t0\\t0\\t7\\n" ;;\n'
+        '  coverage) printf "#rname\\tstartpos\\tendpos\\tnumreads\\tcovbases\\tcoverage\\tmeandepth\\tmeanbaseq\\tmeanmapq\\n"\n'
+        '    if [ "$3" = "{chr1}" ]; then printf "chr1\\t1\\t1000\\t40\\t800\\t80\\t4.0\\t30\\t60\\n";'
+        ' else printf "chr2\\t1\\t500\\t10\\t250\\t50\\t1.0\\t30\\t20\\n"; fi ;;\n'
+        "esac\n",
+        encoding="utf-8",
+    )
+    tool.chmod(0o755)
+    return calls
+
+
+def test_region_stats_runs_contigs_in_parallel_and_summarizes(tmp_path: Path, monkeypatch) -> None:
+    calls = _install_fake_samtools(tmp_path)
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}:{os.environ['PATH']}")
+    bam = tmp_path / "reads.sorted.bam"
+    bam.write_text("bam", encoding="utf-8")
+
+    summary = run_region_stats(
+        bam,
+        table_path=tmp_path / "coverage.tsv",
+        summary_path=tmp_path / "regions.json",
+        jobs=2,
+        commands=("echo {name} {length}",),
+        command_dir=tmp_path / "regions",
+    )
+
+    assert summary["contigs"] == 3 and summary["contigs_with_reads"] == 2
+    assert summary["covered_bases"] == 1050
+    assert summary["mean_depth"] == round((4.0 * 1000 + 1.0 * 500) / 1600, 4)
+    rows = (tmp_path / "coverage.tsv").read_text(encoding="utf-8").splitlines()
+    assert rows[1].split("\t")[:6] == ["chr1", "1000", "40", "2", "800", "0.8"]
+    assert rows[3].split("\t")[4] == "0"
+    # chrM 在 idxstats 中无 reads，不应再调用 samtools coverage
+    assert sum(line.startswith("coverage") for line in calls.read_text(encoding="utf-8").splitlines()) == 2
+    assert (tmp_path / "regions" / "chrM.cmd0.out").read_text(encoding="utf-8") == "chrM 100\n"
+    assert parse_idxstats("*\t0\t0\t5\n") == []
+
+
+def _patch_alignment_steps(monkeypatch) -> None:
+    def fake_map(_ref: Path, _reads: Path, output_bam: Path, **_: object) -> bool:
+        output_bam.write_text("bam", encoding="utf-8")
+        return True
+
+    def fake_index(bam: Path, **_: object) -> bool:
+        bam.with_suffix(bam.suffix + ".bai").write_text("bai", encoding="utf-8")
+        return True
+
+    monkeypatch.setattr(alignment, "run_aligner_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", fake_map)
+    monkeypatch.setattr(alignment, "_run_samtools_index", fake_index)
+    monkeypatch.setattr(
+        alignment,
+        "_run_samtools_flagstat",
+        lambda *args, **kwargs: "50 + 0 in total (QC-passed reads + QC-failed reads)\n50 + 0 mapped (100.00% : N/A)\n",
+    )
+    monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
+
+
+def test_alignment_merges_region_stats_into_metadata(tmp_path: Path, monkeypatch) -> None:
+    _install_fake_samtools(tmp_path)
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}:{os.environ['PATH']}")
+    ref = tmp_path / "ref.fa"
+    reads = tmp_path / "reads.fastq"
+    ref.write_text(">chr1\nACGT\n", encoding="utf-8")
+    reads.write_text("@r1\nACGT\n+\nIIII\n", encoding="utf-8")
+    run_root = tmp_path / "run"
+    _patch_alignment_steps(monkeypatch)
+
+    stats = alignment.run_alignment_pipeline(ref, reads, outdir=run_root, skip_preflight=True, region_stats=True, region_jobs=2)
+
+    assert stats is not None and stats["covered_bases"] == 1050
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["steps"]["region_stats"]["status"] == "success"
+    assert metadata["stats"]["coverage_breadth"] == round(1050 / 1600, 6)
+    assert (run_root / "results" / "reads.sorted.coverage.tsv").exists()
+
+
+def test_alignment_fails_region_step_when_a_contig_fails(tmp_path: Path, monkeypatch) -> None:
+    _install_fake_samtools(tmp_path)
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}:{os.environ['PATH']}")
+    ref = tmp_path / "ref.fa"
+    reads = tmp_path / "reads.fastq"
+    ref.write_text(">chr1\nACGT\n", encoding="utf-8")
+    reads.write_text("@r1\nACGT\n+\nIIII\n", encoding="utf-8")
+    run_root = tmp_path / "run"
+    _patch_alignment_steps(monkeypatch)
+    (tmp_path / "fail_chr2").write_text("", encoding="utf-8")
+
+    assert alignment.run_alignment_pipeline(ref, reads, outdir=run_root, skip_preflight=True, region_stats=True) is None
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    step = metadata["steps"]["region_stats"]
+    assert step["status"] == "failed" and step["outputs"]["failed_contigs"] == ["chr2"]
+    assert "chr2 broken" in (run_root / "logs" / "align.stderr.log").read_text(encoding="utf-8")
+
+    # 部分失败的汇总不会被 resume 复用
+    (tmp_path / "fail_chr2").unlink()
+    stats = alignment.run_alignment_pipeline(ref, reads, outdir=run_root, skip_preflight=True, region_stats=True, resume=True)
+    assert stats is not None and stats["covered_bases"] == 1050
+
+
+def test_region_stats_do_not_override_depth_engine(tmp_path: Path, monkeypatch) -> None:
+    _install_fake_samtools(tmp_path)
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}:{os.environ['PATH']}")
+    ref = tmp_path / "ref.fa"
+    reads = tmp_path / "reads.fastq"
+    ref.write_text(">chr1\nACGT\n", encoding="utf-8")
+    reads.write_text("@r1\nACGT\n+\nIIII\n", encoding="utf-8")
+    _patch_alignment_steps(monkeypatch)
+
+    def fake_depth(_alignment: Path, *, table_path: Path, summary_path: Path, **_: object) -> dict[str, object]:
+        summary = {"covered_1x": 7, "breadth_1x": 0.5, "mean_depth": 9.0, "breadth_10x": 0.1, "breadth_30x": 0.0}
+        table_path.write_text("contig\n", encoding="utf-8")
+        summary_path.write_text(json.dumps(summary), encoding="utf-8")
+        return summary
+
+    monkeypatch.setattr(alignment, "run_depth_stats", fake_depth)
+    stats = alignment.run_alignment_pipeline(
+        ref, reads, outdir=tmp_path / "run", skip_preflight=True, region_stats=True, depth_stats=True,
+    )
+
+    assert stats is not None
+    assert (stats["covered_bases"], stats["mean_depth"]) == (7, 9.0)
+    assert stats["region_covered_bases"] == 1050
+    assert stats["region_mean_depth"] == round((4.0 * 1000 + 1.0 * 500) / 1600, 4)
@@ -0,0 +1,58 @@
+import json
+from pathlib import Path
+
+from bioflow.alignment import parse_flagstat
+from bioflow.sam_stats import SamStreamStats
+
+SAM = (
+    "@HD\tVN:1.6\tSO:unsorted\n"
+    "@SQ\tSN:chr1\tLN:1000\n"
+    "@SQ\tSN:chr2\tLN:500\n"
+    "p1\t99\tchr1\t100\t60\t4M\t=\t300\t204\tACGT\tIIII\n"
+    "p1\t147\tchr1\t300\t60\t4M\t=\t100\t-204\tACGT\tIIII\n"
+    "p2\t73\tchr1\t50\t20\t4M\t=\t50\t0\tACGT\tIIII\n"
+    "p2\t133\tchr1\t50\t0\t*\t=\t50\t0\tACGT\tIIII\n"
+    "p3\t65\tchr1\t10\t40\t4M\tchr2\t20\t0\tACGT\tIIII\n"
+    "p3\t129\tchr2\t20\t3\t4M\tchr1\t10\t0\tACGT\tIIII\n"
+    "p1\t2147\tchr2\t400\t10\t2S2M\t=\t100\t0\tAC\tII\n"
+    "p4\t1613\tchr1\t500\t60\t4M\t=\t500\t0\tACGT\tIIII"
+)
+
+
+def test_stream_stats_matches_flagstat_across_chunk_boundaries(tmp_path: Path) -> None:
+    stats = SamStreamStats()
+    data = SAM.encode("utf-8")
+    for start in range(0, len(data), 7):
+        stats.feed(data[start:start + 7])
+    assert not stats.complete
+    stats.finish()
+
+    passed = stats.passed
+    assert stats.complete and stats.malformed == 0
+    assert passed["total"] == 7 and passed["primary"] == 6 and passed["supplementary"] == 1
+    assert passed["mapped"] == 6 and passed["primary_mapped"] == 5
+    assert passed["properly_paired"] == 2 and passed["singletons"] == 1
+    assert passed["mate_diff_chr"] == 2 and passed["mate_diff_chr_q5"] == 1
+    assert stats.failed["total"] == 1 and stats.failed["duplicates"] == 1
+    assert stats.insert_size_summary()["median"] == 204.0
+
+    parsed = parse_flagstat(stats.flagstat_text())
+    assert parsed["total"] == 7
+    assert parsed["mapped"] == 6
+    assert parsed["properly_paired"] == 2
+
+    stats.write_json(tmp_path / "stats.json")
+    report = json.loads((tmp_path / "stats.json").read_text(encoding="utf-8"))
+    assert report["contigs"][0] == {"name": "chr1", "length": 1000, "mapped": 4}
+
+
+def test_stream_stats_merge_sums_shards() -> None:
+    lines = SAM.encode("utf-8").split(b"\n")
+    first, second, whole = SamStreamStats(), SamStreamStats(), SamStreamStats()
+    for index, line in enumerate(lines):
+        whole.add_line(line)
+        (first if index % 2 else second).add_line(line)
+    first.merge(second)
+
+    assert first.passed == whole.passed and first.failed == whole.failed
+    assert first.mapq == whole.mapq
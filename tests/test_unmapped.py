@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+from pathlib import Path
+
+import bioflow.alignment as alignment
+from bioflow.unmapped import UnmappedFastqWriter, unmapped_fastq_paths
+
+
+def test_unmapped_writer_routes_pairs_and_restores_read_orientation(tmp_path: Path) -> None:
+    paths = unmapped_fastq_paths(tmp_path, "sample.sorted", paired=True)
+    writer = UnmappedFastqWriter(paths)
+    sam = (
+        b"@SQ\tSN:chr1\tLN:100\n"
+        b"p1\t77\t*\t0\t0\t*\t*\t0\t0\tACGT\tIIIJ\n"
+        b"p1\t141\t*\t0\t0\t*\t*\t0\t0\tAACC\t*\n"
+        b"p2\t73\tchr1\t5\t60\t4M\t=\t5\t0\tACGT\tIIII\n"
+        b"p2\t181\tchr1\t5\t0\t*\t=\t5\t0\tAACG\tABCD\n"
+        b"p3\t329\tchr1\t5\t0\t*\t=\t5\t0\tACGT\tIIII\n"
+    )
+    # 按不规则大小切块，验证跨块半行的处理
+    for start in range(0, len(sam), 7):
+        writer.feed(sam[start:start + 7])
+    writer.finish()
+
+    assert writer.counts == {"unmapped_r1": 1, "unmapped_r2": 1, "unmapped_singletons": 1}
+    assert not list(tmp_path.glob(".*.tmp"))
+    assert gzip.decompress(paths["unmapped_r1"].read_bytes()) == b"@p1/1\nACGT\n+\nIIIJ\n"
+    assert gzip.decompress(paths["unmapped_r2"].read_bytes()) == b'@p1/2\nAACC\n+\n""""\n'
+    assert gzip.decompress(paths["unmapped_singletons"].read_bytes()) == b"@p2/2\nCGTT\n+\nDCBA\n"
+
+    failed = UnmappedFastqWriter(unmapped_fastq_paths(tmp_path / "failed", "x", paired=False))
+    failed.feed(b"r1\t4\t*\t0\t0\t*\t*\t0\t0\tACGT\tIIII\n")
+    failed.discard()
+    assert not list((tmp_path / "failed").iterdir())
+
+
+def test_alignment_exports_unmapped_reads_from_sharded_stream(tmp_path: Path, monkeypatch) -> None:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    calls = tmp_path / "calls.log"
+    # 假 bwa 把输入的每条 read 都报告为未比对
+    (bin_dir / "bwa").write_text(
+        "#!/bin/sh\n"
+        f'echo "bwa $*" >> {calls}\n'
+        'for last in "$@"; do :; done\n'
+        "printf '@SQ\\tSN:chr1\\tLN:100\\n'\n"
+        "awk 'NR%4==1{name=substr($1,2)} NR%4==2{print name\"\\t4\\t*\\t0\\t0\\t*\\t*\\t0\\t0\\t\"$0\"\\tIIII\"}' \"$last\"\n",
+        encoding="utf-8",
+    )
+    (bin_dir / "samtools").write_text(
+        '#!/bin/sh\nout=""\nwhile [ $# -gt 0 ]; do [ "$1" = "-o" ] && out="$2"; shift; done\ncat > "$out"\n'
+        # 以 BGZF EOF 块结尾，让 resume 把输出视为完整的 BAM
+        "printf '\\037\\213\\010\\004\\000\\000\\000\\000\\000\\377\\006\\000BC\\002\\000\\033\\000\\003"
+        "\\000\\000\\000\\000\\000\\000\\000\\000\\000' >> \"$out\"\n",
+        encoding="utf-8",
+    )
+    for tool in bin_dir.iterdir():
+        tool.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setattr(alignment, "_SHARD_BLOCK_RECORDS", 2)
+    monkeypatch.setattr(
+        alignment,
+        "_run_samtools_merge",
+        lambda output_bam, inputs, **_: output_bam.write_bytes(b"".join(path.read_bytes() for path in inputs)) > 0,
+    )
+    monkeypatch.setattr(alignment, "_run_samtools_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
+    ref = tmp_path / "ref.fa"
+    reads = tmp_path / "reads.fastq"
+    ref.write_text(">chr1\nACGT\n", encoding="utf-8")
+    reads.write_text("".join(f"@r{index}\nACGT\n+\nIIII\n" for index in range(5)), encoding="utf-8")
+    for suffix in alignment.BWA_INDEX_SUFFIXES:
+        ref.with_suffix(ref.suffix + suffix).write_text("idx", encoding="utf-8")
+    run_root = tmp_path / "run"
+
+    stats = alignment.run_alignment_pipeline(
+        ref, reads, outdir=run_root, shards=2, skip_preflight=True, unmapped_fastq=True, stream_stats=True,
+    )
+
+    assert stats is not None and stats["unmapped"] == 5 and stats["unmapped_fastq_reads"] == 5
+    unmapped = run_root / "results" / "reads.sorted.unmapped.fastq.gz"
+    names = gzip.decompress(unmapped.read_bytes()).decode().splitlines()[::4]
+    assert sorted(names) == [f"@r{index}" for index in range(5)]
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["outputs"]["unmapped"] == str(unmapped)
+    assert metadata["steps"]["map_sort"]["outputs"]["unmapped_records"] == {"unmapped": 5}
+
+    # FASTQ 完好时 resume 复用比对结果；缺失时整个比对步骤重跑
+    calls.unlink()
+    alignment.run_alignment_pipeline(ref, reads, outdir=run_root, shards=2, resume=True, skip_preflight=True, unmapped_fastq=True, stream_stats=True)
+    assert "bwa mem" not in calls.read_text(encoding="utf-8")
+    unmapped.unlink()
+    stats = alignment.run_alignment_pipeline(
+        ref, reads, outdir=run_root, shards=2, resume=True, skip_preflight=True, unmapped_fastq=True, stream_stats=True,
+    )
+    assert stats is not None and calls.read_text(encoding="utf-8").count("bwa mem") == 2
+    assert unmapped.is_file()
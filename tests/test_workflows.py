@@ -1,5 +1,9 @@
 import json
+import os
+import re
 import subprocess
+import threading
+import time
 from argparse import Namespace
 from pathlib import Path
 
@@ -7,6 +11,7 @@ import bioflow.alignment as alignment
 import bioflow.cli as cli
 import bioflow.pipeline as pipeline
 import bioflow.search as search
+from bioflow.sam_stats import SamStreamStats
 
 
 def test_qc_pipeline_uses_standard_outdir(tmp_path: Path, monkeypatch) -> None:
@@ -46,7 +51,7 @@ def test_alignment_pipeline_writes_results_and_metadata(tmp_path: Path, monkeypa
     reads.write_text("@r1\nACGT\n+\n!!!!\n", encoding="utf-8")
     run_root = tmp_path / "runs" / "align-001"
 
-    monkeypatch.setattr(alignment, "_run_bwa_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(alignment, "run_aligner_index", lambda *args, **kwargs: True)
 
     def fake_map(_ref: Path, _reads: Path, output_bam: Path, **_: object) -> bool:
         output_bam.write_text("bam", encoding="utf-8")
@@ -56,7 +61,7 @@ def test_alignment_pipeline_writes_results_and_metadata(tmp_path: Path, monkeypa
         bam.with_suffix(bam.suffix + ".bai").write_text("bai", encoding="utf-8")
         return True
 
-    monkeypatch.setattr(alignment, "_run_bwa_mem_pipe_sort", fake_map)
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", fake_map)
     monkeypatch.setattr(alignment, "_run_samtools_index", fake_index)
     monkeypatch.setattr(
         alignment,
@@ -107,6 +112,164 @@ def test_search_pipeline_generates_summary_and_metadata(tmp_path: Path, monkeypa
     assert metadata["status"] == "success"
     assert metadata["summary"]["hit_count"] == 1
     assert metadata["input_details"]["query"]["size_bytes"] > 0
+    assert metadata["outputs"]["per_query_tsv"] == str(run_root / "results" / "query.blast.per_query.tsv")
+
+
+def test_search_shards_queries_and_resumes_only_failed_shards(tmp_path: Path, monkeypatch) -> None:
+    db = tmp_path / "ref.fa"
+    query = tmp_path / "query.fa"
+    db.write_text(">ref\nACGT\n", encoding="utf-8")
+    query.write_text("".join(f">q{index}\nACGT\n" for index in range(7)), encoding="utf-8")
+    run_root = tmp_path / "runs" / "search-shards"
+    monkeypatch.setattr(search, "_blast_db_ready", lambda _: True)
+    calls: list[tuple[str, int]] = []
+    fail = {"shard002.fa"}
+
+    def fake_blastn(_db: Path, shard_query: Path, output_path: Path, *, num_threads: int = 1, **_: object) -> bool:
+        calls.append((shard_query.name, num_threads))
+        if shard_query.name in fail:
+            return False
+        names = [line[1:].strip() for line in shard_query.read_text(encoding="utf-8").splitlines() if line.startswith(">")]
+        output_path.write_text(
+            "".join(f"{name}\tref\t99.00\t4\t0\t0\t1\t4\t1\t4\t1e-20\t80\n" for name in names),
+            encoding="utf-8",
+        )
+        return True
+
+    monkeypatch.setattr(search, "_run_blastn", fake_blastn)
+
+    assert search.run_blast_search(db, query, outdir=run_root, threads=6, shards=3, skip_preflight=True) is None
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["steps"]["split_query"]["outputs"]["records"] == [3, 2, 2]
+    assert metadata["steps"]["blastn:shard002"]["status"] == "failed"
+    assert "running" not in {metadata["steps"][f"blastn:shard{shard:03d}"]["status"] for shard in range(3)}
+    assert {threads for _name, threads in calls} == {2}
+
+    # 仅重跑失败的分片，合并结果保持查询顺序
+    calls.clear()
+    fail.clear()
+    result = search.run_blast_search(db, query, outdir=run_root, threads=6, shards=3, resume=True, skip_preflight=True)
+    assert result is not None and result["hits"] == 7
+    assert calls == [("shard002.fa", 6)]
+    lines = (run_root / "results" / "query.blast.tsv").read_text(encoding="utf-8").splitlines()
+    assert [line.split("\t")[0] for line in lines] == [f"q{index}" for index in range(7)]
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["steps"]["blastn:shard000"]["status"] == "skipped"
+    assert metadata["steps"]["blastn:shard002"]["status"] == "success"
+
+
+def test_split_query_balances_records_without_empty_shards(tmp_path: Path) -> None:
+    for total, shards, expected in ((5, 4, [2, 1, 1, 1]), (9, 4, [3, 2, 2, 2]), (2, 4, [1, 1]), (0, 3, [0])):
+        query = tmp_path / f"query{total}.fa"
+        query.write_text("".join(f">q{index}\nACGT\n" for index in range(total)), encoding="utf-8")
+        shard_dir = tmp_path / f"shards{total}"
+        shard_dir.mkdir()
+
+        counts = search._split_query_fasta(query, lambda shard: shard_dir / f"shard{shard:03d}.fa", shards=shards)
+
+        assert counts == expected
+        files = sorted(shard_dir.iterdir())
+        assert len(files) == len(expected)
+        assert "".join(path.read_text(encoding="utf-8") for path in files) == query.read_text(encoding="utf-8")
+
+
+def test_stoppable_command_terminates_when_signalled(tmp_path: Path) -> None:
+    stop = threading.Event()
+    timer = threading.Timer(0.2, stop.set)
+    timer.start()
+    started = time.monotonic()
+    ok = search._run_cmd(["sleep", "30"], quiet=True, stderr_log=tmp_path / "stderr.log", stop=stop)
+    timer.join()
+
+    assert ok is False
+    assert time.monotonic() - started < 10
+
+
+def test_streaming_blast_summary_matches_full_sort(tmp_path: Path) -> None:
+    rows = []
+    for index in range(60):
+        query = f"q{index % 4}"
+        evalue = [1e-30, 1e-10, 1e-5][index % 3]
+        rows.append(f"{query}\ts{index}\t{90 + index % 7}.00\t100\t0\t0\t1\t100\t1\t100\t{evalue}\t{50 + index % 11}\n")
+    tsv = tmp_path / "hits.tsv"
+    tsv.write_text("".join(rows), encoding="utf-8")
+
+    summary = search.summarize_blast_tsv(tsv, top_n=5, per_query_top_n=2)
+
+    ranked = search._rank_hits(search.parse_blast_tsv(tsv))
+    assert [hit["subject_id"] for hit in summary["top_hits"]] == [hit.subject_id for hit in ranked[:5]]
+    assert summary["best_hit"]["subject_id"] == ranked[0].subject_id
+    assert summary["hit_count"] == 60 and summary["query_count"] == 4
+    assert (summary["min_evalue"], summary["max_evalue"]) == (1e-30, 1e-5)
+    assert (summary["min_identity"], summary["max_identity"]) == (90.0, 96.0)
+    per_query = summary["top_hits_per_query"]
+    assert [hit["subject_id"] for hit in per_query["q1"]] == [hit.subject_id for hit in ranked if hit.query_id == "q1"][:2]
+    assert not hasattr(ranked[0], "__dict__")
+    assert search.summarize_blast_hits([])["best_hit"] is None
+
+
+def test_per_query_tables_aggregate_hits_in_one_pass(tmp_path: Path) -> None:
+    query = tmp_path / "query.fa"
+    query.write_text(">q1 first\nACGTACGTAC\nACGTACGTAC\n>q2\nACGTA\n>q3\nACGT\n", encoding="utf-8")
+    tsv = tmp_path / "query.blast.tsv"
+    tsv.write_text(
+        "q1\ts1\t99.00\t8\t0\t0\t1\t8\t1\t8\t1e-10\t40\n"
+        "q1\ts2\t99.00\t8\t0\t0\t5\t12\t1\t8\t1e-10\t40\n"
+        "q1\ts1\t90.00\t5\t0\t0\t20\t16\t1\t5\t1e-3\t20\n"
+        "q2\ts3\t95.00\t5\t0\t0\t1\t5\t1\t5\t1e-5\t30\n",
+        encoding="utf-8",
+    )
+    tables = search.query_table_paths(tsv)
+
+    summary = search.summarize_blast_tsv(
+        tsv,
+        query_tables=tables,
+        query_lengths=search.read_query_lengths(query),
+    )
+
+    assert summary["hit_count"] == 4
+    assert (summary["queries_with_hits"], summary["queries_without_hits"]) == (2, 1)
+    header, q1, q2 = [line.split("\t") for line in tables["per_query_tsv"].read_text(encoding="utf-8").splitlines()]
+    assert tuple(header) == search.QUERY_TABLE_COLUMNS
+    row = dict(zip(header, q1))
+    # 同分时先出现的命中胜出；覆盖区间 1-12 与 16-20 合并后为 17bp
+    assert (row["hit_count"], row["subject_count"], row["best_subject"]) == ("3", "2", "s1")
+    assert (row["max_identity"], row["covered_bases"], row["query_coverage"]) == ("99", "17", "0.85")
+    assert dict(zip(header, q2))["query_coverage"] == "1"
+    if "per_query_npz" in tables:
+        import numpy as np
+
+        columns = np.load(tables["per_query_npz"])
+        assert list(columns["query_id"]) == ["q1", "q2"]
+        assert list(columns["covered_bases"]) == [17, 5]
+    assert not list(tmp_path.glob(".*.tmp*"))
+
+    # 查询 FASTA 中重复的 ID 会让同一 query 的命中不连续，仍应并入同一行
+    tsv.write_text(tsv.read_text(encoding="utf-8") + "q1\ts9\t80.00\t5\t0\t0\t30\t34\t1\t5\t1\t10\n", encoding="utf-8")
+    summary = search.summarize_blast_tsv(tsv, query_tables=tables)
+    assert (summary["hit_count"], summary["queries_with_hits"]) == (5, 2)
+    rows = [line.split("\t") for line in tables["per_query_tsv"].read_text(encoding="utf-8").splitlines()[1:]]
+    assert [(row[0], row[2], row[3], row[11]) for row in rows] == [("q1", "4", "3", "22"), ("q2", "1", "1", "5")]
+
+
+def test_search_records_failed_summary_for_malformed_blast_output(tmp_path: Path, monkeypatch) -> None:
+    db = tmp_path / "ref.fa"
+    query = tmp_path / "query.fa"
+    db.write_text(">ref\nACGT\n", encoding="utf-8")
+    query.write_text(">q1\nACGT\n", encoding="utf-8")
+    run_root = tmp_path / "run"
+    monkeypatch.setattr(search, "_blast_db_ready", lambda _: True)
+    monkeypatch.setattr(
+        search,
+        "_run_blastn",
+        lambda _db, _query, output_path, **_: output_path.write_text("q1\tref\tnot-a-number\n", encoding="utf-8") > 0,
+    )
+
+    assert search.run_blast_search(db, query, outdir=run_root, skip_preflight=True) is None
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["status"] == "failed"
+    assert metadata["steps"]["summary"]["status"] == "failed"
+    assert metadata["failure_summary"].startswith("summary:")
 
 
 def test_search_run_cmd_retains_failure_logs(tmp_path: Path, monkeypatch) -> None:
@@ -247,7 +410,7 @@ def test_alignment_resume_skips_completed_steps(tmp_path: Path, monkeypatch) ->
     run_root = tmp_path / "runs" / "align-001"
     bam = run_root / "results" / "reads.sorted.bam"
     bam.parent.mkdir(parents=True, exist_ok=True)
-    bam.write_text("bam", encoding="utf-8")
+    bam.write_bytes(b"bam" + alignment._BGZF_EOF)
     bam.with_suffix(".bam.bai").write_text("bai", encoding="utf-8")
     (run_root / "results" / "reads.sorted.flagstat.txt").write_text(
         "10 + 0 in total (QC-passed reads + QC-failed reads)\n8 + 0 mapped (80.00% : N/A)\n",
@@ -266,8 +429,8 @@ def test_alignment_resume_skips_completed_steps(tmp_path: Path, monkeypatch) ->
         ),
         encoding="utf-8",
     )
-    monkeypatch.setattr(alignment, "_run_bwa_index", lambda *args, **kwargs: (_ for _ in ()).throw(AssertionError("should skip index")))
-    monkeypatch.setattr(alignment, "_run_bwa_mem_pipe_sort", lambda *args, **kwargs: (_ for _ in ()).throw(AssertionError("should skip map")))
+    monkeypatch.setattr(alignment, "run_aligner_index", lambda *args, **kwargs: (_ for _ in ()).throw(AssertionError("should skip index")))
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", lambda *args, **kwargs: (_ for _ in ()).throw(AssertionError("should skip map")))
     monkeypatch.setattr(alignment, "_run_samtools_index", lambda *args, **kwargs: (_ for _ in ()).throw(AssertionError("should skip bam index")))
     monkeypatch.setattr(alignment, "_run_samtools_flagstat", lambda *args, **kwargs: (_ for _ in ()).throw(AssertionError("should skip flagstat")))
     monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
@@ -305,8 +468,8 @@ def test_alignment_resume_recomputes_invalid_flagstat(tmp_path: Path, monkeypatc
         ),
         encoding="utf-8",
     )
-    monkeypatch.setattr(alignment, "_run_bwa_index", lambda *args, **kwargs: True)
-    monkeypatch.setattr(alignment, "_run_bwa_mem_pipe_sort", lambda *args, **kwargs: True)
+    monkeypatch.setattr(alignment, "run_aligner_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", lambda *args, **kwargs: True)
     monkeypatch.setattr(alignment, "_run_samtools_index", lambda *args, **kwargs: True)
     monkeypatch.setattr(
         alignment,
@@ -400,3 +563,483 @@ def test_cmd_search_json_reports_resume_used(tmp_path: Path, monkeypatch, capsys
     assert exit_code == cli.EXIT_SUCCESS
     payload = json.loads(capsys.readouterr().out)
     assert payload["resume_used"] is True
+
+
+def test_alignment_shards_reads_and_resumes_failed_shard(tmp_path: Path, monkeypatch, capsys) -> None:
+    ref = tmp_path / "ref.fa"
+    reads = tmp_path / "reads.fastq"
+    ref.write_text(">ref\nACGT\n", encoding="utf-8")
+    reads.write_text("".join(f"@r{index}\nACGT\n+\nIIII\n" for index in range(10)), encoding="utf-8")
+    for suffix in alignment.BWA_INDEX_SUFFIXES:
+        ref.with_suffix(ref.suffix + suffix).write_text("idx", encoding="utf-8")
+    run_root = tmp_path / "runs" / "align-shards"
+    monkeypatch.setattr(alignment, "_SHARD_BLOCK_RECORDS", 2)
+    calls: list[tuple[str, int]] = []
+    failing = {"shard001.reads"}
+
+    def fake_map(_ref: Path, shard_reads: Path, output_bam: Path, *, threads: int = 1, **_: object) -> bool:
+        calls.append((shard_reads.name, threads))
+        if shard_reads.name in failing:
+            return False
+        output_bam.write_bytes(shard_reads.read_bytes() + alignment._BGZF_EOF)
+        return True
+
+    def fake_merge(output_bam: Path, inputs: list[Path], **_: object) -> bool:
+        output_bam.write_bytes(b"".join(path.read_bytes() for path in inputs))
+        return True
+
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", fake_map)
+    monkeypatch.setattr(alignment, "_run_samtools_merge", fake_merge)
+    monkeypatch.setattr(alignment, "_run_samtools_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(
+        alignment,
+        "_run_samtools_flagstat",
+        lambda *args, **kwargs: "10 + 0 in total (QC-passed reads + QC-failed reads)\n10 + 0 mapped (100.00% : N/A)\n",
+    )
+    monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
+
+    first = alignment.run_alignment_pipeline(ref, reads, outdir=run_root, threads=6, shards=3, skip_preflight=True)
+    assert first is None
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["steps"]["split_reads"]["outputs"]["records"] == [4, 4, 2]
+    assert metadata["steps"]["map_sort:shard001"]["status"] == "failed"
+    assert all(
+        step["status"] != "running" for name, step in metadata["steps"].items() if name.startswith("map_sort:shard")
+    )
+    assert {threads for _name, threads in calls} == {2}
+
+    calls.clear()
+    failing.clear()
+    capsys.readouterr()
+    stats = alignment.run_alignment_pipeline(ref, reads, outdir=run_root, threads=6, shards=3, resume=True, skip_preflight=True)
+    assert stats is not None
+    # 拆分、分片比对与合并各计一步：index, split, map, merge, bam index, flagstat
+    labels = re.findall(r"(\d+)/(\d+)\]", capsys.readouterr().out)
+    assert labels == [(str(step), "6") for step in range(1, 7)]
+    assert [name for name, _threads in calls if name != "shard001.reads"] == []
+    merged = (run_root / "results" / "reads.sorted.bam").read_bytes().replace(alignment._BGZF_EOF, b"").decode("utf-8")
+    assert sorted(line for line in merged.splitlines() if line.startswith("@r")) == sorted(f"@r{index}" for index in range(10))
+    assert not (run_root / "tmp" / "shards").exists()
+
+
+def test_map_pipe_sort_stops_pipeline_when_signalled(tmp_path: Path, monkeypatch) -> None:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    tool = bin_dir / "samtools"
+    tool.write_text("#!/bin/sh\nexec sleep 30\n", encoding="utf-8")
+    tool.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+
+    class SleepAligner:
+        name = "sleep"
+
+        def map_command(self, *_: object, **__: object) -> list[str]:
+            return ["sleep", "30"]
+
+    output = tmp_path / "out.bam"
+    stop = threading.Event()
+    timer = threading.Timer(0.2, stop.set)
+    timer.start()
+    started = time.monotonic()
+    ok = alignment._run_map_pipe_sort(
+        tmp_path / "ref.fa",
+        tmp_path / "reads.fastq",
+        output,
+        aligner=SleepAligner(),
+        stderr_log=tmp_path / "stderr.log",
+        stop=stop,
+    )
+    timer.join()
+
+    assert ok is False
+    assert time.monotonic() - started < 10
+    assert not output.exists() and not alignment._partial_path(output).exists()
+
+
+def test_alignment_chunked_map_resumes_only_missing_chunks(tmp_path: Path, monkeypatch) -> None:
+    ref = tmp_path / "ref.fa"
+    reads = tmp_path / "reads.fastq"
+    ref.write_text(">ref\nACGT\n", encoding="utf-8")
+    reads.write_text("".join(f"@r{index}\nACGT\n+\nIIII\n" for index in range(10)), encoding="utf-8")
+    for suffix in alignment.BWA_INDEX_SUFFIXES:
+        ref.with_suffix(ref.suffix + suffix).write_text("idx", encoding="utf-8")
+    run_root = tmp_path / "runs" / "align-chunks"
+    calls: list[str] = []
+    failing = {"shard003.reads"}
+
+    def fake_map(_ref: Path, chunk_reads: Path, output_bam: Path, **_: object) -> bool:
+        calls.append(chunk_reads.name)
+        if chunk_reads.name in failing:
+            return False
+        output_bam.write_bytes(chunk_reads.read_bytes() + alignment._BGZF_EOF)
+        return True
+
+    merged_inputs: list[list[str]] = []
+
+    def fake_merge(output_bam: Path, inputs: list[Path], **_: object) -> bool:
+        merged_inputs.append([path.name for path in inputs])
+        output_bam.write_bytes(b"".join(path.read_bytes() for path in inputs))
+        return True
+
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", fake_map)
+    monkeypatch.setattr(alignment, "_run_samtools_merge", fake_merge)
+    monkeypatch.setattr(alignment, "_run_samtools_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(
+        alignment,
+        "_run_samtools_flagstat",
+        lambda *args, **kwargs: "10 + 0 in total (QC-passed reads + QC-failed reads)\n10 + 0 mapped (100.00% : N/A)\n",
+    )
+    monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
+
+    assert alignment.run_alignment_pipeline(ref, reads, outdir=run_root, threads=4, chunk_reads=3, skip_preflight=True) is None
+    assert calls == [f"shard{index:03d}.reads" for index in range(4)]
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["steps"]["split_reads"]["outputs"]["records"] == [3, 3, 3, 1]
+    assert list(metadata["steps"])[2:7] == ["split_reads", *[f"map_sort:shard{index:03d}" for index in range(4)]]
+    shard_dir = run_root / "tmp" / "shards"
+    assert json.loads((shard_dir / "shard001.bam.done").read_text(encoding="utf-8"))["records"] == 3
+
+    # 已完成分块的 BAM 被截断（缺少 EOF 块）时，其完成标记失效，需与缺失分块一起重跑
+    (shard_dir / "shard000.bam").write_bytes(b"truncated")
+    calls.clear()
+    failing.clear()
+    stats = alignment.run_alignment_pipeline(ref, reads, outdir=run_root, threads=4, chunk_reads=3, resume=True, skip_preflight=True)
+    assert stats is not None
+    assert calls == ["shard000.reads", "shard003.reads"]
+    assert merged_inputs[-1] == [f"shard{index:03d}.bam" for index in range(4)]
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert [metadata["steps"][f"map_sort:shard{index:03d}"]["status"] for index in range(4)] == ["success", "skipped", "skipped", "success"]
+    assert metadata["parameters"]["chunk_reads"] == 3
+    assert not list((run_root / "results").glob(".*partial*"))
+
+
+def test_alignment_paired_end_runs_as_one_sample(tmp_path: Path, monkeypatch) -> None:
+    ref = tmp_path / "ref.fa"
+    reads1 = tmp_path / "sample_R1.fastq"
+    reads2 = tmp_path / "sample_R2.fastq"
+    ref.write_text(">ref\nACGT\n", encoding="utf-8")
+    reads1.write_text("".join(f"@r{index}/1\nACGT\n+\nIIII\n" for index in range(5)), encoding="utf-8")
+    reads2.write_text("".join(f"@r{index}/2\nTTTT\n+\nIIII\n" for index in range(5)), encoding="utf-8")
+    for suffix in alignment.BWA_INDEX_SUFFIXES:
+        ref.with_suffix(ref.suffix + suffix).write_text("idx", encoding="utf-8")
+    run_root = tmp_path / "runs" / "align-pe"
+    monkeypatch.setattr(alignment, "_SHARD_BLOCK_RECORDS", 1)
+    mapped: list[tuple[Path, Path | None]] = []
+
+    def fake_map(_ref: Path, reads: Path, output_bam: Path, *, reads2: Path | None = None, **_: object) -> bool:
+        mapped.append((reads, reads2))
+        output_bam.write_text("bam", encoding="utf-8")
+        return True
+
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", fake_map)
+    monkeypatch.setattr(alignment, "_run_samtools_merge", lambda output_bam, inputs, **_: output_bam.write_text("bam") > 0)
+    monkeypatch.setattr(alignment, "_run_samtools_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(
+        alignment,
+        "_run_samtools_flagstat",
+        lambda *args, **kwargs: (
+            "10 + 0 in total (QC-passed reads + QC-failed reads)\n"
+            "9 + 0 mapped (90.00% : N/A)\n"
+            "10 + 0 paired in sequencing\n"
+            "8 + 0 properly paired (80.00% : N/A)\n"
+        ),
+    )
+    monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
+
+    stats = alignment.run_alignment_pipeline(
+        ref,
+        reads1,
+        reads2=reads2,
+        outdir=run_root,
+        shards=2,
+        skip_preflight=True,
+    )
+    assert stats is not None
+    assert stats["paired"] == 10 and stats["properly_paired"] == 8
+    assert (run_root / "results" / "sample.sorted.bam").exists()
+    assert sorted((reads.name, mate.name) for reads, mate in mapped if mate is not None) == [
+        ("shard000.reads", "shard000.reads2"),
+        ("shard001.reads", "shard001.reads2"),
+    ]
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["inputs"]["reads2"] == str(reads2)
+    assert metadata["steps"]["split_reads"]["outputs"]["records"] == [3, 2]
+
+    # 以单端方式 resume 同一运行目录时，比对步骤不能复用双端结果
+    mapped.clear()
+    alignment.run_alignment_pipeline(ref, reads1, output=Path("sample.sorted.bam"), outdir=run_root, resume=True, skip_preflight=True)
+    assert mapped == [(reads1, None)]
+
+
+def _write_fake_tool(bin_dir: Path, name: str, body: str) -> None:
+    tool = bin_dir / name
+    tool.write_text(f"#!/bin/sh\n{body}\n", encoding="utf-8")
+    tool.chmod(0o755)
+
+
+def test_bwa_mem_pipes_sam_straight_into_sort(tmp_path: Path, monkeypatch) -> None:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    calls = tmp_path / "calls.log"
+    _write_fake_tool(bin_dir, "bwa", f'echo "bwa $*" >> {calls}\nprintf "@SQ\\tSN:chr1\\tLN:100\\nr1\\t0\\tchr1\\t1\\t60\\t4M\\t*\\t0\\t0\\tACGT\\tIIII\\nr2\\t4\\t*\\t0\\t0\\t*\\t*\\t0\\t0\\tACGT\\tIIII\\n"\necho "[M::process] read 1 sequences" >&2')
+    _write_fake_tool(
+        bin_dir,
+        "samtools",
+        f'echo "samtools $*" >> {calls}\n'
+        'while [ "$#" -gt 0 ]; do if [ "$1" = "-o" ]; then out="$2"; fi; shift; done\n'
+        'cat > "$out"',
+    )
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    output_bam = tmp_path / "out.bam"
+    stream_stats = SamStreamStats()
+
+    ok = alignment._run_map_pipe_sort(
+        tmp_path / "ref.fa",
+        tmp_path / "reads.fastq",
+        output_bam,
+        threads=2,
+        sort_memory="512M",
+        tmp_prefix=tmp_path / "tmp" / "out.sort",
+        stream_stats=stream_stats,
+        stderr_log=tmp_path / "align.stderr.log",
+    )
+
+    assert ok
+    assert output_bam.read_text(encoding="utf-8").startswith("@SQ")
+    commands = calls.read_text(encoding="utf-8").splitlines()
+    assert not any(" view " in command for command in commands)
+    sort_command = next(command for command in commands if command.startswith("samtools sort"))
+    assert f"-m 512M -T {tmp_path / 'tmp' / 'out.sort'}" in sort_command
+    assert "process" in (tmp_path / "align.stderr.log").read_text(encoding="utf-8")
+    assert stream_stats.complete
+    assert stream_stats.passed["total"] == 2 and stream_stats.passed["mapped"] == 1
+    assert output_bam.read_text(encoding="utf-8").count("\n") == 3
+
+
+def test_tee_consumer_error_fails_step_without_blocking(tmp_path: Path, monkeypatch) -> None:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    # 输出远超队列容量，解析线程若停止取数据，转发线程会永久阻塞
+    _write_fake_tool(bin_dir, "bwa", 'yes "r1\t0\tchr1\t1\t60\t4M\t*\t0\t0\tACGT\tIIII" | head -c 134217728')
+    _write_fake_tool(
+        bin_dir,
+        "samtools",
+        'while [ "$#" -gt 0 ]; do if [ "$1" = "-o" ]; then out="$2"; fi; shift; done\n'
+        'cat > "$out"',
+    )
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+
+    class BrokenStats(SamStreamStats):
+        def feed(self, chunk: bytes) -> None:
+            raise ValueError("bad record")
+
+    output_bam = tmp_path / "out.bam"
+    stats = BrokenStats()
+    result: list[bool] = []
+    worker = threading.Thread(
+        target=lambda: result.append(
+            alignment._run_map_pipe_sort(
+                tmp_path / "ref.fa",
+                tmp_path / "reads.fastq",
+                output_bam,
+                stream_stats=stats,
+                stderr_log=tmp_path / "align.stderr.log",
+            )
+        ),
+        daemon=True,
+    )
+    worker.start()
+    worker.join(timeout=60)
+
+    assert result == [False]
+    assert not stats.complete
+    assert not output_bam.exists()
+    assert "bad record" in (tmp_path / "align.stderr.log").read_text(encoding="utf-8")
+
+
+def test_auto_sort_memory_scales_with_threads(monkeypatch) -> None:
+    monkeypatch.setattr(alignment, "available_memory_bytes", lambda: 8 * 1024 ** 3)
+    assert alignment.auto_sort_memory(4) == "1024M"
+    assert alignment.auto_sort_memory(64) == "256M"
+    monkeypatch.setattr(alignment, "available_memory_bytes", lambda: None)
+    assert alignment.auto_sort_memory(4) is None
+
+
+def test_markdup_stage_streams_collate_fixmate_sort_markdup(tmp_path: Path, monkeypatch) -> None:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    calls = tmp_path / "calls.log"
+    _write_fake_tool(
+        bin_dir,
+        "samtools",
+        f'echo "samtools $*" >> {calls}\n'
+        'case "$1" in\n'
+        '  collate) cat "$4" ;;\n'
+        '  fixmate|sort) cat ;;\n'
+        '  markdup) while [ "$#" -gt 2 ]; do if [ "$1" = "-f" ]; then stats="$2"; fi; shift; done\n'
+        '    printf "DUPLICATE TOTAL: 3\\nDUPLICATE PRIMARY TOTAL: 2\\n" > "$stats"; cat > "$2" ;;\n'
+        'esac',
+    )
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    sorted_bam = tmp_path / "in.bam"
+    sorted_bam.write_text("records\n", encoding="utf-8")
+    stats_path = tmp_path / "markdup.txt"
+
+    ok = alignment._run_markdup_pipe(
+        sorted_bam,
+        tmp_path / "out.bam",
+        threads=4,
+        tmp_prefix=tmp_path / "tmp" / "in",
+        stats_path=stats_path,
+    )
+
+    assert ok
+    assert (tmp_path / "out.bam").read_text(encoding="utf-8") == "records\n"
+    commands = [line.split()[1] for line in calls.read_text(encoding="utf-8").splitlines()]
+    assert sorted(commands) == ["collate", "fixmate", "markdup", "sort"]
+    assert alignment.parse_markdup_stats(stats_path.read_text(encoding="utf-8")) == {
+        "duplicates": 3,
+        "primary_duplicates": 2,
+        "optical_duplicates": 0,
+    }
+
+
+def test_alignment_markdup_step_resumes_after_failure(tmp_path: Path, monkeypatch) -> None:
+    ref = tmp_path / "ref.fa"
+    reads = tmp_path / "reads.fastq"
+    ref.write_text(">ref\nACGT\n", encoding="utf-8")
+    reads.write_text("@r1\nACGT\n+\n!!!!\n", encoding="utf-8")
+    run_root = tmp_path / "runs" / "align-001"
+    map_calls: list[Path] = []
+    markdup_results = [False, True]
+
+    def fake_map(_ref: Path, _reads: Path, output_bam: Path, **_: object) -> bool:
+        map_calls.append(output_bam)
+        output_bam.write_bytes(b"sorted" + alignment._BGZF_EOF)
+        return True
+
+    def fake_markdup(input_bam: Path, output_bam: Path, *, stats_path: Path, **_: object) -> bool:
+        assert input_bam.read_bytes() == b"sorted" + alignment._BGZF_EOF
+        output_bam.write_bytes(b"marked" + alignment._BGZF_EOF)
+        stats_path.write_text("DUPLICATE TOTAL: 2\n", encoding="utf-8")
+        return markdup_results.pop(0)
+
+    def fake_index(bam: Path, **_: object) -> bool:
+        bam.with_suffix(bam.suffix + ".bai").write_text("bai", encoding="utf-8")
+        return True
+
+    monkeypatch.setattr(alignment, "run_aligner_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", fake_map)
+    monkeypatch.setattr(alignment, "_run_markdup_pipe", fake_markdup)
+    monkeypatch.setattr(alignment, "_run_samtools_index", fake_index)
+    monkeypatch.setattr(
+        alignment,
+        "_run_samtools_flagstat",
+        lambda *args, **kwargs: "10 + 0 in total (QC-passed reads + QC-failed reads)\n2 + 0 duplicates\n8 + 0 mapped (80.00% : N/A)\n",
+    )
+    monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
+
+    assert alignment.run_alignment_pipeline(ref, reads, outdir=run_root, skip_preflight=True, markdup=True) is None
+    bam = run_root / "results" / "reads.sorted.bam"
+    assert bam.read_bytes() == b"sorted" + alignment._BGZF_EOF
+    assert not (run_root / "tmp" / "reads.sorted.markdup.bam").exists()
+
+    stats = alignment.run_alignment_pipeline(ref, reads, outdir=run_root, resume=True, skip_preflight=True, markdup=True)
+
+    assert stats is not None and stats["duplicates"] == 2
+    assert len(map_calls) == 1
+    assert bam.read_bytes() == b"marked" + alignment._BGZF_EOF
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert list(metadata["steps"]) == ["bwa_index", "map_sort", "markdup", "bam_index", "flagstat"]
+    assert metadata["steps"]["map_sort"]["status"] == "skipped"
+    assert metadata["steps"]["markdup"]["status"] == "success"
+    assert metadata["parameters"]["markdup"] is True
+
+
+def test_alignment_cram_output_builds_fai_and_validates_on_resume(tmp_path: Path, monkeypatch) -> None:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    _write_fake_tool(bin_dir, "samtools", '[ "$1" = "faidx" ] && printf "ref\\t4\\t5\\t4\\t5\\n" > "$2.fai"')
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    ref = tmp_path / "ref.fa"
+    reads = tmp_path / "reads.fastq"
+    ref.write_text(">ref\nACGT\n", encoding="utf-8")
+    reads.write_text("@r1\nACGT\n+\n!!!!\n", encoding="utf-8")
+    run_root = tmp_path / "runs" / "align-001"
+    map_calls: list[Path | None] = []
+
+    def fake_map(_ref: Path, _reads: Path, output_bam: Path, *, reference: Path | None = None, **_: object) -> bool:
+        map_calls.append(reference)
+        output_bam.write_bytes(b"CRAM\x03\x00payload")
+        return True
+
+    def fake_index(bam: Path, **_: object) -> bool:
+        bam.with_suffix(bam.suffix + ".crai").write_text("crai", encoding="utf-8")
+        return True
+
+    monkeypatch.setattr(alignment, "run_aligner_index", lambda *args, **kwargs: True)
+    monkeypatch.setattr(alignment, "_run_map_pipe_sort", fake_map)
+    monkeypatch.setattr(alignment, "_run_samtools_index", fake_index)
+    monkeypatch.setattr(
+        alignment,
+        "_run_samtools_flagstat",
+        lambda *args, **kwargs: "10 + 0 in total (QC-passed reads + QC-failed reads)\n8 + 0 mapped (80.00% : N/A)\n",
+    )
+    monkeypatch.setattr(alignment, "display_alignment_stats", lambda stats: None)
+
+    stats = alignment.run_alignment_pipeline(ref, reads, outdir=run_root, skip_preflight=True, output_format="cram")
+
+    cram = run_root / "results" / "reads.sorted.cram"
+    assert stats is not None
+    assert map_calls == [ref]
+    assert (tmp_path / "ref.fa.fai").exists()
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert metadata["steps"]["map_sort"]["outputs"]["cram"] == str(cram)
+    assert metadata["steps"]["bam_index"]["outputs"] == {"crai": str(cram) + ".crai"}
+
+    # 截断的 CRAM 缺少文件头，resume 时应重新比对
+    cram.write_text("truncated", encoding="utf-8")
+    alignment.run_alignment_pipeline(ref, reads, outdir=run_root, resume=True, skip_preflight=True, output_format="cram")
+    metadata = json.loads((run_root / "metadata.json").read_text(encoding="utf-8"))
+    assert len(map_calls) == 2
+    assert metadata["steps"]["map_sort"]["status"] == "success"
+    assert metadata["steps"]["bam_index"]["status"] == "success"
+
+
+def test_bwa_progress_is_parsed_and_stderr_logged_while_running(tmp_path: Path, monkeypatch) -> None:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    stderr_log = tmp_path / "align.stderr.log"
+    _write_fake_tool(
+        bin_dir,
+        "bwa",
+        'echo "[M::mem_process_seqs] Processed 1000 reads in 0.5 CPU sec, 0.1 real sec" >&2\n'
+        # 第二批输出前确认第一行已实时写入日志，而不是在结束时一次性写入
+        f'for i in 1 2 3 4 5 6 7 8 9 10; do grep -q "Processed 1000" {stderr_log} && break; sleep 0.1; done\n'
+        f'grep -q "Processed 1000" {stderr_log} || exit 3\n'
+        'echo "[M::mem_process_seqs] Processed 250 reads in 0.1 CPU sec, 0.1 real sec" >&2\n'
+        'printf "@SQ\\tSN:chr1\\tLN:100\\n"',
+    )
+    _write_fake_tool(
+        bin_dir,
+        "samtools",
+        'while [ "$#" -gt 0 ]; do if [ "$1" = "-o" ]; then out="$2"; fi; shift; done\n'
+        'sleep 0.3; cat > "$out"',
+    )
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+
+    with alignment._PipelineMonitor(interval=0.05, show_progress=False) as monitor:
+        ok = alignment._run_map_pipe_sort(
+            tmp_path / "ref.fa",
+            tmp_path / "reads.fastq",
+            tmp_path / "out.bam",
+            monitor=monitor,
+            stderr_log=stderr_log,
+        )
+
+    assert ok
+    summary = monitor.summary()
+    assert summary["reads"] == 1250
+    assert "samtools sort" in summary["stages"]
+    assert summary["stages"]["samtools sort"]["peak_rss_bytes"] > 0
+    assert stderr_log.read_text(encoding="utf-8").count("Processed") == 2